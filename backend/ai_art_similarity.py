@@ -1,118 +1,297 @@
 import os
 import numpy as np
-import tensorflow as tf
-from tensorflow.keras.applications import ResNet50
-from tensorflow.keras.applications.resnet50 import preprocess_input
-from tensorflow.keras.preprocessing import image  # Add this line
-
-from tensorflow.keras.models import Model
-import matplotlib.pyplot as plt
-from sklearn.neighbors import NearestNeighbors
-import requests
 from PIL import Image
 from io import BytesIO
-import pickle
 import glob
-from tqdm import tqdm
 import base64
+import hashlib
+from concurrent.futures import Future
+from contextlib import nullcontext
+
+from feature_store import (FeatureStoreWriter, content_hash, file_signature, load_feature_store,
+                           save_feature_store, store_exists)
+from fetcher import get_fetcher, is_url
+import metrics
+from inference import build_inference_backend, preprocess_input
+from metadata import MetadataTable, filter_key, read_metadata_file
+from nn_index import append_rows, build_index, l2_normalize, validate_k
+from pipeline import iter_decoded_batches
+from query_cache import CachedQuery, content_key
+from regions import REGION_STORE, RegionIndex
 
 class ImageSimilaritySearch:
-    def __init__(self, model_type="resnet50", pooling="avg"):
+    def __init__(self, model_type="resnet50", pooling="avg", index_backend="exact", index_params=None,
+                 decode_workers=None, prefetch_batches=2, query_cache=None, inference_backend="keras",
+                 inference_params=None, metadata_schema=None, fetcher=None, region_params=None):
         """
         Initialize the image similarity search system.
         
         Args:
             model_type (str): The pre-trained model to use as feature extractor.
             pooling (str): The pooling method to use for the feature extraction.
+            index_backend (str): Nearest neighbour backend ('exact', 'ivf' or 'hnsw').
+            index_params (dict, optional): Recall/speed knobs for the backend,
+                e.g. {'nprobe': 16} for 'ivf' or {'ef_search': 128} for 'hnsw'.
+            decode_workers (int, optional): Threads decoding and resizing images
+                while indexing. Defaults to min(8, CPU count).
+            prefetch_batches (int): Decoded batches buffered ahead of the model
+                while indexing; bounds indexing memory.
+            query_cache (QueryCache, optional): Cache of query embeddings and
+                results in front of search().
+            inference_backend (str): Feature extractor runtime ('keras', 'tflite'
+                or 'onnx').
+            inference_params (dict, optional): Runtime options, e.g.
+                {'num_threads': 4, 'quantize': 'int8'}.
+            metadata_schema (dict, optional): Types of metadata fields beyond
+                metadata.DEFAULT_SCHEMA, e.g. {'year': 'number'}.
+            fetcher (ImageFetcher, optional): Client for URL queries. Defaults
+                to the process-wide fetcher.get_fetcher().
+            region_params (dict, optional): Enables region matching (see
+                regions.py) with these RegionIndex options, e.g.
+                {'scales': [1, 2, 3]}. Images and queries are then embedded
+                per tile and artworks are scored by their best tile match.
         """
         self.model_type = model_type
         self.pooling = pooling
+        self.index_backend = index_backend
+        self.index_params = dict(index_params or {})
+        self.decode_workers = decode_workers
+        self.prefetch_batches = prefetch_batches
+        self.query_cache = query_cache
+        self.inference_backend = inference_backend
+        self.inference_params = dict(inference_params or {})
+        self.metadata_schema = metadata_schema
+        self.fetcher = fetcher if fetcher is not None else get_fetcher()
         self.feature_vector_size = 2048  # ResNet50 feature size
         self.feature_extractor = self._build_feature_extractor()
         self.database_features = None
         self.database_paths = None
         self.nn_model = None
+        # Tile vectors of every row in region mode
+        self.regions = RegionIndex(**region_params) if region_params is not None else None
+        # Paths loaded from a feature store without region vectors; re-embedded on sync
+        self._regions_missing = set()
+        # Metadata of every row of database_features, for filtered search
+        self.metadata = MetadataTable(metadata_schema)
+        # Bumped on every index change; cached query results from older
+        # versions are discarded
+        self.index_version = 0
+        # path -> {'mtime', 'size', 'sha1', 'row', 'metadata'} for every live indexed image
+        self.manifest = {}
+        self._features_buffer = None
         
     def _build_feature_extractor(self):
-        """Build the feature extractor model."""
-        base_model = ResNet50(weights='imagenet', include_top=False, pooling=self.pooling)
-        model = Model(inputs=base_model.input, outputs=base_model.output)
-        return model
+        """Build the feature extractor on the configured runtime."""
+        return build_inference_backend(self.inference_backend, pooling=self.pooling, **self.inference_params)
+
     def save_features_cache(self, cache_path):
         """
-        Save extracted features and model state to cache.
+        Save extracted features and their metadata as a new feature store version.
         
         Args:
-            cache_path (str): Path to save the cache file.
-        """
-        cache = {
-            'features': self.database_features,
-            'paths': self.database_paths,
-            'model_type': self.model_type,
-            'pooling': self.pooling,
-            'feature_vector_size': self.feature_vector_size
-        }
-        with open(cache_path, 'wb') as f:
-            pickle.dump(cache, f)
+            cache_path (str): Feature store directory.
+        """
+        features, paths, manifest = self._live_database()
+        meta_rows = [None] * len(paths)
+        for path, entry in manifest.items():
+            meta_rows[entry['row']] = {
+                'path': path,
+                'mtime': entry['mtime'],
+                'size': entry['size'],
+                'sha1': entry['sha1'],
+                'metadata': entry.get('metadata'),
+            }
+        save_feature_store(
+            cache_path, features, meta_rows,
+            model_type=self.model_type,
+            pooling=self.pooling,
+            extra_header={'normalized': True},
+        )
+        if self.regions is not None:
+            self._save_regions(cache_path)
         print(f"Features cache saved to {cache_path}")
 
     def load_features_cache(self, cache_path):
         """
-        Load extracted features and model state from cache.
+        Open a feature store. The feature matrix is memory-mapped, not read.
         
         Args:
-            cache_path (str): Path to load the cache file from.
+            cache_path (str): Feature store directory.
         """
-        with open(cache_path, 'rb') as f:
-            cache = pickle.load(f)
-        
-        self.database_features = cache['features']
-        self.database_paths = cache['paths']
-        self.model_type = cache['model_type']
-        self.pooling = cache['pooling']
-        self.feature_vector_size = cache['feature_vector_size']
+        store = load_feature_store(cache_path)
+        header = store.header
+        if header['model_type'] != self.model_type or header['pooling'] != self.pooling:
+            raise ValueError(
+                f"Feature store was built with {header['model_type']}/{header['pooling']}, "
+                f"expected {self.model_type}/{self.pooling}"
+            )
+        manifest = {}
+        for row, meta in enumerate(store.meta):
+            manifest[meta['path']] = {
+                'mtime': meta.get('mtime'),
+                'size': meta.get('size'),
+                'sha1': meta.get('sha1'),
+                'metadata': meta.get('metadata'),
+                'row': row,
+            }
+        self._set_database(store.features, store.paths, manifest, normalized=header.get('normalized', False))
+        self.feature_vector_size = header['dim']
         
         # Rebuild the nearest neighbors model
         self._build_nn_model()
+        if self.regions is not None:
+            self._load_regions(cache_path)
+    
+    def _region_header(self):
+        return {'normalized': True, 'scales': list(self.regions.scales), 'overlap': self.regions.overlap}
+    
+    def _region_writer(self, cache_path):
+        """Writer for the region store of a feature store, or a null context outside region mode."""
+        if self.regions is None:
+            return nullcontext()
+        return FeatureStoreWriter(os.path.join(cache_path, REGION_STORE), self.feature_vector_size,
+                                  self.model_type, self.pooling, dtype="float16",
+                                  extra_header=self._region_header())
+    
+    def _save_regions(self, cache_path):
+        """Write the live region vectors as a new version of the region store."""
+        vectors, owners = self.regions.live()
+        if len(vectors) == 0:
+            vectors = np.empty((0, self.feature_vector_size), dtype=np.float16)
+        meta_rows = []
+        for owner in owners:
+            path = self.database_paths[owner]
+            meta_rows.append({'path': path, 'sha1': self.manifest[path]['sha1']})
+        with self._region_writer(cache_path) as writer:
+            writer.append(vectors, meta_rows)
+    
+    def _load_regions(self, cache_path):
+        """
+        Open the region store of a feature store. Regions are matched to rows by
+        path and content hash; images without regions are re-embedded on sync.
+        """
+        region_dir = os.path.join(cache_path, REGION_STORE)
+        vectors = np.empty((0, self.feature_vector_size), dtype=np.float16)
+        owners = np.empty(0, dtype=np.int32)
+        if store_exists(region_dir):
+            store = load_feature_store(region_dir)
+            header = store.header
+            if header['dim'] != self.feature_vector_size or any(
+                    header.get(key) != value for key, value in self._region_header().items()):
+                print(f"Ignoring region store built with {header.get('scales')}/{header.get('overlap')} tiles")
+            else:
+                vectors = store.features
+                owners = np.array([
+                    self.manifest[meta['path']]['row']
+                    if meta['path'] in self.manifest and self.manifest[meta['path']]['sha1'] == meta.get('sha1')
+                    else -1
+                    for meta in store.meta
+                ], dtype=np.int32)
+        self.regions.fit(vectors, owners, normalized=True)
+        covered = set(self.regions.owners().tolist())
+        self._regions_missing = {path for path, entry in self.manifest.items() if entry['row'] not in covered}
+        if self._regions_missing:
+            print(f"{len(self._regions_missing)} indexed images have no region vectors yet")
+    def _load_image(self, img_data):
+        """
+        Decode a query or database image.
+        
+        Args:
+            img_data (str, bytes or PIL.Image): Base64 string, file path, URL, raw
+                image bytes, or PIL Image object.
+            
+        Returns:
+            PIL.Image: RGB image.
+        """
+        try:
+            if is_url(img_data):
+                # Handle HTTP URLs (bounded, pooled fetch; see fetcher.py)
+                img_data = self.fetcher.fetch(img_data)
+            if isinstance(img_data, Image.Image) and img_data.mode == 'RGB':
+                # Already decoded (e.g. by the query cache lookup)
+                return img_data
+            with metrics.stage('decode'):
+                if isinstance(img_data, str):
+                    if img_data.startswith('data:image'):
+                        # Handle base64 data URL
+                        base64_data = img_data.split(',')[1]
+                        img_bytes = base64.b64decode(base64_data)
+                        img = Image.open(BytesIO(img_bytes))
+                    else:
+                        # Handle local file paths
+                        img = Image.open(img_data)
+                elif isinstance(img_data, (bytes, bytearray)):
+                    # Handle raw uploaded file bytes
+                    img = Image.open(BytesIO(img_data))
+                else:
+                    img = img_data
+                
+                # Decode now rather than lazily on first use, so it is timed here
+                img.load()
+                # Convert grayscale to RGB if needed
+                if img.mode != 'RGB':
+                    img = img.convert('RGB')
+            return img
+        except Exception as e:
+            raise ValueError(f"Error processing image: {str(e)}")
+
     def _preprocess_image(self, img_data, target_size=(224, 224)):
         """
         Preprocess an image for the feature extractor.
         
         Args:
-            img_data (str or PIL.Image): Base64 string, file path, or PIL Image object.
+            img_data (str, bytes or PIL.Image): Base64 string, file path, raw image bytes,
+                or PIL Image object.
             target_size (tuple): Target size for resizing.
             
         Returns:
             numpy.ndarray: Preprocessed image.
         """
+        img = self._load_image(img_data)
         try:
-            if isinstance(img_data, str):
-                if img_data.startswith('data:image'):
-                    # Handle base64 data URL
-                    base64_data = img_data.split(',')[1]
-                    img_bytes = base64.b64decode(base64_data)
-                    img = Image.open(BytesIO(img_bytes))
-                elif img_data.startswith('http'):
-                    # Handle HTTP URLs
-                    response = requests.get(img_data)
-                    img = Image.open(BytesIO(response.content))
-                else:
-                    # Handle local file paths
-                    img = Image.open(img_data)
-            else:
-                img = img_data
-                
-            # Convert grayscale to RGB if needed
-            if img.mode != 'RGB':
-                img = img.convert('RGB')
-                
-            img = img.resize(target_size)
-            img_array = image.img_to_array(img)
-            img_array = np.expand_dims(img_array, axis=0)
-            return preprocess_input(img_array)
+            with metrics.stage('resize'):
+                img_array = np.asarray(img.resize(target_size), dtype=np.float32)
+            with metrics.stage('preprocess'):
+                return preprocess_input(np.expand_dims(img_array, axis=0))
         except Exception as e:
             raise ValueError(f"Error processing image: {str(e)}")
 
+    def _preprocess_tiles(self, img_data):
+        """
+        Model input for one image: (1, H, W, 3), or in region mode
+        (n_tiles, H, W, 3) with the whole image first.
+        """
+        if self.regions is None:
+            return self._preprocess_image(img_data)
+        img = self._load_image(img_data)
+        try:
+            return self.regions.tiles(img)
+        except Exception as e:
+            raise ValueError(f"Error processing image: {str(e)}")
+    
+    def _query_embedding(self, features):
+        """Query embedding from the model output for one image's _preprocess_tiles() input."""
+        if self.regions is None:
+            return features.flatten()
+        return features.reshape(-1, features.shape[-1])
+    
+    def _embed_query(self, img_data):
+        """Feature vector of a query, or its (n_tiles, D) tile vectors in region mode."""
+        return self._query_embedding(self.predict(self._preprocess_tiles(img_data)))
+    
+    def predict(self, images):
+        """
+        Run the feature extractor on preprocessed images, timed as the
+        'predict' stage (see metrics.py).
+        
+        Args:
+            images (numpy.ndarray): (N, 224, 224, 3) model input.
+            
+        Returns:
+            numpy.ndarray: (N, D) features.
+        """
+        with metrics.stage('predict', len(images)):
+            return self.feature_extractor.predict(images, verbose=0)
     
     def extract_features(self, img_data):
         """
@@ -125,236 +304,651 @@ class ImageSimilaritySearch:
             numpy.ndarray: Feature vector.
         """
         preprocessed_img = self._preprocess_image(img_data)
-        features = self.feature_extractor.predict(preprocessed_img)
+        features = self.predict(preprocessed_img)
         return features.flatten()
     
-    def index_database(self, database_dir, pattern="*.png", batch_size=32, save_path=None, cache_path=None):
+    def _set_database(self, features, paths, manifest, normalized=False):
+        """
+        Replace the indexed database (the caller rebuilds the index).
+        
+        Args:
+            features (numpy.ndarray): Feature matrix, one row per path.
+            paths (list): Image paths.
+            manifest (dict): Change-detection entries (and metadata) per path.
+            normalized (bool): Rows are already unit length.
+        """
+        self.database_features = features if normalized else l2_normalize(features, copy=False)
+        self.database_paths = list(paths)
+        self._features_buffer = self.database_features
+        self.manifest = manifest
+        records = [None] * len(self.database_paths)
+        for entry in manifest.values():
+            records[entry['row']] = entry.get('metadata')
+        metadata = MetadataTable(self.metadata_schema)
+        metadata.append(records)
+        self.metadata = metadata
+    
+    def _live_database(self):
+        """
+        Return (features, paths, manifest) without the rows of removed images.
+        """
+        live_rows = [row for row, path in enumerate(self.database_paths) if path is not None]
+        if len(live_rows) == len(self.database_paths):
+            return self.database_features, list(self.database_paths), dict(self.manifest)
+        remap = {row: new_row for new_row, row in enumerate(live_rows)}
+        manifest = {path: dict(entry, row=remap[entry['row']]) for path, entry in self.manifest.items()}
+        return (self.database_features[live_rows],
+                [self.database_paths[row] for row in live_rows],
+                manifest)
+    
+    @staticmethod
+    def _scan_database_dir(database_dir, pattern="*.png"):
+        """List the image files of a database directory, without duplicates."""
+        image_paths = set()
+        for file_pattern in (pattern, "*.jpeg", "*.png"):
+            image_paths.update(glob.glob(os.path.join(database_dir, file_pattern)))
+        return sorted(image_paths)
+    
+    def _load_for_index(self, path):
+        """
+        Read, fingerprint and preprocess one database image (runs on a decode thread).
+        
+        Returns:
+            tuple: (preprocessed tiles, file signature with SHA-1)
+        """
+        signature = file_signature(path)
+        with open(path, 'rb') as f:
+            img_bytes = f.read()
+        signature['sha1'] = hashlib.sha1(img_bytes).hexdigest()
+        return self._preprocess_tiles(img_bytes), signature
+    
+    def _extract_paths(self, image_paths, batch_size=32, writer=None, metadata=None, region_writer=None):
+        """
+        Extract features for a list of image files.
+        
+        Images are decoded on a thread pool while the model runs on the
+        previous batch. With a writer, features are streamed to the feature
+        store and not kept in memory; otherwise they are collected in a single
+        preallocated-and-grown matrix. In region mode every image is embedded
+        per tile (whole image first), with model calls of about batch_size tiles.
+        
+        Args:
+            image_paths (list): Image file paths.
+            batch_size (int): Batch size for feature extraction.
+            writer (FeatureStoreWriter, optional): Destination for the features.
+            metadata (dict, optional): path -> metadata, stored with the rows
+                written to the writer.
+            region_writer (FeatureStoreWriter, optional): Destination for the
+                region vectors in region mode.
+        
+        Returns:
+            tuple: (normalized features or None when streamed to writer,
+                paths that could be processed, {path: signature},
+                float16 (len(paths) * n_tiles, D) region vectors, or None
+                outside region mode or when streamed to region_writer)
+        """
+        from tqdm import tqdm
+
+        features = None
+        region_features = None
+        count = 0
+        valid_paths = []
+        signatures = {}
+        n_tiles = 1 if self.regions is None else self.regions.n_tiles
+        batch_size = max(1, batch_size // n_tiles)
+        
+        batches = iter_decoded_batches(
+            image_paths, self._load_for_index,
+            batch_size=batch_size,
+            workers=self.decode_workers,
+            prefetch=self.prefetch_batches,
+        )
+        total = (len(image_paths) + batch_size - 1) // batch_size
+        for batch in tqdm(batches, total=total, desc="Extracting features"):
+            for img_path, e in batch.errors:
+                print(f"Error processing {img_path}: {e}")
+            if batch.images is None:
+                continue
+            
+            # Unit-length rows make cosine similarity a dot product
+            images = batch.images.reshape((-1,) + batch.images.shape[2:])
+            tile_features = l2_normalize(self.predict(images))
+            tile_features = tile_features.reshape(len(batch.paths), n_tiles, -1)
+            batch_features = tile_features[:, 0]
+            if self.regions is not None:
+                tile_features = tile_features.reshape(len(images), -1)
+                if region_writer is not None:
+                    region_writer.append(tile_features, [
+                        {'path': path, 'sha1': signature['sha1']}
+                        for path, signature in zip(batch.paths, batch.extras)
+                        for _ in range(n_tiles)
+                    ])
+                else:
+                    region_features = append_rows(region_features, count * n_tiles,
+                                                  tile_features.astype(np.float16))
+            if writer is not None:
+                writer.append(batch_features, [
+                    dict(signature, path=path, metadata=(metadata or {}).get(path))
+                    for path, signature in zip(batch.paths, batch.extras)
+                ])
+            else:
+                features = append_rows(features, count, batch_features)
+                count += len(batch_features)
+            valid_paths.extend(batch.paths)
+            signatures.update(zip(batch.paths, batch.extras))
+        
+        if region_features is not None:
+            region_features = region_features[:count * n_tiles]
+        if writer is not None:
+            return None, valid_paths, signatures, region_features
+        if features is None:
+            features = np.empty((0, self.feature_vector_size), dtype=np.float32)
+        return features[:count], valid_paths, signatures, region_features
+    
+    def index_database(self, database_dir, pattern="*.png", batch_size=32, cache_path=None):
         """
         Index all images in a directory to build a searchable database.
         
+        When a cache exists it is loaded and brought up to date with
+        sync_database(), so only new or changed images are embedded.
+        
         Args:
             database_dir (str): Directory containing images.
             pattern (str): Pattern to match image files.
             batch_size (int): Batch size for feature extraction.
-            save_path (str, optional): Path to save the database.
+            cache_path (str, optional): Feature store directory.
             
         Returns:
             tuple: (features, image_paths)
         """
-        image_paths = glob.glob(os.path.join(database_dir, pattern))
-        image_paths.extend(glob.glob(os.path.join(database_dir, "*.jpeg")))
-        image_paths.extend(glob.glob(os.path.join(database_dir, "*.png")))
-        if cache_path and os.path.exists(cache_path):
+        if cache_path and store_exists(cache_path):
             print("Loading features from cache...")
-            self.load_features_cache(cache_path)
-            return self.database_features, self.database_paths
+            try:
+                self.load_features_cache(cache_path)
+            except ValueError as e:
+                print(f"Ignoring features cache: {e}")
+            else:
+                self.sync_database(database_dir, pattern=pattern, batch_size=batch_size, cache_path=cache_path)
+                return self.database_features, self.database_paths
+        
+        image_paths = self._scan_database_dir(database_dir, pattern)
+        metadata = read_metadata_file(database_dir)
         print(f"Found {len(image_paths)} images in database directory.")
         
         if len(image_paths) == 0:
             raise ValueError(f"No images found in {database_dir} with pattern {pattern}")
         
-        # Process images in batches
-        all_features = []
-        valid_paths = []
+        if cache_path:
+            # Stream features to disk, then memory-map them back
+            with FeatureStoreWriter(cache_path, self.feature_vector_size, self.model_type, self.pooling,
+                                    extra_header={'normalized': True}) as writer, \
+                    self._region_writer(cache_path) as region_writer:
+                self._extract_paths(image_paths, batch_size, writer=writer, metadata=metadata,
+                                    region_writer=region_writer)
+            print(f"Features cache saved to {cache_path}")
+            self.load_features_cache(cache_path)
+            return self.database_features, self.database_paths
         
-        for i in tqdm(range(0, len(image_paths), batch_size), desc="Extracting features"):
-            batch_paths = image_paths[i:i+batch_size]
-            batch_images = []
-            
-            for img_path in batch_paths:
-                try:
-                    preprocessed_img = self._preprocess_image(img_path)
-                    batch_images.append(preprocessed_img[0])  # Remove batch dimension
-                    valid_paths.append(img_path)
-                except Exception as e:
-                    print(f"Error processing {img_path}: {e}")
+        features_array, valid_paths, signatures, region_features = self._extract_paths(image_paths, batch_size)
+        manifest = {path: dict(signatures[path], metadata=metadata.get(path), row=row)
+                    for row, path in enumerate(valid_paths)}
+        self._set_database(features_array, valid_paths, manifest, normalized=True)
+        
+        # Build the nearest neighbors model
+        self._build_nn_model()
+        if self.regions is not None:
+            self.regions.fit(region_features, self._region_owners(range(len(valid_paths))), normalized=True)
             
-            if batch_images:
-                batch_images = np.array(batch_images)
-                batch_features = self.feature_extractor.predict(batch_images)
-                all_features.extend(batch_features)
+        return features_array, valid_paths
+    
+    def sync_database(self, database_dir, pattern="*.png", batch_size=32, cache_path=None):
+        """
+        Bring the index up to date with a database directory.
         
-        # Convert to numpy arrays
-        features_array = np.array(all_features)
+        Files whose modification time and size are unchanged are skipped
+        without reading them; otherwise the content hash decides whether the
+        image really changed. Only new or changed images are embedded, and the
+        index is updated in place.
         
-        self.database_features = features_array
-        self.database_paths = valid_paths
+        Args:
+            database_dir (str): Directory containing images.
+            pattern (str): Pattern to match image files.
+            batch_size (int): Batch size for feature extraction.
+            cache_path (str, optional): Cache to rewrite if anything changed.
+            
+        Returns:
+            dict: Counts of added, updated, removed, relabeled (metadata
+                changed), unchanged and failed (could not be embedded) images.
+                A changed image that fails keeps its indexed version and is
+                retried on the next sync.
+        """
+        image_paths = self._scan_database_dir(database_dir, pattern)
+        metadata = read_metadata_file(database_dir)
+        current = set(image_paths)
+        removed = [path for path in self.manifest if path not in current]
+
+        to_embed = []
+        relabel = {}
+        unchanged = 0
+        for path in image_paths:
+            try:
+                signature = file_signature(path)
+            except OSError:
+                continue
+            entry = self.manifest.get(path)
+            if entry and path in self._regions_missing:
+                # Indexed before region mode was enabled: embed its tiles
+                to_embed.append(path)
+                continue
+            if entry and entry['mtime'] == signature['mtime'] and entry['size'] == signature['size']:
+                unchanged += 1
+            elif entry and entry['sha1'] == content_hash(path):
+                # Touched but not modified
+                entry.update(signature)
+                unchanged += 1
+            else:
+                to_embed.append(path)
+                continue
+            if entry.get('metadata') != metadata.get(path):
+                relabel[path] = metadata.get(path)
         
-        # Build the nearest neighbors model
-        self._build_nn_model()
+        indexed = {path for path in to_embed if path in self.manifest}
+        self.remove_images(removed)
+        self.update_metadata(relabel)
+        added = self.add_images(to_embed, batch_size, metadata=metadata)
+        updated = sum(1 for path in added if path in indexed)
         
-        if save_path:
-            self.save_database(save_path)
-        if cache_path:
+        summary = {
+            'added': len(added) - updated,
+            'updated': updated,
+            'removed': len(removed),
+            'relabeled': len(relabel),
+            'unchanged': unchanged,
+            'failed': len(to_embed) - len(added),
+        }
+        print(f"Synced {database_dir}: {summary}")
+        if cache_path and (to_embed or removed or relabel):
             self.save_features_cache(cache_path)
+        return summary
+    
+    def add_images(self, image_paths, batch_size=32, metadata=None):
+        """
+        Embed images and add them to the index, replacing earlier versions of
+        the same paths. Costs time in proportion to len(image_paths).
+        
+        An indexed image that cannot be embedded again (e.g. a transient read
+        error) keeps its previous version instead of being dropped.
+        
+        Args:
+            image_paths (list): Image file paths.
+            batch_size (int): Batch size for feature extraction.
+            metadata (dict, optional): path -> metadata for filtered search.
             
-        return features_array, valid_paths
+        Returns:
+            list: Paths that were added.
+        """
+        image_paths = list(image_paths)
+        if not image_paths:
+            return []
+        features, valid_paths, signatures, region_features = self._extract_paths(image_paths, batch_size)
+        failed = [path for path in image_paths if path not in signatures]
+        if failed:
+            kept = sum(1 for path in failed if path in self.manifest)
+            print(f"Could not embed {len(failed)} of {len(image_paths)} images "
+                  f"({kept} keep their indexed version)")
+        # Replace earlier versions of the images that were embedded again
+        self.remove_images([path for path in valid_paths if path in self.manifest])
+        if not valid_paths:
+            return []
+        self._add_rows(features, valid_paths, signatures, metadata or {}, region_features)
+        return valid_paths
+    
+    def update_metadata(self, metadata):
+        """
+        Replace the metadata of indexed images without re-embedding them.
+        
+        Rows are never modified in place, so each image is re-added under a
+        new row with its existing features and the old row is removed.
+        
+        Args:
+            metadata (dict): path -> new metadata (None to clear it). Unknown
+                paths are ignored.
+            
+        Returns:
+            list: Paths whose metadata was replaced.
+        """
+        paths = [path for path in metadata if path in self.manifest]
+        if not paths:
+            return []
+        old_rows = [self.manifest[path]['row'] for path in paths]
+        features = np.stack([self.database_features[row] for row in old_rows])
+        signatures = {
+            path: {key: self.manifest[path][key] for key in ('mtime', 'size', 'sha1')}
+            for path in paths
+        }
+        self.remove_images(paths)
+        self._add_rows(features, paths, signatures, metadata)
+        if self.regions is not None:
+            # The tiles are unchanged too: hand them to the new rows
+            self.regions.move_owners(old_rows, [self.manifest[path]['row'] for path in paths])
+        return paths
+    
+    def _add_rows(self, features, paths, signatures, metadata, region_features=None):
+        """
+        Append unit-length feature rows for paths that are not indexed, and
+        in region mode their n_tiles region vectors each.
+        """
+        if self.nn_model is None:
+            manifest = {path: dict(signatures[path], metadata=metadata.get(path), row=row)
+                        for row, path in enumerate(paths)}
+            self._set_database(features, paths, manifest, normalized=True)
+            self._build_nn_model()
+            if region_features is not None:
+                self.regions.fit(region_features, self._region_owners(range(len(paths))), normalized=True)
+                self._regions_missing.difference_update(paths)
+            return
+        count = len(self.database_paths)
+        # Rows become searchable once the index has them, so everything a
+        # search looks up by row is extended first (searches do not wait for
+        # a sync in progress)
+        self._features_buffer = append_rows(self._features_buffer, count, features)
+        self.database_features = self._features_buffer[:count + len(paths)]
+        self.database_paths.extend(paths)
+        # The index references database_features rather than keeping its own copy
+        rows = self.nn_model.extend(self.database_features)
+        # After the index: until then, filters simply do not allow the new rows
+        self.metadata.append([metadata.get(path) for path in paths])
+        if region_features is not None:
+            self.regions.add(region_features, self._region_owners(rows))
+            self._regions_missing.difference_update(paths)
+        self.index_version += 1
+        for row, path in zip(rows, paths):
+            self.manifest[path] = dict(signatures[path], metadata=metadata.get(path), row=int(row))
+    
+    def _region_owners(self, rows):
+        """Owner row of every region vector of images added in row order."""
+        return np.repeat(np.asarray(rows, dtype=np.int32), self.regions.n_tiles)
+    
+    def remove_images(self, image_paths):
+        """
+        Remove images from the index in place.
+        
+        Args:
+            image_paths (list): Image file paths. Unknown paths are ignored.
+            
+        Returns:
+            list: Paths that were removed.
+        """
+        removed = [path for path in image_paths if path in self.manifest]
+        rows = [self.manifest.pop(path)['row'] for path in removed]
+        if rows and self.nn_model is not None:
+            self.nn_model.remove(rows)
+        if rows and self.regions is not None:
+            self.regions.remove_owners(rows)
+            self._regions_missing.difference_update(removed)
+        for row in rows:
+            self.database_paths[row] = None
+        if rows:
+            self.index_version += 1
+        return removed
     
     def _build_nn_model(self):
-        """Build the nearest neighbors model for searching."""
-        self.nn_model = NearestNeighbors(n_neighbors=10, algorithm='auto', metric='cosine')
-        self.nn_model.fit(self.database_features)
+        """Build the nearest neighbors index for searching."""
+        nn_model = build_index(self.index_backend, **self.index_params)
+        # _set_database() guarantees unit-length rows
+        nn_model.fit(self.database_features, normalized=True)
+        # Swap only once fitted, so searches never see a half-built index
+        previous, self.nn_model = self.nn_model, nn_model
+        self.index_version += 1
+        if hasattr(previous, 'close'):
+            # Sharded indexes own worker processes
+            previous.close()
     
-    def search(self, query_img_data, top_k=5):
+    def search(self, query_img_data, top_k=5, filters=None):
         """
         Search for similar images in the database.
         
         Args:
             query_img_data (str or PIL.Image): Base64 string, file path, or PIL Image object.
             top_k (int): Number of results to return.
+            filters (dict, optional): Metadata filter (see metadata.py); only
+                matching images are returned.
             
         Returns:
             list: List of (similarity_score, image_path) tuples.
+
+        Raises:
+            ValueError: If top_k is below 1 or the database is not indexed.
         """
         if self.database_features is None or self.nn_model is None:
             raise ValueError("Database not indexed. Call index_database() first.")
+        validate_k(top_k)
         
-        # Extract features from query image
-        query_features = self.extract_features(query_img_data)
-        query_features = query_features.reshape(1, -1)
+        query = self.lookup_query(query_img_data, top_k, filters)
+        if query.results is not None:
+            return query.results
+        if query.embedding is None:
+            # Extract features from query image
+            query.embedding = self._embed_query(query.image)
+        return self.complete_query(query, top_k, filters)
+    
+    def lookup_query(self, query_img_data, top_k=5, filters=None):
+        """
+        Look a query up in the query cache.
         
-        # Find nearest neighbors
-        distances, indices = self.nn_model.kneighbors(
-            query_features, 
-            n_neighbors=min(top_k, len(self.database_paths))
-        )
+        Args:
+            query_img_data (str, bytes or PIL.Image): Query image.
+            top_k (int): Number of results to return.
+            filters (dict, optional): Metadata filter of the search.
+            
+        Returns:
+            CachedQuery: With results and/or embedding filled in on a hit. Its
+                `image` may have been decoded already and should be used for
+                feature extraction.
+        """
+        query = CachedQuery(query_img_data, content_key=content_key(query_img_data))
+        if self.query_cache is not None:
+            self.query_cache.lookup(query, top_k, self.index_version, decode=self._load_image,
+                                    filter_key=filter_key(filters))
+        return query
+    
+    def complete_query(self, query, top_k=5, filters=None):
+        """
+        Search with a query's embedding and remember the outcome in the cache.
         
-        # Prepare results
-        results = []
-        for i, idx in enumerate(indices[0]):
-            similarity_score = 1.0 - distances[0][i]  # Convert distance to similarity
-            results.append((similarity_score, self.database_paths[idx]))
+        Args:
+            query (CachedQuery): Query returned by lookup_query() with its
+                embedding set.
+            top_k (int): Number of results to return.
+            filters (dict, optional): Metadata filter (see metadata.py).
+            
+        Returns:
+            list: List of (similarity_score, image_path) tuples.
+        """
+        return self.complete_queries([query], top_k, filters)[0]
+    
+    def complete_queries(self, queries, top_k=5, filters=None):
+        """
+        complete_query() for several queries with one index lookup.
         
-        return results
+        Args:
+            queries (list): CachedQuery objects with their embeddings set.
+            top_k (int): Number of results to return per query.
+            filters (dict, optional): Metadata filter applied to every query.
+            
+        Returns:
+            list: One list of (similarity_score, image_path) tuples per query.
+        """
+        index_version = self.index_version
+        all_results = self.search_by_features_batch(np.stack([q.embedding for q in queries]), top_k=top_k,
+                                                    filters=filters)
+        if self.query_cache is not None:
+            key = filter_key(filters)
+            for query, results in zip(queries, all_results):
+                self.query_cache.store(query, results, top_k, index_version, filter_key=key)
+        return all_results
     
-    def save_database(self, path):
+    def search_by_features(self, query_features, top_k=5, filters=None):
         """
-        Save the indexed database to disk.
+        Search for similar images given an already extracted feature vector.
         
         Args:
-            path (str): Path to save the database.
+            query_features (numpy.ndarray): Feature vector of the query image,
+                or its (n_tiles, D) tile vectors in region mode.
+            top_k (int): Number of results to return.
+            filters (dict, optional): Metadata filter (see metadata.py).
+            
+        Returns:
+            list: List of (similarity_score, image_path) tuples.
         """
-        database = {
-            'features': self.database_features,
-            'paths': self.database_paths
-        }
-        with open(path, 'wb') as f:
-            pickle.dump(database, f)
-        print(f"Database saved to {path}")
+        return self.search_by_features_batch(np.asarray(query_features)[None], top_k, filters)[0]
     
-    def load_database(self, path):
+    def search_by_features_batch(self, query_features, top_k=5, filters=None):
         """
-        Load an indexed database from disk.
+        Search for several feature vectors with one matrix-level index query.
+        
+        A filter is evaluated to a row mask first and the index only
+        considers allowed rows, so up to top_k matching images are returned
+        however few images the filter allows. In region mode the region
+        index is searched instead and artworks are ranked by their best tile.
         
         Args:
-            path (str): Path to load the database from.
+            query_features (numpy.ndarray): (Q, D) feature vectors, or in
+                region mode (Q, n_tiles, D) query tile vectors.
+            top_k (int): Number of results to return per query.
+            filters (dict, optional): Metadata filter (see metadata.py).
+            
+        Returns:
+            list: One list of (similarity_score, image_path) tuples per query.
+        
+        Raises:
+            ValueError: If the filter is malformed or top_k is below 1.
         """
-        with open(path, 'rb') as f:
-            database = pickle.load(f)
+        if self.database_features is None or self.nn_model is None:
+            raise ValueError("Database not indexed. Call index_database() first.")
+        validate_k(top_k)
+        if self.nn_model.n_alive == 0:
+            return [[] for _ in range(len(query_features))]
         
-        self.database_features = database['features']
-        self.database_paths = database['paths']
-        self._build_nn_model()
-        print(f"Loaded database with {len(self.database_paths)} images")
+        # Find nearest neighbors among the rows the filter allows
+        allowed = None
+        if filters:
+            with metrics.stage('filter'):
+                allowed = self.metadata.evaluate(filters)
+        index = self.regions if self.regions is not None else self.nn_model
+        query_features = np.asarray(query_features)
+        with metrics.stage('knn', len(query_features)):
+            similarities, indices = index.query(
+                query_features,
+                min(top_k, self.nn_model.n_alive),
+                allowed=allowed,
+            )
+        
+        # Prepare results
+        all_results = []
+        for row_similarities, row_indices in zip(similarities, indices):
+            results = []
+            for similarity_score, idx in zip(row_similarities, row_indices):
+                if idx < 0 or self.database_paths[idx] is None:
+                    continue
+                results.append((float(similarity_score), self.database_paths[idx]))
+            all_results.append(results)
+        
+        return all_results
     
-    def visualize_results(self, query_img_path, results, display_size=(224, 224)):
+    def _prepare_batch_query(self, item, top_k, filters):
+        position, query_img_data = item
+        if isinstance(query_img_data, Exception):
+            raise query_img_data
+        if isinstance(query_img_data, Future):
+            # URL being fetched by fetcher.prefetch()
+            query_img_data = query_img_data.result()
+        query = self.lookup_query(query_img_data, top_k, filters)
+        if query.results is not None or query.embedding is not None:
+            return None, query
+        return self._preprocess_tiles(query.image), query
+    
+    def search_batch(self, queries, top_k=5, batch_size=32, filters=None):
         """
-        Visualize search results.
+        Search for many query images, streaming results chunk by chunk.
+        
+        Queries are decoded on the decode pool while the previous chunk is
+        embedded; each chunk is embedded with one model call and searched with
+        one index query. URL queries are fetched concurrently, up to
+        prefetch_batches + 1 chunks ahead of the decode pool. A query that cannot be fetched or
+        decoded fails on its own without affecting the rest of the batch.
         
         Args:
-            query_img_path (str or PIL.Image): Path to query image or PIL Image object.
-            results (list): List of (similarity_score, image_path) tuples.
-            display_size (tuple): Display size for images.
-        """
-        if isinstance(query_img_path, str):
-            if query_img_path.startswith('http'):
-                response = requests.get(query_img_path)
-                query_img = Image.open(BytesIO(response.content))
-            else:
-                query_img = Image.open(query_img_path)
-        else:
-            query_img = query_img_path
-        
-        # Create a figure with subplots
-        n_results = len(results)
-        fig, axes = plt.subplots(1, n_results + 1, figsize=(15, 4))
-        
-        # Display query image
-        axes[0].imshow(query_img.resize(display_size))
-        axes[0].set_title("Query Image")
-        axes[0].axis('off')
-        
-        # Display results
-        for i, (score, path) in enumerate(results):
-            img = Image.open(path)
-            axes[i + 1].imshow(img.resize(display_size))
-            axes[i + 1].set_title(f"Score: {score:.2f}")
-            axes[i + 1].axis('off')
-        
-        plt.tight_layout()
-        plt.show()
-
-
-def download_sample_dataset(output_dir, num_images=100):
-    """
-    Download a sample dataset from the CIFAR-10 dataset.
+            queries (iterable): Query images (base64 data URL, file path, URL,
+                raw bytes or PIL Image). Consumed lazily. An exception instance in
+                place of a query is reported as that query's error.
+            top_k (int): Number of results to return per query.
+            batch_size (int): Queries per model call.
+            filters (dict, optional): Metadata filter applied to every query.
+            
+        Yields:
+            tuple: (position, results, error) for every query, in input order;
+                results is a list of (similarity_score, image_path) tuples, or
+                None with error set to a message.
+        """
+        if self.database_features is None or self.nn_model is None:
+            raise ValueError("Database not indexed. Call index_database() first.")
+        validate_k(top_k)
+        
+        queries = self.fetcher.prefetch(queries, window=batch_size * (self.prefetch_batches + 1))
+        batches = iter_decoded_batches(
+            enumerate(queries), lambda item: self._prepare_batch_query(item, top_k, filters),
+            batch_size=batch_size,
+            workers=self.decode_workers,
+            prefetch=self.prefetch_batches,
+        )
+        for batch in batches:
+            done = {position: (None, str(e)) for (position, _), e in batch.errors}
+            pending = []
+            for (position, _), query in batch.skipped:
+                if query.results is not None:
+                    done[position] = (query.results, None)
+                else:
+                    pending.append((position, query))
+            if batch.images is not None:
+                images = batch.images.reshape((-1,) + batch.images.shape[2:])
+                features = self.predict(images)
+                embeddings = features.reshape(len(batch.paths), -1, features.shape[-1])
+                for (position, _), query, embedding in zip(batch.paths, batch.extras, embeddings):
+                    query.embedding = self._query_embedding(embedding)
+                    pending.append((position, query))
+            if pending:
+                all_results = self.complete_queries([query for _, query in pending], top_k, filters)
+                for (position, _), results in zip(pending, all_results):
+                    done[position] = (results, None)
+            for position in sorted(done):
+                yield (position,) + done[position]
     
-    Args:
-        output_dir (str): Directory to save the images.
-        num_images (int): Number of images to download.
-    """
-    # Create output directory if it doesn't exist
-    os.makedirs(output_dir, exist_ok=True)
-    
-    # Load CIFAR-10 dataset
-    (x_train, y_train), _ = tf.keras.datasets.cifar10.load_data()
-    
-    # Define class names
-    class_names = ['airplane', 'automobile', 'bird', 'cat', 'deer', 
-                   'dog', 'frog', 'horse', 'ship', 'truck']
-    
-    # Save images
-    count = 0
-    for i in range(min(num_images, len(x_train))):
-        img = Image.fromarray(x_train[i])
-        class_name = class_names[y_train[i][0]]
-        img_path = os.path.join(output_dir, f"{class_name}_{i}.png")
-        img.save(img_path)
-        count += 1
-    
-    print(f"Downloaded {count} images to {output_dir}")
+    def visualize_results(self, query_img_path, results, display_size=(224, 224)):
+        """
+        Visualize search results (see tools.visualize_results).
+        """
+        from tools import visualize_results
+        visualize_results(query_img_path, results, display_size)
+
 
-def search_with_query_image(query_img_path="", top_k=5):
+def search_with_query_image(query_img_path, top_k=5, engine=None):
     """
     Search for similar images using a user-provided query image.
     
     Args:
-        cache_path (str): Path to the features cache file.
-        database_path (str): Path to the database file.
+        query_img_path (str, bytes or PIL.Image): Query image (base64 data URL,
+            file path, URL, raw bytes or PIL Image).
         top_k (int): Number of similar images to return.
+        engine (SearchEngine, optional): Warmed engine to reuse. Defaults to the
+            process-wide engine, which is loaded on first use.
     """
-    # Download a sample dataset
-    sample_dir = "art_dataset"
-    cache_path = "features_cache.pkl"
-    print("test")
-    query_img_path = "data:image/jpeg;base64,/9j/4AAQSkZJRgABAQAAAQABAAD//gA7Q1JFQVRPUjogZ2QtanBlZyB2MS4wICh1c2luZyBJSkcgSlBFRyB2NjIpLCBxdWFsaXR5ID0gODIK/9sAQwAGBAQFBAQGBQUFBgYGBwkOCQkICAkSDQ0KDhUSFhYVEhQUFxohHBcYHxkUFB0nHR8iIyUlJRYcKSwoJCshJCUk/9sAQwEGBgYJCAkRCQkRJBgUGCQkJCQkJCQkJCQkJCQkJCQkJCQkJCQkJCQkJCQkJCQkJCQkJCQkJCQkJCQkJCQkJCQk/8AAEQgBBgH0AwEiAAIRAQMRAf/EAB8AAAEFAQEBAQEBAAAAAAAAAAABAgMEBQYHCAkKC//EALUQAAIBAwMCBAMFBQQEAAABfQECAwAEEQUSITFBBhNRYQcicRQygZGhCCNCscEVUtHwJDNicoIJChYXGBkaJSYnKCkqNDU2Nzg5OkNERUZHSElKU1RVVldYWVpjZGVmZ2hpanN0dXZ3eHl6g4SFhoeIiYqSk5SVlpeYmZqio6Slpqeoqaqys7S1tre4ubrCw8TFxsfIycrS09TV1tfY2drh4uPk5ebn6Onq8fLz9PX29/j5+v/EAB8BAAMBAQEBAQEBAQEAAAAAAAABAgMEBQYHCAkKC//EALURAAIBAgQEAwQHBQQEAAECdwABAgMRBAUhMQYSQVEHYXETIjKBCBRCkaGxwQkjM1LwFWJy0QoWJDThJfEXGBkaJicoKSo1Njc4OTpDREVGR0hJSlNUVVZXWFlaY2RlZmdoaWpzdHV2d3h5eoKDhIWGh4iJipKTlJWWl5iZmqKjpKWmp6ipqrKztLW2t7i5usLDxMXGx8jJytLT1NXW19jZ2uLj5OXm5+jp6vLz9PX29/j5+v/aAAwDAQACEQMRAD8A50ClFApR1r9LPkxcU4UlLVCCnCkp1MBRSjigUuKYgFLRSihCYAU4cUUoqhAM06kpQKYhaUUAU7g0xCYpwoxS4piClFGKUc0CClAo47UtABSigClFMAFKM0Ype1ABiilx7UuMUCExRTqKAGinDpRQKAClxRil5oEJijFKOaWgLjQKKXgUUAJijFLilNAXG4owaXrRQFxuDQafSGkMZ60YpxFJQA3FIetPpMCgBtIadikxQMSk6mnYpDQA3BpKfSEUgG0mKdR2pANxiilopANIpKeaSgBuKKWkpWAbiinYooAyQKUCgUtZI3AUoFGKdVAA60uKTFPFNCClFAHFKPpTEAFKBRSimIUClxRS4pgAFOApAM04CmIKWlpaaEFLigUuKZIAUoGKAKdimAmOKdiilH0oAAKWjFKBQITFLilFLTEFGKXFLikAmOKKWlp2EJj2opaMUgEFLilxRQAYoox7UoFMBuKXFKBRigBMUEU7tSEdaQCYpMU6jvQA3FGMUtFADSKMUtGKAG4zSEU7FG2kMbikwM0/FJg5oAYRSEU/HakxQMbikIp1GKAuNxSYpxFFIY3GeKTFOopANNJT6QigBuKTHNOxSUhDeaKU0UWGZIpRSYpwFZpG4AUtFKBTEKtKKAKXGaBC9aUUDpSgUxAKcOlGPWlxVIGApcUU4CmIAKUUAUoHOaZNwH0pwpMZpcUwuKKWjFKKYgFOAoxSgUCCloxTsUBcRRTgKAMUoHNMQAZoFLjmjFAgpaUUmKYC4oxS4oxQFxKMU7FFIBAKUClxRjFFgE6UAe1LilxTAbS4pcUCgQnajFLijFIBuKMU7FIKBjaCKd1oNIBlFOPSkNACGkxTiKSgBMUh604ikNAxuKTFPpMUWEN60hFOxSUhjcUmKeaaeRQAlJiloIoGJRS4pCKQXExSHg06kPWkFxhzRTqKQjJANKKOaUVmbgBThRgUopoApRQBSimIXFKKBSimDFFKKBSimIByeacBSCnAU0IBxS0ClxzVIkBThQBS0IApcUopQM0xBS4oAp2M0xCAU7FGKXtQIAKdQBS0wExS0YpRRYAxQBS0oFAgoxS4oxQAgzS80oGKDSAAPWjFLRigBMUYNLilxii4CYoxRRQAlLilxRikA3FFOpKAExSECnYpDQA0ijFOpMUDuNxQRTiMUmKBCEUhFOppoGJSU4/SkxQAhFJilNFADSKQ9adSEUgGkGkxTqSgYhFJ1pTSUAJig0uKSkIbiil4FFKwzJp4poFOrI3FpQKSnAUxAKdSYpwGKYBS4oxSimIUUtApRTEKOKXFA5pcc1SQg70ooxShaaELinYpBjvSjmmSKKUUYpcUxABzTulAFLigBccUooxS4pgFLigClxTEAFFLjNLjFABjilAooxQAUYpcYpQKQCACjFLilxSAaKXFLigCgAxRilxRSASloxRigBKKXFFACGk607FIBmgBKSnYzSY5oASilxRQA0igilIpMUAJSEU7FJjmgBppMU7FHegBpApKcRTcUDuJ1NIadSHihgNxzSU6kPWkA00hpxpMUAJSGlxRSAbRRiigDLxSgUgFOFZG4uKUUUoFMAxTqTHNKKYhcUo5oGDSgUwAU4CgCnAUxMBS0UoFUSKBQKUYpQKaEAFOAoHFKBQIMU7FFKBxTEAGBTgKPalxTQgxThQOlLigAxSgUv1opgGMUuKMUuKQCAUuKXFGKQBigClpaLgJiilxRikAlFLil4oAQCilpaAG4op2KMUANNFOxSEGi4CEYpKf1pMUAN7UGlIoxQA3GaMU6kNADcUYp1JQA00hFPxTTQA3FJjmnUUANpCKdikoAZ0pDTjSHrQAlIeaXGaMUWGNNIadjikNIBtIRTqQ9aAG9KKD7CikIzKcopAKUVkjoFxSjpQOlLTEGKXrRilAxVAKBSgUgFOFAhRzTsUgpcE1QmKBxSgUUoFMQoGDSiilFMkXGadikAxTgKYgFOA4pKdTAMUuKKdimIBzTsUnalxSAUUYooFACil7UAZpRSABRijFKBSAAKUdaMUtACYFLigUuKLgJS4oFFIAxRilxUkFu077UwWxkLkAt7DPU+1TOaguaT0KjFydkRqpY4AzW9pPgrV9WAeO3MUR/wCWkvyj/wCvXRaSnh7QI0aQJc3f8TNhtp9AOlX5/iHbJMLeFUMrDKoW5IHfFeBic3qNuOHj82enRwEFrVfyRzkXh3TIL6XT0W+1m+t3RJ4rJAscRbs0jcDABJ/DuRW9efDa1uSVtWitCOjNcF8/8B2DH51C3ii8uNwQpApOcIMZqpLqU7fMJXJ7ktXlSx2JvzOpr/XyO5YajaygZfiHwHqGg2/2ovFcW4OC8Z+79a5jFdrf61L/AGHdxSOxWXagB9cg/wAga4sjmvpMrxNSvS5qnc8fG0Y06loDaDSkUV6ZyCUhFOxmkIzQA3FGKXFJQAh60nenYpCOaAG0h607FJQAlIR3pTmjtQAw0hFOxmkNADaSnYpKAG4pDzTqTFIY2jFKRSGgQlFGKKVgMsU4UgHNOFZm4ClFApaaABThSCnDpTABwadRS45oExRSikFOAqkSGM04UgFKKYhwpRyaQU4D2pkiinCminiqABS4oFOFMQYxThSYp1ABSiilxSYAOaXFFKBSEAFKKAKWkMAKUUUuKAEpaKKADpRTqTFIAFGKXp1xSWtzLLM8dsh3YALkdAepHpxn+nrWFevGlG7NaVJ1HZFe9naGMqmfOYEIAuSTj071paTa3is7zHZvULtXqcE4JP0PQcVZ07RRHI0rfvJmOXkbt9PQe1aTRsihYjhgQd3rXzWMzCVR2ex7WGwqgjJFlqE0imULaW6PnAO55MH9BVTTdEuLXUJLkPHDEWJ2INzyjnBd25/AV0jDzB61EcIpY15U8ZLVI7I4dOzZHy+OSNpyCDirAcnC/mapTSlxhQCO3fNTecbG28+Ztzn/AFa+p/wrnoxnXqKEN2a1JRpxcpFTXLvcUtlGBHy3+9/+qsmnyO0jlmJLE5JPem44r9BwtBUaSprofKVqrqTc31EpMU7FIRXQZCUUuKSgBP50lOopgNIpKdjimnrQAYppp1JQA00hFOpD+tADSMUlONIelADaQ0tIRQA00UtJSAQ009ad+FBoAbRRRQBmAUoFFKOtZG4tAFFKKaAUUoFApcc0wFFOFIKWmSxRxS0ClHPWqEKBThSYpaZLFUd6cKQelOFMQoFKOaMU4CmIBTqTFOxTAADS0UuKACnCkp1JsAApaMUoFSAAUo5oFKKAAUUtGKQBjmloxS0AJUsNu84YqMIgyzHoBUOcv5agmQrkADOPc+grYsxJcoI9myNQNqDv7n3rgxeNjRVludWHwzqavYwWs577d5ieVCgO4P0PcH6jAOenXrWx4ZVbtXlSMrbLn58ghmznp1H41txWESIPORWP9081OzbvQAdq+ZxONc73Pao4dRtYiOBwq7V9BVa4WR2UIcAHmrTrxkn8Kru+evAHavHqVLnfCA6WQJHhePWsHXNWmtoVFraSTgN+82csR7CtGV3fO3OTSQWENin2m+kODysY6v8AT/Gop051ZKEFdlTnCnHmm9CDS8tam7vEkgQdFYAE/wCyBVS9vHvJi7AKoGFUdFHpT76+e9k3EBEXhEHRRVXjFfcZXlscLHml8TPmcbjXXlZfCJSYpcYoxXr3OASilpOtMBtFOIpKAEpKWigBKQjmlNFADKDSkUhFMBDSdqU0nSgBp+lIeacRSEUANIpDTiKSgBtJTiOKbSASkxTj0puKAG4opcUUAZtLjmkFKOtZG4opaAKvaV9laYpcIHzwu48fpUVaqpwc2r2KhDnkolMUoFaYtNOvbme3tLiSGWDHmCVCY+fR8f4/Ws+FEub+SwgnglnjG4hZVwR7HOD1rClj6FRXUvvNZ4arB2aEpQKv/wDCP6oR8tjcOPVELfypjaNqMX37G5X6xMP6V0xrU3tJfeYOnJboqAYpwHentbTJ96KQfVSKQRsOqmtVJPZkNMB0pwFIFPpTgDjpTTJYCnAUgFOAqhC9qcBipbS0kvJRHHtHqzHCqPUntXM678Q/DOhay+kvcXVzJGQstxDEPKRvQZIJx34/OuevjKNFpVJWNaWHqVNYI6IU4Co4JYriJJoZFlikUMjqchgehFSV0RkpLmRk01oxQKUCgClAx1piAU6kHNLjmpAUUtFLQAYpcVIttI0MlwQqQRjLyyMERB7scAVBDNBcJ5lvcQXEeceZBKsik/VSRWftYc3LfUrklbmtoSAUuKKKpuwkrhSSQ3DyJFCBlvvHGSo6ZA9jirem6VLqcmyaJltz15KtwT3Hrx+fauksNKhiLbRgZ5J5J56V42NzNRvGmejhsE370zL03SZRF5bYaQjk9gcfyrXtLFLRSQ26Q/ec9PoBVsmOJSE6Dj61Xd2c9f8AAV8zWxDluezTpJERLF9x5PamTSMhwoyffpTpZPL+6M561Vkn9Dk/yrz51LnXGNh7SbARk5JzjOagIeVsKCSegp0UElySAcAcsxOAo9zVa81NIMxWTEno03Qn/d9PrXRg8BVxUrQWncxxGKhQjeW5PNcQ6Yu07Zrj+71VD7+p9qxp7iS5laSVy7HqTUZJPJor7fBYClhY2gte58zicXOu7y2CkxRRXccohFB6UtHemA2jml6UhpgGKQilpDTATFJTjTaAE70UtJQAhFJilpDTAQ0hpTSUAIeKQ0ppDQAlIRS0h60ANpKcaSgBtIRTiKSkA3FFLRQBmUopKUVkbijrThxTQKcBxVWAbfyXl1B5KXAjQ/eAXl/qayDo04zjYT65Oa2gOadXmVsnw1V8zVn5HXDH1oKyZhfYrmIfclz6q1OW81C1AEd7ex49GK/yNbgHNLgHqOK458PwfwTaN45pL7UUZMPizXYCAmtaivPTz3/xqynjXxDwTq0zj0kw/wDMVaa1gk+9Eh/CoX0m1f8AgK/Q1yTyHER+CdzaOZ0n8USQeNtcIJZ7OQf7dlE3/stIfiBqQyDY6PJ9bRV/kBVSTQI2yY5WX6gGsTXNGk0+0a4a5G3OAFBBJPYVyVcBjqKcnsvM3hicNUdlv6G/N8TpbcfPomiyH0COCfyaobf4oT6g0kVr4a0pJU+9IvmsF7YwWIJPYc154ys37syN5r/KAOoJr1zwn4VtvDWmRQjbJN/rJJW6liOa5oYustZTdvU2lQpvaKJvD1rqxsZJtaMCSXDZS2QYEa+57nH+cV474x8B6w/iGc2VnLdvM24xwjc+T329cHrntnBr2u6162gVxAyXUiYyqMPlHua56/1+2IfZaQyyvy0mxTj2yeTj1rKriZ1pdzSnTjTRe8ERab4X8LWOma/FdS6hGrM/2eVdsW5iQmcEEjPOD3x2reGueDsfMmqL/wADQ/0FeZXPiS4tSQplI7YU0C9ub9Va5mMUTdATjNbQzDFU0oqTSMpYWjN3sj07+2PBrDiXVB9BGf607+0vB5HF1qgP/XBD/wCzVwP7mztfMR4pF/u4BIqlNqtn96SKP/vkD+VV/a+K/nJ+oUf5T037d4Q/6COpL9bVf/i6DqHgxfvavfL9bQf/ABVeXx38Vyf3dsQn97JH6ZNVNRuYY1OyaYPjhd+RTWcYv+b8hf2fQ/lPVZtd8B24zJ4juEOOjWZ/oayrvxj4enltItGg1K6e4fagdQN+Op46ADvn/GvKvD+j3Xi7W3gcOLOFh5z55b2/GvbNL0O00wiSOIeYFCBsfdUdFHoPat45rXtecjN4Gleyicb8Z31K68NJaQSOsCsHaFAQpC5JHueVP/AT6VwfwXvp4/Fq2ckkq2E0bm5Kru2KqkhseoP8/evatZazvYXsGuAXGGLqRujxzu9q56AaXpyzwac0MIm4kkFuiGT2LKoJH1781wPGT9p7SL1Ov2EeTkex2BuvCKddVvmPta//AGVNj1PwUtwsrahqTBSCqiADGP8AgX1/OuHmjjU7nIKngFGzSLpqyYMToV+uK1nmmImrSkZQwdGLuononifxJpFnoMD6Hdu0spwAQAyIOOQM4/Ouf0T+1dVlEq3EoiB+aRgNv0HrVDRfDkmozkSgrbpwx9fYV3NrbraQJDCoRF4UDgAVzxrzSs2aulFu9iRmZAArkHGCB0zSPdsi/vAFXu69B9adLAvlENIyE/3etV5CZOG4X0rnnO5tCNh7zZ4U8etRnywvmStsQd+59gPWopzbafaNczkrGgzgms2yu4PEcdxNplzFcLbsVMaH5tv94Drj17iurL8NTr1UqsrIxxdadOF4K7J7zUnuB5MeY4B/CD19ye9U6CMUV99RowpRUKasj5OpUlUlzT3ExxS0UVqQFIKWigBtLRQelACUhpaQimAlBoxRTAQ02nUmKYCUmKWg0AJSGlpDzQA0ikIpxpMUwGmkpxFJQAhpKU0n4UAJSUpHFIeKAEpCKWgikA3FFBooAyxTsCkHpS1kjcUU6kFKKoQopRQKUUxBTh1pKWmhDhzS4pBS0xMcBiq95YW995f2hd4jOQueM+9WN1AGTzSnCM1yyV0EZOLujGm8JaRcsWNoFY85RiKYG1PVLmSw+0yrYQ/u94OGfHUE9TW+BgUqqBnAArgxGU0K1rxSt2Oqlj6tO9nc51fCPkKVtrlY1PJUJgH8qr3PhzUUUmN4X/4FiutFRXUTTRGJDjf8pb0Hf/PvWNXJMK02o/iXTzKumrs850zRp7yZ7iSNpGHIVRnj2q1LHIhxNC6Y4wwIxXfWlnFaJsiUD1Pc1MUVhggEe9efDh28bynZnVLNrSso6Hlt7LbwRMxjXPsBk1n2Vo80gnnHGeFya9D8RaMl+Ybe3tY97NuZwoGAPf8Az0p6eDNP8lFdpfMUcspxz9K4p5NX53Tg7pdTpWYUuVSlpc4ye4uY8RQSYduijoo9TxWXcFolInDHnmRH5P4Gu9bwOkIka3u33sc/vFzn8RXJXmg3L6s9rPhhGR9zkHNcWIwFegr1I6HRRxVOrpBm98PfENtpazobRlgfBVwOd3fP14roNT1+9v3X7Pem1hzzHGoJb6sRXG+RblRE6EKvTtg1Td545ljW4YpnlXbIP49f51wSj5nWmdzNOLlCrMoJ6FeATWeQWbG07hWZDqkduA9x+7DcB85Ufj2/HFXYpGu5ljs0M7HnCc/iT2qUmhbknznOVIWui0Hw7NqIWW5UxW45UdGf6egq/wCH/DPlBZbw+Y45CZ+Vf8a6VZEDbEYZFDdhpEttFHbRrFEgVQMBRUzTRw4LuATwB3qlJcCMEr8zemcUKfMQCVRzyR1qHIpIlaZS3O85Pp+tIiYkLu/yjmkUBh04rndZ1nzN9pZtvHR3z19h7Uoq4N2KvijU/wC1JDbwt+6T0/i96463S70G/F3YztCA2/5ODu9Qa1JsqwV9yFckHFZ2o6msEBDgk84DDrWqlbYztfc7bQvFOneLWNvK0dnqo4w3yRzn+jfofarstvJDcfZ5EKS7tu1uDmvDpNUkF2jpuaYtiONPvEn+Qr1bwlpus3Qt5tW1CZ4ocHy88sR0Geu1e3qfSvdwecTpQ5Z69jzcRlsKkuaOhP4/8SWHw+0eO4lhN/fzOFjhDFY1znlj1OMdBjr1rE8FfEG08ZLLF9mFnexDc0QYsrL6qTz6cHP1rT+Kvhb/AISfSllMhUxkYO3leynHfqRj39q5b4afDu58NahPquoXUJYRtFDDEGJYnqzZAwAO3XParweZVqtda3v0FXwVKFF6WsegUUUV9afPBSGlpMUAJQaWk60AIaSnEUmKYCU006kqgENJSnrRQA2ilpKBjaQ040lMQmKaadSUgG0GlNIRTAQ0hp1JSAbSGnYxSUANxRS4ooAyhSigUo61kjcUUveilAqhCilFIKUU0IXFKKSlqhDqM5pBmnqKBChaeBSUopiHUoHekxUkcZkbApSkoq8tgjFydkCqWzgE0vSr9jdtYXISGQiTbvIxkEZxz2/CtGXSrfWUMunKsN2Bl7XPD+6f/E/lXnwzSm58r0Xc6pYOajfqYA60opXRo2KOpVhwQR0pBXpXucYtBbPSkzTlFIAC5HNQ6Z4fhgaW/uZFUZLPMw4Xvge9XlEVqEkuckt9yJfvP7+w96mitZ9RmSScYC/ciX7sfX8zz1ryMfiqcbLdo9DCUJu/RMo3mj2etsEazEMK5AbGJXPHJP58Vy+sfDFrBjeW98JBnIhl4b8CK9MSFLddqYZ+57CqkmntfSZlbCnoO+K+XruNWTlI9uneEbI8ttfDF5q04tHtWEbcO7r8qj+tej6B4dtNGtEjiRVVQBkjmtlLSK3jCBQABjAps00QhKsnzfWvMnJLSJ1xTe4w3MZUqAQo/iqi93EjM/CA9WA5P5VWEN3dvIZpEjjBwigE59yajNrMJ0jmAdDyAgPP19Kwb7GiRoRt5rrLG+Ex6datHBBkdjHGo5J4A96bDCEj8yQgKg4HYVymv3Wt6u7W0Nt5FkP4S4zJ9ef0rpoYOtVV4xbRjUr04O0pJC+KPGKLC1vYTRlOjFXG5vp7Vx3/AAlcyExLHubOAF5/Op9V8Oar9nZ4oI8gf3xWTpHh25hhe6+zSTOD8xQZOa6Z4aUfccGmYxrRl73MrEt94hvIAPOlAP3thHyr9T61g6lrUl+25mROOAo6/hTdcuriKRleKRJTxhgQR7U3QtIeVzcTDaOvIrBxS33Nk7nUfDDwmLzUpdSuxl0wUVuwOef0r1XUNUsdDWNZ5xG7/cRQSzV41B4i1PQbwNayo8jDbkDBx7jkVonVp7uRbnU7nDOOE3Y3fj6VnKDb3LUkek3figrL8ojZBjCoc/mf8KuW91ZeIgZLCRkuRw1pMfm/4Af4h7dfrXmn9r2yD5W2+2eKrX2qpEgmG5XU7kcHaQfWurBYqWFnzwOfEUVXjyyPS3QoSrAhhwQaFQuQqgknsK4vQfihJK62+s27agGIWKSJgs/vz0YfX8673wtrNrftdXVlHdJDGSsc0qAZI6478dP8K+pjnVJ0+a2p4byypz2voQXccenzR295d2dtcyjKW81wiSuPZCcn8qjIwSCCCPWvAviZDqieLLm6vGldpSu2RiT91QpGfYjH5eteyeC5b668IaTc6iJBcSxH5pBy6hiFb8h+lVl+ZSxE+SSDF4FUoc8WbGKTFKaQ17J5gHpSHilopgNNIaU0UwGkc0nenUh60xiEUhFKaSgBDSEUtBoAaaMUUGgQhFIRS0ECgY0ikpaCaBDaQ06kNADcUUtFAGUKcKaKd2rI3FpcelIOlFUA8UCmg04UCFpQOlAFO71SQmKtPFNFOqkSxRSikGcU6mSKKntH2zAHo3FQCnA4ORWdWmqkHB9SoTcJKSNpYwT0qpqmrWmgW5vb26S1jQ/fZsHPt6n2FWonkmtC8ARpdp2hzgFvQn0rzTxR4KvvFWuR2Mt/Ld3oxJcyj5beyjPRFXux9z05718jJOEnF9D6CFpq56dofiLRviBZRvI/2W9cExTSAKZVyQC69QDjhvzqlqWl3WlXBguoijDp6EeoPcVHpPh600OAR28Y3kAPKQNz4GBnH8u1dHbaqZbQWV9bR3luv3d5w0f+63auzCY2dHR6x7f5HJXw0Z6rc5dVJOAM59KkeUW7+VGqzXeMhD92Merf4e1S6vNbRXkcGmb18448xm3FfXbwO3eren6UkEfORk5JPUmunGZmuW1Mzw+C1vIj03THklaaVmlkP35W7c9P/rVrqyouyIYHdu5pjPhBHGMKvQVHC7gtvABB+8O9fM18RzHs06Vicj5cDv1ptvIivghsj+LHFAO8fL09aa8qwqxYBVH8VefUqNnVGBLLfIj/ADAbV9RUQAuf9WN5PQ4zUYtkuFE903lWyng45Y+g9TUF1qTSYjtl8iEDAVTyfqe9dmAyuri3daR7nNi8dTw6tu+xcljSEfvJEjPoTz+Qqq99CowiFyO7cCqGc9eaUV9Nh8hw9PWfvM8SrmtaekdCSW4kmOWb6DsKj7UUCvZjCMFaKsjzpScneRFcwG5hMQbaG4Y+1LBbx20QiiUKo7CpM0hzmkqUebntqVzy5eW+hh+IdFbW2htwoWNTuaQjp7CpD4U0/wCyCBFePAxuU8n3raUAChwWRgpAYjgmuaeCozk5zjds1jiqkYqMXZI89h8GFdTl2s05ByC3HHaoPEFtPZWpE9kwXpjbkE9vavR4oUhXCj6nuahv7f7TbtEFU7uPm6V5FTI48jlf3vL8j0I5m+dK2h43b2g02GS8mUK55RD0z9Kx5769uAzSOXdunH9K9muvB2nXiw+em4p94929vpU58MaRlStjCrKMBlGDXJHIq7V20dLzSku5zvwz+HzG0GpaoG8yYcL0ITrj2zXqkMdrYwgbVhijX5R0UD2H0rMtdQktLVLdIVyi7Q5PHHTj1rBu11kzPL9qaYMeASPl+gx/jXnzy3F6+5sdSxtDT3jWvrfRbi+S7vZYTC+NqSQJKjsOjlWVvpuxVq+e4uiLmQiSIgKkiYKYHAAxxj2rjp4buQgPHKWByTzzWroyX1pysrQRNy0WcrJ9VPFd+Ve2oVLKnc5cf7OrC7nY0DRSuwZyQoXPYdBTa+wWx86woNFIaYCHpRQTRTAQ0nelpKY7iUGg0lAB2pDSmkPWgBtFKaSgANJQaKAuIaQ0ppDQISkNL+FFADaKSigDLzTgcUwU4Vibi5pRQBThVJAAHengc0lKKpCFpR1oxzS1RIopwqKSeKBcyyKg9zUP9rWI/wCXgfgp/wAKwqYujSdpySNIUKk/hVy6KXFUBrNn/wA9f0p41ey/57cf7prNZjhf+fiK+p1v5WXRS5qmNVsj/wAtx/3y3+FL/almf+Xgf98N/hT/ALRw386+8X1St/Kzc0qd8vChXewym7pmtbTdJh06IqmWaRi8sjfekc9WNclb6zZ28qSrcgFTn7jc/pW3e+PNHtrOWSKYyyqpKxlGXcfTOOK8HMqlKVTnhJO56eEhUUOWSNS6jVASSABySe1ZkjS3n7uI+XF3J7j1+lVtH1SbxPp9teykAOgcon3Qe9bMVujFVIxGDn6n+tcM68YLzOqNNyYzTtLt4E85vnlbkMRyB6D2q4zKrDOM9hRIVbCr0U5zSOol4QAuOlebVrtnXClYjcgN3A/nStG0p6YA7+lMiWQoPOYFgTnHb2qVsxIDLIIUx1b7x+grmjGdWXLBXZrKUYK8nYMJDGETJY/wgcmmziGzG+8O+X+GBT0/3vT+dVZdX8sFbNShPWVuXP09KzmZnJLEkmvo8Bw+21PE/d/meRis1+zR+8mubuW6YM54Awqjoo9BUVIKWvqoQjBcsVoeFKTk7sUUCijpTJFozikzS0DClAoHNLSAO1Hegc0UALSZopOtKwCE5pQMUYpeaYCd6SlooATAooopgBFJRzRQAnakNKaQ8UxCUUHrR3pgJSdDS8000xgaKKDQAlBoo7UANwaT6040nWgBuKKXGKTFAhKSlooATFNpxpKAG4ooOaKAMkCnqOKQCnDiskjcUDmnAUgpRVALinAU0U7FUiWL3pSMj04pKcO1MRnTaOsrF/Pk3HueajbRp0/1dwMehFa9FedVynC1HeUdfU64Y6tDRMxf7NukBGM/Qj+tMNndA8xn/vmt4GlxXFPh7Dv4W0bxzWqt0mc/5DKPnQD6oKb5cQPSP8UrowoIwR+dBtYn+9Gh/CuSfDb+xP8AA3jnC+1E5xkix92E/pXO6t9q1GY2GnQMWJw8i5KgfWvRk0PT503y4GDgqCf1q+JUtTElqsUcI4YKMNj27V4s8BWjUdOCcmj0Y4mm4KcnYs+GtITR9Hs7IZ/dxKrk92xz+taxCoR1P0rBuPEN5bR7bexSfH/LR25P4DFYF74r1h22lvs/siAfz5rKvha9P+KrF0q9OfwO53blYt0jusaD+JiAB+Jpj6laRDKS+ZuH/LMZz+P/AOuvNTqtxJJunleQ+rkmtKyvTnMLDB6xnof8KMIqCqL6wm0Ku6rj+63Osl1mQ5ECCL/a6t+f+FUmkeRizsWY9STmoLedbiPcoIwcEHqKlHWvvcJSw8YJ0EreR8vXnVcrVXqKKWgUV1GAopelJS5zzSAXtRTaUUALSgUgpelIBR04petJRSAWgnikzxSYz1oAXPNKBQAKOKACkPFLQaAE4opRQaAG0YpcUUAJSUtIe9MApOaWkoAQ0lOxSGmISkpaKYxuKKCKDTATFJS0EUAJSGlpCKAENIadSUANpKd1pKAG0nenUUCGYopaKAMoU4UUVkbiinUUVSAUD1pwoopoTFFKOvSiiqJFpcdKKKAFA5p4FFFNEscBinD1oopiHClFFFAhRSSQxyjDorD3FFFS4p6ME2tijPodrLkoDGfbkVmXWkS2WXSZSB9RRRXhZngcOqbmoK562CxNVz5XLQ1dGhYRG4dss4xj2rTHWiiu7LIRhhoqKOTGycqzuOoooruOUXNJRRSAcOtLRRSAWiiigAzR70UUAFOFFFIBaTHNFFJALijFFFAxBQaKKYhD7UtFFADaKKKYBjNJiiigApKKKAExSd6KKYCGkPWiimAUlFFMAIpKKKAE70GiigBMUmKKKAGkUh6UUUAJiiiigR//2Q=="
-    # download_sample_dataset(sample_dir, num_images=200)
-    
-    # Initialize the image similarity search system
-    search_system = ImageSimilaritySearch()
-    
-    # Index the database
-    print("Indexing the database...")
-    search_system.index_database(sample_dir, save_path="image_database.pkl", cache_path=cache_path)
-    
-    search_system.index_database(
-        sample_dir, 
-        save_path="image_database.pkl",
-        cache_path=cache_path
-    )
+    if engine is None:
+        from search_engine import get_engine
+        engine = get_engine()
+        engine.warmup()
 
-    # Test with a sample query image
-    results = search_system.search(query_img_path, top_k=5)
+    results = engine.search(query_img_path, top_k=top_k)
     
     # Print results
     print("\nSearch results:")
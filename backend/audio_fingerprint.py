@@ -0,0 +1,570 @@
+"""
+Landmark fingerprints of audio recordings, and the inverted hash index that
+matches them.
+
+A recording is mixed to mono, resampled to `sample_rate` and turned into a
+log-magnitude spectrogram by a vectorized STFT. Its spectral peaks are the
+points that are loudest in their time-frequency neighbourhood, at most
+`peaks_per_second` per second of audio. Each peak (the anchor) is paired with
+the next `fan_out` peaks in a target zone after it, and every pair becomes a
+24-bit hash stored with the anchor's frame:
+
+    anchor frequency bin (9 bits) | target frequency bin (9 bits) | frame delta (6 bits)
+
+Peaks survive noise, lossy compression and level changes, and a pair's hash
+does not depend on where in the recording it occurs, so a short clip shares
+many hashes with the track it was cut from. The clip's true position shows up
+as many matching hashes agreeing on one offset (track frame - clip frame),
+while chance matches spread over all offsets (OffsetVotes).
+
+HashIndex keeps the (hash, track, frame) postings sorted by hash, so matching
+a clip costs two binary searches per clip hash plus the postings that share
+its hashes, and never touches the rest of the catalog. New tracks go to a new
+sorted segment and segments are merged once there are too many, as in an LSM
+tree. The merged arrays are saved as-is and memory-mapped on load.
+"""
+import base64
+import threading
+import wave
+from io import BytesIO
+
+import numpy as np
+
+# Bits of the hash fields; frequency bins must be below 2 ** FREQ_BITS and
+# frame deltas below 2 ** DT_BITS
+FREQ_BITS = 9
+DT_BITS = 6
+
+# File extensions treated as audio when a database directory is scanned
+AUDIO_EXTENSIONS = ('.aac', '.aif', '.aiff', '.au', '.caf', '.flac', '.m4a', '.mp3', '.oga', '.ogg', '.opus',
+                    '.rf64', '.snd', '.w64', '.wav', '.wma')
+
+# Extensions of the soundfile (libsndfile) formats, by format name
+_SOUNDFILE_EXTENSIONS = {
+    'AIFF': ('.aif', '.aiff'),
+    'AU': ('.au', '.snd'),
+    'CAF': ('.caf',),
+    'FLAC': ('.flac',),
+    'MP3': ('.mp3',),
+    'OGG': ('.oga', '.ogg', '.opus'),
+    'RF64': ('.rf64',),
+    'W64': ('.w64',),
+    'WAV': ('.wav',),
+}
+
+
+def _read_wav(source):
+    """Decode a PCM WAV file; returns (mono float32 samples in [-1, 1], sample rate)."""
+    with wave.open(source, 'rb') as f:
+        channels, width, rate = f.getnchannels(), f.getsampwidth(), f.getframerate()
+        raw = f.readframes(f.getnframes())
+    if width == 1:
+        samples = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128) / 128
+    elif width == 2:
+        samples = np.frombuffer(raw, dtype='<i2').astype(np.float32) / (1 << 15)
+    elif width == 3:
+        packed = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        # Assemble in the top three bytes, then shift back down to sign-extend
+        ints = ((packed[:, 0] << 8) | (packed[:, 1] << 16) | (packed[:, 2] << 24)) >> 8
+        samples = ints.astype(np.float32) / (1 << 23)
+    elif width == 4:
+        samples = np.frombuffer(raw, dtype='<i4').astype(np.float32) / (1 << 31)
+    else:
+        raise ValueError(f"Unsupported WAV sample width: {width} bytes")
+    if channels > 1:
+        samples = samples[:len(samples) // channels * channels].reshape(-1, channels).mean(axis=1)
+    return samples, rate
+
+
+def _read_soundfile(source):
+    """Decode any format libsndfile reads (FLAC, OGG, MP3, float WAV, ...)."""
+    try:
+        import soundfile
+    except (ImportError, OSError) as e:
+        raise ValueError("Only PCM WAV audio is supported without the soundfile package "
+                         "(pip install soundfile)") from e
+    samples, rate = soundfile.read(source, dtype='float32', always_2d=True)
+    return samples.mean(axis=1), rate
+
+
+def decodable_extensions():
+    """
+    File extensions load_audio can decode in this environment: PCM WAV, plus
+    every format libsndfile reads when the soundfile package is installed.
+
+    Returns:
+        tuple: Lower-case extensions with the leading dot.
+    """
+    extensions = {'.wav'}
+    try:
+        import soundfile
+    except (ImportError, OSError):
+        # OSError: the package is installed but libsndfile is not
+        return tuple(sorted(extensions))
+    for name in soundfile.available_formats():
+        extensions.update(_SOUNDFILE_EXTENSIONS.get(name, ()))
+    return tuple(sorted(extensions))
+
+
+def resample(samples, rate, target_rate):
+    """
+    Resample mono audio. Downsampling averages over the source samples of each
+    target sample first, a cheap anti-aliasing filter that is good enough for
+    spectral peaks.
+
+    Args:
+        samples (numpy.ndarray): Mono samples.
+        rate (int): Their sample rate.
+        target_rate (int): Sample rate wanted.
+
+    Returns:
+        numpy.ndarray: float32 samples at target_rate.
+    """
+    samples = np.asarray(samples, dtype=np.float32)
+    if rate == target_rate or len(samples) == 0:
+        return samples
+    if rate % target_rate == 0:
+        factor = rate // target_rate
+        return samples[:len(samples) // factor * factor].reshape(-1, factor).mean(axis=1)
+    if rate > target_rate:
+        width = int(round(rate / target_rate))
+        cumulative = np.concatenate([[0.0], np.cumsum(samples, dtype=np.float64)])
+        smoothed = (cumulative[width:] - cumulative[:-width]) / width
+        samples = np.concatenate([smoothed, np.full(width - 1, smoothed[-1])]).astype(np.float32)
+    n_out = int(len(samples) * target_rate / rate)
+    positions = np.arange(n_out) * (rate / target_rate)
+    return np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+
+
+def load_audio(data, sample_rate=11025):
+    """
+    Decode a recording to mono float32 samples.
+
+    Args:
+        data (str, bytes or numpy.ndarray): File path, base64 data URL, raw
+            file bytes, or samples already at sample_rate. PCM WAV is read
+            with the standard library; other formats need the optional
+            soundfile package.
+        sample_rate (int): Sample rate of the result.
+
+    Returns:
+        numpy.ndarray: Samples in [-1, 1].
+    """
+    if isinstance(data, np.ndarray):
+        return np.asarray(data, dtype=np.float32)
+    if isinstance(data, str) and data.startswith('data:'):
+        data = base64.b64decode(data.split(',', 1)[1])
+    if isinstance(data, (bytes, bytearray)):
+        data = BytesIO(data)
+    try:
+        samples, rate = _read_wav(data)
+    except (wave.Error, EOFError):
+        if hasattr(data, 'seek'):
+            data.seek(0)
+        samples, rate = _read_soundfile(data)
+    return resample(samples, rate, sample_rate)
+
+
+def _max_filter(values, radius, axis):
+    """Maximum over a window of 2 * radius + 1 along one axis (edges use what is there)."""
+    result = values.copy()
+    source = np.moveaxis(values, axis, 0)
+    target = np.moveaxis(result, axis, 0)
+    for shift in range(1, radius + 1):
+        np.maximum(target[shift:], source[:-shift], out=target[shift:])
+        np.maximum(target[:-shift], source[shift:], out=target[:-shift])
+    return result
+
+
+class Fingerprinter:
+    """Spectral peak-pair (landmark) fingerprints of mono audio."""
+
+    name = "landmarks"
+
+    def __init__(self, sample_rate=11025, n_fft=1024, hop_length=256, peak_radius=(7, 10),
+                 peaks_per_second=30, fan_out=10, max_dt=63, max_df=96, dynamic_range_db=60.0,
+                 min_db=-30.0, min_prominence_db=15.0):
+        """
+        Args:
+            sample_rate (int): Audio is resampled to this rate first.
+            n_fft (int): STFT window length; frequency bins are n_fft / 2.
+            hop_length (int): Samples between STFT frames.
+            peak_radius (tuple): (frames, bins) a peak must dominate on each side.
+            peaks_per_second (int): Strongest peaks kept per second of audio.
+            fan_out (int): Later peaks each anchor is paired with.
+            max_dt (int): Largest anchor-target distance in frames.
+            max_df (int): Largest anchor-target distance in frequency bins.
+            dynamic_range_db (float): Peaks quieter than the loudest point of
+                the recording minus this are ignored.
+            min_db (float): Peaks below this level are ignored (silence).
+            min_prominence_db (float): How far a peak must rise above the
+                median level of its frame.
+        """
+        if n_fft // 2 > 1 << FREQ_BITS:
+            raise ValueError(f"n_fft must be at most {2 << FREQ_BITS}")
+        if not 1 <= max_dt < 1 << DT_BITS:
+            raise ValueError(f"max_dt must be between 1 and {(1 << DT_BITS) - 1}")
+        self.sample_rate = int(sample_rate)
+        self.n_fft = int(n_fft)
+        self.hop_length = int(hop_length)
+        self.peak_radius = tuple(int(r) for r in peak_radius)
+        self.peaks_per_second = int(peaks_per_second)
+        self.fan_out = int(fan_out)
+        self.max_dt = int(max_dt)
+        self.max_df = int(max_df)
+        self.dynamic_range_db = float(dynamic_range_db)
+        self.min_db = float(min_db)
+        self.min_prominence_db = float(min_prominence_db)
+        self._window = np.hanning(self.n_fft).astype(np.float32)
+
+    def params(self):
+        """Settings that fingerprints depend on; stores built with others are not comparable."""
+        return {
+            'name': self.name,
+            'sample_rate': self.sample_rate,
+            'n_fft': self.n_fft,
+            'hop_length': self.hop_length,
+            'peak_radius': list(self.peak_radius),
+            'peaks_per_second': self.peaks_per_second,
+            'fan_out': self.fan_out,
+            'max_dt': self.max_dt,
+            'max_df': self.max_df,
+            'dynamic_range_db': self.dynamic_range_db,
+            'min_db': self.min_db,
+            'min_prominence_db': self.min_prominence_db,
+        }
+
+    @property
+    def frame_seconds(self):
+        """Duration of one STFT hop."""
+        return self.hop_length / self.sample_rate
+
+    def spectrogram(self, samples, block_frames=2048):
+        """
+        Log-magnitude STFT.
+
+        Args:
+            samples (numpy.ndarray): Mono samples at sample_rate.
+            block_frames (int): Frames transformed at a time, to bound memory.
+
+        Returns:
+            numpy.ndarray: (frames, n_fft / 2) float32 magnitudes in dB,
+                without the Nyquist bin.
+        """
+        samples = np.asarray(samples, dtype=np.float32)
+        if len(samples) < self.n_fft:
+            samples = np.pad(samples, (0, self.n_fft - len(samples)))
+        # Overlapping frames as a strided view; nothing is copied until windowed
+        frames = np.lib.stride_tricks.sliding_window_view(samples, self.n_fft)[::self.hop_length]
+        n_bins = self.n_fft // 2
+        spectrogram = np.empty((len(frames), n_bins), dtype=np.float32)
+        for start in range(0, len(frames), block_frames):
+            block = frames[start:start + block_frames] * self._window
+            magnitude = np.abs(np.fft.rfft(block, axis=1)[:, :n_bins])
+            spectrogram[start:start + len(block)] = 20 * np.log10(magnitude + 1e-6)
+        return spectrogram
+
+    def find_peaks(self, spectrogram):
+        """
+        Local maxima of a spectrogram, thinned to the strongest
+        peaks_per_second in every second.
+
+        Returns:
+            tuple: (frames, bins) of the peaks as int32 arrays, in time order.
+        """
+        if spectrogram.size == 0:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int32)
+        radius_t, radius_f = self.peak_radius
+        neighbourhood = _max_filter(_max_filter(spectrogram, radius_t, axis=0), radius_f, axis=1)
+        floor = max(float(spectrogram.max()) - self.dynamic_range_db, self.min_db)
+        # Noise peaks rise a few dB above the noise floor (the frame median); content stands out
+        prominent = spectrogram > np.median(spectrogram, axis=1, keepdims=True) + self.min_prominence_db
+        is_peak = (spectrogram == neighbourhood) & (spectrogram > floor) & prominent
+        # The DC bin carries offsets, not content
+        is_peak[:, 0] = False
+        frames, bins = np.nonzero(is_peak)
+        values = spectrogram[frames, bins]
+
+        # Rank peaks within each second by strength and keep the strongest
+        second = frames // max(int(round(1 / self.frame_seconds)), 1)
+        order = np.lexsort((-values, second))
+        by_second = second[order]
+        rank = np.arange(len(order)) - np.searchsorted(by_second, by_second, side='left')
+        keep = np.sort(order[rank < self.peaks_per_second])
+        return frames[keep].astype(np.int32), bins[keep].astype(np.int32)
+
+    def hash_peaks(self, frames, bins):
+        """
+        Pair every peak with the next fan_out peaks in its target zone.
+
+        Args:
+            frames (numpy.ndarray): Peak frames, in time order.
+            bins (numpy.ndarray): Peak frequency bins.
+
+        Returns:
+            tuple: (hashes uint32, anchor frames int32)
+        """
+        hashes = []
+        anchors = []
+        for step in range(1, min(self.fan_out, len(frames) - 1) + 1):
+            dt = frames[step:] - frames[:-step]
+            df = bins[step:] - bins[:-step]
+            pairs = np.flatnonzero((dt >= 1) & (dt <= self.max_dt) & (np.abs(df) <= self.max_df))
+            hashes.append(
+                (bins[pairs].astype(np.uint32) << (FREQ_BITS + DT_BITS))
+                | (bins[pairs + step].astype(np.uint32) << DT_BITS)
+                | dt[pairs].astype(np.uint32)
+            )
+            anchors.append(frames[pairs])
+        if not hashes:
+            return np.empty(0, dtype=np.uint32), np.empty(0, dtype=np.int32)
+        return np.concatenate(hashes), np.concatenate(anchors).astype(np.int32)
+
+    def fingerprint(self, samples):
+        """
+        Hashes of a recording.
+
+        Args:
+            samples (numpy.ndarray): Mono samples at sample_rate.
+
+        Returns:
+            tuple: (hashes uint32, anchor frames int32)
+        """
+        return self.hash_peaks(*self.find_peaks(self.spectrogram(samples)))
+
+
+class HashIndex:
+    """
+    Inverted index from landmark hash to (track row, frame) postings.
+
+    Like VectorIndex rows, track rows are never reused: removing a track marks
+    its row dead and its postings are dropped at the next merge.
+    """
+
+    def __init__(self, max_segments=8, max_postings_per_hash=None):
+        """
+        Args:
+            max_segments (int): Sorted segments kept before they are merged
+                into one; lookups binary-search every segment.
+            max_postings_per_hash (int, optional): Hashes with more postings
+                than this in a segment are skipped at lookup, like stop
+                words: they match too many tracks to tell them apart.
+        """
+        self.max_segments = max(int(max_segments), 1)
+        self.max_postings_per_hash = max_postings_per_hash
+        # (hashes, tracks, frames) per segment, each sorted by hash
+        self._segments = []
+        self._alive = np.zeros(0, dtype=bool)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _sorted(hashes, tracks, frames):
+        order = np.argsort(hashes, kind='stable')
+        return (np.asarray(hashes, dtype=np.uint32)[order], np.asarray(tracks, dtype=np.int32)[order],
+                np.asarray(frames, dtype=np.int32)[order])
+
+    def fit(self, hashes, tracks, frames, n_tracks, alive=None, presorted=False):
+        """
+        Replace all postings.
+
+        Args:
+            hashes (numpy.ndarray): Posting hashes. Arrays sorted by hash (e.g.
+                memory-mapped from a store) are used as-is with presorted.
+            tracks (numpy.ndarray): Track row of every posting.
+            frames (numpy.ndarray): Anchor frame of every posting.
+            n_tracks (int): Number of track rows.
+            alive (numpy.ndarray, optional): Boolean mask of live track rows.
+            presorted (bool): The postings are already sorted by hash.
+        """
+        segment = (hashes, tracks, frames) if presorted else self._sorted(hashes, tracks, frames)
+        alive = np.ones(n_tracks, dtype=bool) if alive is None else np.asarray(alive, dtype=bool).copy()
+        with self._lock:
+            self._segments = [segment] if len(segment[0]) else []
+            self._alive = alive
+        return self
+
+    def add(self, hashes, tracks, frames, n_tracks):
+        """
+        Add postings of new track rows as a new segment.
+
+        Args:
+            hashes, tracks, frames (numpy.ndarray): The postings.
+            n_tracks (int): Number of track rows after the new ones.
+        """
+        segment = self._sorted(hashes, tracks, frames)
+        with self._lock:
+            alive = np.ones(n_tracks, dtype=bool)
+            alive[:len(self._alive)] = self._alive
+            segments = self._segments + ([segment] if len(segment[0]) else [])
+            if len(segments) > self.max_segments:
+                segments = [self._merge(segments, alive)]
+            # Readers snapshot the list; it is replaced, never mutated
+            self._alive = alive
+            self._segments = segments
+
+    def remove_tracks(self, rows):
+        """Drop the postings of the given track rows."""
+        if len(rows) == 0:
+            return
+        with self._lock:
+            alive = self._alive.copy()
+            alive[np.asarray(rows, dtype=np.int64)] = False
+            self._alive = alive
+
+    @staticmethod
+    def _merge(segments, alive):
+        hashes = np.concatenate([s[0] for s in segments])
+        tracks = np.concatenate([s[1] for s in segments])
+        frames = np.concatenate([s[2] for s in segments])
+        live = alive[tracks]
+        return HashIndex._sorted(hashes[live], tracks[live], frames[live])
+
+    def postings(self):
+        """All live postings merged into one (hashes, tracks, frames) segment sorted by hash."""
+        with self._lock:
+            segments, alive = self._segments, self._alive
+        if not segments:
+            return np.empty(0, np.uint32), np.empty(0, np.int32), np.empty(0, np.int32)
+        return self._merge(segments, alive)
+
+    def track_postings(self, rows):
+        """
+        Postings of some track rows, gathered in one pass over the segments.
+
+        Args:
+            rows (list): Track rows.
+
+        Returns:
+            list: (hashes, frames) of each row, in the order of rows.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        with self._lock:
+            segments, n_tracks = self._segments, len(self._alive)
+        wanted = np.zeros(n_tracks, dtype=bool)
+        wanted[rows] = True
+        hashes, tracks, frames = [np.empty(0, np.uint32)], [np.empty(0, np.int32)], [np.empty(0, np.int32)]
+        for segment_hashes, segment_tracks, segment_frames in segments:
+            mine = wanted[segment_tracks]
+            hashes.append(segment_hashes[mine])
+            tracks.append(segment_tracks[mine])
+            frames.append(segment_frames[mine])
+        hashes, tracks, frames = np.concatenate(hashes), np.concatenate(tracks), np.concatenate(frames)
+        # Only the picked postings are sorted, by track, then sliced per row
+        order = np.argsort(tracks, kind='stable')
+        hashes, tracks, frames = hashes[order], tracks[order], frames[order]
+        starts = np.searchsorted(tracks, rows, side='left')
+        stops = np.searchsorted(tracks, rows, side='right')
+        return [(hashes[start:stop], frames[start:stop]) for start, stop in zip(starts, stops)]
+
+    def lookup(self, hashes, allowed=None):
+        """
+        Postings of live tracks that share a hash with the query.
+
+        Args:
+            hashes (numpy.ndarray): Query hashes.
+            allowed (numpy.ndarray, optional): Boolean mask over track rows;
+                other tracks are ignored.
+
+        Returns:
+            tuple: (query positions, track rows, frames) of every matching
+                posting; query positions index `hashes`.
+        """
+        hashes = np.asarray(hashes, dtype=np.uint32)
+        # Snapshot: add() and remove_tracks() replace these, never mutate them
+        segments, alive = self._segments, self._alive
+        if allowed is not None:
+            allowed = np.asarray(allowed, dtype=bool)
+            mask = np.zeros(len(alive), dtype=bool)
+            n = min(len(alive), len(allowed))
+            mask[:n] = alive[:n] & allowed[:n]
+            alive = mask
+        positions, tracks, frames = [], [], []
+        for segment_hashes, segment_tracks, segment_frames in segments:
+            starts = np.searchsorted(segment_hashes, hashes, side='left')
+            counts = np.searchsorted(segment_hashes, hashes, side='right') - starts
+            if self.max_postings_per_hash is not None:
+                counts[counts > self.max_postings_per_hash] = 0
+            total = int(counts.sum())
+            if total == 0:
+                continue
+            # Expand the [start, start + count) ranges into posting ids
+            offsets = np.cumsum(counts) - counts
+            ids = np.repeat(starts - offsets, counts) + np.arange(total)
+            owners = np.asarray(segment_tracks[ids])
+            live = alive[owners]
+            positions.append(np.repeat(np.arange(len(hashes)), counts)[live])
+            tracks.append(owners[live])
+            frames.append(np.asarray(segment_frames[ids])[live])
+        if not positions:
+            empty = np.empty(0, dtype=np.int32)
+            return np.empty(0, dtype=np.int64), empty, empty
+        return np.concatenate(positions), np.concatenate(tracks), np.concatenate(frames)
+
+    @property
+    def n_postings(self):
+        """Stored postings, including those of removed tracks not yet merged away."""
+        return sum(len(s[0]) for s in self._segments)
+
+    @property
+    def nbytes(self):
+        """Memory of the postings (a memmap counts in full)."""
+        return sum(s[0].nbytes + s[1].nbytes + s[2].nbytes for s in self._segments)
+
+    def stats(self):
+        """Posting and segment counts, for health checks."""
+        return {
+            'tracks': int(self._alive.sum()),
+            'postings': self.n_postings,
+            'segments': len(self._segments),
+            'nbytes': self.nbytes,
+        }
+
+
+class OffsetVotes:
+    """
+    Offset histogram of one query, filled batch by batch, so a clip that is
+    still streaming in can be matched with whatever has arrived so far.
+    """
+
+    def __init__(self):
+        self._keys = []
+        self.n_hashes = 0
+
+    def add(self, query_frames, n_hashes, tracks, frames):
+        """
+        Count the matches of one batch of query hashes.
+
+        Args:
+            query_frames (numpy.ndarray): Query frame of every match.
+            n_hashes (int): Query hashes in the batch, matched or not.
+            tracks (numpy.ndarray): Track row of every match.
+            frames (numpy.ndarray): Track frame of every match.
+        """
+        self.n_hashes += n_hashes
+        if len(tracks) == 0:
+            return
+        offsets = np.asarray(frames, dtype=np.int64) - np.asarray(query_frames, dtype=np.int64)
+        self._keys.append((np.asarray(tracks, dtype=np.int64) << 32) | (offsets + (1 << 31)))
+
+    def top(self, k, min_votes=1):
+        """
+        Best offset of the k tracks with the most agreeing matches.
+
+        Matches at adjacent offsets are counted together, since the STFT grid
+        of a clip falls up to half a hop off the grid of its track.
+
+        Returns:
+            list: (votes, track row, offset in frames) tuples, most votes first.
+        """
+        if not self._keys:
+            return []
+        keys, counts = np.unique(np.concatenate(self._keys), return_counts=True)
+        # keys are sorted, so the neighbouring offset of a key is found by binary search
+        neighbour = np.minimum(np.searchsorted(keys, keys + 1), len(keys) - 1)
+        votes = counts + np.where(keys[neighbour] == keys + 1, counts[neighbour], 0)
+        tracks = keys >> 32
+        order = np.lexsort((-votes, tracks))
+        first = order[np.flatnonzero(np.r_[True, tracks[order][1:] != tracks[order][:-1]])]
+        first = first[votes[first] >= min_votes]
+        best = first[np.argsort(-votes[first], kind='stable')[:k]]
+        return [(int(votes[i]), int(tracks[i]), int((keys[i] & 0xFFFFFFFF) - (1 << 31))) for i in best]
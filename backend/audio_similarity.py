@@ -0,0 +1,536 @@
+"""
+Audio similarity search: finds the indexed tracks that a recording or a short
+clip was taken from, and where in each track it starts.
+
+Works like ImageSimilaritySearch on a directory of audio files with an
+optional metadata.jsonl. Tracks are fingerprinted on the decode pool, and
+the index lives in a versioned feature store that is kept in sync by
+modification time, size and SHA-1. Searches take the same metadata filters
+and go through the same query cache. See audio_fingerprint.py for the
+fingerprints and the hash index.
+
+The feature store has one row per track: its duration in seconds and its
+hash count. The postings of all tracks are stored with the rows as the named
+arrays 'hashes', 'tracks' and 'frames'. They are sorted by hash, so opening a
+store memory-maps the index without sorting anything.
+"""
+import glob
+import os
+
+import numpy as np
+
+import metrics
+from audio_fingerprint import AUDIO_EXTENSIONS, Fingerprinter, HashIndex, OffsetVotes, decodable_extensions, load_audio
+from feature_store import FeatureStoreWriter, content_hash, file_signature, load_feature_store, store_exists
+from metadata import MetadataTable, filter_key, read_metadata_file
+from nn_index import append_rows, validate_k
+from pipeline import iter_decoded_batches
+from query_cache import CachedQuery, content_key
+
+# Per-track row of the feature store
+TRACK_COLUMNS = ('duration_seconds', 'hashes')
+
+
+class AudioSimilaritySearch:
+    def __init__(self, fingerprint_params=None, index_params=None, min_votes=5, decode_workers=None,
+                 prefetch_batches=2, query_cache=None, metadata_schema=None):
+        """
+        Initialize the audio similarity search system.
+
+        Args:
+            fingerprint_params (dict, optional): Fingerprinter options, e.g.
+                {'peaks_per_second': 40}. Stores built with other options are
+                rebuilt.
+            index_params (dict, optional): HashIndex options, e.g.
+                {'max_postings_per_hash': 5000}.
+            min_votes (int): Hashes that must agree on one offset for a track
+                to be reported.
+            decode_workers (int, optional): Threads decoding and fingerprinting
+                tracks while indexing. Defaults to min(8, CPU count).
+            prefetch_batches (int): Fingerprinted batches buffered ahead of
+                the indexer.
+            query_cache (QueryCache, optional): Cache of query fingerprints and
+                results in front of search().
+            metadata_schema (dict, optional): Types of metadata fields beyond
+                metadata.DEFAULT_SCHEMA.
+        """
+        self.fingerprinter = Fingerprinter(**(fingerprint_params or {}))
+        self.index_params = dict(index_params or {})
+        self.index = HashIndex(**self.index_params)
+        self.min_votes = min_votes
+        self.decode_workers = decode_workers
+        self.prefetch_batches = prefetch_batches
+        self.query_cache = query_cache
+        self.metadata_schema = metadata_schema
+        # One (duration, hash count) row per track row; removed tracks keep their row
+        self.track_info = np.empty((0, len(TRACK_COLUMNS)), dtype=np.float32)
+        self.database_paths = []
+        self.metadata = MetadataTable(metadata_schema)
+        # Bumped on every index change; cached results of older versions are discarded
+        self.index_version = 0
+        # path -> {'mtime', 'size', 'sha1', 'row', 'metadata'} for every live indexed track
+        self.manifest = {}
+        self._info_buffer = self.track_info
+
+    def _load_audio(self, audio_data):
+        """
+        Decode a query or database recording.
+
+        Args:
+            audio_data (str, bytes or numpy.ndarray): File path, base64 data
+                URL, raw file bytes, or mono samples at the fingerprint rate.
+
+        Returns:
+            numpy.ndarray: Mono float32 samples.
+        """
+        try:
+            with metrics.stage('audio_decode'):
+                return load_audio(audio_data, self.fingerprinter.sample_rate)
+        except Exception as e:
+            raise ValueError(f"Error processing audio: {str(e)}")
+
+    def fingerprint(self, audio_data):
+        """
+        Fingerprint a recording.
+
+        Returns:
+            tuple: (hashes, anchor frames, duration in seconds)
+        """
+        samples = self._load_audio(audio_data)
+        with metrics.stage('fingerprint'):
+            hashes, frames = self.fingerprinter.fingerprint(samples)
+        return hashes, frames, len(samples) / self.fingerprinter.sample_rate
+
+    @staticmethod
+    def _scan_database_dir(database_dir, pattern=None):
+        """
+        List the audio files of a database directory.
+
+        Without a pattern, every file with an extension load_audio can decode
+        is listed.
+
+        Raises:
+            ValueError: If there is no pattern and the directory also holds
+                audio files that cannot be decoded here (e.g. MP3 without the
+                soundfile package), instead of leaving them out silently.
+        """
+        if pattern is not None:
+            return sorted(glob.glob(os.path.join(database_dir, pattern)))
+        decodable = decodable_extensions()
+        paths, undecodable = [], []
+        for path in glob.glob(os.path.join(database_dir, '*')):
+            extension = os.path.splitext(path)[1].lower()
+            if extension in decodable:
+                paths.append(path)
+            elif extension in AUDIO_EXTENSIONS:
+                undecodable.append(path)
+        if undecodable:
+            raise ValueError(
+                f"{len(undecodable)} audio files in {database_dir} cannot be decoded here, e.g. "
+                f"{os.path.basename(undecodable[0])} (readable: {', '.join(decodable)}). Install "
+                f"soundfile (pip install soundfile) or pass a pattern that leaves them out."
+            )
+        return sorted(paths)
+
+    def _fingerprint_for_index(self, path):
+        """
+        Read, hash and fingerprint one database track (runs on a decode thread).
+
+        Returns:
+            tuple: (None, (file signature with SHA-1, fingerprint)); there is
+                no model input, so every track is a "skipped" item of its batch.
+        """
+        signature = file_signature(path)
+        signature['sha1'] = content_hash(path)
+        return None, (signature, self.fingerprint(path))
+
+    def _fingerprint_paths(self, paths, batch_size=32):
+        """
+        Fingerprint audio files on the decode pool.
+
+        Returns:
+            tuple: (paths that could be processed, {path: signature},
+                [(hashes, frames, duration)] in the same order)
+        """
+        valid_paths, signatures, fingerprints = [], {}, []
+        batches = iter_decoded_batches(
+            paths, self._fingerprint_for_index,
+            batch_size=batch_size,
+            workers=self.decode_workers,
+            prefetch=self.prefetch_batches,
+        )
+        for batch in batches:
+            for path, e in batch.errors:
+                print(f"Error processing {path}: {e}")
+            for path, (signature, fingerprint) in batch.skipped:
+                valid_paths.append(path)
+                signatures[path] = signature
+                fingerprints.append(fingerprint)
+        return valid_paths, signatures, fingerprints
+
+    def index_database(self, database_dir, pattern=None, batch_size=32, cache_path=None):
+        """
+        Index all audio files in a directory.
+
+        When a cache exists it is loaded and brought up to date with
+        sync_database(), so only new or changed tracks are fingerprinted.
+
+        Args:
+            database_dir (str): Directory containing audio files.
+            pattern (str, optional): Glob pattern of the audio files; default
+                every file of a format that can be decoded (see _scan_database_dir).
+            batch_size (int): Tracks per decode batch.
+            cache_path (str, optional): Feature store directory.
+
+        Returns:
+            list: Indexed paths (None for removed rows).
+        """
+        if cache_path and store_exists(cache_path):
+            print("Loading audio fingerprints from cache...")
+            try:
+                self.load_features_cache(cache_path)
+            except ValueError as e:
+                print(f"Ignoring audio fingerprint cache: {e}")
+            else:
+                self.sync_database(database_dir, pattern=pattern, batch_size=batch_size, cache_path=cache_path)
+                return self.database_paths
+
+        paths = self._scan_database_dir(database_dir, pattern)
+        print(f"Found {len(paths)} audio files in database directory.")
+        if len(paths) == 0:
+            raise ValueError(f"No audio files found in {database_dir}"
+                             + (f" with pattern {pattern}" if pattern else ""))
+
+        self._reset()
+        self.add_tracks(paths, batch_size, metadata=read_metadata_file(database_dir))
+        if cache_path:
+            self.save_features_cache(cache_path)
+        return self.database_paths
+
+    def sync_database(self, database_dir, pattern=None, batch_size=32, cache_path=None):
+        """
+        Bring the index up to date with a database directory, fingerprinting
+        only new or changed tracks.
+
+        Args:
+            database_dir (str): Directory containing audio files.
+            pattern (str, optional): Glob pattern of the audio files; default
+                every file of a format that can be decoded (see _scan_database_dir).
+            batch_size (int): Tracks per decode batch.
+            cache_path (str, optional): Cache to rewrite if anything changed.
+
+        Returns:
+            dict: Counts of added, updated, removed, relabeled (metadata
+                changed), unchanged and failed (could not be read) tracks.
+        """
+        paths = self._scan_database_dir(database_dir, pattern)
+        metadata = read_metadata_file(database_dir)
+        current = set(paths)
+        removed = [path for path in self.manifest if path not in current]
+
+        to_fingerprint = []
+        relabel = {}
+        unchanged = 0
+        for path in paths:
+            try:
+                signature = file_signature(path)
+            except OSError:
+                continue
+            entry = self.manifest.get(path)
+            if entry and entry['mtime'] == signature['mtime'] and entry['size'] == signature['size']:
+                unchanged += 1
+            elif entry and entry['sha1'] == content_hash(path):
+                # Touched but not modified
+                entry.update(signature)
+                unchanged += 1
+            else:
+                to_fingerprint.append(path)
+                continue
+            if entry.get('metadata') != metadata.get(path):
+                relabel[path] = metadata.get(path)
+
+        indexed = {path for path in to_fingerprint if path in self.manifest}
+        self.remove_tracks(removed)
+        self.update_metadata(relabel)
+        added = self.add_tracks(to_fingerprint, batch_size, metadata=metadata)
+        updated = sum(1 for path in added if path in indexed)
+
+        summary = {
+            'added': len(added) - updated,
+            'updated': updated,
+            'removed': len(removed),
+            'relabeled': len(relabel),
+            'unchanged': unchanged,
+            'failed': len(to_fingerprint) - len(added),
+        }
+        print(f"Synced {database_dir}: {summary}")
+        if cache_path and (to_fingerprint or removed or relabel):
+            self.save_features_cache(cache_path)
+        return summary
+
+    def add_tracks(self, paths, batch_size=32, metadata=None):
+        """
+        Fingerprint tracks and add them to the index, replacing earlier
+        versions of the same paths. An indexed track that cannot be read
+        again keeps its previous version.
+
+        Args:
+            paths (list): Audio file paths.
+            batch_size (int): Tracks per decode batch.
+            metadata (dict, optional): path -> metadata for filtered search.
+
+        Returns:
+            list: Paths that were added.
+        """
+        paths = list(paths)
+        if not paths:
+            return []
+        valid_paths, signatures, fingerprints = self._fingerprint_paths(paths, batch_size)
+        failed = [path for path in paths if path not in signatures]
+        if failed:
+            kept = sum(1 for path in failed if path in self.manifest)
+            print(f"Could not fingerprint {len(failed)} of {len(paths)} tracks "
+                  f"({kept} keep their indexed version)")
+        self.remove_tracks([path for path in valid_paths if path in self.manifest])
+        if not valid_paths:
+            return []
+        self._add_rows(valid_paths, signatures, fingerprints, metadata or {})
+        return valid_paths
+
+    def update_metadata(self, metadata):
+        """
+        Replace the metadata of indexed tracks without fingerprinting them
+        again: each track is re-added under a new row with its postings.
+
+        Args:
+            metadata (dict): path -> new metadata (None to clear it). Unknown
+                paths are ignored.
+
+        Returns:
+            list: Paths whose metadata was replaced.
+        """
+        paths = [path for path in metadata if path in self.manifest]
+        if not paths:
+            return []
+        old_rows = [self.manifest[path]['row'] for path in paths]
+        fingerprints = [
+            (hashes, frames, float(self.track_info[row, 0]))
+            for row, (hashes, frames) in zip(old_rows, self.index.track_postings(old_rows))
+        ]
+        signatures = {
+            path: {key: self.manifest[path][key] for key in ('mtime', 'size', 'sha1')}
+            for path in paths
+        }
+        self.remove_tracks(paths)
+        self._add_rows(paths, signatures, fingerprints, metadata)
+        return paths
+
+    def _add_rows(self, paths, signatures, fingerprints, metadata):
+        """Append track rows and their postings for paths that are not indexed."""
+        count = len(self.database_paths)
+        rows = np.arange(count, count + len(paths))
+        info = np.array([(duration, len(hashes)) for hashes, _, duration in fingerprints],
+                        dtype=np.float32).reshape(-1, len(TRACK_COLUMNS))
+        # Extend what a search looks up by row before the index can return
+        # the new rows (searches do not wait for a sync in progress)
+        self._info_buffer = append_rows(self._info_buffer, count, info)
+        self.track_info = self._info_buffer[:count + len(paths)]
+        self.database_paths.extend(paths)
+        self.index.add(
+            np.concatenate([hashes for hashes, _, _ in fingerprints]),
+            np.repeat(rows, [len(hashes) for hashes, _, _ in fingerprints]),
+            np.concatenate([frames for _, frames, _ in fingerprints]),
+            n_tracks=count + len(paths),
+        )
+        self.metadata.append([metadata.get(path) for path in paths])
+        self.index_version += 1
+        for row, path in zip(rows, paths):
+            self.manifest[path] = dict(signatures[path], metadata=metadata.get(path), row=int(row))
+
+    def remove_tracks(self, paths):
+        """
+        Remove tracks from the index in place.
+
+        Args:
+            paths (list): Audio file paths. Unknown paths are ignored.
+
+        Returns:
+            list: Paths that were removed.
+        """
+        removed = [path for path in paths if path in self.manifest]
+        rows = [self.manifest.pop(path)['row'] for path in removed]
+        self.index.remove_tracks(rows)
+        for row in rows:
+            self.database_paths[row] = None
+        if rows:
+            self.index_version += 1
+        return removed
+
+    def _reset(self):
+        self.index = HashIndex(**self.index_params)
+        self.track_info = self._info_buffer = np.empty((0, len(TRACK_COLUMNS)), dtype=np.float32)
+        self.database_paths = []
+        self.metadata = MetadataTable(self.metadata_schema)
+        self.manifest = {}
+        self.index_version += 1
+
+    def save_features_cache(self, cache_path):
+        """
+        Save the live tracks and their postings as a new feature store version.
+
+        Args:
+            cache_path (str): Feature store directory.
+        """
+        live_rows = np.array([row for row, path in enumerate(self.database_paths) if path is not None],
+                             dtype=np.int64)
+        remap = np.full(len(self.database_paths), -1, dtype=np.int32)
+        remap[live_rows] = np.arange(len(live_rows), dtype=np.int32)
+        hashes, tracks, frames = self.index.postings()
+        meta_rows = []
+        for row in live_rows:
+            path = self.database_paths[row]
+            entry = self.manifest[path]
+            meta_rows.append({key: entry.get(key) for key in ('mtime', 'size', 'sha1', 'metadata')})
+            meta_rows[-1]['path'] = path
+        with FeatureStoreWriter(cache_path, len(TRACK_COLUMNS), self.fingerprinter.name, None,
+                                extra_header={'columns': list(TRACK_COLUMNS),
+                                              'fingerprint': self.fingerprinter.params()}) as writer:
+            writer.append(self.track_info[live_rows], meta_rows)
+            writer.write_array('hashes', hashes)
+            writer.write_array('tracks', remap[tracks])
+            writer.write_array('frames', frames)
+        print(f"Audio fingerprints saved to {cache_path}")
+
+    def load_features_cache(self, cache_path):
+        """
+        Open a feature store. The postings are memory-mapped, not read.
+
+        Args:
+            cache_path (str): Feature store directory.
+
+        Raises:
+            ValueError: If the store was built with other fingerprint settings.
+        """
+        store = load_feature_store(cache_path)
+        header = store.header
+        if header.get('fingerprint') != self.fingerprinter.params():
+            raise ValueError("Audio fingerprint store was built with other fingerprint settings")
+        manifest = {}
+        for row, meta in enumerate(store.meta):
+            manifest[meta['path']] = {
+                'mtime': meta.get('mtime'),
+                'size': meta.get('size'),
+                'sha1': meta.get('sha1'),
+                'metadata': meta.get('metadata'),
+                'row': row,
+            }
+        index = HashIndex(**self.index_params).fit(
+            store.arrays['hashes'], store.arrays['tracks'], store.arrays['frames'],
+            n_tracks=len(store), presorted=True,
+        )
+        metadata = MetadataTable(self.metadata_schema)
+        metadata.append([meta.get('metadata') for meta in store.meta])
+        self.index = index
+        self.track_info = self._info_buffer = store.features
+        self.database_paths = store.paths
+        self.metadata = metadata
+        self.manifest = manifest
+        self.index_version += 1
+
+    def search(self, query_audio_data, top_k=5, filters=None):
+        """
+        Find the tracks a recording or clip comes from.
+
+        Args:
+            query_audio_data (str, bytes or numpy.ndarray): Query recording
+                (see _load_audio).
+            top_k (int): Number of results to return.
+            filters (dict, optional): Metadata filter (see metadata.py).
+
+        Returns:
+            list: (score, path, offset_seconds) tuples, best first. The score
+                is the fraction of the query's hashes that agree on the
+                offset, the position of the query's start in the track.
+
+        Raises:
+            ValueError: If top_k is below 1 or the audio cannot be decoded.
+        """
+        validate_k(top_k)
+        query = self.lookup_query(query_audio_data, top_k, filters)
+        if query.results is not None:
+            return query.results
+        if query.embedding is None:
+            query.embedding = self.fingerprint(query.image)[:2]
+        return self.complete_query(query, top_k, filters)
+
+    def lookup_query(self, query_audio_data, top_k=5, filters=None):
+        """
+        Look a query up in the query cache by content.
+
+        Returns:
+            CachedQuery: With results and/or the (hashes, frames) fingerprint
+                as its embedding filled in on a hit.
+        """
+        query = CachedQuery(query_audio_data, content_key=content_key(query_audio_data))
+        if self.query_cache is not None:
+            self.query_cache.lookup(query, top_k, self.index_version, filter_key=filter_key(filters))
+        return query
+
+    def complete_query(self, query, top_k=5, filters=None):
+        """
+        Search with a query's fingerprint and remember the outcome in the cache.
+
+        Returns:
+            list: (score, path, offset_seconds) tuples.
+        """
+        index_version = self.index_version
+        results = self.search_by_fingerprint(*query.embedding, top_k=top_k, filters=filters)
+        if self.query_cache is not None:
+            self.query_cache.store(query, results, top_k, index_version, filter_key=filter_key(filters))
+        return results
+
+    def search_by_fingerprint(self, hashes, frames, top_k=5, filters=None, votes=None):
+        """
+        Match already computed query hashes.
+
+        Args:
+            hashes (numpy.ndarray): Query hashes.
+            frames (numpy.ndarray): Their anchor frames.
+            top_k (int): Number of results to return.
+            filters (dict, optional): Metadata filter (see metadata.py).
+            votes (OffsetVotes, optional): Votes of earlier parts of the same
+                query, for matching a clip as it streams in; updated in place.
+
+        Returns:
+            list: (score, path, offset_seconds) tuples.
+        """
+        validate_k(top_k)
+        allowed = None
+        if filters:
+            with metrics.stage('filter'):
+                allowed = self.metadata.evaluate(filters)
+        votes = votes if votes is not None else OffsetVotes()
+        with metrics.stage('hash_lookup'):
+            positions, tracks, track_frames = self.index.lookup(hashes, allowed=allowed)
+            votes.add(np.asarray(frames)[positions], len(hashes), tracks, track_frames)
+            best = votes.top(top_k, self.min_votes)
+
+        results = []
+        frame_seconds = self.fingerprinter.frame_seconds
+        for count, row, offset in best:
+            path = self.database_paths[row]
+            if path is None:
+                continue
+            score = min(count / max(votes.n_hashes, 1), 1.0)
+            results.append((float(score), path, round(offset * frame_seconds, 3)))
+        return results
+
+    def stats(self):
+        """Track count, indexed duration and index size, for health checks."""
+        live = [row for row, path in enumerate(self.database_paths) if path is not None]
+        return {
+            'tracks': len(live),
+            'indexed_seconds': round(float(self.track_info[live, 0].sum()), 1) if live else 0.0,
+            'index': self.index.stats(),
+            'fingerprint': self.fingerprinter.params(),
+        }
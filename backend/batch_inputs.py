@@ -0,0 +1,125 @@
+"""
+Turn batch search uploads into (item_id, query) pairs.
+
+Each uploaded file is one of:
+    an image              queried as is
+    a .zip archive        every file inside is an image query
+    .ndjson / .jsonl      one query per line: a JSON string holding a base64
+                          image data URL or an http(s) image URL, or an object
+                          {"id": ..., "image": <data URL or URL>}
+
+Everything is read lazily so the search can start before the last upload is
+parsed. Problems with single items (bad JSON, oversized images, anything
+that is neither a data URL nor an http(s) URL) are yielded as exception instances in place of the
+query, to be reported for that item only.
+"""
+import json
+import zipfile
+
+# Largest image accepted as an uploaded file, zip member or ndjson line
+MAX_ITEM_BYTES = 32 * 1024 * 1024
+
+NDJSON_EXTENSIONS = ('.ndjson', '.jsonl')
+NDJSON_CONTENT_TYPES = ('application/x-ndjson', 'application/jsonl', 'application/jsonlines')
+ZIP_CONTENT_TYPES = ('application/zip', 'application/x-zip-compressed')
+
+
+def iter_zip(fileobj, name, max_item_bytes=MAX_ITEM_BYTES):
+    """Yield (name/member, bytes) for every file in a zip archive."""
+    with zipfile.ZipFile(fileobj) as archive:
+        for info in archive.infolist():
+            if info.is_dir() or info.filename.startswith('__MACOSX/'):
+                continue
+            item_id = f"{name}/{info.filename}"
+            if info.file_size > max_item_bytes:
+                yield item_id, ValueError(f"Image is larger than {max_item_bytes} bytes")
+                continue
+            yield item_id, archive.read(info)
+
+
+def _skip_line(fileobj, chunk_bytes):
+    """Discard the rest of the current line, a chunk at a time."""
+    while True:
+        chunk = fileobj.readline(chunk_bytes)
+        if not chunk or chunk.endswith(b'\n'):
+            return
+
+
+def iter_ndjson(fileobj, name, max_item_bytes=MAX_ITEM_BYTES):
+    """
+    Yield (id, data URL or URL) for every non-empty line of an ndjson upload.
+
+    At most max_item_bytes + 1 bytes are read at once, so the rest of an
+    oversized line is skipped without being buffered.
+    """
+    line_number = 0
+    while True:
+        line = fileobj.readline(max_item_bytes + 1)
+        if not line:
+            return
+        line_number += 1
+        item_id = f"{name}:{line_number}"
+        if len(line) > max_item_bytes:
+            if not line.endswith(b'\n'):
+                _skip_line(fileobj, max_item_bytes + 1)
+            yield item_id, ValueError(f"Line is larger than {max_item_bytes} bytes")
+            continue
+        if not line.strip():
+            continue
+        try:
+            entry = json.loads(line)
+        except ValueError as e:
+            yield item_id, ValueError(f"Invalid JSON: {e}")
+            continue
+        if isinstance(entry, dict):
+            item_id = str(entry.get('id', item_id))
+            entry = entry.get('image')
+        # Inline images and URLs (fetched with fetcher.py's limits); a path
+        # here would be opened by the server
+        if not isinstance(entry, str) or not entry.startswith(('data:image', 'http://', 'https://')):
+            yield item_id, ValueError("Expected a base64 image data URL or an http(s) URL")
+            continue
+        yield item_id, entry
+
+
+def _kind(filename, content_type):
+    filename = (filename or "").lower()
+    content_type = (content_type or "").split(';')[0].strip().lower()
+    if filename.endswith('.zip') or content_type in ZIP_CONTENT_TYPES:
+        return 'zip'
+    if filename.endswith(NDJSON_EXTENSIONS) or content_type in NDJSON_CONTENT_TYPES:
+        return 'ndjson'
+    return 'image'
+
+
+def iter_uploads(uploads, max_item_bytes=MAX_ITEM_BYTES):
+    """
+    Expand uploaded files into individual queries.
+
+    Args:
+        uploads (list): Objects with `filename`, `content_type` and a binary
+            `file` (e.g. FastAPI UploadFile).
+        max_item_bytes (int): Largest accepted image file, zip member or
+            ndjson line. At most this many bytes (plus one) of an image
+            file are read.
+
+    Yields:
+        tuple: (item_id, query), where query is image bytes, a data URL, or an
+            exception describing why the item cannot be searched.
+    """
+    for position, upload in enumerate(uploads):
+        name = upload.filename or f"upload-{position}"
+        try:
+            kind = _kind(upload.filename, upload.content_type)
+            if kind == 'zip':
+                yield from iter_zip(upload.file, name, max_item_bytes)
+            elif kind == 'ndjson':
+                yield from iter_ndjson(upload.file, name, max_item_bytes)
+            else:
+                data = upload.file.read(max_item_bytes + 1)
+                if len(data) > max_item_bytes:
+                    yield name, ValueError(f"Image is larger than {max_item_bytes} bytes")
+                else:
+                    yield name, data
+        except (zipfile.BadZipFile, OSError, UnicodeDecodeError) as e:
+            yield name, ValueError(f"Unreadable upload: {e}")
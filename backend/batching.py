@@ -0,0 +1,132 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+
+class BatchScheduler:
+    """
+    Micro-batching scheduler for feature extraction.
+
+    Preprocessed images submitted from any thread are collected for up to
+    `batch_window_ms` (or until `max_batch_size` images are waiting) and run
+    through a single `predict` call on a dedicated worker thread. Every caller
+    gets back its own future holding its row of the output.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=16, batch_window_ms=5.0, name="feature-batcher"):
+        """
+        Initialize the scheduler.
+
+        Args:
+            predict_fn (callable): Takes an (N, ...) array and returns (N, D) features.
+            max_batch_size (int): Largest batch passed to predict_fn.
+            batch_window_ms (float): How long to wait for more queries after the
+                first one arrives. 0 disables waiting (greedy batching of whatever
+                is already queued).
+            name (str): Name of the worker thread.
+        """
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.batch_window = max(batch_window_ms, 0.0) / 1000.0
+        self.name = name
+        self._queue = queue.Queue()
+        self._thread = None
+        self._stopped = threading.Event()
+        self.batches_run = 0
+        self.items_run = 0
+
+    def start(self):
+        """Start the worker thread (idempotent)."""
+        if self._thread is None or not self._thread.is_alive():
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        """Stop the worker thread after the current batch."""
+        self._stopped.set()
+        self._queue.put(None)
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def submit(self, preprocessed):
+        """
+        Queue one preprocessed image.
+
+        Args:
+            preprocessed (numpy.ndarray): A single image, with or without a
+                leading batch dimension of 1.
+
+        Returns:
+            concurrent.futures.Future: Resolves to the image's feature vector.
+        """
+        if self._stopped.is_set():
+            raise RuntimeError("BatchScheduler is stopped")
+        future = Future()
+        preprocessed = np.asarray(preprocessed)
+        if preprocessed.ndim == 4:
+            preprocessed = preprocessed[0]
+        self._queue.put((preprocessed, future))
+        return future
+
+    def stats(self):
+        """Return batch counters."""
+        return {
+            'batches': self.batches_run,
+            'items': self.items_run,
+            'mean_batch_size': self.items_run / self.batches_run if self.batches_run else 0.0,
+            'queued': self._queue.qsize(),
+        }
+
+    def _collect(self):
+        """Block for the first item, then gather more until the window closes."""
+        first = self._queue.get()
+        if first is None:
+            return []
+        batch = [first]
+        deadline = time.perf_counter() + self.batch_window
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._stopped.set()
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while not self._stopped.is_set():
+            batch = self._collect()
+            if not batch:
+                continue
+            # Skip callers that gave up while waiting in the queue
+            batch = [(img, fut) for img, fut in batch if fut.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                features = self.predict_fn(np.stack([img for img, _ in batch]))
+            except Exception as e:
+                for _, fut in batch:
+                    fut.set_exception(e)
+                continue
+            self.batches_run += 1
+            self.items_run += len(batch)
+            for i, (_, fut) in enumerate(batch):
+                fut.set_result(np.asarray(features[i]).flatten())
+        # Fail whatever is still queued so no caller waits forever
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None and item[1].set_running_or_notify_cancel():
+                item[1].set_exception(RuntimeError("BatchScheduler is stopped"))
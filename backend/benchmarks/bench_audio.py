@@ -0,0 +1,194 @@
+"""
+Indexing throughput and clip matching of the audio fingerprint engine.
+
+Generates --tracks synthetic tracks offline (random note sequences with
+decaying harmonics, written as 16-bit WAV files), then measures:
+
+  index   fingerprinting throughput of AudioSimilaritySearch.index_database
+          on the decode pool (seconds of audio per second), the size of the
+          postings, and the time to reopen the memory-mapped store
+  match   recall@1 and offset accuracy of clips of each --clip-seconds cut
+          at random positions, with white noise at each --snr-db, and the
+          time per query split into decode + fingerprint and hash lookup
+  scale   hash lookup time of the same clips against the catalog postings
+          padded with random postings to each --pad-postings size, to show
+          that matching cost follows the postings sharing the clip's hashes
+          rather than the catalog size
+
+Usage:
+    python benchmarks/bench_audio.py --tracks 200 --seconds 60 --clip-seconds 2 5 10 \\
+        --snr-db inf 10 0 --pad-postings 1000000 10000000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import wave
+from io import BytesIO
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio_fingerprint import DT_BITS, FREQ_BITS, HashIndex, OffsetVotes
+from audio_similarity import AudioSimilaritySearch
+
+
+def synthetic_track(rng, seconds, sample_rate):
+    """Random notes of 0.1-0.5 s, each a few decaying sines, plus a little noise."""
+    out = np.zeros(int(seconds * sample_rate), dtype=np.float32)
+    position = 0
+    while position < len(out):
+        length = min(int(sample_rate * rng.uniform(0.1, 0.5)), len(out) - position)
+        t = np.arange(length, dtype=np.float32) / sample_rate
+        envelope = np.exp(-t * rng.uniform(2, 8))
+        for _ in range(rng.integers(1, 4)):
+            frequency = 110 * 2 ** (rng.integers(0, 48) / 12)
+            out[position:position + length] += envelope * np.sin(2 * np.pi * frequency * t) * rng.uniform(0.1, 0.4)
+        position += length
+    out += 0.01 * rng.standard_normal(len(out)).astype(np.float32)
+    return out / np.abs(out).max() * 0.8
+
+
+def encode_wav(samples, sample_rate):
+    buffer = BytesIO()
+    with wave.open(buffer, 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes((np.clip(samples, -1, 1) * 32767).astype('<i2').tobytes())
+    return buffer.getvalue()
+
+
+def add_noise(rng, samples, snr_db):
+    if np.isinf(snr_db):
+        return samples
+    noise_power = np.mean(samples ** 2) / 10 ** (snr_db / 10)
+    return samples + np.sqrt(noise_power) * rng.standard_normal(len(samples)).astype(np.float32)
+
+
+def bench_index(args, search, database_dir, cache_path):
+    t0 = time.perf_counter()
+    search.index_database(database_dir, cache_path=cache_path)
+    elapsed = time.perf_counter() - t0
+    stats = search.index.stats()
+    audio_seconds = args.tracks * args.seconds
+    print(f"\nindex: {args.tracks} tracks in {elapsed:.2f}s = {args.tracks / elapsed:.1f} tracks/s, "
+          f"{audio_seconds / elapsed:.0f}x real time")
+    print(f"postings: {stats['postings']} ({stats['postings'] / audio_seconds:.1f}/s of audio), "
+          f"{stats['nbytes'] / 2 ** 20:.1f} MiB, {stats['nbytes'] / max(stats['postings'], 1):.0f} bytes/posting")
+
+    reopened = AudioSimilaritySearch(decode_workers=args.workers)
+    t0 = time.perf_counter()
+    reopened.index_database(database_dir, cache_path=cache_path)
+    print(f"reopen store: {(time.perf_counter() - t0) * 1000:.1f} ms (memory-mapped, no re-sort)")
+
+
+def make_clips(args, rng, tracks, clip_seconds, snr_db):
+    clips = []
+    for _ in range(args.queries):
+        target = int(rng.integers(len(tracks)))
+        start = rng.uniform(0, args.seconds - clip_seconds)
+        first = int(start * args.sample_rate)
+        clip = add_noise(rng, tracks[target][first:first + int(clip_seconds * args.sample_rate)], snr_db)
+        clips.append((target, start, encode_wav(clip, args.sample_rate)))
+    return clips
+
+
+def bench_match(args, search, paths, tracks):
+    rng = np.random.default_rng(1)
+    print(f"\n{'clip_s':>7} {'snr_db':>7} {'recall@1':>9} {'offset_ok':>10} {'score':>6} "
+          f"{'fp_ms':>8} {'lookup_ms':>10} {'p95_ms':>8}")
+    for clip_seconds in args.clip_seconds:
+        for snr_db in args.snr_db:
+            hits = offsets_ok = 0
+            scores, fp_times, lookup_times, totals = [], [], [], []
+            for target, start, data in make_clips(args, rng, tracks, clip_seconds, snr_db):
+                t0 = time.perf_counter()
+                hashes, frames, _ = search.fingerprint(data)
+                t1 = time.perf_counter()
+                results = search.search_by_fingerprint(hashes, frames, top_k=1)
+                t2 = time.perf_counter()
+                fp_times.append(t1 - t0)
+                lookup_times.append(t2 - t1)
+                totals.append(t2 - t0)
+                if results and results[0][1] == paths[target]:
+                    hits += 1
+                    scores.append(results[0][0])
+                    offsets_ok += abs(results[0][2] - start) < args.offset_tolerance
+            n = args.queries
+            print(f"{clip_seconds:>7g} {snr_db:>7g} {hits / n:>9.2f} {offsets_ok / n:>10.2f} "
+                  f"{np.mean(scores) if scores else 0:>6.2f} {np.mean(fp_times) * 1000:>8.2f} "
+                  f"{np.mean(lookup_times) * 1000:>10.3f} {np.percentile(totals, 95) * 1000:>8.2f}")
+
+
+def bench_scale(args, search, tracks):
+    rng = np.random.default_rng(2)
+    hashes, track_rows, frames = search.index.postings()
+    n_tracks = len(search.database_paths)
+    queries = [search.fingerprint(clip[2])[:2]
+               for clip in make_clips(args, rng, tracks, min(args.clip_seconds), float('inf'))]
+    print(f"\n{'postings':>12} {'build_s':>8} {'lookup_ms':>10} {'postings/query':>15}")
+    for size in [0] + list(args.pad_postings):
+        # Random postings of imaginary tracks after the real ones
+        pad = max(size - len(hashes), 0)
+        pad_tracks = n_tracks + rng.integers(0, max(pad // 2000, 1), pad)
+        index = HashIndex()
+        t0 = time.perf_counter()
+        index.fit(
+            np.concatenate([hashes, rng.integers(0, 1 << (2 * FREQ_BITS + DT_BITS), pad, dtype=np.uint32)]),
+            np.concatenate([track_rows, pad_tracks.astype(track_rows.dtype)]),
+            np.concatenate([frames, rng.integers(0, 20000, pad).astype(frames.dtype)]),
+            n_tracks=int(pad_tracks.max(initial=n_tracks - 1)) + 1,
+        )
+        build = time.perf_counter() - t0
+        times, matched = [], []
+        for query_hashes, query_frames in queries:
+            t0 = time.perf_counter()
+            positions, rows, track_frames = index.lookup(query_hashes)
+            votes = OffsetVotes()
+            votes.add(query_frames[positions], len(query_hashes), rows, track_frames)
+            votes.top(1, search.min_votes)
+            times.append(time.perf_counter() - t0)
+            matched.append(len(rows))
+        print(f"{index.n_postings:>12d} {build:>8.2f} {np.mean(times) * 1000:>10.3f} {np.mean(matched):>15.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tracks", type=int, default=100)
+    parser.add_argument("--seconds", type=float, default=30, help="Length of every track")
+    parser.add_argument("--sample-rate", type=int, default=22050, help="Sample rate of the WAV files")
+    parser.add_argument("--queries", type=int, default=50, help="Clips per clip length and SNR")
+    parser.add_argument("--clip-seconds", type=float, nargs="+", default=[2, 5, 10])
+    parser.add_argument("--snr-db", type=float, nargs="+", default=[float('inf'), 10, 0])
+    parser.add_argument("--offset-tolerance", type=float, default=0.1,
+                        help="Seconds within which a reported offset counts as right")
+    parser.add_argument("--pad-postings", type=int, nargs="*", default=[1000000, 10000000],
+                        help="Index sizes for the lookup scaling measurement")
+    parser.add_argument("--workers", type=int, help="Decode pool threads (default min(8, CPUs))")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    tracks = [synthetic_track(rng, args.seconds, args.sample_rate) for _ in range(args.tracks)]
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        database_dir = os.path.join(work_dir, "audio")
+        cache_path = os.path.join(work_dir, "audio_store")
+        os.makedirs(database_dir)
+        paths = []
+        for i, samples in enumerate(tracks):
+            paths.append(os.path.join(database_dir, f"track_{i:05d}.wav"))
+            with open(paths[-1], 'wb') as f:
+                f.write(encode_wav(samples, args.sample_rate))
+
+        print(f"catalog={args.tracks} tracks of {args.seconds:g}s at {args.sample_rate} Hz")
+        search = AudioSimilaritySearch(decode_workers=args.workers)
+        bench_index(args, search, database_dir, cache_path)
+        bench_match(args, search, paths, tracks)
+        bench_scale(args, search, tracks)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Throughput and latency of the feature-extraction batch scheduler.
+
+Runs a closed-loop load (each client submits a query, waits for its features,
+then submits the next one) for every combination of batch window and maximum
+batch size, and prints throughput plus p50/p99 latency.
+
+By default the model is simulated by a predict function that costs a fixed
+per-call overhead plus a per-image cost, which is the shape of Keras `predict`
+on CPU. Pass --model to measure the real ResNet50 extractor instead.
+
+Usage:
+    python benchmarks/bench_batching.py --clients 32 --requests 2000 \\
+        --windows 0 2 5 10 --batch-sizes 1 8 16 32
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from batching import BatchScheduler
+
+
+def simulated_predict(call_overhead_ms, per_image_ms, dim=2048):
+    def predict(batch):
+        time.sleep((call_overhead_ms + per_image_ms * len(batch)) / 1000.0)
+        return np.zeros((len(batch), dim), dtype=np.float32)
+    return predict
+
+
+def keras_predict():
+    from ai_art_similarity import ImageSimilaritySearch
+    extractor = ImageSimilaritySearch().feature_extractor
+    return lambda batch: extractor.predict(batch, verbose=0)
+
+
+def run_load(predict_fn, window_ms, max_batch_size, clients, requests):
+    scheduler = BatchScheduler(predict_fn, max_batch_size=max_batch_size, batch_window_ms=window_ms).start()
+    query = np.zeros((224, 224, 3), dtype=np.float32)
+    latencies = []
+    lock = threading.Lock()
+    per_client = max(requests // clients, 1)
+
+    def client():
+        local = []
+        for _ in range(per_client):
+            t0 = time.perf_counter()
+            scheduler.submit(query).result()
+            local.append(time.perf_counter() - t0)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    stats = scheduler.stats()
+    scheduler.stop()
+
+    latencies_ms = np.array(latencies) * 1000.0
+    return {
+        'window_ms': window_ms,
+        'max_batch': max_batch_size,
+        'qps': len(latencies) / elapsed,
+        'p50_ms': float(np.percentile(latencies_ms, 50)),
+        'p99_ms': float(np.percentile(latencies_ms, 99)),
+        'mean_batch': stats['mean_batch_size'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--windows", type=float, nargs="+", default=[0, 2, 5, 10])
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 16, 32])
+    parser.add_argument("--call-overhead-ms", type=float, default=20.0)
+    parser.add_argument("--per-image-ms", type=float, default=2.0)
+    parser.add_argument("--model", action="store_true", help="Use the real ResNet50 extractor")
+    args = parser.parse_args()
+
+    if args.model:
+        predict_fn = keras_predict()
+    else:
+        predict_fn = simulated_predict(args.call_overhead_ms, args.per_image_ms)
+
+    print(f"{'window_ms':>10} {'max_batch':>10} {'qps':>10} {'p50_ms':>10} {'p99_ms':>10} {'mean_batch':>11}")
+    for window_ms in args.windows:
+        for max_batch_size in args.batch_sizes:
+            r = run_load(predict_fn, window_ms, max_batch_size, args.clients, args.requests)
+            print(f"{r['window_ms']:>10.1f} {r['max_batch']:>10d} {r['qps']:>10.1f} "
+                  f"{r['p50_ms']:>10.2f} {r['p99_ms']:>10.2f} {r['mean_batch']:>11.2f}")
+
+
+if __name__ == "__main__":
+    main()
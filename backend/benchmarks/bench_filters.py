@@ -0,0 +1,124 @@
+"""
+Latency and recall of metadata-filtered search.
+
+Builds a synthetic catalog with artist, license, uploader, registration and
+creation date metadata, then runs filters from broad to very selective and
+compares, per backend:
+
+  prefilter   the filter mask is passed to the index (what search() does)
+  postfilter  the index is asked for overfetch * k results and the ones that
+              fail the filter are dropped
+
+Recall is against the exact top-k among the rows the filter allows; "full"
+is the share of queries that got all k results.
+
+Usage:
+    python benchmarks/bench_filters.py --size 200000 --dim 2048 --backends exact ivf hnsw
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_index import recall_at_k, synthetic_catalog
+from metadata import MetadataTable
+from nn_index import build_index, l2_normalize
+
+FILTERS = [
+    ("uploader != u1", {'uploader': {'ne': 'u1'}}),
+    ("license in 2 of 5", {'license': {'in': ['cc0', 'cc-by']}}),
+    ("registered", {'registered': True}),
+    ("created in 2021", {'created': {'gte': '2021-01-01', 'lt': '2022-01-01'}}),
+    ("registered, 2021", {'registered': True, 'created': {'gte': '2021-01-01', 'lt': '2022-01-01'}}),
+    ("artist a10", {'artist': 'a10'}),
+    ("artist a500", {'artist': 'a500'}),
+]
+
+
+def synthetic_metadata(size, seed=0):
+    rng = np.random.default_rng(seed)
+    artists = rng.zipf(1.3, size) % 5000
+    licenses = np.array(['cc0', 'cc-by', 'cc-by-nc', 'all-rights', 'unknown'])[rng.integers(0, 5, size)]
+    registered = rng.random(size) < 0.3
+    uploaders = rng.integers(0, 1000, size)
+    created = rng.uniform(946684800, 1735689600, size)  # 2000-2025
+    return [
+        {'artist': f"a{artists[i]}", 'license': str(licenses[i]), 'registered': bool(registered[i]),
+         'uploader': f"u{uploaders[i]}", 'created': float(created[i])}
+        for i in range(size)
+    ]
+
+
+def run(index, queries, k, allowed, overfetch=None):
+    """Per-query search; returns (ms per query, found ids)."""
+    found = []
+    t0 = time.perf_counter()
+    for q in queries:
+        if overfetch is None:
+            ids = index.query(q[None, :], k, allowed=allowed)[1][0]
+        else:
+            ids = index.query(q[None, :], k * overfetch)[1][0]
+            ids = ids[(ids >= 0) & allowed[np.maximum(ids, 0)]][:k]
+        found.append(np.pad(ids[:k], (0, k - len(ids[:k])), constant_values=-1))
+    return (time.perf_counter() - t0) * 1000 / len(queries), np.array(found)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=2048)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--backends", nargs="+", default=["exact", "ivf", "hnsw"])
+    parser.add_argument("--overfetch", type=int, default=10, help="Post-filter fetches overfetch * k results")
+    args = parser.parse_args()
+
+    features = l2_normalize(synthetic_catalog(args.size, args.dim))
+    rng = np.random.default_rng(1)
+    queries = features[rng.choice(args.size, args.queries, replace=False)]
+    queries = l2_normalize(queries + 0.1 * rng.random(queries.shape, dtype=np.float32))
+
+    table = MetadataTable()
+    t0 = time.perf_counter()
+    table.append(synthetic_metadata(args.size))
+    print(f"catalog={args.size} dim={args.dim} queries={args.queries} k={args.k} "
+          f"metadata built in {time.perf_counter() - t0:.2f}s, {table.nbytes / 2**20:.1f} MiB")
+
+    masks = {}
+    print(f"\n{'filter':>18} {'allowed':>8} {'eval_ms':>8}")
+    for label, expression in FILTERS:
+        t0 = time.perf_counter()
+        masks[label] = table.evaluate(expression)
+        eval_ms = (time.perf_counter() - t0) * 1000
+        print(f"{label:>18} {masks[label].mean():>8.2%} {eval_ms:>8.2f}")
+
+    truths = {}
+    for label, mask in masks.items():
+        ids = np.flatnonzero(mask)
+        scores = queries @ features[ids].T
+        truths[label] = ids[np.argsort(-scores, axis=1)[:, :args.k]]
+
+    print(f"\n{'backend':>8} {'filter':>18} {'pre_ms':>8} {'pre_rec':>8} {'pre_full':>8} "
+          f"{'post_ms':>8} {'post_rec':>8} {'post_full':>9}")
+    for backend in args.backends:
+        try:
+            index = build_index(backend).fit(features, normalized=True)
+        except ImportError as e:
+            print(f"skipping {backend}: {e}")
+            continue
+        for label, mask in masks.items():
+            truth = truths[label]
+            want = min(args.k, int(mask.sum()))
+            pre_ms, pre = run(index, queries, args.k, mask)
+            post_ms, post = run(index, queries, args.k, mask, overfetch=args.overfetch)
+            print(f"{backend:>8} {label:>18} {pre_ms:>8.2f} {recall_at_k(pre, truth):>8.3f} "
+                  f"{np.mean((pre >= 0).sum(axis=1) >= want):>8.2f} {post_ms:>8.2f} "
+                  f"{recall_at_k(post, truth):>8.3f} {np.mean((post >= 0).sum(axis=1) >= want):>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Recall@k and queries/second of the nearest neighbour backends.
+
+Builds a synthetic clustered catalog (non-negative, like pooled ResNet
+features), computes exact ground truth, then sweeps each backend's recall/speed
+knob and reports build time, recall@k against the exact results and single-query
+QPS.
+
+Usage:
+    python benchmarks/bench_index.py --size 200000 --dim 2048 --k 10
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from nn_index import build_index
+
+
+def synthetic_catalog(size, dim, n_clusters=256, noise=0.5, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.gamma(1.0, 1.0, size=(n_clusters, dim)).astype(np.float32)
+    assign = rng.integers(0, n_clusters, size)
+    features = centers[assign] + noise * rng.random((size, dim), dtype=np.float32)
+    return np.maximum(features, 0)
+
+
+def recall_at_k(found, truth):
+    hits = sum(len(set(f[f >= 0]) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+
+def measure(index, features, queries, truth, k):
+    t0 = time.perf_counter()
+    index.fit(features)
+    build = time.perf_counter() - t0
+    found = []
+    t0 = time.perf_counter()
+    for q in queries:
+        found.append(index.query(q[None, :], k)[1][0])
+    elapsed = time.perf_counter() - t0
+    return build, recall_at_k(np.array(found), truth), len(queries) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=2048)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[16, 32, 64, 128])
+    args = parser.parse_args()
+
+    features = synthetic_catalog(args.size, args.dim)
+    rng = np.random.default_rng(1)
+    queries = features[rng.choice(args.size, args.queries, replace=False)]
+    queries = queries + 0.1 * rng.random(queries.shape, dtype=np.float32)
+
+    exact = build_index("exact").fit(features)
+    truth = exact.query(queries, args.k)[1]
+
+    configs = [("exact", {})]
+    configs += [("ivf", {'nprobe': n}) for n in args.nprobe]
+    try:
+        import hnswlib  # noqa: F401
+        configs += [("hnsw", {'ef_search': ef}) for ef in args.ef_search]
+    except ImportError:
+        print("hnswlib not installed; skipping the hnsw backend")
+
+    print(f"catalog={args.size} dim={args.dim} queries={args.queries} k={args.k}")
+    print(f"{'backend':>8} {'params':>18} {'build_s':>9} {'recall@k':>9} {'qps':>10}")
+    built = {}
+    for backend, params in configs:
+        # Reuse one fitted index per backend and only change the query knob
+        if backend in built:
+            index = built[backend]
+            for name, value in params.items():
+                setattr(index, name, value)
+            t0 = time.perf_counter()
+            found = np.array([index.query(q[None, :], args.k)[1][0] for q in queries])
+            qps = len(queries) / (time.perf_counter() - t0)
+            build, recall = 0.0, recall_at_k(found, truth)
+        else:
+            index = build_index(backend, **params)
+            build, recall, qps = measure(index, features, queries, truth, args.k)
+            built[backend] = index
+        label = ",".join(f"{n}={v}" for n, v in params.items()) or "-"
+        print(f"{backend:>8} {label:>18} {build:>9.2f} {recall:>9.3f} {qps:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
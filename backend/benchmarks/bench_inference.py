@@ -0,0 +1,85 @@
+"""
+Latency and throughput of the feature extractor runtimes.
+
+Runs each backend on preprocessed noise images and reports median per-image
+latency at batch size 1, images/sec at each batch size, and the cosine parity
+of its embeddings against the Keras model.
+
+Backends are given as name[:int8], e.g.:
+    python benchmarks/bench_inference.py --backends keras tflite tflite:int8 onnx onnx:int8 --threads 1 4
+"""
+import argparse
+import gc
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from inference import build_inference_backend, embedding_parity, sample_batch
+
+
+def time_batches(backend, batch, repeats):
+    """Return per-call wall times (seconds) after one warm-up call."""
+    backend.predict(batch)
+    times = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        backend.predict(batch)
+        times.append(time.perf_counter() - t0)
+    return np.array(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", default=["keras", "tflite", "tflite:int8"])
+    parser.add_argument("--threads", type=int, nargs="+", default=[0],
+                        help="Thread counts to try (0 = runtime default)")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--pooling", default="avg")
+    parser.add_argument("--model-dir", default="models")
+    parser.add_argument("--tolerance", type=float, default=1e-3)
+    args = parser.parse_args()
+
+    batches = {size: sample_batch(size, seed=size) for size in args.batch_sizes}
+    parity_batch = sample_batch(8, seed=1)
+    reference = build_inference_backend("keras", pooling=args.pooling)
+    expected = reference.predict(parity_batch)
+
+    print(f"{'backend':>14} {'threads':>7} {'bs1_ms':>8} "
+          + " ".join(f"{f'img/s@{size}':>10}" for size in args.batch_sizes)
+          + f" {'min_cos':>9} {'parity':>6}")
+    for spec in args.backends:
+        name, _, quantize = spec.partition(":")
+        for threads in args.threads:
+            params = {'num_threads': threads or None}
+            if name != "keras":
+                params['model_dir'] = args.model_dir
+            if quantize:
+                params['quantize'] = quantize
+            if name == "keras" and not threads:
+                backend = reference
+            else:
+                backend = build_inference_backend(name, pooling=args.pooling, **params)
+
+            latency = np.median(time_batches(backend, batches[1], args.repeats)) * 1000.0 \
+                if 1 in batches else float('nan')
+            throughput = []
+            for size, batch in batches.items():
+                times = time_batches(backend, batch, max(args.repeats // size, 3))
+                throughput.append(size / np.median(times))
+            parity = embedding_parity(expected, backend.predict(parity_batch), args.tolerance)
+
+            print(f"{spec:>14} {threads or 'auto':>7} {latency:>8.2f} "
+                  + " ".join(f"{rate:>10.1f}" for rate in throughput)
+                  + f" {parity['min_cosine']:>9.6f} {'ok' if parity['ok'] else 'FAIL':>6}")
+            if backend is not reference:
+                del backend
+                gc.collect()
+
+
+if __name__ == "__main__":
+    main()
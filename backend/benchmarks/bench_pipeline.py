@@ -0,0 +1,241 @@
+"""
+Per-stage and end-to-end latency of the similarity pipeline.
+
+Generates a synthetic catalog of --size artworks offline (no dataset or
+network is needed beyond the model weights), then measures:
+
+  stages  every stage on its own: decode (PNG database images and JPEG
+          queries), resize, preprocess_input, model predict at each batch
+          size, and a kNN query against the catalog embeddings, padded with
+          synthetic vectors to --knn-rows rows to size larger catalogs
+  http    closed-loop load from --clients concurrent clients posting JPEG
+          queries to /reverse-image-search of the FastAPI app, in process
+          (httpx ASGITransport, no sockets), and the server-side time per
+          stage under that load, read back from /metrics
+
+The query cache is disabled unless --query-cache is given, so every request
+runs the whole pipeline.
+
+Usage:
+    python benchmarks/bench_pipeline.py --size 200 --clients 8 --requests 400 \\
+        --inference-backend tflite --inference-params '{"model_dir": "models"}'
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+from io import BytesIO
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import metrics
+from ai_art_similarity import ImageSimilaritySearch
+from bench_index import synthetic_catalog
+from bench_regions import synthetic_artwork
+from inference import preprocess_input
+from nn_index import build_index, l2_normalize
+
+
+def encode(img, fmt, **params):
+    buffer = BytesIO()
+    img.save(buffer, format=fmt, **params)
+    return buffer.getvalue()
+
+
+def time_calls(fn, inputs):
+    """Call fn on every input; return the per-call wall times in seconds."""
+    times = []
+    for value in inputs:
+        t0 = time.perf_counter()
+        fn(value)
+        times.append(time.perf_counter() - t0)
+    return np.array(times)
+
+
+def print_stage(name, times, items_per_call=1):
+    ms = np.asarray(times) * 1000
+    print(f"{name:>22} {len(ms):>7d} {items_per_call:>6d} {np.percentile(ms, 50):>9.3f} "
+          f"{np.percentile(ms, 95):>9.3f} {ms.mean() / items_per_call:>9.3f}")
+
+
+def bench_stages(args, search, database_dir, queries):
+    paths = sorted(os.path.join(database_dir, name) for name in os.listdir(database_dir)
+                   if name.endswith(".png"))
+    png = [open(path, 'rb').read() for path in paths]
+
+    print(f"\n{'stage':>22} {'calls':>7} {'items':>6} {'p50_ms':>9} {'p95_ms':>9} {'ms/item':>9}")
+    print_stage("decode (png)", time_calls(search._load_image, png))
+    print_stage("decode (jpeg)", time_calls(search._load_image, queries))
+    images = [search._load_image(data) for data in queries]
+    print_stage("resize", time_calls(lambda img: img.resize((224, 224)), images))
+    pixels = [np.asarray(img.resize((224, 224)), dtype=np.float32)[None] for img in images]
+    print_stage("preprocess", time_calls(preprocess_input, pixels))
+
+    inputs = np.concatenate([preprocess_input(p) for p in pixels])
+    for batch_size in args.batch_sizes:
+        batch = np.resize(inputs, (batch_size,) + inputs.shape[1:])
+        # The first call at a new batch size may build or re-plan the graph
+        search.predict(batch)
+        print_stage(f"predict (batch {batch_size})", time_calls(search.predict, [batch] * args.repeats), batch_size)
+
+    features = search.database_features
+    rng = np.random.default_rng(1)
+    if args.knn_rows > len(features):
+        padding = synthetic_catalog(args.knn_rows - len(features), features.shape[1])
+        features = np.concatenate([features, padding])
+    features = l2_normalize(features)
+    index = build_index(args.index_backend, **json.loads(args.index_params))
+    t0 = time.perf_counter()
+    index.fit(features, normalized=True)
+    build = time.perf_counter() - t0
+    probes = features[rng.choice(len(features), args.repeats)]
+    probes = l2_normalize(probes + 0.05 * rng.standard_normal(probes.shape).astype(np.float32))
+    print_stage(f"knn ({args.index_backend})", time_calls(lambda q: index.query(q[None], args.k), probes))
+    print(f"knn index: {len(features)} rows, built in {build:.2f}s")
+
+
+def parse_stage_metrics(text):
+    """Per-stage (calls, seconds, items) from the /metrics exposition text."""
+    stages = {}
+    pattern = re.compile(r'^similarity_stage_(seconds_sum|seconds_count|items_total)\{stage="([^"]+)"\} (\S+)$')
+    for line in text.splitlines():
+        match = pattern.match(line)
+        if match:
+            field, name, value = match.groups()
+            stages.setdefault(name, {})[field] = float(value)
+    return stages
+
+
+async def http_load(app, queries, clients, requests, k):
+    import httpx
+
+    latencies = []
+    statuses = {}
+    counter = itertools.count()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        async def worker():
+            while (i := next(counter)) < requests:
+                t0 = time.perf_counter()
+                response = await client.post(
+                    "/reverse-image-search",
+                    files={"file": (f"query_{i}.jpg", queries[i % len(queries)], "image/jpeg")},
+                    data={"top_k": str(k)},
+                )
+                latencies.append(time.perf_counter() - t0)
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(clients)))
+        elapsed = time.perf_counter() - start
+        exposition = (await client.get("/metrics")).text
+    return np.array(latencies), statuses, elapsed, exposition
+
+
+def bench_http(args, database_dir, cache_path, queries):
+    os.environ.update({
+        "ART_DATASET_DIR": database_dir,
+        "FEATURES_CACHE_PATH": cache_path,
+        "INDEX_BACKEND": args.index_backend,
+        "INDEX_PARAMS": args.index_params,
+        "INFERENCE_BACKEND": args.inference_backend,
+        "INFERENCE_PARAMS": args.inference_params,
+        "QUERY_CACHE_SIZE": os.environ.get("QUERY_CACHE_SIZE", "1024") if args.query_cache else "0",
+    })
+    import main
+    from search_engine import get_engine
+
+    # ASGITransport does not send lifespan events, so warm up here
+    if not get_engine().warmup():
+        raise RuntimeError(f"Search engine warmup failed: {get_engine().error}")
+    metrics.reset()
+    latencies, statuses, elapsed, exposition = asyncio.run(
+        http_load(main.app, queries, args.clients, args.requests, args.k))
+
+    ms = latencies * 1000
+    print(f"\nhttp: {args.clients} clients, {len(ms)} requests, statuses {statuses}")
+    print(f"{'qps':>10} {'p50_ms':>10} {'p95_ms':>10} {'p99_ms':>10}")
+    print(f"{len(ms) / elapsed:>10.1f} {np.percentile(ms, 50):>10.2f} {np.percentile(ms, 95):>10.2f} "
+          f"{np.percentile(ms, 99):>10.2f}")
+
+    print(f"\nserver-side stages under load (/metrics)")
+    print(f"{'stage':>22} {'calls':>7} {'items/call':>11} {'ms/call':>9} {'ms/item':>9}")
+    for name, values in sorted(parse_stage_metrics(exposition).items()):
+        calls = values.get('seconds_count', 0)
+        items = values.get('items_total', 0)
+        seconds = values.get('seconds_sum', 0.0)
+        if calls:
+            print(f"{name:>22} {int(calls):>7d} {items / calls:>11.2f} {seconds * 1000 / calls:>9.3f} "
+                  f"{seconds * 1000 / max(items, 1):>9.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=200, help="Synthetic catalog images")
+    parser.add_argument("--image-size", type=int, default=512, help="Side of the catalog images")
+    parser.add_argument("--queries", type=int, default=50, help="Distinct JPEG query images")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--repeats", type=int, default=20, help="Calls per predict and kNN measurement")
+    parser.add_argument("--knn-rows", type=int, default=100000,
+                        help="Pad the kNN benchmark index to this many rows")
+    parser.add_argument("--index-backend", default="exact")
+    parser.add_argument("--index-params", default="{}", help="JSON object")
+    parser.add_argument("--inference-backend", default="keras")
+    parser.add_argument("--inference-params", default="{}", help="JSON object")
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--query-cache", action="store_true", help="Keep the query cache enabled")
+    parser.add_argument("--profile-dir", help="Write sampled cProfile dumps of the stages here")
+    parser.add_argument("--skip-stages", action="store_true")
+    parser.add_argument("--skip-http", action="store_true")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    catalog = [synthetic_artwork(rng, args.image_size) for _ in range(args.size)]
+    # Queries are re-encoded, slightly shifted copies of catalog images
+    queries = []
+    for target in rng.choice(args.size, args.queries):
+        img = catalog[target]
+        shift = int(args.image_size * 0.05)
+        img = img.crop((shift, shift, img.width, img.height)).resize(img.size)
+        queries.append(encode(img, "JPEG", quality=int(rng.integers(70, 95))))
+    if args.profile_dir:
+        metrics.configure_profiling(args.profile_dir, every=10)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        database_dir = os.path.join(work_dir, "catalog")
+        cache_path = os.path.join(work_dir, "features_store")
+        os.makedirs(database_dir)
+        for i, img in enumerate(catalog):
+            img.save(os.path.join(database_dir, f"art_{i:05d}.png"))
+
+        print(f"catalog={args.size} images of {args.image_size}px, inference={args.inference_backend}, "
+              f"index={args.index_backend}")
+        search = ImageSimilaritySearch(inference_backend=args.inference_backend,
+                                       inference_params=json.loads(args.inference_params))
+        # The first predict call builds the inference graph
+        search.extract_features(catalog[0])
+        t0 = time.perf_counter()
+        search.index_database(database_dir, cache_path=cache_path)
+        index_seconds = time.perf_counter() - t0
+        print(f"indexing: {args.size / index_seconds:.1f} images/s (decode pool overlapping predict)")
+
+        if not args.skip_stages:
+            bench_stages(args, search, database_dir, queries)
+        del search
+        if not args.skip_http:
+            bench_http(args, database_dir, cache_path, queries)
+        if args.profile_dir:
+            print(f"\nprofiles written to {args.profile_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Memory, latency and ranking quality of the compressed storage modes.
+
+Indexes a synthetic catalog with the 'quantized' backend in each storage mode
+(optionally after PCA) and reports bytes per item, single-query latency and
+recall@k against the float32 exact ranking.
+
+Usage:
+    python benchmarks/bench_quantization.py --size 100000 --dim 2048 --pca-dims 256 512
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_index import recall_at_k, synthetic_catalog
+from nn_index import build_index
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=2048)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--pq-m", type=int, nargs="+", default=[32, 64, 128])
+    parser.add_argument("--pca-dims", type=int, nargs="*", default=[256])
+    parser.add_argument("--whiten", action="store_true")
+    args = parser.parse_args()
+
+    features = synthetic_catalog(args.size, args.dim)
+    rng = np.random.default_rng(1)
+    queries = features[rng.choice(args.size, args.queries, replace=False)]
+    queries = queries + 0.1 * rng.random(queries.shape, dtype=np.float32)
+    truth = build_index("exact").fit(features).query(queries, args.k)[1]
+
+    configs = [{'storage': 'float32'}, {'storage': 'float16'}, {'storage': 'int8'}]
+    configs += [{'storage': 'pq', 'm': m} for m in args.pq_m]
+    for pca_dim in args.pca_dims:
+        configs += [
+            {'storage': 'float16', 'pca_dim': pca_dim, 'whiten': args.whiten},
+            {'storage': 'int8', 'pca_dim': pca_dim, 'whiten': args.whiten},
+            {'storage': 'pq', 'm': max(pca_dim // 8, 1), 'pca_dim': pca_dim, 'whiten': args.whiten},
+        ]
+
+    print(f"catalog={args.size} dim={args.dim} queries={args.queries} k={args.k}")
+    print(f"{'mode':>34} {'bytes/item':>11} {'build_s':>8} {'query_ms':>9} {'recall@k':>9}")
+    for params in configs:
+        index = build_index("quantized", **params)
+        t0 = time.perf_counter()
+        index.fit(features)
+        build = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        found = np.array([index.query(q[None, :], args.k)[1][0] for q in queries])
+        query_ms = (time.perf_counter() - t0) * 1000.0 / len(queries)
+
+        label = ",".join(f"{n}={v}" for n, v in params.items() if v is not False)
+        print(f"{label:>34} {index.nbytes / args.size:>11.1f} {build:>8.2f} "
+              f"{query_ms:>9.3f} {recall_at_k(found, truth):>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
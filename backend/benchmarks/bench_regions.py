@@ -0,0 +1,143 @@
+"""
+Recall of partial copies with and without region matching, and its cost.
+
+Generates synthetic artworks (random shapes on random backgrounds), indexes
+them with global embeddings only and in region mode at each tile setting,
+then queries with three kinds of partial copies of random artworks:
+
+  crop      a random 30-60% crop, rescaled
+  collage   a 2x2 grid of four artworks; the target is one of them
+  merch     the artwork shrunk onto a plain product-coloured canvas
+
+Reports recall@1 and recall@k of the source artwork per query kind, indexing
+time per image, query latency and index memory per artwork.
+
+Usage:
+    python benchmarks/bench_regions.py --size 500 --queries 50 --scales 1,2 1,2,3 \\
+        --inference-backend tflite --inference-params '{"model_dir": "models"}'
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai_art_similarity import ImageSimilaritySearch
+
+
+def synthetic_artwork(rng, size=320):
+    img = Image.new('RGB', (size, size), tuple(int(c) for c in rng.integers(0, 256, 3)))
+    draw = ImageDraw.Draw(img)
+    for _ in range(rng.integers(6, 16)):
+        box = sorted(rng.integers(0, size, 2)), sorted(rng.integers(0, size, 2))
+        box = [box[0][0], box[1][0], box[0][1] + 8, box[1][1] + 8]
+        color = tuple(int(c) for c in rng.integers(0, 256, 3))
+        shape = rng.integers(0, 3)
+        if shape == 0:
+            draw.ellipse(box, fill=color)
+        elif shape == 1:
+            draw.rectangle(box, fill=color)
+        else:
+            draw.line(box, fill=color, width=int(rng.integers(3, 15)))
+    return img
+
+
+def crop(rng, img):
+    fraction = rng.uniform(0.3, 0.6)
+    w, h = int(img.width * np.sqrt(fraction)), int(img.height * np.sqrt(fraction))
+    left, upper = rng.integers(0, img.width - w), rng.integers(0, img.height - h)
+    return img.crop((left, upper, left + w, upper + h)).resize((img.width, img.height))
+
+
+def collage(rng, images, target):
+    others = rng.choice(len(images), 3, replace=False)
+    tiles = [images[target]] + [images[i] for i in others]
+    order = rng.permutation(4)
+    half = images[target].width // 2
+    canvas = Image.new('RGB', (2 * half, 2 * half))
+    for slot, tile in zip(order, tiles):
+        canvas.paste(tile.resize((half, half)), ((slot % 2) * half, (slot // 2) * half))
+    return canvas
+
+
+def merch(rng, img):
+    canvas = Image.new('RGB', (img.width, img.height), tuple(int(c) for c in rng.integers(0, 256, 3)))
+    side = int(img.width * rng.uniform(0.35, 0.5))
+    left, upper = rng.integers(0, img.width - side, 2)
+    canvas.paste(img.resize((side, side)), (int(left), int(upper)))
+    return canvas
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=300)
+    parser.add_argument("--queries", type=int, default=40, help="Queries per kind")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--scales", nargs="+", default=["1,2", "1,2,3"],
+                        help="Region tile settings to compare with global-only search")
+    parser.add_argument("--overlap", type=float, default=0.25)
+    parser.add_argument("--inference-backend", default="keras")
+    parser.add_argument("--inference-params", default="{}", help="JSON object")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    images = [synthetic_artwork(rng) for _ in range(args.size)]
+    targets = rng.choice(args.size, args.queries, replace=False)
+    queries = {
+        'crop': [crop(rng, images[t]) for t in targets],
+        'collage': [collage(rng, images, t) for t in targets],
+        'merch': [merch(rng, images[t]) for t in targets],
+    }
+
+    with tempfile.TemporaryDirectory() as database_dir:
+        paths = []
+        for i, img in enumerate(images):
+            paths.append(os.path.join(database_dir, f"art_{i:05d}.png"))
+            img.save(paths[-1])
+        target_paths = [paths[t] for t in targets]
+
+        configs = [("global", None)] + [
+            (f"regions {spec}", {'scales': [int(s) for s in spec.split(",")], 'overlap': args.overlap})
+            for spec in args.scales
+        ]
+        print(f"artworks={args.size} queries={args.queries} per kind k={args.k} "
+              f"inference={args.inference_backend}")
+        print(f"\n{'mode':>16} {'kind':>8} {'recall@1':>9} {f'recall@{args.k}':>9} {'query_ms':>9}")
+        summary = []
+        for label, region_params in configs:
+            search = ImageSimilaritySearch(inference_backend=args.inference_backend,
+                                           inference_params=json.loads(args.inference_params),
+                                           region_params=region_params)
+            # The first predict call builds the inference graph
+            search.extract_features(images[0])
+            t0 = time.perf_counter()
+            search.index_database(database_dir)
+            index_ms = (time.perf_counter() - t0) * 1000 / args.size
+            nbytes = search.database_features.nbytes
+            if search.regions is not None:
+                nbytes += search.regions.nbytes
+            for kind, kind_queries in queries.items():
+                hits1 = hitsk = 0
+                t0 = time.perf_counter()
+                for query, target in zip(kind_queries, target_paths):
+                    found = [path for _, path in search.search(query, top_k=args.k)]
+                    hits1 += found[:1] == [target]
+                    hitsk += target in found
+                query_ms = (time.perf_counter() - t0) * 1000 / len(kind_queries)
+                print(f"{label:>16} {kind:>8} {hits1 / args.queries:>9.2f} {hitsk / args.queries:>9.2f} "
+                      f"{query_ms:>9.1f}")
+            summary.append((label, index_ms, nbytes / args.size))
+
+        print(f"\n{'mode':>16} {'index_ms/img':>13} {'KB/artwork':>11}")
+        for label, index_ms, per_artwork in summary:
+            print(f"{label:>16} {index_ms:>13.1f} {per_artwork / 1024:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
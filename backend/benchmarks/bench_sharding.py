@@ -0,0 +1,96 @@
+"""
+Query throughput of scatter-gather search as the number of shards grows.
+
+Indexes a synthetic catalog once in-process (the single-process baseline) and
+then with ShardedIndex at each shard count, and runs a closed-loop load from
+--clients threads. Reports QPS, p50/p99 latency, recall@k against the exact
+ranking, and the share of queries that missed a shard's timeout.
+
+Usage:
+    python benchmarks/bench_sharding.py --size 1000000 --dim 2048 --shards 1 2 4 8 --clients 8
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_index import recall_at_k, synthetic_catalog
+from nn_index import build_index
+
+
+def run_load(index, queries, k, clients, duration):
+    """Closed-loop load; returns (qps, latencies in seconds, results by query position)."""
+    latencies = [[] for _ in range(clients)]
+    found = {}
+    stop = time.perf_counter() + duration
+
+    def client(worker):
+        position = worker
+        while time.perf_counter() < stop:
+            q = queries[position % len(queries)]
+            t0 = time.perf_counter()
+            ids = index.query(q[None, :], k)[1][0]
+            latencies[worker].append(time.perf_counter() - t0)
+            found.setdefault(position % len(queries), ids)
+            position += clients
+
+    threads = [threading.Thread(target=client, args=(worker,)) for worker in range(clients)]
+    t0 = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - t0
+    latencies = np.concatenate([np.array(l) for l in latencies])
+    return len(latencies) / elapsed, latencies, found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=200000)
+    parser.add_argument("--dim", type=int, default=2048)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds of load per configuration")
+    parser.add_argument("--backend", default="exact", help="Index backend inside each shard")
+    parser.add_argument("--timeout", type=float, default=1.0,
+                        help="Per-query shard deadline; slower shards are left out (allow_partial)")
+    args = parser.parse_args()
+
+    features = synthetic_catalog(args.size, args.dim)
+    rng = np.random.default_rng(1)
+    queries = features[rng.choice(args.size, args.queries, replace=False)]
+    queries = queries + 0.1 * rng.random(queries.shape, dtype=np.float32)
+    truth = build_index("exact").fit(features).query(queries, args.k)[1]
+
+    print(f"catalog={args.size} dim={args.dim} clients={args.clients} k={args.k} cpus={os.cpu_count()}")
+    print(f"{'config':>16} {'build_s':>8} {'qps':>8} {'p50_ms':>8} {'p99_ms':>8} {'recall@k':>9} {'partial':>8}")
+    configs = [("in-process", None)] + [(f"{n} shards", n) for n in args.shards]
+    for label, num_shards in configs:
+        t0 = time.perf_counter()
+        if num_shards is None:
+            index = build_index(args.backend).fit(features)
+        else:
+            index = build_index("sharded", num_shards=num_shards, shard_backend=args.backend,
+                                timeout=args.timeout, allow_partial=True).fit(features)
+        build = time.perf_counter() - t0
+
+        qps, latencies, found = run_load(index, queries, args.k, args.clients, args.duration)
+        positions = sorted(found)
+        recall = recall_at_k(np.array([found[p] for p in positions]), truth[positions])
+        partial = index.partial_queries / max(index.queries, 1) if num_shards else 0.0
+        print(f"{label:>16} {build:>8.2f} {qps:>8.1f} {np.percentile(latencies, 50) * 1000:>8.2f} "
+              f"{np.percentile(latencies, 99) * 1000:>8.2f} {recall:>9.3f} {partial:>8.3f}")
+        if num_shards is not None:
+            index.close()
+
+
+if __name__ == "__main__":
+    main()
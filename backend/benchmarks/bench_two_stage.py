@@ -0,0 +1,70 @@
+"""
+Latency and recall of two-stage retrieval (coarse scan + exact re-rank).
+
+Indexes a synthetic catalog with the 'two_stage' backend for each first-stage
+representation and candidate count, and reports single-query latency,
+first-stage bytes per item and recall@k against the exact float32 ranking.
+The 'exact' backend is the baseline.
+
+Usage:
+    python benchmarks/bench_two_stage.py --size 200000 --dim 2048 --candidates 64 256 1024
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_index import recall_at_k, synthetic_catalog
+from nn_index import build_index, l2_normalize
+
+
+def run(index, queries, k):
+    """Per-query search; returns (ms per query, found ids)."""
+    t0 = time.perf_counter()
+    found = np.array([index.query(q[None, :], k)[1][0] for q in queries])
+    return (time.perf_counter() - t0) * 1000 / len(queries), found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=2048)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--candidates", type=int, nargs="+", default=[64, 256, 1024])
+    parser.add_argument("--pca-dims", type=int, nargs="*", default=[64, 128])
+    args = parser.parse_args()
+
+    features = l2_normalize(synthetic_catalog(args.size, args.dim))
+    rng = np.random.default_rng(1)
+    queries = features[rng.choice(args.size, args.queries, replace=False)]
+    queries = l2_normalize(queries + 0.1 * rng.random(queries.shape, dtype=np.float32))
+
+    exact = build_index("exact").fit(features, normalized=True)
+    exact_ms, truth = run(exact, queries, args.k)
+    print(f"catalog={args.size} dim={args.dim} queries={args.queries} k={args.k}")
+    print(f"{'first stage':>24} {'candidates':>10} {'bytes/item':>11} {'build_s':>8} {'query_ms':>9} {'recall@k':>9}")
+    print(f"{'exact (baseline)':>24} {'-':>10} {features.nbytes / args.size:>11.1f} {'-':>8} "
+          f"{exact_ms:>9.3f} {1.0:>9.3f}")
+
+    stages = [('binary', {'storage': 'binary'})]
+    stages += [(f"binary, pca {d}", {'storage': 'binary', 'pca_dim': d}) for d in args.pca_dims]
+    stages += [(f"float16, pca {d}", {'storage': 'float16', 'pca_dim': d}) for d in args.pca_dims]
+    for label, params in stages:
+        index = build_index("two_stage", **params)
+        t0 = time.perf_counter()
+        index.fit(features, normalized=True)
+        build = time.perf_counter() - t0
+        for candidates in args.candidates:
+            index.candidates = candidates
+            query_ms, found = run(index, queries, args.k)
+            print(f"{label:>24} {candidates:>10} {index.nbytes / args.size:>11.1f} {build:>8.2f} "
+                  f"{query_ms:>9.3f} {recall_at_k(found, truth):>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Cold-start report for the API process.
+
+Imports the server module in fresh interpreters and reports:
+  - time from process start until the import finished, and RSS at that point
+    (median over --runs), and optionally until the search engine is warm
+  - a `python -X importtime` breakdown: self time per top-level package and
+    the slowest direct imports by cumulative time
+
+With --json, one record per invocation is appended to a JSON-lines file so
+cold start and RSS can be tracked across commits.
+
+Usage:
+    python benchmarks/startup_report.py --runs 5 --warmup --json startup_history.jsonl
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import json
+import {module}
+import startup
+startup.mark('app_imported_seconds')
+if {warmup}:
+    from search_engine import get_engine
+    get_engine().warmup()
+print(json.dumps(startup.report()))
+"""
+
+
+def run_probe(module, warmup=False, importtime=False):
+    """Import the module in a fresh interpreter; return (report, importtime stderr)."""
+    cmd = [sys.executable]
+    if importtime:
+        cmd += ["-X", "importtime"]
+    cmd += ["-c", PROBE.format(module=module, warmup=warmup)]
+    result = subprocess.run(cmd, cwd=BACKEND_DIR, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    return report, result.stderr
+
+
+def parse_importtime(stderr, module):
+    """
+    Parse `-X importtime` output.
+
+    Returns:
+        tuple: ({root package: self seconds}, [(cumulative seconds, name)] for
+            the imports made directly by `module`, slowest first).
+    """
+    by_package = defaultdict(float)
+    children, pending = [], []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        head, cumulative_us, name = line.split("|", 2)
+        depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        name = name.strip()
+        by_package[name.split(".")[0]] += int(head.split(":")[1]) / 1e6
+        # Children are printed before their parent, one indentation level deeper
+        if depth == 1:
+            pending.append((int(cumulative_us) / 1e6, name))
+        elif depth == 0:
+            if name == module:
+                children = pending
+            pending = []
+    return dict(by_package), sorted(children, reverse=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="main", help="Module to import (from the backend directory)")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--warmup", action="store_true", help="Also time a full search engine warmup")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--json", help="Append a JSON-lines record to this file")
+    args = parser.parse_args()
+
+    reports = [run_probe(args.module, warmup=args.warmup)[0] for _ in range(args.runs)]
+    _, stderr = run_probe(args.module, importtime=True)
+    by_package, direct = parse_importtime(stderr, args.module)
+
+    record = {
+        'timestamp': time.time(),
+        'module': args.module,
+        'runs': args.runs,
+        'app_imported_seconds': round(float(np.median([r['app_imported_seconds'] for r in reports])), 4),
+        'rss_bytes': int(np.median([r['rss_bytes'] for r in reports])),
+        'peak_rss_bytes': int(np.median([r['peak_rss_bytes'] for r in reports])),
+    }
+    if args.warmup:
+        record['engine_ready_seconds'] = round(float(np.median([r['engine_ready_seconds'] for r in reports])), 4)
+
+    print(f"import {args.module}: {record['app_imported_seconds']:.3f}s after process start (median of {args.runs})")
+    if args.warmup:
+        print(f"engine ready: {record['engine_ready_seconds']:.3f}s after process start")
+    print(f"RSS {record['rss_bytes'] / 2**20:.1f} MiB, peak {record['peak_rss_bytes'] / 2**20:.1f} MiB"
+          + (" (after warmup)" if args.warmup else ""))
+
+    print(f"\n{'self_ms':>9}  package")
+    for package, seconds in sorted(by_package.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"{seconds * 1000:>9.1f}  {package}")
+    print(f"\n{'cumul_ms':>9}  imported by {args.module}")
+    for seconds, module in direct[:args.top]:
+        print(f"{seconds * 1000:>9.1f}  {module}")
+
+    if args.json:
+        with open(args.json, "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+
+if __name__ == "__main__":
+    main()
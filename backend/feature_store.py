@@ -0,0 +1,311 @@
+"""
+Versioned on-disk feature store.
+
+A store is a directory of immutable versions plus a pointer to the current
+one:
+
+    features_store/
+        CURRENT             name of the live version, replaced atomically
+        v000003/
+            header.json     format, version, model_type, pooling, dim, dtype, count
+            features.bin    raw row-major (count, dim) matrix of `dtype`, opened with np.memmap
+            meta.jsonl      one JSON object per row (path, mtime, size, sha1, ...)
+            <name>.npy      optional named arrays stored alongside the rows
+                            (e.g. an inverted index), also memory-mapped
+
+Readers memory-map the matrix read-only, so every worker process on a host
+shares one page-cached copy and opening a store costs milliseconds regardless
+of its size. Writers build a new version in a temporary directory and only
+publish it by swapping CURRENT, so a crash never leaves a half-written store
+behind. Nothing is unpickled.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+FORMAT_NAME = "copyright-guardian-features"
+FORMAT_VERSION = 1
+FEATURES_FILE = "features.bin"
+META_FILE = "meta.jsonl"
+ARRAY_SUFFIX = ".npy"
+HEADER_FILE = "header.json"
+CURRENT_FILE = "CURRENT"
+
+
+def _fsync_dir(path):
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def file_signature(path):
+    """Cheap change detector stored with each row: modification time and size."""
+    stat = os.stat(path)
+    return {'mtime': stat.st_mtime, 'size': stat.st_size}
+
+
+def content_hash(path, chunk_size=1 << 20):
+    """SHA-1 of a file's contents, stored with each row to tell touched files from modified ones."""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def store_exists(store_dir):
+    """Return True if `store_dir` holds a published store."""
+    return os.path.isfile(os.path.join(store_dir, CURRENT_FILE))
+
+
+def _current_version_dir(store_dir):
+    with open(os.path.join(store_dir, CURRENT_FILE)) as f:
+        return os.path.join(store_dir, f.read().strip())
+
+
+class FeatureStore:
+    """A read-only, memory-mapped version of a feature store."""
+
+    def __init__(self, path, header, features, meta, arrays=None):
+        self.path = path
+        self.header = header
+        self.features = features
+        self.meta = meta
+        self.arrays = arrays or {}
+
+    @property
+    def paths(self):
+        return [row['path'] for row in self.meta]
+
+    def __len__(self):
+        return self.header['count']
+
+
+def load_feature_store(store_dir):
+    """
+    Open the current version of a store.
+
+    Args:
+        store_dir (str): Store directory.
+
+    Returns:
+        FeatureStore: Header, memory-mapped (count, dim) features, metadata
+            rows and memory-mapped named arrays.
+    """
+    version_dir = _current_version_dir(store_dir)
+    with open(os.path.join(version_dir, HEADER_FILE)) as f:
+        header = json.load(f)
+    if header.get('format') != FORMAT_NAME:
+        raise ValueError(f"{store_dir} is not a feature store")
+    if header.get('format_version', 0) > FORMAT_VERSION:
+        raise ValueError(f"Feature store format {header['format_version']} is newer than supported ({FORMAT_VERSION})")
+
+    count, dim = header['count'], header['dim']
+    features_path = os.path.join(version_dir, FEATURES_FILE)
+    if count == 0:
+        features = np.empty((0, dim), dtype=header['dtype'])
+    else:
+        features = np.memmap(features_path, dtype=header['dtype'], mode='r', shape=(count, dim))
+
+    with open(os.path.join(version_dir, META_FILE)) as f:
+        meta = [json.loads(line) for line in f if line.strip()]
+    if len(meta) != count:
+        raise ValueError(f"Feature store {version_dir} is corrupt: {len(meta)} metadata rows for {count} vectors")
+
+    arrays = {}
+    for name, spec in header.get('arrays', {}).items():
+        array_path = os.path.join(version_dir, name + ARRAY_SUFFIX)
+        # An empty array cannot be memory-mapped
+        arrays[name] = np.load(array_path, mmap_mode='r' if np.prod(spec['shape']) else None,
+                               allow_pickle=False)
+    return FeatureStore(version_dir, header, features, meta, arrays)
+
+
+class FeatureStoreWriter:
+    """
+    Write a new version of a store, row batch by row batch.
+
+    Rows go straight to disk, so the full matrix never has to be held in
+    memory. Nothing is visible to readers until commit().
+
+        with FeatureStoreWriter("features_store", dim=2048, model_type="resnet50",
+                                pooling="avg") as writer:
+            writer.append(batch_features, batch_meta)
+        # committed on clean exit, discarded on exception
+    """
+
+    def __init__(self, store_dir, dim, model_type, pooling, dtype="float32", extra_header=None,
+                 keep_versions=2):
+        """
+        Args:
+            store_dir (str): Store directory (created if needed).
+            dim (int): Feature dimension.
+            model_type (str): Feature extractor the vectors come from.
+            pooling (str): Pooling used by the extractor.
+            dtype (str): Stored dtype.
+            extra_header (dict, optional): Additional header fields.
+            keep_versions (int): Published versions to keep on disk. Older ones
+                are deleted after commit (open memmaps of them stay valid).
+        """
+        self.store_dir = store_dir
+        self.dim = dim
+        self.dtype = np.dtype(dtype)
+        self.keep_versions = max(keep_versions, 1)
+        self.header = {
+            'format': FORMAT_NAME,
+            'format_version': FORMAT_VERSION,
+            'model_type': model_type,
+            'pooling': pooling,
+            'dim': dim,
+            'dtype': self.dtype.name,
+            **(extra_header or {}),
+        }
+        self.count = 0
+        os.makedirs(store_dir, exist_ok=True)
+        self._tmp_dir = tempfile.mkdtemp(prefix=".tmp-", dir=store_dir)
+        # mkdtemp creates 0700; published versions must be readable by every worker
+        os.chmod(self._tmp_dir, 0o755)
+        self._features = open(os.path.join(self._tmp_dir, FEATURES_FILE), 'wb')
+        self._meta = open(os.path.join(self._tmp_dir, META_FILE), 'w')
+        self._arrays = {}
+        self._closed = False
+        self.version_dir = None
+
+    def append(self, features, meta_rows):
+        """
+        Append a batch of rows.
+
+        Args:
+            features (numpy.ndarray): (M, dim) features.
+            meta_rows (list of dict): M metadata rows; each needs a 'path'.
+        """
+        features = np.ascontiguousarray(np.atleast_2d(features), dtype=self.dtype)
+        if len(features) != len(meta_rows):
+            raise ValueError("features and meta_rows must have the same length")
+        if len(features) == 0:
+            return
+        if features.shape[1] != self.dim:
+            raise ValueError(f"Expected {self.dim}-d features, got {features.shape[1]}")
+        self._features.write(features.tobytes())
+        for row in meta_rows:
+            self._meta.write(json.dumps(row, separators=(',', ':')) + "\n")
+        self.count += len(features)
+
+    def write_array(self, name, array):
+        """
+        Store a named array with this version (opened as store.arrays[name]).
+
+        Args:
+            name (str): Array name; a plain file name without suffix.
+            array (numpy.ndarray): Any non-object array.
+        """
+        if not name.isidentifier():
+            raise ValueError(f"Invalid array name {name!r}")
+        array = np.ascontiguousarray(array)
+        with open(os.path.join(self._tmp_dir, name + ARRAY_SUFFIX), 'wb') as f:
+            np.save(f, array, allow_pickle=False)
+            f.flush()
+            os.fsync(f.fileno())
+        self._arrays[name] = {'dtype': array.dtype.name, 'shape': list(array.shape)}
+
+    def _next_version(self):
+        versions = [int(name[1:]) for name in os.listdir(self.store_dir)
+                    if name.startswith('v') and name[1:].isdigit()]
+        return max(versions, default=0) + 1
+
+    def commit(self):
+        """
+        Publish the written rows as the store's new current version.
+
+        Returns:
+            str: Path of the published version directory.
+        """
+        for f in (self._features, self._meta):
+            f.flush()
+            os.fsync(f.fileno())
+            f.close()
+
+        version = self._next_version()
+        header = dict(self.header, version=version, count=self.count, created=time.time())
+        if self._arrays:
+            header['arrays'] = self._arrays
+        header_path = os.path.join(self._tmp_dir, HEADER_FILE)
+        with open(header_path, 'w') as f:
+            json.dump(header, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+
+        name = f"v{version:06d}"
+        version_dir = os.path.join(self.store_dir, name)
+        os.rename(self._tmp_dir, version_dir)
+        pointer_tmp = os.path.join(self.store_dir, CURRENT_FILE + ".tmp")
+        with open(pointer_tmp, 'w') as f:
+            f.write(name)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(pointer_tmp, os.path.join(self.store_dir, CURRENT_FILE))
+        _fsync_dir(self.store_dir)
+        self._closed = True
+        self.version_dir = version_dir
+
+        self._prune()
+        return version_dir
+
+    def abort(self):
+        """Discard everything written so far."""
+        if self._closed:
+            return
+        for f in (self._features, self._meta):
+            if not f.closed:
+                f.close()
+        shutil.rmtree(self._tmp_dir, ignore_errors=True)
+        self._closed = True
+
+    def _prune(self):
+        versions = sorted(name for name in os.listdir(self.store_dir)
+                          if name.startswith('v') and name[1:].isdigit())
+        for name in versions[:-self.keep_versions]:
+            shutil.rmtree(os.path.join(self.store_dir, name), ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+        return False
+
+
+def save_feature_store(store_dir, features, meta_rows, model_type, pooling, **kwargs):
+    """
+    Write a whole feature matrix as a new store version.
+
+    Args:
+        store_dir (str): Store directory.
+        features (numpy.ndarray): (N, dim) features.
+        meta_rows (list of dict): N metadata rows; each needs a 'path'.
+        model_type (str): Feature extractor the vectors come from.
+        pooling (str): Pooling used by the extractor.
+        **kwargs: Passed to FeatureStoreWriter.
+
+    Returns:
+        str: Path of the published version directory.
+    """
+    features = np.atleast_2d(features)
+    with FeatureStoreWriter(store_dir, features.shape[1], model_type, pooling, **kwargs) as writer:
+        writer.append(features, meta_rows)
+    return writer.version_dir
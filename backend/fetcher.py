@@ -0,0 +1,445 @@
+"""
+Asynchronous fetching of remote query images (http and https URLs).
+
+One ImageFetcher owns an event loop thread and a pooled httpx.AsyncClient, so
+connections to an image host are reused across queries and any number of
+downloads wait on the network without tying up threads. Threads (decode
+workers, sync callers) use fetch() or submit(); coroutines use fetch_async(),
+which never blocks the calling event loop.
+
+Every fetch is bounded:
+  - at most `per_host` concurrent requests per host and `max_connections` overall
+  - a connect timeout and an overall deadline per request (counted from when
+    a per-host slot is free), so a host that drips bytes cannot hold a
+    request forever
+  - a maximum body size, checked against Content-Length and while streaming
+  - only http(s), and unless allow_private is set, no private, loopback or
+    link-local addresses (the server must not be usable to probe its own
+    network); every redirect hop is checked again. The check runs when the
+    connection is opened, on the addresses actually connected to, so a host
+    that resolves to a public address for the check and to a private one
+    for the connection (DNS rebinding) is still refused
+
+The body is fed to an incremental PIL parser as it arrives, so decoding
+overlaps the download and the raw bytes are never buffered separately.
+"""
+import asyncio
+import contextlib
+import functools
+import ipaddress
+import os
+import socket
+import threading
+import time
+from collections import OrderedDict, deque
+from urllib.parse import urljoin, urlsplit
+
+from PIL import Image, ImageFile
+
+import metrics
+
+# Largest accepted image download
+MAX_BODY_BYTES = 32 * 1024 * 1024
+
+
+class FetchError(ValueError):
+    """A remote image could not be fetched or decoded."""
+
+
+def is_url(value):
+    """Return True for query values that are fetched over HTTP."""
+    return isinstance(value, str) and value.startswith(('http://', 'https://'))
+
+
+async def _resolve_global(host, port):
+    """
+    Resolve a host, refusing it if any of its addresses is not global.
+
+    Returns:
+        list: The address strings to connect to, in resolver order.
+
+    Raises:
+        FetchError: If the host cannot be resolved or is private, loopback,
+            link-local or otherwise non-global.
+    """
+    try:
+        infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except socket.gaierror as e:
+        raise FetchError(f"Cannot resolve {host}: {e}") from None
+    addresses = []
+    for info in infos:
+        address = ipaddress.ip_address(info[4][0].split('%')[0])
+        if address.version == 6 and address.ipv4_mapped is not None:
+            address = address.ipv4_mapped
+        if not address.is_global:
+            raise FetchError(f"Refusing to fetch from {host}: it resolves to {address}")
+        if str(address) not in addresses:
+            addresses.append(str(address))
+    return addresses
+
+
+class _CheckedNetworkBackend:
+    """
+    httpcore network backend that resolves hosts itself with _resolve_global()
+    and connects to the addresses it checked, so the connection cannot be
+    made to an address that was never checked.
+    """
+
+    def __init__(self, httpcore):
+        self._httpcore = httpcore
+        self._backend = httpcore.AnyIOBackend()
+
+    async def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        error = None
+        for address in await _resolve_global(host, port):
+            try:
+                return await self._backend.connect_tcp(address, port, timeout=timeout, local_address=local_address,
+                                                       socket_options=socket_options)
+            except self._httpcore.ConnectError as e:
+                error = e
+        raise error
+
+    async def connect_unix_socket(self, path, timeout=None, socket_options=None):
+        raise FetchError("Image URLs are not fetched over unix sockets")
+
+    async def sleep(self, seconds):
+        await self._backend.sleep(seconds)
+
+
+@contextlib.contextmanager
+def _httpx_errors(httpx, httpcore):
+    """Re-raise httpcore errors as the httpx errors of the same name."""
+    try:
+        yield
+    except httpcore.TimeoutException as e:
+        raise getattr(httpx, type(e).__name__, httpx.TimeoutException)(str(e)) from e
+    except (httpcore.NetworkError, httpcore.ProtocolError, httpcore.UnsupportedProtocol, httpcore.ProxyError) as e:
+        raise getattr(httpx, type(e).__name__, httpx.TransportError)(str(e)) from e
+
+
+@functools.lru_cache(maxsize=None)
+def _transport_class(httpx, httpcore):
+    """
+    The httpx transport of ImageFetcher, built on first use so that httpx and
+    httpcore are only imported once a URL is fetched.
+    """
+
+    class ResponseStream(httpx.AsyncByteStream):
+        def __init__(self, stream):
+            self._stream = stream
+
+        async def __aiter__(self):
+            with _httpx_errors(httpx, httpcore):
+                async for part in self._stream:
+                    yield part
+
+        async def aclose(self):
+            await self._stream.aclose()
+
+    class CheckedTransport(httpx.AsyncBaseTransport):
+        """
+        HTTP/1.1 transport over an httpcore connection pool. Unless private
+        addresses are allowed, the pool connects through
+        _CheckedNetworkBackend, so every connection is made to an address
+        that was checked for being global.
+        """
+
+        def __init__(self, limits, allow_private):
+            self._pool = httpcore.AsyncConnectionPool(
+                ssl_context=httpx.create_ssl_context(),
+                max_connections=limits.max_connections,
+                max_keepalive_connections=limits.max_keepalive_connections,
+                keepalive_expiry=limits.keepalive_expiry,
+                network_backend=None if allow_private else _CheckedNetworkBackend(httpcore),
+            )
+
+        async def handle_async_request(self, request):
+            core_request = httpcore.Request(
+                method=request.method,
+                url=httpcore.URL(
+                    scheme=request.url.raw_scheme,
+                    host=request.url.raw_host,
+                    port=request.url.port,
+                    target=request.url.raw_path,
+                ),
+                headers=request.headers.raw,
+                content=request.stream,
+                extensions=request.extensions,
+            )
+            with _httpx_errors(httpx, httpcore):
+                response = await self._pool.handle_async_request(core_request)
+            return httpx.Response(
+                status_code=response.status,
+                headers=response.headers,
+                stream=ResponseStream(response.stream),
+                extensions=response.extensions,
+            )
+
+        async def aclose(self):
+            await self._pool.aclose()
+
+    return CheckedTransport
+
+
+class ImageFetcher:
+    """Pooled, bounded HTTP client for query images, driven by its own event loop thread."""
+
+    def __init__(self, timeout=10.0, connect_timeout=3.0, max_bytes=MAX_BODY_BYTES, per_host=4,
+                 max_connections=64, max_redirects=3, allow_private=False, chunk_size=64 * 1024,
+                 max_hosts=1024):
+        """
+        Args:
+            timeout (float): Deadline of one request in seconds, from when a
+                per-host slot is free.
+            connect_timeout (float): Deadline for establishing a connection.
+            max_bytes (int): Largest accepted body.
+            per_host (int): Concurrent requests per host; further requests
+                to the same host wait for a free slot.
+            max_connections (int): Size of the connection pool.
+            max_redirects (int): Redirects followed per fetch.
+            allow_private (bool): Allow URLs resolving to private, loopback
+                or link-local addresses.
+            chunk_size (int): Bytes read and fed to the decoder at a time.
+            max_hosts (int): Hosts whose per-host limit is tracked; beyond
+                this, the least recently used idle hosts are forgotten.
+        """
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.max_bytes = max_bytes
+        self.per_host = per_host
+        self.max_connections = max_connections
+        self.max_redirects = max_redirects
+        self.allow_private = allow_private
+        self.chunk_size = chunk_size
+        self.max_hosts = max_hosts
+        self._loop = None
+        self._client = None
+        self._httpx = None
+        # host -> [semaphore, requests holding or waiting for it], least
+        # recently used first; only touched on the event loop thread
+        self._hosts = OrderedDict()
+        self._start_lock = threading.Lock()
+        self.requests = 0
+        self.failures = 0
+        self.in_flight = 0
+        self.bytes_received = 0
+
+    def _ensure_started(self):
+        with self._start_lock:
+            if self._loop is None:
+                try:
+                    import httpx
+                except ImportError as e:
+                    raise ImportError("Fetching image URLs requires httpx (pip install httpx)") from e
+                self._httpx = httpx
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="image-fetcher", daemon=True).start()
+                self._client = asyncio.run_coroutine_threadsafe(self._create_client(), loop).result()
+                self._loop = loop
+            return self._loop
+
+    async def _create_client(self):
+        import httpcore
+
+        httpx = self._httpx
+        limits = httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections)
+        transport = _transport_class(httpx, httpcore)(limits, self.allow_private)
+        return httpx.AsyncClient(
+            transport=transport,
+            timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout),
+            # Redirects are followed by hand so every hop's URL is validated
+            follow_redirects=False,
+            headers={'Accept': 'image/*'},
+            # A proxy from the environment would make the connections, and
+            # bypass the address check
+            trust_env=False,
+        )
+
+    def submit(self, url):
+        """
+        Start fetching an image.
+
+        Returns:
+            concurrent.futures.Future: Resolves to a PIL image, or raises FetchError.
+        """
+        return asyncio.run_coroutine_threadsafe(self._fetch(url), self._ensure_started())
+
+    def fetch(self, url):
+        """Fetch and decode an image, blocking the calling thread."""
+        return self.submit(url).result()
+
+    async def fetch_async(self, url):
+        """Fetch and decode an image from a coroutine running on any event loop."""
+        return await asyncio.wrap_future(self.submit(url))
+
+    def prefetch(self, items, window=32):
+        """
+        Start fetching URLs up to `window` items ahead of the consumer.
+
+        Args:
+            items (iterable): Queries; URLs among them are fetched. Consumed lazily.
+            window (int): Items read ahead.
+
+        Yields:
+            Each item, with URLs replaced by the Future of their image.
+        """
+        pending = deque()
+        for item in items:
+            pending.append(self.submit(item) if is_url(item) else item)
+            if len(pending) > window:
+                yield pending.popleft()
+        while pending:
+            yield pending.popleft()
+
+    async def _fetch(self, url):
+        self.requests += 1
+        self.in_flight += 1
+        failed = True
+        t0 = time.perf_counter()
+        try:
+            image = await self._follow(url)
+            failed = False
+            return image
+        except self._httpx.HTTPError as e:
+            self.failures += 1
+            raise FetchError(f"Could not fetch {url}: {type(e).__name__}: {e}") from None
+        except FetchError:
+            self.failures += 1
+            raise
+        finally:
+            self.in_flight -= 1
+            # Recorded directly: stage() would profile the shared event loop thread
+            metrics.observe('fetch', time.perf_counter() - t0, error=failed)
+
+    async def _follow(self, url):
+        for _ in range(self.max_redirects + 1):
+            host = self._check_url(url)
+            slot = self._host_slot(host)
+            slot[1] += 1
+            try:
+                async with slot[0]:
+                    # The deadline starts once a slot is free, so a long queue for
+                    # one host does not time out the requests at its tail
+                    try:
+                        image, location = await asyncio.wait_for(self._get(url), self.timeout)
+                    except asyncio.TimeoutError:
+                        raise FetchError(f"Timed out after {self.timeout}s fetching {url}") from None
+            finally:
+                slot[1] -= 1
+            if image is not None:
+                return image
+            url = urljoin(url, location)
+        raise FetchError(f"More than {self.max_redirects} redirects fetching {url}")
+
+    def _host_slot(self, host):
+        """
+        The [semaphore, users] entry of a host. Adding a host beyond
+        max_hosts forgets the least recently used hosts nobody is using, so
+        the table stays bounded however many hosts are queried.
+        """
+        slot = self._hosts.get(host)
+        if slot is not None:
+            self._hosts.move_to_end(host)
+            return slot
+        slot = self._hosts[host] = [asyncio.Semaphore(self.per_host), 0]
+        excess = len(self._hosts) - self.max_hosts
+        if excess > 0:
+            idle = [name for name, (_, users) in self._hosts.items() if users == 0 and name != host]
+            for name in idle[:excess]:
+                del self._hosts[name]
+        return slot
+
+    async def _get(self, url):
+        """One request: (image, None), or (None, location) for a redirect."""
+        async with self._client.stream('GET', url) as response:
+            if response.is_redirect:
+                return None, response.headers['location']
+            if response.status_code != 200:
+                raise FetchError(f"{url} returned HTTP {response.status_code}")
+            return await self._decode(url, response), None
+
+    @staticmethod
+    def _check_url(url):
+        """
+        Validate a URL and return its host key for the per-host limit. Its
+        addresses are checked when connecting (see _resolve_global).
+        """
+        parts = urlsplit(url)
+        try:
+            port = parts.port or (443 if parts.scheme == 'https' else 80)
+        except ValueError:
+            port = None
+        if parts.scheme not in ('http', 'https') or not parts.hostname or port is None:
+            raise FetchError(f"Unsupported image URL {url!r}")
+        return f"{parts.hostname}:{port}"
+
+    async def _decode(self, url, response):
+        length = response.headers.get('content-length', '')
+        if length.isdigit() and int(length) > self.max_bytes:
+            raise FetchError(f"{url} is larger than {self.max_bytes} bytes")
+        parser = ImageFile.Parser()
+        received = 0
+        # Closed here rather than when garbage collected, which may happen
+        # after the event loop stopped
+        async with contextlib.aclosing(response.aiter_bytes(self.chunk_size)) as chunks:
+            async for chunk in chunks:
+                received += len(chunk)
+                if received > self.max_bytes:
+                    raise FetchError(f"{url} is larger than {self.max_bytes} bytes")
+                try:
+                    parser.feed(chunk)
+                except (OSError, SyntaxError, ValueError, Image.DecompressionBombError) as e:
+                    raise FetchError(f"{url} is not a readable image: {e}") from None
+        self.bytes_received += received
+        try:
+            return parser.close()
+        except (OSError, SyntaxError, ValueError, Image.DecompressionBombError) as e:
+            raise FetchError(f"{url} is not a readable image: {e}") from None
+
+    def stats(self):
+        """Return the fetch counters."""
+        return {
+            'requests': self.requests,
+            'failures': self.failures,
+            'in_flight': self.in_flight,
+            'bytes_received': self.bytes_received,
+            'hosts': len(self._hosts),
+        }
+
+    def close(self):
+        """Close pooled connections and stop the event loop thread."""
+        with self._start_lock:
+            loop, self._loop = self._loop, None
+            if loop is None:
+                return
+            asyncio.run_coroutine_threadsafe(self._client.aclose(), loop).result()
+            # Finish closing response streams before the loop stops running tasks
+            asyncio.run_coroutine_threadsafe(loop.shutdown_asyncgens(), loop).result()
+            loop.call_soon_threadsafe(loop.stop)
+            self._hosts = OrderedDict()
+
+
+_fetcher = None
+_fetcher_lock = threading.Lock()
+
+
+def get_fetcher():
+    """
+    Return the process-wide image fetcher. Nothing is started until the
+    first URL is fetched.
+
+    Configured through the FETCH_TIMEOUT (seconds), FETCH_MAX_BYTES,
+    FETCH_PER_HOST, FETCH_MAX_CONNECTIONS and FETCH_ALLOW_PRIVATE (0/1)
+    environment variables.
+    """
+    global _fetcher
+    with _fetcher_lock:
+        if _fetcher is None:
+            _fetcher = ImageFetcher(
+                timeout=float(os.getenv("FETCH_TIMEOUT", "10")),
+                max_bytes=int(os.getenv("FETCH_MAX_BYTES", str(MAX_BODY_BYTES))),
+                per_host=int(os.getenv("FETCH_PER_HOST", "4")),
+                max_connections=int(os.getenv("FETCH_MAX_CONNECTIONS", "64")),
+                allow_private=os.getenv("FETCH_ALLOW_PRIVATE", "0") == "1",
+            )
+        return _fetcher
@@ -0,0 +1,300 @@
+"""
+Selectable runtimes for the ResNet50 feature extractor.
+
+Every backend exposes `predict(batch, verbose=0)` on preprocessed (N, 224, 224, 3)
+float32 input, so it is a drop-in replacement for the Keras model:
+
+    keras   the Keras model; small batches skip Model.predict's per-call
+            overhead and call the model directly
+    tflite  the model exported to a graph-optimized TFLite flatbuffer and run
+            by the TFLite interpreter; quantize='int8' applies dynamic-range
+            int8 weight quantization
+    onnx    the model exported to ONNX and run by onnxruntime with all graph
+            optimizations; quantize='int8' applies dynamic quantization
+            (requires the optional onnxruntime package, and tf2onnx with tf.keras 2)
+
+Exported models are written to `model_dir` and reused on the next start.
+TensorFlow is only imported to build or export the Keras model, so a tflite
+start from an exported model (with ai_edge_litert installed) or an onnx start
+does not load it at all.
+"""
+import os
+import threading
+
+import numpy as np
+
+INPUT_SHAPE = (224, 224, 3)
+
+# ImageNet channel means (BGR) the Keras ResNet50 weights were trained with
+_BGR_MEAN = np.array([103.939, 116.779, 123.68], dtype=np.float32)
+
+
+def preprocess_input(pixels):
+    """
+    NumPy version of keras.applications.resnet50.preprocess_input ('caffe'
+    mode: RGB -> BGR, minus the ImageNet means), so preprocessing does not
+    import TensorFlow.
+
+    Args:
+        pixels (numpy.ndarray): (..., 3) RGB values in [0, 255].
+
+    Returns:
+        numpy.ndarray: float32 model input.
+    """
+    return np.asarray(pixels, dtype=np.float32)[..., ::-1] - _BGR_MEAN
+
+
+def build_keras_model(pooling="avg"):
+    """Build the Keras ResNet50 feature extractor."""
+    from tensorflow.keras.applications import ResNet50
+    from tensorflow.keras.models import Model
+
+    base_model = ResNet50(weights='imagenet', include_top=False, pooling=pooling)
+    return Model(inputs=base_model.input, outputs=base_model.output)
+
+
+def _set_tf_threads(num_threads):
+    if not num_threads:
+        return
+    import tensorflow as tf
+    try:
+        tf.config.threading.set_intra_op_parallelism_threads(num_threads)
+        tf.config.threading.set_inter_op_parallelism_threads(1)
+    except RuntimeError:
+        # TensorFlow was already initialized by an earlier model
+        print("TensorFlow already initialized; ignoring num_threads")
+
+
+class InferenceBackend:
+    """Interface of the feature extractor runtimes."""
+
+    name = None
+
+    def predict(self, batch, verbose=0):
+        """
+        Extract features.
+
+        Args:
+            batch (numpy.ndarray): (N, 224, 224, 3) preprocessed images.
+            verbose (int): Accepted for compatibility with Keras; ignored.
+
+        Returns:
+            numpy.ndarray: (N, D) features.
+        """
+        raise NotImplementedError
+
+
+class KerasBackend(InferenceBackend):
+    name = "keras"
+
+    def __init__(self, pooling="avg", num_threads=None, direct_call_max_batch=32, model=None):
+        """
+        Args:
+            pooling (str): Pooling of the ResNet50 output.
+            num_threads (int, optional): TensorFlow intra-op threads.
+            direct_call_max_batch (int): Batches up to this size call the model
+                directly instead of going through Model.predict, which builds a
+                dataset and a callback loop on every call.
+            model (tf.keras.Model, optional): Prebuilt model.
+        """
+        _set_tf_threads(num_threads)
+        self.model = model if model is not None else build_keras_model(pooling)
+        self.direct_call_max_batch = direct_call_max_batch
+
+    def predict(self, batch, verbose=0):
+        if len(batch) <= self.direct_call_max_batch:
+            return np.asarray(self.model(batch, training=False))
+        return self.model.predict(batch, verbose=verbose)
+
+
+class TFLiteBackend(InferenceBackend):
+    name = "tflite"
+
+    def __init__(self, pooling="avg", num_threads=None, quantize=None, model_dir="models"):
+        """
+        Args:
+            pooling (str): Pooling of the ResNet50 output.
+            num_threads (int, optional): Interpreter threads (default: all cores).
+            quantize (str, optional): 'int8' for dynamic-range weight quantization.
+            model_dir (str): Where the exported flatbuffer is cached.
+        """
+        if quantize not in (None, "int8"):
+            raise ValueError(f"Unsupported quantization '{quantize}' for tflite")
+        suffix = "-int8" if quantize else ""
+        model_path = os.path.join(model_dir, f"resnet50-{pooling}{suffix}.tflite")
+        if not os.path.exists(model_path):
+            self._export(pooling, quantize, model_path)
+        self.model_path = model_path
+        self.num_threads = num_threads or os.cpu_count()
+        try:
+            # The standalone runtime avoids importing TensorFlow once the model is exported
+            from ai_edge_litert.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+        self.interpreter = Interpreter(model_path=model_path, num_threads=self.num_threads)
+        self._input = self.interpreter.get_input_details()[0]['index']
+        self._output = self.interpreter.get_output_details()[0]['index']
+        self._batch_size = None
+        # The interpreter holds per-call state and is not thread-safe
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _export(pooling, quantize, model_path):
+        import tensorflow as tf
+
+        print(f"Exporting feature extractor to {model_path}...")
+        converter = tf.lite.TFLiteConverter.from_keras_model(build_keras_model(pooling))
+        if quantize == "int8":
+            converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        flatbuffer = converter.convert()
+        os.makedirs(os.path.dirname(model_path) or ".", exist_ok=True)
+        tmp_path = model_path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(flatbuffer)
+        os.replace(tmp_path, model_path)
+
+    def predict(self, batch, verbose=0):
+        batch = np.ascontiguousarray(batch, dtype=np.float32)
+        with self._lock:
+            if len(batch) != self._batch_size:
+                self.interpreter.resize_tensor_input(self._input, (len(batch),) + INPUT_SHAPE)
+                self.interpreter.allocate_tensors()
+                self._batch_size = len(batch)
+            self.interpreter.set_tensor(self._input, batch)
+            self.interpreter.invoke()
+            return self.interpreter.get_tensor(self._output).copy()
+
+
+class ONNXBackend(InferenceBackend):
+    name = "onnx"
+
+    def __init__(self, pooling="avg", num_threads=None, quantize=None, model_dir="models"):
+        """
+        Args:
+            pooling (str): Pooling of the ResNet50 output.
+            num_threads (int, optional): onnxruntime intra-op threads.
+            quantize (str, optional): 'int8' for dynamic int8 quantization.
+            model_dir (str): Where the exported model is cached.
+        """
+        try:
+            import onnxruntime as ort
+        except ImportError as e:
+            raise ImportError("The 'onnx' inference backend requires onnxruntime (pip install onnxruntime)") from e
+        if quantize not in (None, "int8"):
+            raise ValueError(f"Unsupported quantization '{quantize}' for onnx")
+
+        model_path = os.path.join(model_dir, f"resnet50-{pooling}.onnx")
+        if not os.path.exists(model_path):
+            self._export(pooling, model_path)
+        if quantize == "int8":
+            quantized_path = os.path.join(model_dir, f"resnet50-{pooling}-int8.onnx")
+            if not os.path.exists(quantized_path):
+                from onnxruntime.quantization import QuantType, quantize_dynamic
+                quantize_dynamic(model_path, quantized_path, weight_type=QuantType.QInt8)
+            model_path = quantized_path
+        self.model_path = model_path
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+            options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self._input = self.session.get_inputs()[0].name
+
+    @staticmethod
+    def _export(pooling, model_path):
+        import tensorflow as tf
+
+        print(f"Exporting feature extractor to {model_path}...")
+        os.makedirs(os.path.dirname(model_path) or ".", exist_ok=True)
+        model = build_keras_model(pooling)
+        signature = [tf.TensorSpec((None,) + INPUT_SHAPE, tf.float32, name="input")]
+        tmp_path = model_path + ".tmp"
+        try:
+            # Keras 3 exports ONNX natively
+            model.export(tmp_path, format="onnx", input_signature=signature)
+        except TypeError:
+            try:
+                import tf2onnx
+            except ImportError as e:
+                raise ImportError("Exporting to ONNX with tf.keras requires tf2onnx (pip install tf2onnx)") from e
+            tf2onnx.convert.from_keras(model, input_signature=signature, opset=13, output_path=tmp_path)
+        os.replace(tmp_path, model_path)
+
+    def predict(self, batch, verbose=0):
+        batch = np.ascontiguousarray(batch, dtype=np.float32)
+        return self.session.run(None, {self._input: batch})[0]
+
+
+INFERENCE_BACKENDS = {
+    KerasBackend.name: KerasBackend,
+    TFLiteBackend.name: TFLiteBackend,
+    ONNXBackend.name: ONNXBackend,
+}
+
+
+def build_inference_backend(backend="keras", pooling="avg", **params):
+    """
+    Create a feature extractor runtime.
+
+    Args:
+        backend (str): One of INFERENCE_BACKENDS ('keras', 'tflite', 'onnx').
+        pooling (str): Pooling of the ResNet50 output.
+        **params: Backend options (num_threads, quantize, model_dir, ...).
+
+    Returns:
+        InferenceBackend: The runtime.
+    """
+    if backend not in INFERENCE_BACKENDS:
+        raise ValueError(f"Unknown inference backend '{backend}'. Choose from {sorted(INFERENCE_BACKENDS)}")
+    return INFERENCE_BACKENDS[backend](pooling=pooling, **params)
+
+
+def sample_batch(size=4, seed=0):
+    """Preprocessed random-noise images, e.g. as parity check input."""
+    rng = np.random.default_rng(seed)
+    pixels = rng.integers(0, 256, size=(size,) + INPUT_SHAPE).astype(np.float32)
+    return preprocess_input(pixels)
+
+
+def embedding_parity(expected, actual, tolerance=1e-3):
+    """
+    Compare two (N, D) embedding matrices row by row.
+
+    Args:
+        expected (numpy.ndarray): Reference embeddings, usually from Keras.
+        actual (numpy.ndarray): Embeddings under test.
+        tolerance (float): Largest allowed cosine distance per row.
+
+    Returns:
+        dict: min_cosine, max_cosine_distance, max_abs_diff and ok.
+    """
+    expected = np.asarray(expected, dtype=np.float32)
+    actual = np.asarray(actual, dtype=np.float32)
+    norms = np.linalg.norm(expected, axis=1) * np.linalg.norm(actual, axis=1)
+    cosine = (expected * actual).sum(axis=1) / np.maximum(norms, 1e-12)
+    max_distance = float(1.0 - cosine.min())
+    return {
+        'min_cosine': float(cosine.min()),
+        'max_cosine_distance': max_distance,
+        'max_abs_diff': float(np.abs(expected - actual).max()),
+        'ok': max_distance <= tolerance,
+    }
+
+
+def check_parity(reference, candidate, batch, tolerance=1e-3):
+    """
+    Compare the embeddings of two backends on the same inputs.
+
+    Args:
+        reference (InferenceBackend): Usually the Keras backend.
+        candidate (InferenceBackend): Backend under test.
+        batch (numpy.ndarray): (N, 224, 224, 3) preprocessed images.
+        tolerance (float): Largest allowed cosine distance per image.
+
+    Returns:
+        dict: See embedding_parity.
+    """
+    return embedding_parity(reference.predict(batch), candidate.predict(batch), tolerance)
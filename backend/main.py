@@ -1,20 +1,21 @@
-from fastapi import FastAPI, HTTPException
-from ic.client import Client
-from ic.identity import Identity
-from ic.candid import encode, decode
-from fastapi import FastAPI, HTTPException
-from fastapi.middleware.cors import CORSMiddleware  # Add this import
-from PIL import Image
-import tensorflow as tf
+# Heavy dependencies (TensorFlow, the inference runtimes) are imported by the
+# search engine warmup, after the server is already accepting requests
+import startup
+import json
+import logging
 import os
-from fastapi import FastAPI, File, Form, UploadFile
-from fastapi.responses import JSONResponse
+import time
+from typing import List, Optional
+from fastapi import FastAPI, File, Form, Request, UploadFile
+from fastapi.middleware.cors import CORSMiddleware  # Add this import
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from dotenv import load_dotenv
-import json
-import base64
-from perplexity_api import query_perplexity_sonar, image_to_base64, preprocess_image
-from ai_art_similarity import search_with_query_image
-import io
+import metrics
+from batch_inputs import iter_uploads
+from fetcher import get_fetcher
+from search_engine import get_audio_engine, get_engine, EngineNotReady
+startup.mark('app_imported_seconds')
+logger = logging.getLogger(__name__)
 app = FastAPI()
 load_dotenv()
 
@@ -25,6 +26,101 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Count requests and time them per route template (see /metrics)."""
+    t0 = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        # Unmatched paths share one label so scanners cannot grow the label set
+        route = route.path if route is not None else "unmatched"
+        metrics.HTTP_SECONDS.observe(time.perf_counter() - t0, method=request.method, route=route)
+        metrics.HTTP_REQUESTS.inc(method=request.method, route=route, status=status)
+
+
+@app.on_event("startup")
+async def warm_search_engine():
+    """Load the similarity model and index once per process, in the background."""
+    get_engine().start_warmup()
+
+
+@app.on_event("startup")
+async def warm_audio_engine():
+    """Open the audio fingerprint index in the background, if there is an audio dataset."""
+    engine = get_audio_engine()
+    if os.path.isdir(engine.database_dir):
+        engine.start_warmup()
+
+
+@app.on_event("startup")
+def schedule_refresh():
+    """
+    Pick up added, changed and deleted files without a restart: the image
+    engine syncs with its dataset every INDEX_REFRESH_SECONDS and the audio
+    engine every AUDIO_INDEX_REFRESH_SECONDS (unset or 0 disables).
+    """
+    for engine, variable in ((get_engine(), "INDEX_REFRESH_SECONDS"),
+                             (get_audio_engine(), "AUDIO_INDEX_REFRESH_SECONDS")):
+        interval = float(os.getenv(variable, "0"))
+        if interval > 0:
+            engine.start_refresh(interval)
+
+
+@app.on_event("startup")
+def configure_profiling():
+    """
+    Optionally write sampled cProfile dumps of pipeline stages to PROFILE_DIR:
+    one in PROFILE_EVERY calls (default 100) of the comma-separated
+    PROFILE_STAGES (default all; see metrics.py).
+    """
+    stages = os.getenv("PROFILE_STAGES")
+    metrics.configure_profiling(
+        os.getenv("PROFILE_DIR"),
+        every=int(os.getenv("PROFILE_EVERY", "100")),
+        stages=stages.split(",") if stages else None,
+    )
+
+
+@app.on_event("shutdown")
+def stop_refresh():
+    """Stop the periodic index refreshes."""
+    get_engine().stop_refresh()
+    get_audio_engine().stop_refresh()
+
+
+@app.on_event("shutdown")
+def close_fetcher():
+    """Close pooled connections to remote image hosts."""
+    get_fetcher().close()
+
+
+@app.get("/health")
+async def health():
+    """Report readiness, model/index load times, cold-start time and RSS."""
+    engine_health = get_engine().health()
+    engine_health['audio'] = get_audio_engine().health()
+    status_code = 200 if engine_health['ready'] else 503
+    return JSONResponse(status_code=status_code, content=engine_health)
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Per-stage latency histograms and counters in the Prometheus text format."""
+    return PlainTextResponse(metrics.render(get_engine().gauges() + get_audio_engine().gauges()),
+                             media_type="text/plain; version=0.0.4")
+
+# from fastapi import HTTPException
+# from ic.client import Client
+# from ic.identity import Identity
+# from ic.candid import encode, decode
+
 # # ICP Local Client (Assumes Local Replica is Running)
 # client = Client(url="http://localhost:8000/")
 # identity = Identity()
@@ -61,27 +157,135 @@ app.add_middleware(
 
 
 
+def parse_filters(filters, engine):
+    """
+    Parse the `filters` form field: a JSON metadata filter such as
+    {"registered": true, "uploader": {"ne": "alice"}} (see metadata.py).
+
+    Raises:
+        ValueError: If it is not a valid filter for the engine's metadata.
+    """
+    if not filters:
+        return None
+    try:
+        expression = json.loads(filters)
+    except ValueError as e:
+        raise ValueError(f"filters is not valid JSON: {e}") from None
+    engine.validate_filter(expression)
+    return expression
+
+
 @app.post("/reverse-image-search")
 async def reverse_image_search(
     file: UploadFile = File(...),
+    top_k: int = Form(5),
+    filters: Optional[str] = Form(None),
 ):
+    if top_k < 1:
+        return JSONResponse(status_code=422, content={"error": "top_k must be at least 1"})
+    try:
+        filters = parse_filters(filters, get_engine())
+    except ValueError as e:
+        return JSONResponse(status_code=422, content={"error": str(e)})
     try:
         # Read the image file
         image_data = await file.read()
         
-        # Optional: Get the image embedding if needed for additional processing
-        # img_array = preprocess_image(image_data)
-        # embedding = image_model.predict(img_array)
-        
-        # Query Perplexity Sonar API
-        result = search_with_query_image()
+        # Search the shared, already-warmed index with the uploaded image
+        result = await get_engine().search_async(image_data, top_k=top_k, filters=filters)
+    except EngineNotReady as e:
+        return JSONResponse(
+            status_code=503,
+            content={"error": str(e)}
+        )
     except Exception as e:
-        print(e)
+        logger.exception("Reverse image search failed")
         return JSONResponse(
             status_code=500,
             content={"error": str(e)}
         )
     return result
+
+
+@app.post("/reverse-image-search/batch")
+async def reverse_image_search_batch(
+    files: List[UploadFile] = File(...),
+    top_k: int = Form(5),
+    filters: Optional[str] = Form(None),
+):
+    """
+    Search many images at once.
+
+    Accepts any number of image files, zip archives of images, and ndjson files
+    of base64 data URLs or image URLs (see batch_inputs). Streams one JSON line
+    per image, in upload order, as each chunk of images is searched:
+    {"index": 0, "id": "a.png", "results": [[score, path], ...]} or
+    {"index": 1, "id": "b.png", "error": "..."}.
+    """
+    if top_k < 1:
+        return JSONResponse(status_code=422, content={"error": "top_k must be at least 1"})
+    try:
+        filters = parse_filters(filters, get_engine())
+    except ValueError as e:
+        return JSONResponse(status_code=422, content={"error": str(e)})
+    ids = []
+
+    def queries():
+        for item_id, query in iter_uploads(files):
+            ids.append(item_id)
+            yield query
+
+    try:
+        results = get_engine().search_batch(
+            queries(), top_k=top_k,
+            batch_size=int(os.getenv("BATCH_SEARCH_CHUNK_SIZE", "32")),
+            filters=filters,
+        )
+    except EngineNotReady as e:
+        return JSONResponse(status_code=503, content={"error": str(e)})
+
+    def lines():
+        for position, matches, error in results:
+            line = {"index": position, "id": ids[position]}
+            if error is None:
+                line["results"] = matches
+            else:
+                line["error"] = error
+            yield json.dumps(line) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@app.post("/reverse-audio-search")
+async def reverse_audio_search(
+    file: UploadFile = File(...),
+    top_k: int = Form(5),
+    filters: Optional[str] = Form(None),
+):
+    """
+    Find the tracks a recording or clip comes from.
+
+    Returns [[score, path, offset_seconds], ...], where score is the fraction
+    of the clip's fingerprint hashes that agree on the match and
+    offset_seconds is where the clip starts in the track.
+    """
+    if top_k < 1:
+        return JSONResponse(status_code=422, content={"error": "top_k must be at least 1"})
+    try:
+        filters = parse_filters(filters, get_audio_engine())
+    except ValueError as e:
+        return JSONResponse(status_code=422, content={"error": str(e)})
+    try:
+        audio_data = await file.read()
+        result = await get_audio_engine().search_async(audio_data, top_k=top_k, filters=filters)
+    except EngineNotReady as e:
+        return JSONResponse(status_code=503, content={"error": str(e)})
+    except Exception as e:
+        logger.exception("Reverse audio search failed")
+        return JSONResponse(status_code=500, content={"error": str(e)})
+    return result
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="127.0.0.1", port=8000)
\ No newline at end of file
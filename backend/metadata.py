@@ -0,0 +1,447 @@
+"""
+Per-row metadata (artist, license, uploader, registration, dates) and the
+filter expressions evaluated against it.
+
+A filter is evaluated to a boolean mask over index row ids before the index
+is searched. The index only generates candidates among allowed rows (see
+VectorIndex.query), so a selective filter still returns a full top_k instead
+of whatever survives filtering an over-fetched result list.
+
+Filter expressions are JSON objects whose conditions must all hold:
+
+    {"registered": true}                                    equal to
+    {"uploader": {"ne": "alice"}}                           not equal to
+    {"license": {"in": ["cc0", "cc-by"]}}                   any of
+    {"artist": {"nin": ["x", "y"]}}                         none of
+    {"created": {"gte": "2020-01-01", "lt": "2024-01-01"}}  range (number and date fields)
+    {"artist": {"exists": true}}                            has a value
+    {"or": [{...}, {...}]}, {"and": [...]}, {"not": {...}}
+
+Rows without a value for a field never match an equality, "in" or range
+condition on it, but they do match "ne" and "nin", which keep every row
+that does not hold one of the listed values: {"uploader": {"ne": "alice"}}
+keeps artworks with no known uploader. Add {"exists": true} to drop them.
+
+Conditions must fit the type of their field (see validate_filter): ranges
+only apply to number and date fields, and bool fields only compare with
+true and false, so {"registered": "false"} is an error rather than a match.
+
+Category and bool fields keep one posting list per distinct value (sorted
+int32 row ids), so an equality filter costs time in proportion to the rows
+it selects. Number and date fields keep a float64 column plus a lazily built
+sort order, so a range is two binary searches.
+"""
+import json
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+import numpy as np
+
+FIELD_TYPES = ('category', 'bool', 'number', 'date')
+
+# Optional per-item metadata in a database directory: one JSON object per
+# line, {"path": <file name relative to the directory>, "artist": ..., ...}
+METADATA_FILE = "metadata.jsonl"
+
+# Fields the API knows about; any other field is typed by its first value
+DEFAULT_SCHEMA = {
+    'artist': 'category',
+    'license': 'category',
+    'uploader': 'category',
+    'registered': 'bool',
+    'created': 'date',
+}
+
+COMPARISONS = ('eq', 'ne', 'in', 'nin', 'gt', 'gte', 'lt', 'lte', 'exists')
+
+
+def _to_timestamp(value):
+    """Date field value (ISO date/datetime string, year or epoch seconds) -> epoch seconds."""
+    if isinstance(value, bool):
+        raise ValueError(f"Expected a date, got {value!r}")
+    if isinstance(value, (int, float)):
+        return float(value)
+    if not isinstance(value, str):
+        raise ValueError(f"Expected a date, got {value!r}")
+    text = value.strip()
+    if len(text) == 4 and text.isdigit():
+        text += "-01-01"
+    try:
+        parsed = datetime.fromisoformat(text.replace('Z', '+00:00'))
+    except ValueError:
+        raise ValueError(f"Invalid date {value!r}; expected ISO 8601 (YYYY-MM-DD)") from None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def _convert(field_type, value):
+    """Stored form of a metadata value; None if it cannot be filtered on."""
+    try:
+        if field_type == 'date':
+            return _to_timestamp(value)
+        if field_type == 'number':
+            return None if isinstance(value, bool) else float(value)
+    except (TypeError, ValueError):
+        return None
+    if field_type == 'bool':
+        return value if isinstance(value, bool) else None
+    return value if isinstance(value, (str, int, float, bool)) else None
+
+
+def _infer_type(value):
+    if isinstance(value, bool):
+        return 'bool'
+    if isinstance(value, (int, float)):
+        return 'number'
+    return 'category'
+
+
+def read_metadata_file(database_dir):
+    """
+    Read a database directory's metadata file, if any.
+
+    Returns:
+        dict: file path (joined with database_dir) -> metadata dict.
+    """
+    metadata_path = os.path.join(database_dir, METADATA_FILE)
+    if not os.path.isfile(metadata_path):
+        return {}
+    metadata = {}
+    with open(metadata_path) as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                path = os.path.join(database_dir, record.pop('path'))
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                print(f"Skipping {metadata_path}:{line_number}: {e!r}")
+                continue
+            metadata[path] = record
+    return metadata
+
+
+def filter_key(expression):
+    """Canonical string for a filter expression (None for no filter), for cache keys."""
+    if not expression:
+        return None
+    return json.dumps(expression, sort_keys=True, separators=(',', ':'))
+
+
+RANGE_COMPARISONS = ('gt', 'gte', 'lt', 'lte')
+
+
+def _check_value(field, field_type, op, value):
+    """Raise ValueError unless value can be compared with a field of this type."""
+    if field_type == 'bool':
+        valid = isinstance(value, bool)
+    elif field_type == 'number':
+        valid = isinstance(value, (int, float)) and not isinstance(value, bool)
+    elif field_type == 'date':
+        try:
+            _to_timestamp(value)
+            valid = True
+        except ValueError:
+            valid = False
+    else:
+        valid = isinstance(value, (str, int, float, bool))
+    if not valid:
+        raise ValueError(f"'{op}' on {field_type} field '{field}' cannot take {value!r}")
+
+
+def _check_condition(field, op, operand, schema):
+    if op not in COMPARISONS:
+        raise ValueError(f"Unknown operator '{op}' on '{field}'. Choose from {list(COMPARISONS)}")
+    if op in ('in', 'nin') and not isinstance(operand, list):
+        raise ValueError(f"'{op}' on '{field}' takes a list")
+    if op == 'exists':
+        if not isinstance(operand, bool):
+            raise ValueError(f"'exists' on '{field}' takes true or false")
+        return
+    if schema is None:
+        return
+    field_type = schema.get(field)
+    if op in RANGE_COMPARISONS and field_type not in ('number', 'date'):
+        raise ValueError(f"'{op}' needs a number or date field; '{field}' is {field_type or 'unknown'}")
+    if field_type is not None:
+        for value in operand if op in ('in', 'nin') else [operand]:
+            _check_value(field, field_type, op, value)
+
+
+def validate_filter(expression, schema=None):
+    """
+    Check a filter expression.
+
+    Without a schema only the structure is checked. With one, every
+    condition is also checked against the type of its field: ranges need a
+    number or date field, bool fields only compare with true/false, number
+    fields with numbers, date fields with dates and category fields with
+    scalars. Fields the schema does not know are not type checked, except
+    that they take no ranges (they have no values).
+
+    Args:
+        expression (dict or None): Filter (see module docstring).
+        schema (dict, optional): Field name -> one of FIELD_TYPES, e.g.
+            MetadataTable.schema.
+
+    Raises:
+        ValueError: Describing the first problem found.
+    """
+    if expression is None:
+        return
+    if not isinstance(expression, dict):
+        raise ValueError("A filter must be a JSON object")
+    for field, condition in expression.items():
+        if field in ('and', 'or'):
+            if not isinstance(condition, list):
+                raise ValueError(f"'{field}' takes a list of filters")
+            for part in condition:
+                validate_filter(part, schema)
+        elif field == 'not':
+            validate_filter(condition, schema)
+        elif isinstance(condition, dict):
+            for op, operand in condition.items():
+                _check_condition(field, op, operand, schema)
+        elif isinstance(condition, list):
+            raise ValueError(f"Use {{\"in\": [...]}} to match '{field}' against several values")
+        else:
+            _check_condition(field, 'eq', condition, schema)
+
+
+class MetadataTable:
+    """
+    Metadata of every index row, stored per field for fast filtering.
+
+    Rows are appended in id order alongside the vector index; a row that has
+    no metadata is simply absent from every posting list. Rows are never
+    updated in place (like index rows): changed metadata is a new row.
+    """
+
+    def __init__(self, schema=None, cache_size=16):
+        """
+        Args:
+            schema (dict, optional): Field name -> one of FIELD_TYPES. Merged
+                over DEFAULT_SCHEMA.
+            cache_size (int): Evaluated filter masks kept for repeated filters.
+        """
+        self.schema = dict(DEFAULT_SCHEMA, **(schema or {}))
+        for field, field_type in self.schema.items():
+            if field_type not in FIELD_TYPES:
+                raise ValueError(f"Unknown type '{field_type}' for field '{field}'. Choose from {list(FIELD_TYPES)}")
+        self.count = 0
+        self.cache_size = cache_size
+        self._postings = {}   # field -> {value: sorted int32 row ids}
+        self._columns = {}    # field -> float64 values (NaN when missing)
+        self._sorted = {}     # field -> (sort order, sorted values), built on first range query
+        self._cache = OrderedDict()
+        self._lock = threading.RLock()
+
+    def append(self, records):
+        """
+        Add the metadata of the next len(records) rows.
+
+        Args:
+            records (list): One dict (or None for no metadata) per row, in row order.
+
+        Returns:
+            numpy.ndarray: The row ids of the new rows.
+        """
+        records = [record or {} for record in records]
+        with self._lock:
+            start = self.count
+            count = start + len(records)
+            by_field = {}
+            for offset, record in enumerate(records):
+                for field, value in record.items():
+                    if value is None:
+                        continue
+                    by_field.setdefault(field, ([], []))
+                    by_field[field][0].append(start + offset)
+                    by_field[field][1].append(value)
+
+            for field, (rows, values) in by_field.items():
+                field_type = self.schema.setdefault(field, _infer_type(values[0]))
+                # Values of the wrong type (a misspelt date, a list) are treated as missing
+                converted = [_convert(field_type, value) for value in values]
+                rows = [row for row, value in zip(rows, converted) if value is not None]
+                values = [value for value in converted if value is not None]
+                if field_type in ('number', 'date'):
+                    column = np.full(count, np.nan)
+                    previous = self._columns.get(field)
+                    if previous is not None:
+                        column[:len(previous)] = previous
+                    column[np.asarray(rows, dtype=np.int64)] = values
+                    self._columns[field] = column
+                    self._sorted.pop(field, None)
+                else:
+                    postings = self._postings.setdefault(field, {})
+                    groups = {}
+                    for row, value in zip(rows, values):
+                        groups.setdefault(value, []).append(row)
+                    for value, group in groups.items():
+                        group = np.asarray(group, dtype=np.int32)
+                        previous = postings.get(value)
+                        postings[value] = group if previous is None else np.concatenate([previous, group])
+
+            for field, column in self._columns.items():
+                if len(column) < count:
+                    self._columns[field] = np.concatenate([column, np.full(count - len(column), np.nan)])
+                    self._sorted.pop(field, None)
+            self.count = count
+            self._cache.clear()
+        return np.arange(start, count)
+
+    def get(self, row):
+        """Return the metadata of one row as a dict (slow; for display)."""
+        with self._lock:
+            record = {}
+            for field, postings in self._postings.items():
+                for value, rows in postings.items():
+                    position = np.searchsorted(rows, row)
+                    if position < len(rows) and rows[position] == row:
+                        record[field] = value
+                        break
+            for field, column in self._columns.items():
+                if row < len(column) and not np.isnan(column[row]):
+                    record[field] = float(column[row])
+            return record
+
+    def evaluate(self, expression):
+        """
+        Evaluate a filter expression.
+
+        Args:
+            expression (dict): Filter (see module docstring).
+
+        Returns:
+            numpy.ndarray: Read-only boolean mask over the table's rows.
+
+        Raises:
+            ValueError: If the expression is malformed or compares a field
+                with a value of another type.
+        """
+        key = filter_key(expression)
+        with self._lock:
+            mask = self._cache.get(key)
+            if mask is not None:
+                self._cache.move_to_end(key)
+                return mask
+            validate_filter(expression, self.schema)
+            mask = self._evaluate(expression)
+            mask.flags.writeable = False
+            self._cache[key] = mask
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            return mask
+
+    def _evaluate(self, expression):
+        mask = np.ones(self.count, dtype=bool)
+        for field, condition in expression.items():
+            if field == 'and':
+                for part in condition:
+                    mask &= self._evaluate(part)
+            elif field == 'or':
+                either = np.zeros(self.count, dtype=bool)
+                for part in condition:
+                    either |= self._evaluate(part)
+                mask &= either
+            elif field == 'not':
+                mask &= ~self._evaluate(condition)
+            elif isinstance(condition, dict):
+                for op, operand in condition.items():
+                    mask &= self._compare(field, op, operand)
+            else:
+                mask &= self._compare(field, 'eq', condition)
+        return mask
+
+    def _rows(self, rows):
+        mask = np.zeros(self.count, dtype=bool)
+        mask[rows] = True
+        return mask
+
+    def _compare(self, field, op, operand):
+        if op == 'ne':
+            return ~self._compare(field, 'eq', operand)
+        if op == 'nin':
+            return ~self._compare(field, 'in', operand)
+        if op == 'in':
+            mask = np.zeros(self.count, dtype=bool)
+            for value in operand:
+                mask |= self._compare(field, 'eq', value)
+            return mask
+
+        field_type = self.schema.get(field)
+        if field in self._columns:
+            column = self._columns[field]
+            if op == 'exists':
+                return ~np.isnan(column) if operand else np.isnan(column)
+            convert = _to_timestamp if field_type == 'date' else float
+            try:
+                value = convert(operand)
+            except (TypeError, ValueError) as e:
+                raise ValueError(f"Invalid value for '{field}': {e}") from None
+            if op == 'eq':
+                return self._range(field, value, True, value, True)
+            bounds = {
+                'gt': (value, False, None, False),
+                'gte': (value, True, None, False),
+                'lt': (None, False, value, False),
+                'lte': (None, False, value, True),
+            }
+            return self._range(field, *bounds[op])
+
+        postings = self._postings.get(field, {})
+        if op == 'exists':
+            present = np.zeros(self.count, dtype=bool)
+            for rows in postings.values():
+                present[rows] = True
+            return present if operand else ~present
+        if op == 'eq':
+            if field_type == 'bool' and not isinstance(operand, bool):
+                # 1 == True would find the True posting list
+                return np.zeros(self.count, dtype=bool)
+            rows = postings.get(operand) if isinstance(operand, (str, int, float, bool)) else None
+            return self._rows(rows) if rows is not None else np.zeros(self.count, dtype=bool)
+        if field_type in ('number', 'date'):
+            # Declared range field without any value yet
+            return np.zeros(self.count, dtype=bool)
+        raise ValueError(f"'{op}' needs a number or date field; '{field}' is {field_type or 'unknown'}")
+
+    def _range(self, field, low, low_inclusive, high, high_inclusive):
+        if field not in self._sorted:
+            column = self._columns[field]
+            present = int((~np.isnan(column)).sum())
+            # NaN (missing) sorts last and is cut off
+            order = np.argsort(column, kind='stable')[:present]
+            self._sorted[field] = (order.astype(np.int32), column[order])
+        order, values = self._sorted[field]
+        start, stop = 0, len(values)
+        if low is not None:
+            start = np.searchsorted(values, low, side='left' if low_inclusive else 'right')
+        if high is not None:
+            stop = np.searchsorted(values, high, side='right' if high_inclusive else 'left')
+        return self._rows(order[start:max(start, stop)])
+
+    @property
+    def nbytes(self):
+        """Memory held by posting lists and columns."""
+        total = sum(rows.nbytes for postings in self._postings.values() for rows in postings.values())
+        return total + sum(column.nbytes for column in self._columns.values())
+
+    def stats(self):
+        """Field types and distinct value counts, for health checks."""
+        with self._lock:
+            return {
+                'rows': self.count,
+                'nbytes': self.nbytes,
+                'fields': {
+                    field: {
+                        'type': self.schema[field],
+                        'distinct': len(self._postings[field]) if field in self._postings else None,
+                    }
+                    for field in sorted(set(self._postings) | set(self._columns))
+                },
+            }
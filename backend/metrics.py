@@ -0,0 +1,329 @@
+"""
+Per-stage latency histograms and counters, exposed in the Prometheus text
+format by GET /metrics.
+
+The pipeline times each stage of a query or of indexing with stage():
+
+    fetch         download of a query image URL (fetcher.py)
+    decode        reading and decoding an image into RGB pixels
+    resize        resizing (and in region mode cropping) to the model input size
+    preprocess    preprocess_input on the resized pixels
+    predict       one feature extractor call; items counts its images
+    filter        evaluating a metadata filter to a row mask
+    knn           one nearest neighbour query; items counts its queries
+    audio_decode  reading an audio file or upload into mono samples
+    fingerprint   spectrogram, peak picking and hashing of one recording
+    hash_lookup   posting lookup and offset voting of one audio query
+
+Every call adds one observation to similarity_stage_seconds{stage=...} and
+its item count to similarity_stage_items_total, so the time per image of a
+batched stage is _sum / items. Recording costs about a microsecond and takes
+no lock shared across stages.
+
+Optional profiling hooks:
+  - add_hook(fn) calls fn(stage, seconds, items) after every stage, e.g. to
+    forward spans to a tracer or log slow calls
+  - configure_profiling(directory) runs cProfile over one in `every` calls of
+    a stage, on the thread that runs it, and writes <stage>-<time>.prof files
+    for pstats or snakeviz
+
+Only the standard library is used; prometheus_client is not required.
+"""
+import itertools
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Upper bounds (seconds) of the latency histogram buckets, 0.5 ms to 10 s
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+        for value in labels.values()
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def _child(self, labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return key, child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def reset(self):
+        with self._lock:
+            self._children = {}
+
+    def samples(self):
+        """Yield (sample name, labels dict, value) for every label set."""
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Monotonic count per label set."""
+
+    type = "counter"
+
+    def _new_child(self):
+        return [0.0, threading.Lock()]
+
+    def inc(self, amount=1, **labels):
+        _, child = self._child(labels)
+        with child[1]:
+            child[0] += amount
+
+    def value(self, **labels):
+        return self._children.get(tuple(str(labels[name]) for name in self.labelnames), [0.0])[0]
+
+    def samples(self):
+        for key, child in sorted(self._children.items()):
+            yield self.name, dict(zip(self.labelnames, key)), child[0]
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket latency histogram per label set."""
+
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        # Per-bucket counts (+Inf last), sum, lock
+        return [[0] * (len(self.buckets) + 1), 0.0, threading.Lock()]
+
+    def observe(self, value, **labels):
+        _, child = self._child(labels)
+        position = bisect_left(self.buckets, value)
+        with child[2]:
+            child[0][position] += 1
+            child[1] += value
+
+    def summary(self, **labels):
+        """Return (count, sum) of one label set."""
+        child = self._children.get(tuple(str(labels[name]) for name in self.labelnames))
+        if child is None:
+            return 0, 0.0
+        return sum(child[0]), child[1]
+
+    def samples(self):
+        for key, child in sorted(self._children.items()):
+            labels = dict(zip(self.labelnames, key))
+            with child[2]:
+                counts, total = list(child[0]), child[1]
+            for bound, cumulative in zip(self.buckets + (float('inf'),), itertools.accumulate(counts)):
+                yield self.name + "_bucket", dict(labels, le=_format_value(float(bound))), cumulative
+            yield self.name + "_sum", labels, total
+            yield self.name + "_count", labels, sum(counts)
+
+
+class Registry:
+    """Named metrics rendered together."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def reset(self):
+        """Clear every recorded value (benchmarks measure one phase at a time)."""
+        for metric in list(self._metrics.values()):
+            metric.reset()
+
+    def render(self, extra=()):
+        """
+        Render the registry in the Prometheus text exposition format.
+
+        Args:
+            extra (iterable): (name, type, help, value) samples computed at
+                scrape time, e.g. queue depths and index size.
+
+        Returns:
+            str: The exposition text.
+        """
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        for name, metric_type, documentation, value in extra:
+            if value is None:
+                continue
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            lines.append(f"{name} {_format_value(float(value))}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "similarity_stage_seconds", "Wall time of one call of a pipeline stage.", ("stage",))
+STAGE_ITEMS = REGISTRY.counter(
+    "similarity_stage_items_total", "Images or queries processed by a pipeline stage.", ("stage",))
+STAGE_ERRORS = REGISTRY.counter(
+    "similarity_stage_errors_total", "Pipeline stage calls that raised.", ("stage",))
+HTTP_SECONDS = REGISTRY.histogram(
+    "similarity_http_request_seconds", "Time until the response headers were sent.", ("method", "route"))
+HTTP_REQUESTS = REGISTRY.counter(
+    "similarity_http_requests_total", "HTTP requests by route and status code.", ("method", "route", "status"))
+
+_hooks = []
+_profiler = None
+
+
+def observe(name, seconds, items=1, error=False):
+    """Record one call of a stage that was timed by the caller."""
+    STAGE_SECONDS.observe(seconds, stage=name)
+    if items:
+        STAGE_ITEMS.inc(items, stage=name)
+    if error:
+        STAGE_ERRORS.inc(stage=name)
+    for hook in _hooks:
+        hook(name, seconds, items)
+
+
+@contextmanager
+def stage(name, items=1):
+    """
+    Time a block as one call of a pipeline stage.
+
+    Args:
+        name (str): Stage name (see the module docstring).
+        items (int): Images or queries the call processes.
+    """
+    profile = _profiler.start(name) if _profiler is not None else None
+    error = False
+    t0 = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        error = True
+        raise
+    finally:
+        elapsed = time.perf_counter() - t0
+        if profile is not None:
+            _profiler.stop(name, profile)
+        observe(name, elapsed, items, error)
+
+
+def add_hook(hook):
+    """Call hook(stage, seconds, items) after every recorded stage call."""
+    _hooks.append(hook)
+
+
+def remove_hook(hook):
+    if hook in _hooks:
+        _hooks.remove(hook)
+
+
+class StageProfiler:
+    """Runs cProfile over one in `every` calls of the selected stages."""
+
+    def __init__(self, directory, every=100, stages=None):
+        """
+        Args:
+            directory (str): Where .prof files are written.
+            every (int): Profile the 1st, (every+1)th, ... call of each stage.
+            stages (iterable, optional): Stages to profile; default all.
+        """
+        self.directory = directory
+        self.every = max(int(every), 1)
+        self.stages = set(stages) if stages else None
+        self.written = 0
+        self._calls = {}
+        # One profile at a time: a profiler only sees its own thread, and
+        # Python 3.12+ allows a single active profiler per process
+        self._busy = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def start(self, name):
+        if self.stages is not None and name not in self.stages:
+            return None
+        calls = self._calls.get(name, 0)
+        self._calls[name] = calls + 1
+        if calls % self.every or not self._busy.acquire(blocking=False):
+            return None
+        import cProfile
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            self._busy.release()
+            return None
+        return profile
+
+    def stop(self, name, profile):
+        profile.disable()
+        try:
+            path = os.path.join(self.directory, f"{name}-{time.time():.6f}.prof")
+            profile.dump_stats(path)
+            self.written += 1
+        finally:
+            self._busy.release()
+
+
+def configure_profiling(directory, every=100, stages=None):
+    """
+    Enable sampled cProfile dumps of pipeline stages, or disable them when
+    directory is empty.
+
+    Returns:
+        StageProfiler or None: The active profiler.
+    """
+    global _profiler
+    _profiler = StageProfiler(directory, every, stages) if directory else None
+    return _profiler
+
+
+def render(extra=()):
+    """Render all metrics in the Prometheus text format (see Registry.render)."""
+    return REGISTRY.render(extra)
+
+
+def reset():
+    """Clear every recorded value."""
+    REGISTRY.reset()
@@ -0,0 +1,753 @@
+import numpy as np
+
+from quantization import PCATransform, build_codec
+
+
+def l2_normalize(features, copy=True):
+    """
+    Scale rows to unit length so that a dot product equals cosine similarity.
+
+    Args:
+        features (numpy.ndarray): (N, D) or (D,) array.
+        copy (bool): If False and the rows are already unit length, return the
+            input unchanged (no copy), which keeps memory-mapped arrays shared.
+
+    Returns:
+        numpy.ndarray: float32 array of unit-length rows.
+    """
+    features = np.asarray(features, dtype=np.float32)
+    norms = np.linalg.norm(features, axis=-1, keepdims=True)
+    if not copy and np.allclose(norms, 1.0, atol=1e-3):
+        return features
+    return features / np.maximum(norms, 1e-12)
+
+
+def append_rows(buffer, count, rows):
+    """
+    Write rows after the first `count` rows of `buffer`, growing it
+    geometrically so repeated appends cost amortized O(len(rows)).
+
+    A buffer whose length equals `count` (e.g. a caller's matrix or a read-only
+    memmap) is never written to; it is copied into a new, larger buffer first.
+
+    Args:
+        buffer (numpy.ndarray or None): (capacity, D) array. A new buffer takes
+            the dtype of `rows`.
+        count (int): Number of rows in use.
+        rows (numpy.ndarray): (M, D) rows to append.
+
+    Returns:
+        numpy.ndarray: The buffer holding count + M rows (possibly reallocated).
+    """
+    rows = np.atleast_2d(np.asarray(rows))
+    needed = count + len(rows)
+    if buffer is None or len(buffer) < needed:
+        template = rows if buffer is None else buffer
+        grown = np.empty((max(needed, 2 * count, 16),) + template.shape[1:], dtype=template.dtype)
+        if count:
+            grown[:count] = buffer[:count]
+        buffer = grown
+    buffer[count:needed] = rows
+    return buffer
+
+
+def validate_k(k):
+    """Raise ValueError unless k is a usable number of neighbours (at least 1)."""
+    if k < 1:
+        raise ValueError(f"k must be at least 1, got {k}")
+
+
+def _top_k(scores, k):
+    """Return (scores, indices) of the k largest entries per row, best first."""
+    k = min(k, scores.shape[1])
+    if k == 0:
+        return np.empty((scores.shape[0], 0), np.float32), np.empty((scores.shape[0], 0), np.int64)
+    if k < scores.shape[1]:
+        part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        part = np.tile(np.arange(scores.shape[1]), (scores.shape[0], 1))
+    part_scores = np.take_along_axis(scores, part, axis=1)
+    order = np.argsort(-part_scores, axis=1, kind='stable')
+    return np.take_along_axis(part_scores, order, axis=1), np.take_along_axis(part, order, axis=1)
+
+
+def _scan_top_k(score_block, n_queries, count, k, alive=None, block_size=65536):
+    """
+    Top-k over `count` rows scored block by block.
+
+    Args:
+        score_block (callable): (start, stop) -> (n_queries, stop - start) scores.
+        n_queries (int): Number of queries.
+        count (int): Number of rows.
+        k (int): Neighbours per query.
+        alive (numpy.ndarray, optional): Boolean mask of rows that may be returned.
+        block_size (int): Rows scored at a time.
+
+    Returns:
+        tuple: (scores, indices), (n_queries, min(k, count)); unfilled slots have index -1.
+    """
+    k = min(k, count)
+    best_scores = best_indices = None
+    for start in range(0, count, block_size):
+        stop = min(start + block_size, count)
+        scores = np.asarray(score_block(start, stop), dtype=np.float32)
+        if alive is not None:
+            scores[:, ~alive[start:stop]] = -np.inf
+        scores, indices = _top_k(scores, k)
+        indices = indices + start
+        if best_scores is None:
+            best_scores, best_indices = scores, indices
+        else:
+            best_scores, order = _top_k(np.hstack([best_scores, scores]), k)
+            best_indices = np.take_along_axis(np.hstack([best_indices, indices]), order, axis=1)
+    if best_scores is None:
+        return np.empty((n_queries, 0), np.float32), np.empty((n_queries, 0), np.int64)
+    best_indices[np.isneginf(best_scores)] = -1
+    return best_scores, best_indices
+
+
+def _restrict(alive, allowed, count):
+    """
+    Rows among the first `count` that are both alive and allowed by a filter
+    mask. A mask shorter than `count` (rows added after it was computed)
+    leaves the missing rows out.
+    """
+    allowed = np.asarray(allowed, dtype=bool)[:count]
+    if len(allowed) < count:
+        allowed = np.concatenate([allowed, np.zeros(count - len(allowed), dtype=bool)])
+    return allowed & alive[:count]
+
+
+def _scan_ids(score_rows, n_queries, ids, k, block_size=65536):
+    """
+    Top-k over an explicit list of row ids, e.g. the rows a filter allows.
+
+    Args:
+        score_rows (callable): Row ids -> (n_queries, len(ids)) scores.
+        n_queries (int): Number of queries.
+        ids (numpy.ndarray): Candidate row ids.
+        k (int): Neighbours per query.
+        block_size (int): Rows scored at a time.
+
+    Returns:
+        tuple: (scores, indices) as from _scan_top_k, with indices mapped to row ids.
+    """
+    scores, local = _scan_top_k(lambda start, stop: score_rows(ids[start:stop]),
+                                n_queries, len(ids), k, block_size=block_size)
+    return scores, np.where(local >= 0, ids[np.maximum(local, 0)], -1)
+
+
+def _pad(scores, indices, k):
+    """Pad ragged results to width k with (-inf, -1)."""
+    n = len(scores)
+    if n >= k:
+        return scores[:k], indices[:k]
+    return (np.concatenate([scores, np.full(k - n, -np.inf, np.float32)]),
+            np.concatenate([indices, np.full(k - n, -1, np.int64)]))
+
+
+class VectorIndex:
+    """
+    Cosine-similarity index over row vectors.
+
+    Backends return similarities (1 - cosine distance) and row indices into the
+    matrix they were fit on, extended by any rows appended with add(). Rows
+    that could not be filled (fewer than k live candidates) have index -1.
+
+    Removed rows keep their id (ids are never reused) and are simply skipped,
+    so the index can be updated in place without a refit.
+
+    Queries can be restricted to the rows of a filter mask (see metadata.py).
+    When the filter allows at most `prefilter_fraction` of the rows, those
+    rows are scored directly; otherwise the mask is applied while the index
+    generates candidates. Either way a query gets the full k results when at
+    least k rows are allowed.
+    """
+
+    name = None
+    prefilter_fraction = 0.1
+
+    def __init__(self):
+        self._vectors = None
+        # Rows appended after fit() by backends that only reference the fitted matrix
+        self._added = None
+        self._count = 0
+        self._alive = np.zeros(0, dtype=bool)
+        self._n_removed = 0
+
+    def fit(self, features, normalized=False):
+        """
+        Build the index.
+
+        Args:
+            features (numpy.ndarray): (N, D) feature matrix.
+            normalized (bool): Rows are known to be unit length. Skips the
+                normalization pass, so a memory-mapped matrix is used as-is
+                without being read up front.
+        """
+        raise NotImplementedError
+
+    def query(self, queries, k, allowed=None):
+        """
+        Find the k most similar rows for each query.
+
+        Args:
+            queries (numpy.ndarray): (Q, D) query matrix.
+            k (int): Number of neighbours per query.
+            allowed (numpy.ndarray, optional): Boolean mask over row ids; only
+                rows where it is True are returned.
+
+        Returns:
+            tuple: (similarities, indices), both (Q, k) arrays.
+
+        Raises:
+            ValueError: If k is below 1.
+        """
+        raise NotImplementedError
+
+    def add(self, features):
+        """
+        Append rows to a fitted index.
+
+        Args:
+            features (numpy.ndarray): (M, D) feature matrix.
+
+        Returns:
+            numpy.ndarray: The ids assigned to the new rows.
+        """
+        raise NotImplementedError
+
+    def extend(self, vectors):
+        """
+        Index the rows a caller appended to its own copy of the fitted matrix.
+
+        For callers that keep every row in one growing buffer: backends that
+        score from the full vectors reference `vectors` instead of holding a
+        second copy of the rows. Others add the new rows as with add().
+
+        Args:
+            vectors (numpy.ndarray): (N + M, D) unit-length rows, the first
+                N = len(self) of which are already indexed. The rows must not
+                be modified afterwards.
+
+        Returns:
+            numpy.ndarray: The ids assigned to the M new rows.
+        """
+        return self.add(vectors[len(self):])
+
+    def remove(self, ids):
+        """
+        Remove rows from the index. Unknown or already removed ids are ignored.
+
+        Args:
+            ids (iterable of int): Row ids to remove.
+        """
+        ids = np.asarray(list(ids), dtype=np.int64)
+        ids = ids[(ids >= 0) & (ids < self._count)]
+        ids = ids[self._alive[ids]]
+        self._alive[ids] = False
+        self._n_removed += len(ids)
+        return ids
+
+    @property
+    def n_alive(self):
+        """Number of rows that can still be returned."""
+        return self._count - self._n_removed
+
+    def __len__(self):
+        """Number of row ids handed out, including removed rows."""
+        return self._count
+
+    def _set_vectors(self, features, normalized=False):
+        self._vectors = features if normalized else l2_normalize(features, copy=False)
+        self._count = len(self._vectors)
+        self._alive = np.ones(self._count, dtype=bool)
+        self._n_removed = 0
+
+    def _rows(self, ids):
+        """Vectors of sorted row ids, from the fitted matrix and the added rows."""
+        fitted = len(self._vectors)
+        split = np.searchsorted(ids, fitted)
+        if split == len(ids):
+            return self._vectors[ids]
+        return np.concatenate([self._vectors[ids[:split]], self._added[ids[split:] - fitted]])
+
+    def _append_vectors(self, features):
+        """Append normalized rows and return (ids, rows)."""
+        new = l2_normalize(np.atleast_2d(features))
+        self._vectors = append_rows(self._vectors, self._count, new)
+        return self._publish_rows(self._count + len(new)), new
+
+    def _extend_vectors(self, vectors):
+        """Reference a caller's matrix extended with new rows and return (ids, rows)."""
+        new = vectors[self._count:]
+        self._vectors = vectors
+        return self._publish_rows(len(vectors)), new
+
+    def _publish_rows(self, count):
+        """Make the rows below `count`, whose vectors are in place, searchable."""
+        ids = np.arange(self._count, count)
+        self._alive = np.concatenate([self._alive, np.ones(len(ids), dtype=bool)])
+        # Publish the new count last so concurrent readers never see ids whose
+        # vectors are not written yet
+        self._count = count
+        return ids
+
+
+class ExactIndex(VectorIndex):
+    """Brute-force scan with a single matrix product per block of rows."""
+
+    name = "exact"
+
+    def __init__(self, block_size=65536):
+        """
+        Args:
+            block_size (int): Rows scored per matrix product; bounds the size of
+                the temporary score matrix on large catalogs.
+        """
+        super().__init__()
+        self.block_size = block_size
+
+    def fit(self, features, normalized=False):
+        self._set_vectors(features, normalized)
+        return self
+
+    def add(self, features):
+        ids, _ = self._append_vectors(features)
+        return ids
+
+    def extend(self, vectors):
+        ids, _ = self._extend_vectors(vectors)
+        return ids
+
+    def query(self, queries, k, allowed=None):
+        validate_k(k)
+        queries = l2_normalize(np.atleast_2d(queries))
+        # Snapshot in reverse publication order (count, alive, vectors) so rows
+        # below `count` are always fully written
+        count = self._count
+        alive = self._alive
+        vectors = self._vectors
+        mask = alive if self._n_removed else None
+        if allowed is not None:
+            mask = _restrict(alive, allowed, count)
+            ids = np.flatnonzero(mask)
+            if len(ids) <= self.prefilter_fraction * count:
+                return _scan_ids(lambda rows: queries @ vectors[rows].T, len(queries), ids, k, self.block_size)
+        return _scan_top_k(
+            lambda start, stop: queries @ vectors[start:stop].T,
+            len(queries), count, k,
+            alive=mask,
+            block_size=self.block_size,
+        )
+
+
+class IVFIndex(VectorIndex):
+    """
+    Inverted-file index: vectors are bucketed by their nearest k-means centroid
+    and a query only scans the `nprobe` closest buckets.
+
+    Pure NumPy, so it runs anywhere the rest of the backend runs. Rows added
+    after fit() go to the bucket of their nearest existing centroid; refit when
+    the catalog has drifted far from the data the centroids were trained on.
+    """
+
+    name = "ivf"
+
+    def __init__(self, nlist=None, nprobe=8, train_size=50000, n_iter=10, seed=0):
+        """
+        Args:
+            nlist (int, optional): Number of buckets. Defaults to 4 * sqrt(N).
+            nprobe (int): Buckets scanned per query. Higher means better recall
+                and slower queries; nprobe == nlist is an exact scan.
+            train_size (int): Maximum number of vectors used to train centroids.
+            n_iter (int): k-means iterations.
+            seed (int): Random seed for centroid initialisation.
+        """
+        super().__init__()
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.train_size = train_size
+        self.n_iter = n_iter
+        self.seed = seed
+        self.centroids = None
+        self.lists = None
+
+    def _train(self, vectors):
+        rng = np.random.default_rng(self.seed)
+        nlist = self.nlist or int(4 * np.sqrt(len(vectors)))
+        nlist = max(1, min(nlist, len(vectors)))
+        sample = vectors
+        if len(vectors) > self.train_size:
+            sample = vectors[np.sort(rng.choice(len(vectors), self.train_size, replace=False))]
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+        for _ in range(self.n_iter):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, sample)
+            empty = np.bincount(assign, minlength=nlist) == 0
+            # Re-seed empty buckets from random vectors
+            sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+            centroids = l2_normalize(sums)
+        return centroids
+
+    def _assign(self, vectors, block_size=65536):
+        return np.concatenate([
+            np.argmax(vectors[i:i + block_size] @ self.centroids.T, axis=1)
+            for i in range(0, len(vectors), block_size)
+        ])
+
+    def fit(self, features, normalized=False):
+        self._set_vectors(features, normalized)
+        self.centroids = self._train(self._vectors)
+        assign = self._assign(self._vectors)
+        order = np.argsort(assign, kind='stable')
+        bounds = np.searchsorted(assign[order], np.arange(len(self.centroids) + 1))
+        self.lists = [order[bounds[i]:bounds[i + 1]] for i in range(len(self.centroids))]
+        return self
+
+    def add(self, features):
+        if self.centroids is None:
+            self.fit(features)
+            return np.arange(self._count)
+        return self._file(*self._append_vectors(features))
+
+    def extend(self, vectors):
+        if self.centroids is None:
+            self.fit(vectors, normalized=True)
+            return np.arange(self._count)
+        return self._file(*self._extend_vectors(vectors))
+
+    def _file(self, ids, vectors):
+        """Put new rows in the bucket of their nearest centroid."""
+        if not len(ids):
+            return ids
+        assign = self._assign(vectors)
+        for bucket in np.unique(assign):
+            self.lists[bucket] = np.concatenate([self.lists[bucket], ids[assign == bucket]])
+        return ids
+
+    def query(self, queries, k, allowed=None):
+        validate_k(k)
+        queries = l2_normalize(np.atleast_2d(queries))
+        alive = self._alive
+        vectors = self._vectors
+        mask = alive if self._n_removed else None
+        allowed_ids = None
+        if allowed is not None:
+            mask = _restrict(alive, allowed, len(alive))
+            allowed_ids = np.flatnonzero(mask)
+            if len(allowed_ids) <= self.prefilter_fraction * len(alive):
+                return _scan_ids(lambda rows: queries @ vectors[rows].T, len(queries), allowed_ids, k)
+        nprobe = self.nprobe
+        if allowed_ids is not None:
+            # Probe proportionally more buckets so that about as many allowed
+            # rows are scanned as an unfiltered query would scan
+            nprobe = int(np.ceil(nprobe * len(alive) / max(len(allowed_ids), 1)))
+        nprobe = min(nprobe, len(self.centroids))
+        _, probes = _top_k(queries @ self.centroids.T, nprobe)
+        all_scores = np.empty((len(queries), k), np.float32)
+        all_indices = np.empty((len(queries), k), np.int64)
+        for qi, query in enumerate(queries):
+            candidates = np.concatenate([self.lists[p] for p in probes[qi]])
+            candidates = candidates[candidates < len(alive)]
+            if mask is not None:
+                candidates = candidates[mask[candidates]]
+            if allowed_ids is not None and len(candidates) < min(k, len(allowed_ids)):
+                # The filter left too few rows in the probed buckets (it may
+                # select one region of the space, e.g. one artist): scan all it allows
+                candidates = allowed_ids
+            scores, local = _top_k((vectors[candidates] @ query)[None, :], k)
+            all_scores[qi], all_indices[qi] = _pad(scores[0], candidates[local[0]], k)
+        return all_scores, all_indices
+
+
+class HNSWIndex(VectorIndex):
+    """
+    Hierarchical navigable small world graph (requires the optional `hnswlib`
+    package).
+    """
+
+    name = "hnsw"
+
+    def __init__(self, M=16, ef_construction=200, ef_search=64, num_threads=-1):
+        """
+        Args:
+            M (int): Graph out-degree. Higher means better recall and more memory.
+            ef_construction (int): Candidate list size while building.
+            ef_search (int): Candidate list size while querying. The main
+                recall/speed knob; must be at least k.
+            num_threads (int): Threads used to build and query (-1 for all cores).
+        """
+        try:
+            import hnswlib
+        except ImportError as e:
+            raise ImportError("The 'hnsw' index backend requires hnswlib (pip install hnswlib)") from e
+        super().__init__()
+        self._hnswlib = hnswlib
+        self.M = M
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.num_threads = num_threads
+        self._index = None
+
+    def fit(self, features, normalized=False):
+        vectors = features if normalized else l2_normalize(features, copy=False)
+        self._index = self._hnswlib.Index(space='ip', dim=vectors.shape[1])
+        self._index.init_index(max_elements=max(len(vectors), 1), ef_construction=self.ef_construction, M=self.M)
+        self._index.add_items(vectors, np.arange(len(vectors)), num_threads=self.num_threads)
+        # The graph keeps its own copy of the vectors. The fitted matrix is
+        # only referenced (a caller's memmap stays shared) to score filtered
+        # candidates, since reading rows back out of the graph is slow
+        self._vectors = vectors
+        self._added = None
+        self._count = len(vectors)
+        self._alive = np.ones(self._count, dtype=bool)
+        self._n_removed = 0
+        return self
+
+    def add(self, features):
+        vectors = l2_normalize(np.atleast_2d(features))
+        if self._index is None:
+            self.fit(vectors)
+            return np.arange(self._count)
+        self._add_items(vectors)
+        self._added = append_rows(self._added, self._count - len(self._vectors), vectors)
+        return self._publish_rows(self._count + len(vectors))
+
+    def extend(self, vectors):
+        if self._index is None:
+            self.fit(vectors, normalized=True)
+            return np.arange(self._count)
+        self._add_items(vectors[self._count:])
+        # The caller's matrix holds every row, including any add()ed before
+        self._vectors = vectors
+        self._added = None
+        return self._publish_rows(len(vectors))
+
+    def _add_items(self, vectors):
+        """Insert rows into the graph under the next ids."""
+        if not len(vectors):
+            return
+        needed = self._count + len(vectors)
+        if self._index.get_max_elements() < needed:
+            self._index.resize_index(max(needed, 2 * self._count))
+        self._index.add_items(vectors, np.arange(self._count, needed), num_threads=self.num_threads)
+
+    def remove(self, ids):
+        removed = super().remove(ids)
+        for i in removed:
+            self._index.mark_deleted(int(i))
+        return removed
+
+    def query(self, queries, k, allowed=None):
+        validate_k(k)
+        queries = l2_normalize(np.atleast_2d(queries))
+        k = min(k, self.n_alive)
+        if k == 0:
+            return np.empty((len(queries), 0), np.float32), np.empty((len(queries), 0), np.int64)
+        self._index.set_ef(max(self.ef_search, k))
+        if allowed is not None:
+            return self._filtered_query(queries, k, _restrict(self._alive, allowed, self._count))
+        labels, distances = self._index.knn_query(queries, k=k, num_threads=self.num_threads)
+        # hnswlib's inner-product distance is 1 - dot
+        return (1.0 - distances).astype(np.float32), labels.astype(np.int64)
+
+    def _filtered_query(self, queries, k, mask):
+        ids = np.flatnonzero(mask)
+        if len(ids) > max(self.prefilter_fraction * self._count, k):
+            try:
+                # The graph search skips disallowed nodes; the callback runs
+                # under the GIL, so one thread is as fast as several
+                labels, distances = self._index.knn_query(
+                    queries, k=k, num_threads=1, filter=lambda label: bool(mask[label]))
+                return (1.0 - distances).astype(np.float32), labels.astype(np.int64)
+            except RuntimeError:
+                # Fewer than k allowed nodes were reachable with this ef
+                pass
+        return _scan_ids(lambda rows: queries @ self._rows(rows).T, len(queries), ids, k)
+
+
+class QuantizedIndex(VectorIndex):
+    """
+    Flat scan over compressed vectors (see quantization.py).
+
+    Only the codes are kept in memory: 2048-d float32 rows take 8 KB each,
+    float16 4 KB, int8 2 KB and product quantization `pq_m` bytes. An optional
+    PCA projection (with whitening) reduces the dimension before encoding.
+    """
+
+    name = "quantized"
+
+    def __init__(self, storage="float16", pca_dim=None, whiten=False, train_size=50000, block_size=4096,
+                 **codec_params):
+        """
+        Args:
+            storage (str): 'float32', 'float16', 'int8' or 'pq'.
+            pca_dim (int, optional): Project to this many dimensions first.
+            whiten (bool): Whiten the PCA components.
+            train_size (int): Maximum number of vectors used to train the codec.
+            block_size (int): Rows decoded and scored per block; small blocks keep
+                the temporary float32 copy in cache.
+            **codec_params: Codec knobs, e.g. m=64 for 'pq'.
+        """
+        super().__init__()
+        self.storage = storage
+        self.train_size = train_size
+        self.block_size = block_size
+        self.codec = build_codec(storage, **codec_params)
+        self.pca = PCATransform(pca_dim, whiten=whiten) if pca_dim else None
+        self._codes = None
+
+    def _transform(self, vectors):
+        return self.pca.transform(vectors) if self.pca is not None else vectors
+
+    def fit(self, features, normalized=False):
+        vectors = features if normalized else l2_normalize(features, copy=False)
+        if self.pca is not None:
+            self.pca.fit(vectors)
+        sample = vectors
+        if len(vectors) > self.train_size:
+            rng = np.random.default_rng(0)
+            sample = vectors[np.sort(rng.choice(len(vectors), self.train_size, replace=False))]
+        self.codec.fit(self._transform(sample))
+        # Encode block by block so a memory-mapped matrix is never fully loaded
+        self._codes = None
+        for start in range(0, len(vectors), self.block_size):
+            codes = self.codec.encode(self._transform(vectors[start:start + self.block_size]))
+            if self._codes is None:
+                self._codes = np.empty((len(vectors),) + codes.shape[1:], dtype=codes.dtype)
+            self._codes[start:start + len(codes)] = codes
+        self._count = len(vectors)
+        self._alive = np.ones(self._count, dtype=bool)
+        self._n_removed = 0
+        return self
+
+    def add(self, features):
+        codes = self.codec.encode(self._transform(l2_normalize(np.atleast_2d(features))))
+        ids = np.arange(self._count, self._count + len(codes))
+        self._codes = append_rows(self._codes, self._count, codes)
+        self._alive = np.concatenate([self._alive, np.ones(len(codes), dtype=bool)])
+        self._count += len(codes)
+        return ids
+
+    def query(self, queries, k, allowed=None):
+        validate_k(k)
+        queries = self._transform(l2_normalize(np.atleast_2d(queries)))
+        count = self._count
+        alive = self._alive
+        codes = self._codes
+        mask = alive if self._n_removed else None
+        if allowed is not None:
+            mask = _restrict(alive, allowed, count)
+            ids = np.flatnonzero(mask)
+            if len(ids) <= self.prefilter_fraction * count:
+                return _scan_ids(lambda rows: self.codec.scores(codes[rows], queries),
+                                 len(queries), ids, k, self.block_size)
+        return _scan_top_k(
+            lambda start, stop: self.codec.scores(codes[start:stop], queries),
+            len(queries), count, k,
+            alive=mask,
+            block_size=self.block_size,
+        )
+
+    @property
+    def nbytes(self):
+        """Memory held by the codes and the codec/PCA parameters."""
+        total = 0 if self._codes is None else self._codes[:self._count].nbytes
+        total += self.codec.nbytes
+        if self.pca is not None:
+            total += self.pca.nbytes
+        return total
+
+
+class TwoStageIndex(QuantizedIndex):
+    """
+    Coarse scan over compact codes, then an exact re-rank of the best candidates.
+
+    The first stage scores every row through a cheap representation: sign
+    bits by default (storage='binary', 256 bytes per 2048-d row), or e.g.
+    PCA-reduced vectors (storage='float16', pca_dim=128). Only its
+    `candidates` best rows are scored against the full-precision vectors.
+
+    The fitted matrix is referenced, not copied, so a memory-mapped feature
+    store stays shared and only candidate rows are ever read from it.
+    """
+
+    name = "two_stage"
+
+    def __init__(self, candidates=256, storage="binary", **params):
+        """
+        Args:
+            candidates (int): Rows kept by the first stage and re-ranked per
+                query. More means better recall and slower queries.
+            storage (str): First-stage codec (see quantization.py).
+            **params: QuantizedIndex options, e.g. pca_dim=128.
+        """
+        super().__init__(storage=storage, **params)
+        self.candidates = candidates
+
+    def fit(self, features, normalized=False):
+        vectors = features if normalized else l2_normalize(features, copy=False)
+        super().fit(vectors, normalized=True)
+        self._vectors = vectors
+        self._added = None
+        return self
+
+    def add(self, features):
+        vectors = l2_normalize(np.atleast_2d(features))
+        self._added = append_rows(self._added, self._count - len(self._vectors), vectors)
+        return super().add(vectors)
+
+    def extend(self, vectors):
+        # Reference the full rows before the codes make the new ids searchable
+        new = vectors[self._count:]
+        self._vectors = vectors
+        self._added = None
+        return super().add(new)
+
+    def query(self, queries, k, allowed=None):
+        validate_k(k)
+        queries = l2_normalize(np.atleast_2d(queries))
+        if allowed is not None:
+            ids = np.flatnonzero(_restrict(self._alive, allowed, self._count))
+            if len(ids) <= self.prefilter_fraction * self._count:
+                return _scan_ids(lambda rows: queries @ self._rows(rows).T, len(queries), ids, k)
+        _, candidates = super().query(queries, max(self.candidates, k), allowed)
+        all_scores = np.empty((len(queries), k), np.float32)
+        all_indices = np.empty((len(queries), k), np.int64)
+        for qi, query in enumerate(queries):
+            rows = np.sort(candidates[qi][candidates[qi] >= 0])
+            scores, local = _top_k((self._rows(rows) @ query)[None, :], k)
+            all_scores[qi], all_indices[qi] = _pad(scores[0], rows[local[0]], k)
+        return all_scores, all_indices
+
+
+INDEX_BACKENDS = {
+    ExactIndex.name: ExactIndex,
+    IVFIndex.name: IVFIndex,
+    HNSWIndex.name: HNSWIndex,
+    QuantizedIndex.name: QuantizedIndex,
+    TwoStageIndex.name: TwoStageIndex,
+}
+
+
+def build_index(backend="exact", **params):
+    """
+    Create an unfitted index.
+
+    Args:
+        backend (str): One of INDEX_BACKENDS ('exact', 'ivf', 'hnsw', 'quantized', 'two_stage'),
+            or 'sharded' for a sharding.ShardedIndex over any of them.
+        **params: Backend-specific recall/speed knobs.
+
+    Returns:
+        VectorIndex: The index.
+    """
+    if backend == "sharded":
+        # Imported here because the shards themselves are built with build_index
+        from sharding import ShardedIndex
+        return ShardedIndex(**params)
+    if backend not in INDEX_BACKENDS:
+        raise ValueError(f"Unknown index backend '{backend}'. Choose from {sorted(INDEX_BACKENDS) + ['sharded']}")
+    return INDEX_BACKENDS[backend](**params)
@@ -0,0 +1,116 @@
+import itertools
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+_DONE = object()
+
+
+def default_workers():
+    """Decode threads used when none are configured."""
+    return min(8, os.cpu_count() or 1)
+
+
+class DecodedBatch:
+    """
+    One batch of decoded images.
+
+    Attributes:
+        images (numpy.ndarray): (M, H, W, C) stacked inputs of the items that
+            decoded successfully, or None if none did.
+        paths (list): Paths of those items, in order.
+        extras (list): Per-item extra values returned by the decode function.
+        errors (list): (path, exception) pairs for items that failed.
+        skipped (list): (path, extra) pairs for items whose decode function
+            returned no array, i.e. that need no model input.
+    """
+
+    def __init__(self, images, paths, extras, errors, skipped=None):
+        self.images = images
+        self.paths = paths
+        self.extras = extras
+        self.errors = errors
+        self.skipped = skipped if skipped is not None else []
+
+
+def iter_decoded_batches(items, decode_fn, batch_size=32, workers=None, prefetch=2):
+    """
+    Decode items on a thread pool while the caller consumes earlier batches.
+
+    A background thread fans each batch out to `workers` decode threads and
+    queues the stacked result. At most `prefetch` finished batches wait in the
+    queue, so memory stays bounded however many items there are, and the caller
+    (typically running model.predict) overlaps with decoding of the next ones.
+
+    Args:
+        items (iterable): Inputs to decode (e.g. file paths). Iterators are
+            consumed lazily, one batch ahead of decoding.
+        decode_fn (callable): item -> (array, extra). Exceptions are reported
+            per item in DecodedBatch.errors instead of stopping the pipeline;
+            a None array puts the item in DecodedBatch.skipped.
+        batch_size (int): Items per batch.
+        workers (int, optional): Decode threads. Defaults to default_workers().
+        prefetch (int): Decoded batches buffered ahead of the consumer.
+
+    Yields:
+        DecodedBatch: Batches in input order.
+    """
+    workers = workers or default_workers()
+    batches = queue.Queue(maxsize=max(prefetch, 1))
+    stop = threading.Event()
+
+    def safe_decode(item):
+        try:
+            return decode_fn(item), None
+        except Exception as e:
+            return None, e
+
+    def produce(pool):
+        try:
+            iterator = iter(items)
+            while not stop.is_set():
+                chunk = list(itertools.islice(iterator, batch_size))
+                if not chunk:
+                    return
+                arrays, paths, extras, errors, skipped = [], [], [], [], []
+                for item, (result, error) in zip(chunk, pool.map(safe_decode, chunk)):
+                    if error is not None:
+                        errors.append((item, error))
+                        continue
+                    array, extra = result
+                    if array is None:
+                        skipped.append((item, extra))
+                        continue
+                    arrays.append(array)
+                    paths.append(item)
+                    extras.append(extra)
+                images = np.stack(arrays) if arrays else None
+                batches.put(DecodedBatch(images, paths, extras, errors, skipped))
+        except BaseException as e:
+            batches.put(e)
+        finally:
+            batches.put(_DONE)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="decode") as pool:
+        producer = threading.Thread(target=produce, args=(pool,), name="decode-producer", daemon=True)
+        producer.start()
+        try:
+            while True:
+                batch = batches.get()
+                if batch is _DONE:
+                    break
+                if isinstance(batch, BaseException):
+                    raise batch
+                yield batch
+        finally:
+            # Unblock the producer if the consumer stopped early
+            stop.set()
+            while producer.is_alive():
+                try:
+                    batches.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            producer.join()
@@ -0,0 +1,319 @@
+"""
+Compressed storage for unit-length feature vectors.
+
+Each codec turns float32 rows into compact codes and scores queries directly
+against the codes (no full decode), approximating the dot product of the
+original rows:
+
+    float32   4 bytes/dim   exact reference
+    float16   2 bytes/dim   ~1e-3 relative error
+    int8      1 byte/dim    per-dimension affine scalar quantization
+    pq        m bytes/row   product quantization, 256 centroids per sub-space
+    binary    1 bit/dim     signs around the mean, scored by Hamming distance;
+                            a coarse first stage (see nn_index.TwoStageIndex)
+
+PCATransform optionally projects vectors to fewer dimensions (with optional
+whitening) before encoding.
+"""
+import numpy as np
+
+
+def _normalize_rows(x):
+    return x / np.maximum(np.linalg.norm(x, axis=-1, keepdims=True), 1e-12)
+
+
+def _sample(vectors, size, rng):
+    if len(vectors) <= size:
+        return np.asarray(vectors, dtype=np.float32)
+    return np.asarray(vectors[np.sort(rng.choice(len(vectors), size, replace=False))], dtype=np.float32)
+
+
+class PCATransform:
+    """Project unit vectors onto their top principal components and re-normalize."""
+
+    def __init__(self, dim, whiten=False, train_size=50000, seed=0):
+        """
+        Args:
+            dim (int): Output dimension.
+            whiten (bool): Scale components to unit variance, which spreads
+                similarity over all kept components instead of the first few.
+            train_size (int): Maximum number of vectors used to fit.
+            seed (int): Random seed for the training sample.
+        """
+        self.dim = dim
+        self.whiten = whiten
+        self.train_size = train_size
+        self.seed = seed
+        self.mean = None
+        self.components = None
+
+    def fit(self, vectors):
+        sample = _sample(vectors, self.train_size, np.random.default_rng(self.seed))
+        self.mean = sample.mean(axis=0)
+        _, singular, vt = np.linalg.svd(sample - self.mean, full_matrices=False)
+        dim = min(self.dim, vt.shape[0])
+        components = vt[:dim]
+        if self.whiten:
+            std = singular[:dim] / np.sqrt(max(len(sample) - 1, 1))
+            components = components / np.maximum(std, 1e-6)[:, None]
+        self.components = components.astype(np.float32)
+        return self
+
+    def transform(self, vectors):
+        projected = (np.asarray(vectors, dtype=np.float32) - self.mean) @ self.components.T
+        return _normalize_rows(projected).astype(np.float32)
+
+    @property
+    def nbytes(self):
+        return self.mean.nbytes + self.components.nbytes
+
+
+class Codec:
+    """Interface of the storage codecs."""
+
+    name = None
+
+    def fit(self, vectors):
+        """Learn codec parameters from (a sample of) the vectors."""
+        return self
+
+    def encode(self, vectors):
+        """Return the codes of (N, D) float32 vectors as an (N, ...) array."""
+        raise NotImplementedError
+
+    def scores(self, codes, queries):
+        """Return (Q, N) approximate dot products between queries and encoded rows."""
+        raise NotImplementedError
+
+    @property
+    def nbytes(self):
+        """Memory held by the codec parameters."""
+        return 0
+
+
+class Float32Codec(Codec):
+    name = "float32"
+
+    def encode(self, vectors):
+        return np.ascontiguousarray(vectors, dtype=np.float32)
+
+    def scores(self, codes, queries):
+        return queries @ codes.T
+
+
+class Float16Codec(Codec):
+    name = "float16"
+
+    def encode(self, vectors):
+        return np.ascontiguousarray(vectors, dtype=np.float16)
+
+    def scores(self, codes, queries):
+        return queries @ codes.astype(np.float32).T
+
+
+class Int8Codec(Codec):
+    """
+    Per-dimension affine scalar quantization: x ~= (code + 128) * scale + low.
+    """
+
+    name = "int8"
+
+    def __init__(self, clip_percentile=0.1, train_size=50000, seed=0):
+        """
+        Args:
+            clip_percentile (float): Range is taken between this percentile and
+                its mirror, so a few outliers do not waste the 256 levels.
+            train_size (int): Maximum number of vectors used to fit the ranges.
+            seed (int): Random seed for the training sample.
+        """
+        self.clip_percentile = clip_percentile
+        self.train_size = train_size
+        self.seed = seed
+        self.low = None
+        self.scale = None
+
+    def fit(self, vectors):
+        sample = _sample(vectors, self.train_size, np.random.default_rng(self.seed))
+        self.low = np.percentile(sample, self.clip_percentile, axis=0).astype(np.float32)
+        high = np.percentile(sample, 100 - self.clip_percentile, axis=0).astype(np.float32)
+        self.scale = np.maximum(high - self.low, 1e-6) / 255.0
+        return self
+
+    def encode(self, vectors):
+        levels = np.rint((np.asarray(vectors, dtype=np.float32) - self.low) / self.scale)
+        return (np.clip(levels, 0, 255) - 128).astype(np.int8)
+
+    def scores(self, codes, queries):
+        # x.q = code.(q * scale) + (128 * scale + low).q
+        offset = queries @ (128.0 * self.scale + self.low)
+        return (queries * self.scale) @ codes.astype(np.float32).T + offset[:, None]
+
+    @property
+    def nbytes(self):
+        return self.low.nbytes + self.scale.nbytes
+
+
+class PQCodec(Codec):
+    """
+    Product quantization: the vector is split into m sub-vectors, each replaced
+    by the id of its nearest of 256 k-means centroids (one byte per sub-vector).
+    Queries are scored with per-sub-space lookup tables.
+    """
+
+    name = "pq"
+
+    def __init__(self, m=16, train_size=20000, n_iter=8, seed=0):
+        """
+        Args:
+            m (int): Number of sub-spaces (bytes per vector). More means better
+                recall and more memory.
+            train_size (int): Maximum number of vectors used to train centroids.
+            n_iter (int): k-means iterations per sub-space.
+            seed (int): Random seed.
+        """
+        self.m = m
+        self.ksub = 256
+        self.train_size = train_size
+        self.n_iter = n_iter
+        self.seed = seed
+        self.dim = None
+        self.dsub = None
+        self.centroids = None
+
+    def _split(self, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        pad = self.m * self.dsub - vectors.shape[1]
+        if pad:
+            vectors = np.pad(vectors, ((0, 0), (0, pad)))
+        return vectors.reshape(len(vectors), self.m, self.dsub)
+
+    def fit(self, vectors):
+        rng = np.random.default_rng(self.seed)
+        self.dim = vectors.shape[1]
+        self.dsub = -(-self.dim // self.m)
+        sample = self._split(_sample(vectors, self.train_size, rng))
+        # Tiny catalogs cannot fill 256 centroids
+        self.ksub = min(self.ksub, len(sample))
+        self.centroids = np.empty((self.m, self.ksub, self.dsub), dtype=np.float32)
+        for j in range(self.m):
+            sub = sample[:, j]
+            centroids = sub[rng.choice(len(sub), self.ksub, replace=False)].copy()
+            for _ in range(self.n_iter):
+                assign = self._nearest(sub, centroids)
+                counts = np.bincount(assign, minlength=self.ksub)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, assign, sub)
+                filled = counts > 0
+                centroids[filled] = sums[filled] / counts[filled, None]
+            self.centroids[j] = centroids
+        return self
+
+    @staticmethod
+    def _nearest(sub, centroids):
+        # argmin ||x - c||^2 == argmax (x.c - ||c||^2 / 2)
+        return np.argmax(sub @ centroids.T - 0.5 * (centroids ** 2).sum(axis=1), axis=1)
+
+    def encode(self, vectors, block_size=65536):
+        codes = np.empty((len(vectors), self.m), dtype=np.uint8)
+        for start in range(0, len(vectors), block_size):
+            sub = self._split(vectors[start:start + block_size])
+            for j in range(self.m):
+                codes[start:start + len(sub), j] = self._nearest(sub[:, j], self.centroids[j])
+        return codes
+
+    def scores(self, codes, queries):
+        # (Q, m, ksub) inner products of each query sub-vector with each centroid
+        tables = np.einsum('qmd,mkd->qmk', self._split(queries), self.centroids)
+        scores = np.zeros((len(queries), len(codes)), dtype=np.float32)
+        for j in range(self.m):
+            scores += tables[:, j, codes[:, j]]
+        return scores
+
+    @property
+    def nbytes(self):
+        return self.centroids.nbytes
+
+
+def _popcount(words):
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(words)
+    # NumPy < 2.0: count bits per byte through a lookup table
+    return _BYTE_POPCOUNT[words.view(np.uint8)].reshape(words.shape + (8,)).sum(axis=-1, dtype=np.uint8)
+
+
+_BYTE_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+class BinaryCodec(Codec):
+    """
+    One bit per dimension: whether it is above the catalog mean. Rows are
+    packed into 64-bit words and compared with XOR and popcount, so a 2048-d
+    row is 256 bytes and a score costs 32 word operations.
+
+    Scores are cos(pi * hamming / bits), the angle estimate of sign hashing;
+    they rank well enough to pick candidates but are too coarse to return.
+    """
+
+    name = "binary"
+
+    def __init__(self, train_size=50000, seed=0):
+        """
+        Args:
+            train_size (int): Maximum number of vectors used to fit the mean.
+            seed (int): Random seed for the training sample.
+        """
+        self.train_size = train_size
+        self.seed = seed
+        self.mean = None
+        self.bits = None
+
+    def fit(self, vectors):
+        self.mean = _sample(vectors, self.train_size, np.random.default_rng(self.seed)).mean(axis=0)
+        self.bits = len(self.mean)
+        return self
+
+    def encode(self, vectors):
+        signs = np.asarray(vectors, dtype=np.float32) > self.mean
+        packed = np.packbits(signs, axis=1)
+        # Pad to whole 64-bit words
+        pad = -packed.shape[1] % 8
+        if pad:
+            packed = np.pad(packed, ((0, 0), (0, pad)))
+        return packed
+
+    def scores(self, codes, queries):
+        words = np.ascontiguousarray(codes).view(np.uint64)
+        query_words = self.encode(queries).view(np.uint64)
+        hamming = np.empty((len(queries), len(codes)), dtype=np.float32)
+        for qi, query in enumerate(query_words):
+            hamming[qi] = _popcount(words ^ query).sum(axis=1, dtype=np.uint32)
+        return np.cos(np.pi * hamming / self.bits)
+
+    @property
+    def nbytes(self):
+        return self.mean.nbytes
+
+
+CODECS = {
+    Float32Codec.name: Float32Codec,
+    Float16Codec.name: Float16Codec,
+    Int8Codec.name: Int8Codec,
+    PQCodec.name: PQCodec,
+    BinaryCodec.name: BinaryCodec,
+}
+
+
+def build_codec(storage="float32", **params):
+    """
+    Create an untrained codec.
+
+    Args:
+        storage (str): One of CODECS ('float32', 'float16', 'int8', 'pq', 'binary').
+        **params: Codec parameters, e.g. m=32 for 'pq'.
+
+    Returns:
+        Codec: The codec.
+    """
+    if storage not in CODECS:
+        raise ValueError(f"Unknown storage mode '{storage}'. Choose from {sorted(CODECS)}")
+    return CODECS[storage](**params)
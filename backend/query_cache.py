@@ -0,0 +1,271 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+def _dct_matrix(n):
+    """Orthonormal DCT-II basis as an (n, n) matrix."""
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    basis = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    basis[0] /= np.sqrt(2.0)
+    return basis
+
+
+_DCT_32 = _dct_matrix(32)
+
+
+def perceptual_hash(img, hash_size=8, min_contrast=1.0):
+    """
+    64-bit DCT perceptual hash (pHash) of a PIL image.
+
+    Re-encoding, rescaling and mild colour changes leave the hash unchanged or
+    a few bits away, so re-uploads of the same artwork map to the same key.
+
+    Flat and nearly flat images are not hashed: their low-frequency
+    coefficients are all close to zero, so their bits only encode rounding
+    noise and unrelated images of that kind would share a hash.
+
+    Args:
+        img (PIL.Image): Image to hash.
+        hash_size (int): Side of the low-frequency block kept (8 -> 64 bits).
+        min_contrast (float): Smallest RMS of the low-frequency coefficients,
+            in grey levels, for the image to be hashed.
+
+    Returns:
+        int or None: The hash, or None if the image has too little detail.
+    """
+    from PIL import Image
+
+    pixels = np.asarray(img.convert('L').resize((32, 32), Image.LANCZOS), dtype=np.float64)
+    dct = _DCT_32 @ pixels @ _DCT_32.T
+    low = dct[:hash_size, :hash_size].flatten()
+    # The DC term only encodes overall brightness. The orthonormal DCT of a
+    # 32x32 block scales contrast by 32
+    if np.sqrt(np.mean(low[1:] ** 2)) / 32 < min_contrast:
+        return None
+    bits = low[1:] > np.median(low[1:])
+    return int(''.join('1' if b else '0' for b in bits), 2)
+
+
+def content_key(img_data):
+    """
+    Exact-content cache key for a query, or None if it cannot be keyed cheaply.
+
+    Raw bytes and base64 data URLs are keyed by their SHA-256. File paths,
+    URLs and PIL images are not, because their content is only known after
+    loading them (the perceptual hash still applies).
+    """
+    if isinstance(img_data, (bytes, bytearray)):
+        return hashlib.sha256(img_data).hexdigest()
+    if isinstance(img_data, str) and img_data.startswith('data:'):
+        return hashlib.sha256(img_data.encode()).hexdigest()
+    return None
+
+
+class CachedQuery:
+    """
+    A query on its way through the cache.
+
+    Attributes:
+        image: The query as given, or the decoded PIL image once it had to be
+            decoded (for the perceptual hash), so it is never decoded twice.
+        content_key (str or None): Exact-content key.
+        phash (int or None): Perceptual hash, if enabled and computed.
+        embedding (numpy.ndarray or None): Cached or freshly extracted features.
+        results (list or None): Cached results valid for the current index.
+    """
+
+    def __init__(self, image, content_key=None, phash=None, embedding=None, results=None):
+        self.image = image
+        self.content_key = content_key
+        self.phash = phash
+        self.embedding = embedding
+        self.results = results
+
+
+class QueryCache:
+    """
+    Bounded LRU + TTL cache of query embeddings and their top-k results.
+
+    Entries are found by exact content hash first and then, if enabled, by
+    perceptual hash. A perceptual hash match reuses another upload's
+    embedding and results for a visually identical image; it is opt-in
+    because distinct images can share a hash. Embeddings depend only on the image, so they survive index
+    changes; results are tagged with the index version they were computed
+    against and are dropped as soon as the index changes. Results only answer
+    queries with the same metadata filter.
+    """
+
+    def __init__(self, max_entries=1024, ttl_seconds=3600, use_perceptual_hash=False, clock=time.monotonic):
+        """
+        Args:
+            max_entries (int): Entries kept before the least recently used is evicted.
+            ttl_seconds (float, optional): Lifetime of an entry; None disables expiry.
+            use_perceptual_hash (bool): Also match re-encoded copies by pHash.
+            clock (callable): Time source (seconds).
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.use_perceptual_hash = use_perceptual_hash
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._by_key = {}
+        self._by_phash = {}
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self.hits = 0
+        self.phash_hits = 0
+        self.embedding_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def _drop(self, entry_id):
+        entry = self._entries.pop(entry_id)
+        for key in entry['keys']:
+            if self._by_key.get(key) == entry_id:
+                del self._by_key[key]
+        if entry['phash'] is not None and self._by_phash.get(entry['phash']) == entry_id:
+            del self._by_phash[entry['phash']]
+
+    def _find(self, entry_id):
+        if entry_id is None:
+            return None
+        entry = self._entries.get(entry_id)
+        if entry is None:
+            return None
+        if entry['expires'] is not None and entry['expires'] <= self.clock():
+            self._drop(entry_id)
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(entry_id)
+        return entry
+
+    def _resolve(self, entry, query, top_k, index_version, filter_key):
+        query.embedding = entry['embedding']
+        if entry['index_version'] != index_version:
+            if entry['results'] is not None:
+                entry['results'] = None
+                self.invalidations += 1
+        elif entry['results'] is not None and entry['top_k'] >= top_k and entry['filter_key'] == filter_key:
+            query.results = entry['results'][:top_k]
+            return True
+        self.embedding_hits += 1
+        return False
+
+    def lookup(self, query, top_k, index_version, decode=None, filter_key=None):
+        """
+        Look a query up by content key, then by perceptual hash.
+
+        Fills query.embedding, and query.results when they are still valid for
+        the current index. Computing the perceptual hash requires decoding the
+        query; the decoded image replaces query.image so it is not decoded
+        again for feature extraction.
+
+        Args:
+            query (CachedQuery): Query with image and content_key set.
+            top_k (int): Number of results asked for.
+            index_version (int): Current version of the index.
+            decode (callable, optional): query.image -> PIL image. Without it the
+                perceptual hash is skipped.
+            filter_key (str, optional): Metadata filter the results must have
+                been computed with (see metadata.filter_key).
+
+        Returns:
+            bool: True if an entry was found.
+        """
+        with self._lock:
+            entry = self._find(self._by_key.get(query.content_key)) if query.content_key else None
+            if entry is not None:
+                if self._resolve(entry, query, top_k, index_version, filter_key):
+                    self.hits += 1
+                return True
+
+        if self.use_perceptual_hash and decode is not None:
+            query.image = decode(query.image)
+            query.phash = perceptual_hash(query.image)
+        if query.phash is not None:
+            with self._lock:
+                entry_id = self._by_phash.get(query.phash)
+                entry = self._find(entry_id)
+                if entry is not None:
+                    # Remember the new encoding as an alias of the same artwork
+                    if query.content_key is not None and query.content_key not in self._by_key:
+                        entry['keys'].append(query.content_key)
+                        self._by_key[query.content_key] = entry_id
+                    if self._resolve(entry, query, top_k, index_version, filter_key):
+                        self.phash_hits += 1
+                    return True
+
+        with self._lock:
+            self.misses += 1
+        return False
+
+    def store(self, query, results, top_k, index_version, filter_key=None):
+        """
+        Remember a query's embedding and results.
+
+        Args:
+            query (CachedQuery): Query with content_key/phash and embedding set.
+            results (list): Results computed for top_k.
+            top_k (int): Number of results asked for.
+            index_version (int): Version of the index the results came from.
+            filter_key (str, optional): Metadata filter the results were computed with.
+        """
+        if query.content_key is None and query.phash is None:
+            return
+        with self._lock:
+            entry_id = self._by_key.get(query.content_key) if query.content_key is not None else None
+            if entry_id is None and query.phash is not None:
+                entry_id = self._by_phash.get(query.phash)
+            entry = self._entries.get(entry_id) if entry_id is not None else None
+            if entry is None:
+                entry_id = self._next_id
+                self._next_id += 1
+                entry = {'keys': [], 'phash': query.phash}
+                self._entries[entry_id] = entry
+                if query.phash is not None:
+                    self._by_phash[query.phash] = entry_id
+            if query.content_key is not None and query.content_key not in entry['keys']:
+                entry['keys'].append(query.content_key)
+                self._by_key[query.content_key] = entry_id
+            entry.update(
+                embedding=query.embedding,
+                results=list(results),
+                top_k=top_k,
+                index_version=index_version,
+                filter_key=filter_key,
+                expires=self.clock() + self.ttl_seconds if self.ttl_seconds else None,
+            )
+            self._entries.move_to_end(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_key.clear()
+            self._by_phash.clear()
+
+    def stats(self):
+        """Return the cache counters."""
+        with self._lock:
+            lookups = self.hits + self.phash_hits + self.embedding_hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'phash_hits': self.phash_hits,
+                'embedding_hits': self.embedding_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+                'hit_rate': (self.hits + self.phash_hits) / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,305 @@
+"""
+Region-level matching for crops, collages and artwork on merchandise.
+
+A single global embedding of the whole image (resized to 224x224) scores
+poorly when only part of the query is the artwork, or when the query is a
+crop of it. In region mode every artwork is also embedded as a grid of
+overlapping tiles at several scales, and so is every query. An artwork's
+score is the best similarity between any query tile and any of its tiles:
+
+    scale 1   the whole image (tile 0, identical to the global embedding)
+    scale 2   2x2 grid of overlapping tiles, each about half the image
+    scale 3   3x3 grid, each about a third of the image
+
+A crop of an artwork matches one of its tiles; a collage or a product photo
+has a query tile that matches the artwork's whole-image tile.
+
+Region vectors are stored as one contiguous float16 matrix (half the size of
+float32) with an int32 owner row per region, and scanned block by block.
+With scales (1, 2) an artwork costs 5 * 2 * D bytes, 20 KB for ResNet50
+features, against 8 KB for its float32 global vector.
+"""
+import threading
+
+import numpy as np
+
+import metrics
+from inference import preprocess_input
+from nn_index import _restrict, _scan_ids, _scan_top_k, append_rows, l2_normalize, validate_k
+
+# Feature store (a subdirectory of the main one) holding the region vectors
+REGION_STORE = "regions"
+
+
+def tile_boxes(width, height, scales=(1, 2), overlap=0.25):
+    """
+    Crop boxes of the multi-scale tile grid, whole image first.
+
+    Args:
+        width (int): Image width.
+        height (int): Image height.
+        scales (tuple): Grid sizes; scale s gives s x s tiles.
+        overlap (float): How much larger than 1/s of the image each tile is,
+            so that a motif on a tile border is still whole in some tile.
+
+    Returns:
+        list: (left, upper, right, lower) boxes, sum(s * s) of them.
+    """
+    boxes = []
+    for scale in scales:
+        tile_w = min(width, int(round(width / scale * (1 + overlap))))
+        tile_h = min(height, int(round(height / scale * (1 + overlap))))
+        for row in range(scale):
+            for col in range(scale):
+                left = int(round(col * (width - tile_w) / (scale - 1))) if scale > 1 else 0
+                upper = int(round(row * (height - tile_h) / (scale - 1))) if scale > 1 else 0
+                boxes.append((left, upper, left + tile_w, upper + tile_h))
+    return boxes
+
+
+def crop_tiles(img, scales=(1, 2), overlap=0.25, target_size=(224, 224)):
+    """
+    Preprocess every tile of an RGB PIL image for the feature extractor.
+
+    Returns:
+        numpy.ndarray: (T, H, W, 3) model input, whole image first.
+    """
+    boxes = tile_boxes(img.width, img.height, scales, overlap)
+    tiles = np.empty((len(boxes), target_size[1], target_size[0], 3), dtype=np.float32)
+    with metrics.stage('resize', len(boxes)):
+        for i, box in enumerate(boxes):
+            tile = img if box == (0, 0, img.width, img.height) else img.crop(box)
+            tiles[i] = np.asarray(tile.resize(target_size), dtype=np.float32)
+    with metrics.stage('preprocess', len(boxes)):
+        return preprocess_input(tiles)
+
+
+class RegionIndex:
+    """
+    Tile vectors of every artwork, searched with per-artwork aggregation.
+
+    Like VectorIndex rows, region rows are never updated in place: removing
+    an artwork marks its regions dead, and re-adding it appends new ones.
+    """
+
+    prefilter_fraction = 0.1
+
+    def __init__(self, scales=(1, 2), overlap=0.25, candidates=None, block_size=4096):
+        """
+        Args:
+            scales (tuple): Tile grid sizes (see tile_boxes). Must include 1
+                so whole images match query tiles.
+            overlap (float): Tile overlap (see tile_boxes).
+            candidates (int, optional): Regions retrieved per query tile
+                before aggregating by artwork. Defaults to max(4 * k, 32).
+            block_size (int): Rows converted to float32 and scored at a time.
+        """
+        scales = tuple(int(s) for s in scales)
+        if 1 not in scales:
+            raise ValueError("Region scales must include 1 (the whole image)")
+        self.scales = (1,) + tuple(s for s in scales if s != 1)
+        self.overlap = overlap
+        self.candidates = candidates
+        self.block_size = block_size
+        self._vectors = None
+        self._owners = np.zeros(0, dtype=np.int32)
+        self._alive = np.zeros(0, dtype=bool)
+        self._count = 0
+        self._n_removed = 0
+        self._lock = threading.Lock()
+
+    @property
+    def n_tiles(self):
+        """Regions per artwork."""
+        return sum(s * s for s in self.scales)
+
+    def tiles(self, img, target_size=(224, 224)):
+        """Preprocessed tiles of an RGB PIL image, (n_tiles, H, W, 3)."""
+        return crop_tiles(img, self.scales, self.overlap, target_size)
+
+    def fit(self, vectors, owners, normalized=False):
+        """
+        Replace all regions.
+
+        Args:
+            vectors (numpy.ndarray): (M, D) region vectors. A float16 matrix
+                (e.g. a memory-mapped region store) is used as-is.
+            owners (numpy.ndarray): (M,) artwork row of every region; -1 for
+                regions that belong to no live artwork.
+            normalized (bool): Rows are known to be unit length.
+        """
+        if not normalized:
+            vectors = l2_normalize(vectors)
+        if vectors.dtype != np.float16:
+            vectors = vectors.astype(np.float16)
+        owners = np.asarray(owners, dtype=np.int32)
+        with self._lock:
+            self._vectors = vectors
+            self._owners = owners
+            self._alive = owners >= 0
+            self._count = len(vectors)
+            self._n_removed = int((~self._alive).sum())
+        return self
+
+    def add(self, vectors, owners):
+        """
+        Append regions.
+
+        Args:
+            vectors (numpy.ndarray): (M, D) region vectors.
+            owners (numpy.ndarray): (M,) artwork rows.
+        """
+        if self._vectors is None:
+            return self.fit(vectors, owners)
+        vectors = l2_normalize(np.atleast_2d(vectors)).astype(np.float16)
+        owners = np.asarray(owners, dtype=np.int32)
+        with self._lock:
+            count = self._count
+            self._vectors = append_rows(self._vectors, count, vectors)
+            self._owners = np.concatenate([self._owners[:count], owners])
+            self._alive = np.concatenate([self._alive[:count], np.ones(len(vectors), dtype=bool)])
+            # Published last, as in VectorIndex._append_vectors
+            self._count = count + len(vectors)
+        return self
+
+    def remove_owners(self, rows):
+        """Drop the regions of the given artwork rows."""
+        if self._vectors is None or len(rows) == 0:
+            return
+        with self._lock:
+            count = self._count
+            dead = self._alive[:count] & np.isin(self._owners[:count], np.asarray(rows, dtype=np.int32))
+            alive = self._alive.copy()
+            alive[:count][dead] = False
+            self._alive = alive
+            self._n_removed += int(dead.sum())
+
+    def move_owners(self, old_rows, new_rows):
+        """
+        Hand the regions of removed artwork rows to the rows that replaced
+        them (a metadata update re-adds an artwork with the same features).
+        """
+        if self._vectors is None or len(old_rows) == 0:
+            return
+        old_rows = np.asarray(old_rows, dtype=np.int32)
+        new_rows = np.asarray(new_rows, dtype=np.int32)
+        order = np.argsort(old_rows)
+        old_rows, new_rows = old_rows[order], new_rows[order]
+        with self._lock:
+            count = self._count
+            owners = self._owners[:count].copy()
+            position = np.minimum(np.searchsorted(old_rows, owners), len(old_rows) - 1)
+            moved = old_rows[position] == owners
+            owners[moved] = new_rows[position[moved]]
+            alive = self._alive[:count].copy()
+            self._n_removed -= int((moved & ~alive).sum())
+            alive[moved] = True
+            # Row ids are never reused, so every region of an old row moves
+            self._owners = owners
+            self._alive = alive
+
+    def live(self):
+        """Return (vectors, owners) of the regions of live artworks."""
+        count = self._count
+        if self._vectors is None:
+            return np.empty((0, 0), dtype=np.float16), np.empty(0, dtype=np.int32)
+        keep = np.flatnonzero(self._alive[:count])
+        return self._vectors[keep], self._owners[keep]
+
+    def owners(self):
+        """Artwork rows that have live regions."""
+        count = self._count
+        return np.unique(self._owners[:count][self._alive[:count]])
+
+    def query(self, queries, k, allowed=None):
+        """
+        Find the k best-matching artworks for each query.
+
+        Args:
+            queries (numpy.ndarray): (Q, T, D) tile vectors per query, or
+                (Q, D) for whole-image queries only.
+            k (int): Number of artworks per query.
+            allowed (numpy.ndarray, optional): Boolean mask over artwork rows.
+
+        Returns:
+            tuple: (scores, artwork rows), both (Q, k); unfilled slots have row -1.
+
+        Raises:
+            ValueError: If k is below 1.
+        """
+        validate_k(k)
+        queries = np.asarray(queries, dtype=np.float32)
+        if queries.ndim == 2:
+            queries = queries[:, None, :]
+        n_queries, n_tiles = queries.shape[:2]
+        if self._vectors is None:
+            return np.empty((n_queries, 0), np.float32), np.empty((n_queries, 0), np.int64)
+        flat = l2_normalize(queries.reshape(n_queries * n_tiles, -1))
+        # Snapshot in reverse publication order, as ExactIndex.query does
+        count = self._count
+        alive = self._alive
+        owners = self._owners
+        vectors = self._vectors
+        candidates = self.candidates or max(4 * k, 32)
+
+        def score(rows):
+            return flat @ vectors[rows].astype(np.float32).T
+
+        mask = alive[:count] if self._n_removed else None
+        if allowed is not None:
+            allowed = np.asarray(allowed, dtype=bool)
+            in_range = (owners[:count] >= 0) & (owners[:count] < len(allowed))
+            by_owner = np.zeros(count, dtype=bool)
+            by_owner[in_range] = allowed[owners[:count][in_range]]
+            mask = _restrict(alive, by_owner, count)
+            ids = np.flatnonzero(mask)
+            if len(ids) <= self.prefilter_fraction * count:
+                scores, hits = _scan_ids(score, len(flat), ids, candidates, self.block_size)
+                return self._aggregate(scores, hits, owners, n_queries, k)
+        scores, hits = _scan_top_k(
+            lambda start, stop: flat @ vectors[start:stop].astype(np.float32).T,
+            len(flat), count, candidates,
+            alive=mask,
+            block_size=self.block_size,
+        )
+        return self._aggregate(scores, hits, owners, n_queries, k)
+
+    @staticmethod
+    def _aggregate(scores, hits, owners, n_queries, k):
+        """Best region score per artwork, top k artworks per query."""
+        scores = scores.reshape(n_queries, -1)
+        hits = hits.reshape(n_queries, -1)
+        all_scores = np.full((n_queries, k), -np.inf, dtype=np.float32)
+        all_rows = np.full((n_queries, k), -1, dtype=np.int64)
+        for qi in range(n_queries):
+            valid = hits[qi] >= 0
+            row_scores = scores[qi][valid]
+            rows = owners[hits[qi][valid]]
+            order = np.argsort(-row_scores, kind='stable')
+            # First occurrence of each artwork in descending score order is its best region
+            _, first = np.unique(rows[order], return_index=True)
+            best = np.sort(first)[:k]
+            all_scores[qi, :len(best)] = row_scores[order][best]
+            all_rows[qi, :len(best)] = rows[order][best]
+        return all_scores, all_rows
+
+    @property
+    def n_alive(self):
+        """Number of live regions."""
+        return self._count - self._n_removed
+
+    @property
+    def nbytes(self):
+        """Memory of the region vectors and owner ids (a memmap counts in full)."""
+        if self._vectors is None:
+            return 0
+        return self._vectors[:self._count].nbytes + self._owners[:self._count].nbytes
+
+    def stats(self):
+        """Region counts and memory, for health checks."""
+        return {
+            'scales': list(self.scales),
+            'tiles_per_image': self.n_tiles,
+            'regions': self.n_alive,
+            'nbytes': self.nbytes,
+        }
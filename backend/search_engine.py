@@ -0,0 +1,643 @@
+import asyncio
+import json
+import os
+import threading
+import time
+
+import numpy as np
+from PIL import Image
+
+import startup
+from ai_art_similarity import ImageSimilaritySearch
+from audio_similarity import AudioSimilaritySearch
+from batching import BatchScheduler
+from fetcher import is_url
+from inference import build_inference_backend, check_parity, sample_batch
+from metadata import validate_filter
+from query_cache import QueryCache
+
+
+class EngineNotReady(RuntimeError):
+    """Raised when a search is attempted before the engine finished warming up."""
+
+
+class BaseSearchEngine:
+    """
+    Lifecycle shared by the process-wide engines: a cold engine is warmed up
+    once (possibly in a background thread), reports its state to the health
+    endpoint, refuses searches until it is ready and syncs its search system
+    with the database directory on refresh.
+
+    Subclasses build their search system in _load() and add the search calls.
+    """
+
+    STATE_COLD = "cold"
+    STATE_WARMING = "warming"
+    STATE_READY = "ready"
+    STATE_FAILED = "failed"
+
+    name = "Search engine"
+    # Start-up milestone recorded when the engine first turns ready (see startup.py)
+    ready_mark = None
+
+    def __init__(self, database_dir, cache_path, query_cache=None):
+        self.database_dir = database_dir
+        self.cache_path = cache_path
+        self.query_cache = query_cache
+        self.search_system = None
+        self.state = self.STATE_COLD
+        self.error = None
+        self.timings = {}
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._ready = threading.Event()
+        self._stop_refresh = threading.Event()
+        # Summary and time of the last completed refresh
+        self.last_refresh = None
+
+    @property
+    def ready(self):
+        return self.state == self.STATE_READY
+
+    def _load(self):
+        """
+        Build the search system and index the database directory.
+
+        Returns:
+            tuple: (search_system, timings dict).
+        """
+        raise NotImplementedError
+
+    def _start(self, search_system):
+        """Start whatever serves the loaded search system, before the engine turns ready."""
+
+    def _describe(self, search_system):
+        """What the ready message says was loaded, e.g. '12 images'."""
+        raise NotImplementedError
+
+    def warmup(self):
+        """
+        Load the search system and the index.
+
+        Safe to call from several threads; only the first call does the work and
+        the others wait for it to finish.
+
+        Returns:
+            bool: True if the engine is ready.
+        """
+        with self._lock:
+            if self.state in (self.STATE_READY, self.STATE_WARMING):
+                started = False
+            else:
+                self.state = self.STATE_WARMING
+                self.error = None
+                self._ready.clear()
+                started = True
+        if not started:
+            self._ready.wait()
+            return self.ready
+
+        try:
+            search_system, timings = self._load()
+        except Exception as e:
+            with self._lock:
+                self.state = self.STATE_FAILED
+                self.error = str(e)
+            print(f"{self.name} warmup failed: {e}")
+            self._ready.set()
+            return False
+
+        self._start(search_system)
+        with self._lock:
+            self.search_system = search_system
+            self.timings = timings
+            self.state = self.STATE_READY
+        if self.ready_mark is not None:
+            startup.mark(self.ready_mark)
+        self._ready.set()
+        print(f"{self.name} ready with {self._describe(search_system)}")
+        return True
+
+    def start_warmup(self):
+        """
+        Warm up in a background thread so the server can accept requests
+        (and answer health checks) while the engine is loading.
+
+        Returns:
+            threading.Thread: The warmup thread.
+        """
+        thread_name = self.name.lower().replace(" ", "-") + "-warmup"
+        thread = threading.Thread(target=self.warmup, name=thread_name, daemon=True)
+        thread.start()
+        return thread
+
+    def refresh(self):
+        """
+        Pick up added, changed and deleted files in the database directory
+        without reloading the model or refitting the index.
+
+        Returns:
+            dict: Counts of added, updated, removed, relabeled, unchanged and
+                failed files (see the search system's sync_database).
+        """
+        self._check_ready()
+        with self._sync_lock:
+            t0 = time.perf_counter()
+            summary = self.search_system.sync_database(self.database_dir, cache_path=self.cache_path)
+            self.last_refresh = dict(summary, seconds=round(time.perf_counter() - t0, 4), finished_at=time.time())
+            return summary
+
+    def start_refresh(self, interval):
+        """
+        Refresh every `interval` seconds in a background thread, starting
+        once the engine is ready, until stop_refresh() is called. Searches
+        keep being answered while a refresh runs.
+
+        Args:
+            interval (float): Seconds between the end of one refresh and the
+                start of the next.
+
+        Returns:
+            threading.Thread: The refresh thread.
+        """
+        def run():
+            while not self._stop_refresh.wait(interval):
+                if not self.ready:
+                    continue
+                try:
+                    self.refresh()
+                except Exception as e:
+                    print(f"{self.name} refresh failed: {e}")
+
+        self._stop_refresh.clear()
+        thread_name = self.name.lower().replace(" ", "-") + "-refresh"
+        thread = threading.Thread(target=run, name=thread_name, daemon=True)
+        thread.start()
+        return thread
+
+    def stop_refresh(self):
+        """Stop the thread started by start_refresh() after its current refresh."""
+        self._stop_refresh.set()
+
+    def _check_ready(self):
+        if not self.ready:
+            raise EngineNotReady(f"{self.name} is {self.state}")
+
+    def validate_filter(self, filters):
+        """
+        Check a metadata filter, against the field types of the indexed
+        metadata once the engine is loaded (see metadata.validate_filter).
+
+        Raises:
+            ValueError: If the filter is malformed or does not fit the field types.
+        """
+        search_system = self.search_system
+        validate_filter(filters, search_system.metadata.schema if search_system is not None else None)
+
+    def _state(self):
+        """The health fields every engine reports."""
+        return {
+            'status': self.state,
+            'ready': self.ready,
+            'error': self.error,
+            'last_refresh': self.last_refresh,
+        }
+
+
+class SearchEngine(BaseSearchEngine):
+    """
+    Process-wide owner of a warmed ImageSimilaritySearch.
+
+    The feature extractor and the nearest neighbors index are loaded once and
+    shared by every request, instead of being rebuilt per call.
+    """
+
+    ready_mark = 'engine_ready_seconds'
+
+    def __init__(self, database_dir="art_dataset", cache_path="features_store",
+                 model_type="resnet50", pooling="avg", max_batch_size=16, batch_window_ms=5.0,
+                 index_backend="exact", index_params=None, query_cache=None, inference_backend="keras",
+                 inference_params=None, parity_tolerance=None, metadata_schema=None, region_params=None):
+        """
+        Initialize the engine without loading anything.
+
+        Args:
+            database_dir (str): Directory containing the images to index.
+            cache_path (str): Feature store directory.
+            model_type (str): The pre-trained model to use as feature extractor.
+            pooling (str): The pooling method to use for the feature extraction.
+            max_batch_size (int): Largest number of concurrent queries embedded
+                in one predict call.
+            batch_window_ms (float): How long the batcher waits for more queries
+                after the first one arrives.
+            index_backend (str): Nearest neighbour backend ('exact', 'ivf' or 'hnsw').
+            index_params (dict, optional): Recall/speed knobs for the backend.
+            query_cache (QueryCache, optional): Cache of query embeddings and
+                results, keyed by content and perceptual hash.
+            inference_backend (str): Feature extractor runtime ('keras', 'tflite'
+                or 'onnx').
+            inference_params (dict, optional): Runtime options (num_threads,
+                quantize, model_dir).
+            parity_tolerance (float, optional): If set and the runtime is not
+                Keras, warmup compares its embeddings with the Keras model and
+                fails when their cosine distance exceeds this.
+            metadata_schema (dict, optional): Types of extra metadata fields
+                (see metadata.py), e.g. {'year': 'number'}.
+            region_params (dict, optional): Enables region matching for crops
+                and collages (see regions.py), e.g. {'scales': [1, 2]}.
+        """
+        super().__init__(database_dir, cache_path, query_cache)
+        self.model_type = model_type
+        self.pooling = pooling
+        self.max_batch_size = max_batch_size
+        self.batch_window_ms = batch_window_ms
+        self.index_backend = index_backend
+        self.index_params = index_params
+        self.inference_backend = inference_backend
+        self.inference_params = inference_params
+        self.parity_tolerance = parity_tolerance
+        self.metadata_schema = metadata_schema
+        self.region_params = region_params
+        self.parity = None
+        self.batcher = None
+
+    def _load(self):
+        t0 = time.perf_counter()
+        search_system = ImageSimilaritySearch(
+            model_type=self.model_type,
+            pooling=self.pooling,
+            index_backend=self.index_backend,
+            index_params=self.index_params,
+            query_cache=self.query_cache,
+            inference_backend=self.inference_backend,
+            inference_params=self.inference_params,
+            metadata_schema=self.metadata_schema,
+            region_params=self.region_params,
+        )
+        if self.parity_tolerance is not None and self.inference_backend != "keras":
+            self.parity = self._check_parity(search_system.feature_extractor)
+        t1 = time.perf_counter()
+        search_system.index_database(self.database_dir, cache_path=self.cache_path)
+        t2 = time.perf_counter()
+        # The first predict call builds the inference graph; pay for it here
+        search_system.extract_features(Image.new('RGB', (224, 224)))
+        t3 = time.perf_counter()
+        return search_system, {
+            'model_load_seconds': round(t1 - t0, 4),
+            'index_load_seconds': round(t2 - t1, 4),
+            'warmup_inference_seconds': round(t3 - t2, 4),
+        }
+
+    def _start(self, search_system):
+        self.batcher = BatchScheduler(
+            search_system.predict,
+            max_batch_size=self.max_batch_size,
+            batch_window_ms=self.batch_window_ms,
+        ).start()
+
+    def _describe(self, search_system):
+        return f"{search_system.nn_model.n_alive} images"
+
+    def _check_parity(self, extractor):
+        """Compare the configured runtime against the Keras model; raise if they disagree."""
+        reference = build_inference_backend("keras", pooling=self.pooling)
+        parity = check_parity(reference, extractor, sample_batch(), tolerance=self.parity_tolerance)
+        print(f"Inference parity ({self.inference_backend} vs keras): "
+              f"min cosine {parity['min_cosine']:.6f}")
+        if not parity['ok']:
+            raise RuntimeError(
+                f"{self.inference_backend} embeddings deviate from Keras by cosine distance "
+                f"{parity['max_cosine_distance']:.2e} (tolerance {self.parity_tolerance:.2e})"
+            )
+        return parity
+
+    def _finish(self, query, top_k, filters=None):
+        results = self.search_system.complete_query(query, top_k=top_k, filters=filters)
+        return [(float(score), path) for score, path in results]
+
+    def search(self, query_img_data, top_k=5, filters=None):
+        """
+        Search for similar images with the shared search system.
+
+        Repeated queries are answered from the query cache. Otherwise the query
+        is preprocessed on the calling thread and embedded together with any
+        other queries in flight by the batch scheduler.
+
+        Args:
+            query_img_data (str, bytes or PIL.Image): Query image.
+            top_k (int): Number of results to return.
+            filters (dict, optional): Metadata filter (see metadata.py).
+
+        Returns:
+            list: List of (similarity_score, image_path) tuples.
+
+        Raises:
+            ValueError: If the filter is malformed.
+        """
+        self._check_ready()
+        self.validate_filter(filters)
+        query = self.search_system.lookup_query(query_img_data, top_k, filters)
+        if query.results is not None:
+            return [(float(score), path) for score, path in query.results]
+        if query.embedding is None:
+            # One batcher item per tile in region mode
+            tiles = self.search_system._preprocess_tiles(query.image)
+            futures = [self.batcher.submit(tile) for tile in tiles]
+            query.embedding = self.search_system._query_embedding(np.stack([f.result() for f in futures]))
+        return self._finish(query, top_k, filters)
+
+    async def search_async(self, query_img_data, top_k=5, filters=None):
+        """
+        Same as search(), without blocking the event loop.
+
+        Decoding and the neighbour lookup run in the default executor and the
+        model call runs on the batcher's worker thread. A URL query is
+        downloaded by the fetcher's event loop, so no executor thread waits
+        on the network.
+        """
+        self._check_ready()
+        self.validate_filter(filters)
+        loop = asyncio.get_running_loop()
+        if is_url(query_img_data):
+            query_img_data = await self.search_system.fetcher.fetch_async(query_img_data)
+        query = await loop.run_in_executor(None, self.search_system.lookup_query, query_img_data, top_k, filters)
+        if query.results is not None:
+            return [(float(score), path) for score, path in query.results]
+        if query.embedding is None:
+            tiles = await loop.run_in_executor(None, self.search_system._preprocess_tiles, query.image)
+            features = await asyncio.gather(*(asyncio.wrap_future(self.batcher.submit(tile)) for tile in tiles))
+            query.embedding = self.search_system._query_embedding(np.stack(features))
+        return await loop.run_in_executor(None, self._finish, query, top_k, filters)
+
+    def search_batch(self, queries, top_k=5, batch_size=32, filters=None):
+        """
+        Search for many query images, streaming results chunk by chunk.
+
+        Chunks are embedded with direct model calls of batch_size images
+        rather than through the batch scheduler, which is sized for
+        interactive traffic.
+
+        Args:
+            queries (iterable): Query images; see ImageSimilaritySearch.search_batch.
+            top_k (int): Number of results to return per query.
+            batch_size (int): Queries per model call.
+            filters (dict, optional): Metadata filter applied to every query.
+
+        Returns:
+            generator: (position, results, error) for every query, in input order.
+
+        Raises:
+            EngineNotReady: Immediately, not on first iteration.
+            ValueError: If the filter is malformed, also immediately.
+        """
+        self._check_ready()
+        self.validate_filter(filters)
+        return self.search_system.search_batch(queries, top_k=top_k, batch_size=batch_size, filters=filters)
+
+    def health(self):
+        """
+        Describe the engine state for the health endpoint.
+
+        Returns:
+            dict: State, load timings and index size.
+        """
+        indexed = 0
+        index_stats = None
+        metadata_stats = None
+        region_stats = None
+        if self.search_system is not None and self.search_system.nn_model is not None:
+            nn_model = self.search_system.nn_model
+            indexed = nn_model.n_alive
+            if hasattr(nn_model, 'stats'):
+                index_stats = nn_model.stats()
+            metadata_stats = self.search_system.metadata.stats()
+            if self.search_system.regions is not None:
+                region_stats = self.search_system.regions.stats()
+        return {
+            **self._state(),
+            'indexed_images': indexed,
+            'model_type': self.model_type,
+            'pooling': self.pooling,
+            'index_backend': self.index_backend,
+            'index': index_stats,
+            'metadata': metadata_stats,
+            'regions': region_stats,
+            'inference_backend': self.inference_backend,
+            'parity': self.parity,
+            'batching': self.batcher.stats() if self.batcher is not None else None,
+            'query_cache': self.query_cache.stats() if self.query_cache is not None else None,
+            'fetcher': self.search_system.fetcher.stats() if self.search_system is not None else None,
+            **self.timings,
+            'process': startup.report(),
+        }
+
+    def gauges(self):
+        """
+        Values read at scrape time by the metrics endpoint, next to the
+        stage histograms recorded in metrics.py.
+
+        Returns:
+            list: (name, type, help, value) tuples; None values are skipped.
+        """
+        search_system = self.search_system
+        indexed = None
+        if search_system is not None and search_system.nn_model is not None:
+            indexed = search_system.nn_model.n_alive
+        batching = self.batcher.stats() if self.batcher is not None else {}
+        cache = self.query_cache.stats() if self.query_cache is not None else {}
+        fetcher = search_system.fetcher.stats() if search_system is not None else {}
+        cache_hits = cache['hits'] + cache['phash_hits'] if cache else None
+        return [
+            ('similarity_engine_ready', 'gauge', "1 once the model and index are loaded.", int(self.ready)),
+            ('similarity_indexed_images', 'gauge', "Live images in the index.", indexed),
+            ('similarity_batcher_queued', 'gauge', "Queries waiting for the feature batcher.",
+             batching.get('queued')),
+            ('similarity_batcher_batches_total', 'counter', "Model calls made by the feature batcher.",
+             batching.get('batches')),
+            ('similarity_batcher_items_total', 'counter', "Queries embedded by the feature batcher.",
+             batching.get('items')),
+            ('similarity_query_cache_entries', 'gauge', "Entries in the query cache.", cache.get('entries')),
+            ('similarity_query_cache_hits_total', 'counter', "Queries answered from cached results.", cache_hits),
+            ('similarity_query_cache_misses_total', 'counter', "Query cache misses.", cache.get('misses')),
+            ('similarity_fetch_in_flight', 'gauge', "Image URL downloads in progress.", fetcher.get('in_flight')),
+            ('similarity_fetch_bytes_total', 'counter', "Bytes of downloaded query images.",
+             fetcher.get('bytes_received')),
+            ('process_resident_memory_bytes', 'gauge', "Resident memory size in bytes.", startup.rss_bytes()),
+        ]
+
+
+class AudioSearchEngine(BaseSearchEngine):
+    """
+    Process-wide owner of a warmed AudioSimilaritySearch. There is no model
+    to load: warming up opens (or builds) the fingerprint store and syncs it
+    with the audio directory.
+    """
+
+    name = "Audio search engine"
+
+    def __init__(self, database_dir="audio_dataset", cache_path="audio_store", fingerprint_params=None,
+                 index_params=None, min_votes=5, query_cache=None, metadata_schema=None):
+        """
+        Initialize the engine without loading anything.
+
+        Args:
+            database_dir (str): Directory containing the audio files to index.
+            cache_path (str): Feature store directory of the fingerprints.
+            fingerprint_params (dict, optional): Fingerprinter options.
+            index_params (dict, optional): HashIndex options.
+            min_votes (int): Agreeing hashes needed to report a track.
+            query_cache (QueryCache, optional): Cache of query fingerprints
+                and results, keyed by content.
+            metadata_schema (dict, optional): Types of extra metadata fields.
+        """
+        super().__init__(database_dir, cache_path, query_cache)
+        self.fingerprint_params = fingerprint_params
+        self.index_params = index_params
+        self.min_votes = min_votes
+        self.metadata_schema = metadata_schema
+
+    def _load(self):
+        t0 = time.perf_counter()
+        search_system = AudioSimilaritySearch(
+            fingerprint_params=self.fingerprint_params,
+            index_params=self.index_params,
+            min_votes=self.min_votes,
+            query_cache=self.query_cache,
+            metadata_schema=self.metadata_schema,
+        )
+        search_system.index_database(self.database_dir, cache_path=self.cache_path)
+        return search_system, {'index_load_seconds': round(time.perf_counter() - t0, 4)}
+
+    def _describe(self, search_system):
+        return f"{len(search_system.manifest)} tracks"
+
+    def search(self, query_audio_data, top_k=5, filters=None):
+        """
+        Find the tracks a recording or clip comes from.
+
+        Args:
+            query_audio_data (str, bytes or numpy.ndarray): Query recording.
+            top_k (int): Number of results to return.
+            filters (dict, optional): Metadata filter (see metadata.py).
+
+        Returns:
+            list: (score, path, offset_seconds) tuples.
+
+        Raises:
+            ValueError: If the filter is malformed or the audio unreadable.
+        """
+        self._check_ready()
+        self.validate_filter(filters)
+        return self.search_system.search(query_audio_data, top_k=top_k, filters=filters)
+
+    async def search_async(self, query_audio_data, top_k=5, filters=None):
+        """Same as search(), run in the default executor so the event loop is not blocked."""
+        self._check_ready()
+        self.validate_filter(filters)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.search_system.search, query_audio_data, top_k, filters)
+
+    def health(self):
+        """
+        Describe the engine state for the health endpoint.
+
+        Returns:
+            dict: State, load timings and index size.
+        """
+        return {
+            **self._state(),
+            'database_dir': self.database_dir,
+            **(self.search_system.stats() if self.search_system is not None else {}),
+            'query_cache': self.query_cache.stats() if self.query_cache is not None else None,
+            **self.timings,
+        }
+
+    def gauges(self):
+        """Scrape-time values for the metrics endpoint (see SearchEngine.gauges)."""
+        stats = self.search_system.index.stats() if self.search_system is not None else {}
+        return [
+            ('similarity_audio_engine_ready', 'gauge', "1 once the fingerprint index is loaded.", int(self.ready)),
+            ('similarity_audio_tracks', 'gauge', "Live tracks in the fingerprint index.", stats.get('tracks')),
+            ('similarity_audio_postings', 'gauge', "Hash postings in the fingerprint index.", stats.get('postings')),
+            ('similarity_audio_index_bytes', 'gauge', "Memory of the fingerprint postings.", stats.get('nbytes')),
+        ]
+
+
+_engine = None
+_engine_lock = threading.Lock()
+_audio_engine = None
+
+
+def get_engine():
+    """
+    Return the process-wide search engine, creating it (cold) on first use.
+
+    Configured through the ART_DATASET_DIR, FEATURES_CACHE_PATH,
+    FEATURE_BATCH_SIZE, FEATURE_BATCH_WINDOW_MS, INDEX_BACKEND,
+    INDEX_PARAMS (JSON object), QUERY_CACHE_SIZE (0 disables the cache),
+    QUERY_CACHE_TTL (seconds), QUERY_CACHE_PHASH (1 also matches re-encoded
+    copies by perceptual hash; off by default), INFERENCE_BACKEND,
+    INFERENCE_PARAMS (JSON object), INFERENCE_PARITY_TOLERANCE,
+    METADATA_SCHEMA (JSON object) and REGION_PARAMS (JSON object; unset
+    disables region matching) environment variables.
+    """
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            query_cache = None
+            cache_size = int(os.getenv("QUERY_CACHE_SIZE", "1024"))
+            if cache_size > 0:
+                query_cache = QueryCache(
+                    max_entries=cache_size,
+                    ttl_seconds=float(os.getenv("QUERY_CACHE_TTL", "3600")),
+                    use_perceptual_hash=os.getenv("QUERY_CACHE_PHASH", "0") == "1",
+                )
+            tolerance = os.getenv("INFERENCE_PARITY_TOLERANCE")
+            region_params = os.getenv("REGION_PARAMS")
+            _engine = SearchEngine(
+                database_dir=os.getenv("ART_DATASET_DIR", "art_dataset"),
+                cache_path=os.getenv("FEATURES_CACHE_PATH", "features_store"),
+                max_batch_size=int(os.getenv("FEATURE_BATCH_SIZE", "16")),
+                batch_window_ms=float(os.getenv("FEATURE_BATCH_WINDOW_MS", "5")),
+                index_backend=os.getenv("INDEX_BACKEND", "exact"),
+                index_params=json.loads(os.getenv("INDEX_PARAMS", "{}")),
+                query_cache=query_cache,
+                inference_backend=os.getenv("INFERENCE_BACKEND", "keras"),
+                inference_params=json.loads(os.getenv("INFERENCE_PARAMS", "{}")),
+                parity_tolerance=float(tolerance) if tolerance else None,
+                metadata_schema=json.loads(os.getenv("METADATA_SCHEMA", "{}")),
+                region_params=json.loads(region_params) if region_params else None,
+            )
+        return _engine
+
+
+def get_audio_engine():
+    """
+    Return the process-wide audio search engine, creating it (cold) on first use.
+
+    Configured through the AUDIO_DATASET_DIR, AUDIO_CACHE_PATH,
+    AUDIO_FINGERPRINT_PARAMS (JSON object), AUDIO_INDEX_PARAMS (JSON object),
+    AUDIO_MIN_VOTES, AUDIO_QUERY_CACHE_SIZE (0 disables the cache) and
+    METADATA_SCHEMA (JSON object) environment variables.
+    """
+    global _audio_engine
+    with _engine_lock:
+        if _audio_engine is None:
+            query_cache = None
+            cache_size = int(os.getenv("AUDIO_QUERY_CACHE_SIZE", "256"))
+            if cache_size > 0:
+                query_cache = QueryCache(
+                    max_entries=cache_size,
+                    ttl_seconds=float(os.getenv("QUERY_CACHE_TTL", "3600")),
+                    use_perceptual_hash=False,
+                )
+            _audio_engine = AudioSearchEngine(
+                database_dir=os.getenv("AUDIO_DATASET_DIR", "audio_dataset"),
+                cache_path=os.getenv("AUDIO_CACHE_PATH", "audio_store"),
+                fingerprint_params=json.loads(os.getenv("AUDIO_FINGERPRINT_PARAMS", "{}")),
+                index_params=json.loads(os.getenv("AUDIO_INDEX_PARAMS", "{}")),
+                min_votes=int(os.getenv("AUDIO_MIN_VOTES", "5")),
+                query_cache=query_cache,
+                metadata_schema=json.loads(os.getenv("METADATA_SCHEMA", "{}")),
+            )
+        return _audio_engine
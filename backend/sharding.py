@@ -0,0 +1,556 @@
+"""
+Scatter-gather search over shards served by other processes or hosts.
+
+The feature matrix is split into contiguous row ranges. Each range is indexed
+by its own shard server: a local worker process (which memory-maps the rows,
+so nothing is copied between processes) or a node process on another host
+started with
+
+    SHARD_AUTHKEY=... python sharding.py --store features_store --shard 0 --num-shards 4 \
+        --host 10.0.0.5 --port 7100
+
+Nodes listen on 127.0.0.1 unless --host says otherwise. Their traffic is
+pickled (multiprocessing.connection), and unpickling runs code chosen by the
+sender, so a node must only be reachable by trusted coordinators: the
+authkey handshake keeps out clients without the secret, but it does not
+encrypt the connection or make a leaked secret harmless. Bind nodes to a
+private interface and firewall the port.
+
+Rows a coordinator add()s to a node are held in the node's memory only. A
+restarted node serves its feature store again, without them, until the
+coordinator is refit on a store that includes them (e.g. the next
+save_features_cache() followed by a restart of both).
+
+ShardedIndex is the coordinator. It implements VectorIndex, so it can back
+ImageSimilaritySearch like any other index (index_backend='sharded'). Each
+query, with its filter mask packed into a bitmap, is sent to every shard at
+once, and the per-shard top-k lists are merged. A query fails with
+ShardUnavailable when a shard does not answer within the timeout or its
+process died. With allow_partial=True it is answered from the other shards
+instead, and a warning names the missing shards.
+
+Shards are addressed by global row ids, which are the rows of the matrix the
+coordinator was fit on, so database_paths lookups work unchanged.
+"""
+import argparse
+import itertools
+import json
+import logging
+import os
+import tempfile
+import threading
+import weakref
+from concurrent.futures import Future, wait
+from contextlib import contextmanager
+from multiprocessing import get_context
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+
+from nn_index import VectorIndex, _restrict, _top_k, build_index, l2_normalize, validate_k
+
+logger = logging.getLogger(__name__)
+
+
+class ShardUnavailable(RuntimeError):
+    """Raised when a shard process or node cannot be reached."""
+
+
+def shard_ranges(n_rows, num_shards):
+    """Split n_rows into num_shards contiguous (start, stop) ranges of near-equal size."""
+    bounds = np.linspace(0, n_rows, num_shards + 1).astype(np.int64)
+    return [(int(start), int(stop)) for start, stop in zip(bounds[:-1], bounds[1:])]
+
+
+class _ShardState:
+    """Server side of one shard: its index and the global ids of its rows."""
+
+    def __init__(self, vectors, start, backend="exact", backend_params=None):
+        self.backend = backend
+        self.start = start
+        self.stop = start + len(vectors)
+        self.index = build_index(backend, **(backend_params or {})).fit(vectors, normalized=True)
+        self.global_ids = np.arange(self.start, self.stop, dtype=np.int64)
+        self._lock = threading.Lock()
+
+    def info(self):
+        return {
+            'start': self.start,
+            'stop': self.stop,
+            'rows': len(self.global_ids),
+            'n_alive': self.index.n_alive,
+            'backend': self.backend,
+            'pid': os.getpid(),
+        }
+
+    def query(self, queries, k, allowed_bits=None, n_rows=0):
+        global_ids = self.global_ids
+        allowed = None
+        if allowed_bits is not None:
+            # The coordinator's filter mask over global ids, sent as a bitmap
+            mask = np.unpackbits(allowed_bits, count=n_rows).astype(bool)
+            allowed = np.zeros(len(global_ids), dtype=bool)
+            known = global_ids < n_rows
+            allowed[known] = mask[global_ids[known]]
+        k = min(k, self.index.n_alive)
+        if k == 0:
+            return np.empty((len(queries), 0), np.float32), np.empty((len(queries), 0), np.int64)
+        similarities, local = self.index.query(queries, k, allowed=allowed)
+        return similarities, np.where(local >= 0, global_ids[np.maximum(local, 0)], -1)
+
+    def add(self, ids, features):
+        with self._lock:
+            # Ids first: a concurrent query may return the new rows as soon as they are indexed
+            self.global_ids = np.concatenate([self.global_ids, np.asarray(ids, dtype=np.int64)])
+            self.index.add(features)
+
+    def remove(self, ids):
+        with self._lock:
+            local = np.flatnonzero(np.isin(self.global_ids, np.asarray(ids, dtype=np.int64)))
+            return len(self.index.remove(local))
+
+
+def _serve_connection(conn, state):
+    """Answer requests on one connection until it closes. Returns True on 'close'."""
+    while True:
+        try:
+            kind, request_id, *payload = conn.recv()
+        except (EOFError, OSError):
+            return False
+        if kind == 'close':
+            return True
+        try:
+            if kind == 'info':
+                reply = ('info', request_id, state.info())
+            elif kind == 'query':
+                reply = ('result', request_id) + state.query(*payload)
+            elif kind == 'add':
+                state.add(*payload)
+                reply = ('ok', request_id, None)
+            elif kind == 'remove':
+                reply = ('ok', request_id, state.remove(*payload))
+            else:
+                reply = ('error', request_id, f"Unknown request '{kind}'")
+        except Exception as e:
+            reply = ('error', request_id, f"{type(e).__name__}: {e}")
+        try:
+            conn.send(reply)
+        except (EOFError, OSError):
+            return False
+
+
+def _run_local_shard(conn, source, start, stop, backend, backend_params):
+    """Entry point of a local shard worker process."""
+    features = np.memmap(source['filename'], dtype=source['dtype'], mode='r',
+                         offset=source['offset'], shape=tuple(source['shape']))
+    state = _ShardState(features[start:stop], start, backend, backend_params)
+    _serve_connection(conn, state)
+    conn.close()
+
+
+def serve_node(store_dir, shard, num_shards, address, authkey, backend="exact", backend_params=None):
+    """
+    Serve one shard of a feature store to remote coordinators.
+
+    Args:
+        store_dir (str): Feature store directory (see feature_store).
+        shard (int): Which of the num_shards row ranges to serve.
+        num_shards (int): Number of shards the store is split into.
+        address (tuple): (host, port) to listen on. Requests are unpickled,
+            so only trusted coordinators may be able to reach it (see the
+            module docstring).
+        authkey (bytes): Shared secret; coordinators without it are refused.
+        backend (str): Index backend of the shard.
+        backend_params (dict, optional): Its recall/speed knobs.
+    """
+    from multiprocessing import AuthenticationError
+
+    from feature_store import load_feature_store
+
+    features = load_feature_store(store_dir).features
+    start, stop = shard_ranges(len(features), num_shards)[shard]
+    state = _ShardState(features[start:stop], start, backend, backend_params)
+    with Listener(address, authkey=authkey) as listener:
+        print(f"Shard {shard}/{num_shards} (rows {start}-{stop}) listening on {listener.address}")
+        while True:
+            try:
+                conn = listener.accept()
+            except (AuthenticationError, OSError) as e:
+                print(f"Rejected connection: {e}")
+                continue
+            threading.Thread(target=_serve_connection, args=(conn, state), daemon=True).start()
+
+
+_BLAS_THREAD_VARIABLES = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS")
+_environ_lock = threading.Lock()
+
+
+@contextmanager
+def _thread_limits(threads):
+    """Set the BLAS thread counts inherited by processes spawned in the block."""
+    if not threads:
+        yield
+        return
+    with _environ_lock:
+        saved = {name: os.environ.get(name) for name in _BLAS_THREAD_VARIABLES}
+        os.environ.update({name: str(threads) for name in _BLAS_THREAD_VARIABLES})
+        try:
+            yield
+        finally:
+            for name, value in saved.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+
+
+class _ShardClient:
+    """
+    Coordinator side of one shard connection.
+
+    Requests are pipelined: any number of threads may have requests in flight,
+    and a reader thread hands each reply to the Future of its request.
+    Replies to requests whose caller already gave up are dropped.
+    """
+
+    _ids = itertools.count(1)
+
+    def __init__(self, name, conn, process=None):
+        self.name = name
+        self.conn = conn
+        self.process = process
+        self.info = None
+        self.alive = True
+        self.error = None
+        self.timeouts = 0
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._reader = None
+
+    def handshake(self, timeout):
+        """Wait until the shard is built and answers; then start the reader."""
+        self.conn.send(('info', 0))
+        if not self.conn.poll(timeout):
+            raise ShardUnavailable(f"Shard {self.name} did not start within {timeout}s")
+        kind, _, payload = self.conn.recv()
+        if kind != 'info':
+            raise ShardUnavailable(f"Shard {self.name} failed to start: {payload}")
+        self.info = payload
+        self._reader = threading.Thread(target=self._read, name=f"shard-{self.name}", daemon=True)
+        self._reader.start()
+
+    def request(self, kind, *payload):
+        future = Future()
+        request_id = next(self._ids)
+        with self._lock:
+            if not self.alive:
+                future.set_exception(ShardUnavailable(f"Shard {self.name} is down: {self.error}"))
+                return future
+            self._pending[request_id] = future
+        try:
+            with self._send_lock:
+                self.conn.send((kind, request_id) + payload)
+        except (EOFError, OSError, ValueError) as e:
+            self._fail(e)
+        return future
+
+    def _read(self):
+        while True:
+            try:
+                kind, request_id, *payload = self.conn.recv()
+            except Exception as e:
+                # Also raised when close() shuts the connection under the reader
+                self._fail(e)
+                return
+            with self._lock:
+                future = self._pending.pop(request_id, None)
+            if future is None:
+                continue
+            if kind == 'error':
+                future.set_exception(RuntimeError(f"Shard {self.name}: {payload[0]}"))
+            else:
+                future.set_result(payload)
+
+    def _fail(self, error):
+        with self._lock:
+            if not self.alive:
+                return
+            self.alive = False
+            self.error = str(error) or type(error).__name__
+            pending, self._pending = self._pending, {}
+        print(f"Shard {self.name} is down: {self.error}")
+        for future in pending.values():
+            future.set_exception(ShardUnavailable(f"Shard {self.name} is down: {self.error}"))
+
+    def close(self):
+        with self._lock:
+            was_alive, self.alive = self.alive, False
+        if was_alive:
+            try:
+                with self._send_lock:
+                    self.conn.send(('close', 0))
+            except (EOFError, OSError, ValueError):
+                pass
+        self.conn.close()
+
+
+def _shutdown(shards, processes, tmp_path):
+    for shard in shards:
+        shard.close()
+    for process in processes:
+        process.join(timeout=5)
+        if process.is_alive():
+            process.terminate()
+    if tmp_path is not None and os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+
+class ShardedIndex(VectorIndex):
+    """Coordinator that fans queries out to shard processes and merges their top-k."""
+
+    name = "sharded"
+
+    def __init__(self, num_shards=None, shard_backend="exact", shard_params=None, nodes=None, authkey=None,
+                 timeout=30.0, allow_partial=False, start_timeout=600.0, threads_per_shard=1):
+        """
+        Args:
+            num_shards (int, optional): Local worker processes (default: CPU count).
+            shard_backend (str): Index backend inside each shard.
+            shard_params (dict, optional): Its recall/speed knobs.
+            nodes (list, optional): "host:port" addresses of node processes
+                (see serve_node) to use instead of local workers, in shard order.
+            authkey (str or bytes, optional): Node secret; defaults to the
+                SHARD_AUTHKEY environment variable.
+            timeout (float, optional): Seconds to wait for the shards' answers
+                to a query; None waits indefinitely.
+            allow_partial (bool): Answer a query from the shards that replied
+                in time, logging a warning, instead of raising
+                ShardUnavailable. Such results may miss true neighbours.
+            start_timeout (float): Seconds to wait for shards to build, and for
+                add()/remove() to be applied.
+            threads_per_shard (int): BLAS threads of each local worker, so that
+                workers do not oversubscribe the cores.
+        """
+        super().__init__()
+        self.num_shards = num_shards or os.cpu_count() or 1
+        self.shard_backend = shard_backend
+        self.shard_params = dict(shard_params or {})
+        self.nodes = list(nodes or [])
+        authkey = authkey if authkey is not None else os.getenv("SHARD_AUTHKEY")
+        self.authkey = authkey.encode() if isinstance(authkey, str) else authkey
+        self.timeout = timeout
+        self.allow_partial = allow_partial
+        self.start_timeout = start_timeout
+        self.threads_per_shard = threads_per_shard
+        self.shards = []
+        self.queries = 0
+        self.partial_queries = 0
+        self._finalizer = None
+
+    def fit(self, features, normalized=False):
+        self.close()
+        if self.nodes:
+            shards, processes, tmp_path = self._connect_nodes(), [], None
+        else:
+            shards, processes, tmp_path = self._start_workers(features, normalized)
+        self._finalizer = weakref.finalize(self, _shutdown, shards, processes, tmp_path)
+        try:
+            for shard in shards:
+                shard.handshake(self.start_timeout)
+        except Exception:
+            self.close()
+            raise
+        if tmp_path is not None:
+            # Workers hold their own mappings; the file is no longer needed
+            os.remove(tmp_path)
+        self.shards = shards
+
+        covered = sorted((shard.info['start'], shard.info['stop']) for shard in shards)
+        bounds = [start for start, _ in covered] + [covered[-1][1]]
+        if bounds[0] != 0 or bounds[-1] != len(features) or any(
+                stop != start for (_, stop), (start, _) in zip(covered[:-1], covered[1:])):
+            self.close()
+            raise ValueError(f"Shards cover rows {covered}, expected 0-{len(features)} without gaps")
+        self._count = len(features)
+        self._alive = np.ones(self._count, dtype=bool)
+        self._n_removed = 0
+        return self
+
+    def _connect_nodes(self):
+        if not self.authkey:
+            raise ValueError("Remote shard nodes require an authkey (SHARD_AUTHKEY)")
+        shards = []
+        for node in self.nodes:
+            host, port = node.rsplit(":", 1)
+            try:
+                conn = Client((host, int(port)), authkey=self.authkey)
+            except OSError as e:
+                raise ShardUnavailable(f"Cannot connect to shard node {node}: {e}") from e
+            shards.append(_ShardClient(node, conn))
+        return shards
+
+    def _start_workers(self, features, normalized):
+        tmp_path = None
+        if not normalized:
+            features = l2_normalize(features)
+        if not self._is_whole_memmap(features):
+            # Workers memory-map their rows, so in-memory matrices go through a file
+            fd, tmp_path = tempfile.mkstemp(suffix=".npy", prefix="shards-")
+            os.close(fd)
+            np.save(tmp_path, np.ascontiguousarray(features))
+            features = np.load(tmp_path, mmap_mode='r')
+        source = {
+            'filename': features.filename,
+            'offset': features.offset,
+            'dtype': features.dtype.str,
+            'shape': features.shape,
+        }
+
+        ctx = get_context("spawn")
+        shards, processes = [], []
+        num_shards = max(1, min(self.num_shards, len(features)))
+        with _thread_limits(self.threads_per_shard):
+            for shard_id, (start, stop) in enumerate(shard_ranges(len(features), num_shards)):
+                parent_conn, child_conn = ctx.Pipe()
+                process = ctx.Process(
+                    target=_run_local_shard,
+                    args=(child_conn, source, start, stop, self.shard_backend, self.shard_params),
+                    name=f"shard-{shard_id}",
+                    daemon=True,
+                )
+                process.start()
+                child_conn.close()
+                processes.append(process)
+                shards.append(_ShardClient(str(shard_id), parent_conn, process))
+        return shards, processes, tmp_path
+
+    @staticmethod
+    def _is_whole_memmap(features):
+        if not isinstance(features, np.memmap) or not features.flags.c_contiguous or features.filename is None:
+            return False
+        # Slices of a memmap keep the file's offset; only the full mapping is safe to reopen
+        return os.path.getsize(features.filename) - features.offset == features.nbytes
+
+    def _gather(self, futures, timeout):
+        _, not_done = wait(futures.values(), timeout=timeout)
+        results = {}
+        for shard, future in futures.items():
+            if future in not_done:
+                shard.timeouts += 1
+            elif future.exception() is None:
+                results[shard] = future.result()
+        return results
+
+    def query(self, queries, k, allowed=None):
+        validate_k(k)
+        queries = l2_normalize(np.atleast_2d(queries))
+        payload = (queries, k)
+        if allowed is not None:
+            count = self._count
+            payload += (np.packbits(_restrict(self._alive, allowed, count)), count)
+        futures = {shard: shard.request('query', *payload) for shard in self.shards}
+        results = self._gather(futures, self.timeout)
+        self.queries += 1
+        if len(results) < len(self.shards):
+            self.partial_queries += 1
+            missing = [shard.name for shard in self.shards if shard not in results]
+            message = f"Shards {missing} did not answer within {self.timeout}s or are down"
+            if not self.allow_partial:
+                raise ShardUnavailable(message)
+            logger.warning("%s; returning partial results from %d of %d shards",
+                           message, len(results), len(self.shards))
+        if not results:
+            return np.empty((len(queries), 0), np.float32), np.empty((len(queries), 0), np.int64)
+
+        similarities = np.hstack([np.asarray(s, dtype=np.float32) for s, _ in results.values()])
+        ids = np.hstack([i for _, i in results.values()])
+        similarities[ids < 0] = -np.inf
+        # Drop rows removed since a slow shard's answer was computed
+        ids_valid = ids >= 0
+        similarities[ids_valid & ~self._alive[np.where(ids_valid, ids, 0)]] = -np.inf
+        best, order = _top_k(similarities, k)
+        best_ids = np.take_along_axis(ids, order, axis=1)
+        best_ids[np.isneginf(best)] = -1
+        return best, best_ids
+
+    def _broadcast(self, kind, *payload, shards=None):
+        futures = {shard: shard.request(kind, *payload) for shard in (shards or self.shards)}
+        results = self._gather(futures, self.start_timeout)
+        failed = [shard.name for shard in futures if shard not in results]
+        if failed:
+            raise ShardUnavailable(f"Shards {failed} did not apply '{kind}'")
+        return results
+
+    def add(self, features):
+        # Held in the shard's memory only: a restarted node no longer has these rows
+        features = l2_normalize(np.atleast_2d(features))
+        ids = np.arange(self._count, self._count + len(features))
+        live = [shard for shard in self.shards if shard.alive]
+        if not live:
+            raise ShardUnavailable("No shard is available")
+        target = min(live, key=lambda shard: shard.info['rows'])
+        # Queries may see the new ids as soon as the shard has them
+        self._alive = np.concatenate([self._alive, np.ones(len(ids), dtype=bool)])
+        try:
+            self._broadcast('add', ids, features, shards=[target])
+        except ShardUnavailable:
+            self._alive = self._alive[:self._count]
+            raise
+        target.info['rows'] += len(ids)
+        self._count += len(ids)
+        return ids
+
+    def remove(self, ids):
+        removed = super().remove(ids)
+        if len(removed):
+            self._broadcast('remove', removed, shards=[shard for shard in self.shards if shard.alive])
+        return removed
+
+    def stats(self):
+        """Per-shard state, for health checks."""
+        return {
+            'queries': self.queries,
+            'partial_queries': self.partial_queries,
+            'allow_partial': self.allow_partial,
+            'shards': [
+                {
+                    'name': shard.name,
+                    'alive': shard.alive,
+                    'error': shard.error,
+                    'rows': shard.info['rows'] if shard.info else None,
+                    'timeouts': shard.timeouts,
+                }
+                for shard in self.shards
+            ],
+        }
+
+    def close(self):
+        """Stop the local workers and disconnect from nodes."""
+        if self._finalizer is not None:
+            self._finalizer()
+            self._finalizer = None
+        self.shards = []
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve one shard of a feature store to a ShardedIndex coordinator.")
+    parser.add_argument("--store", required=True, help="Feature store directory")
+    parser.add_argument("--shard", type=int, required=True)
+    parser.add_argument("--num-shards", type=int, required=True)
+    parser.add_argument("--host", default="127.0.0.1",
+                        help="Interface to listen on; only trusted coordinators may reach it (requests are pickled)")
+    parser.add_argument("--port", type=int, required=True)
+    parser.add_argument("--backend", default="exact")
+    parser.add_argument("--backend-params", default="{}", help="JSON object")
+    args = parser.parse_args()
+
+    authkey = os.getenv("SHARD_AUTHKEY")
+    if not authkey:
+        parser.error("set SHARD_AUTHKEY to the secret shared with the coordinator")
+    serve_node(args.store, args.shard, args.num_shards, (args.host, args.port), authkey.encode(),
+               args.backend, json.loads(args.backend_params))
+
+
+if __name__ == "__main__":
+    main()
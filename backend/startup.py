@@ -0,0 +1,71 @@
+"""
+Cold-start and memory figures of the current process, reported by /health.
+
+Times are seconds since the process started (read from /proc where
+available, otherwise since this module was imported), so they include
+interpreter start-up and module imports.
+"""
+import os
+import resource
+import sys
+import threading
+import time
+
+_IMPORTED_AT = time.time()
+_marks = {}
+_lock = threading.Lock()
+
+
+def _process_start_time():
+    """Wall-clock time the process started, or None if it cannot be read."""
+    try:
+        with open("/proc/self/stat") as f:
+            # The command name (field 2) may contain spaces; fields after it are fixed
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        started_after_boot = int(fields[19]) / os.sysconf("SC_CLK_TCK")
+        return time.time() - uptime + started_after_boot
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+PROCESS_STARTED_AT = _process_start_time() or _IMPORTED_AT
+
+
+def seconds_since_start():
+    return time.time() - PROCESS_STARTED_AT
+
+
+def mark(name):
+    """Record that the process reached a start-up milestone (first time only)."""
+    with _lock:
+        _marks.setdefault(name, round(seconds_since_start(), 4))
+
+
+def rss_bytes():
+    """Current resident set size, falling back to the peak if unavailable."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, IndexError, ValueError):
+        return peak_rss_bytes()
+
+
+def peak_rss_bytes():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def report():
+    """Return uptime, RSS and the recorded milestones (seconds since start)."""
+    with _lock:
+        marks = dict(_marks)
+    return {
+        'pid': os.getpid(),
+        'uptime_seconds': round(seconds_since_start(), 4),
+        'rss_bytes': rss_bytes(),
+        'peak_rss_bytes': peak_rss_bytes(),
+        **marks,
+    }
@@ -0,0 +1,67 @@
+import json
+import os
+import sys
+
+import numpy as np
+import pytest
+from PIL import Image
+
+# Backend modules import each other by name, as main.py and the benchmarks do
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from inference import InferenceBackend  # noqa: E402
+
+
+class PooledPixelsBackend(InferenceBackend):
+    """
+    Stand-in for ResNet50: 8x8 average-pooled pixels projected to 2048
+    dimensions. Cheap and deterministic, and distinct images get distinct,
+    stable embeddings.
+    """
+
+    name = "pooled_pixels"
+
+    def __init__(self, pooling="avg", **params):
+        self.projection = np.random.default_rng(0).standard_normal((8 * 8 * 3, 2048)).astype(np.float32)
+        self.calls = 0
+
+    def predict(self, batch, verbose=0):
+        self.calls += 1
+        batch = np.asarray(batch, dtype=np.float32)
+        pooled = batch.reshape(len(batch), 8, 28, 8, 28, 3).mean(axis=(2, 4))
+        return pooled.reshape(len(batch), -1) @ self.projection
+
+
+def pattern_image(seed, size=(96, 96)):
+    """A random 6x6 grid of coloured blocks."""
+    rng = np.random.default_rng(seed)
+    blocks = rng.integers(0, 256, (6, 6, 3), dtype=np.uint8)
+    return Image.fromarray(blocks).resize(size, Image.NEAREST)
+
+
+@pytest.fixture
+def image_search(monkeypatch):
+    """Factory of ImageSimilaritySearch instances on the PooledPixelsBackend."""
+    import ai_art_similarity
+
+    monkeypatch.setattr(ai_art_similarity, "build_inference_backend",
+                        lambda backend, pooling="avg", **params: PooledPixelsBackend(pooling))
+
+    def create(**params):
+        params.setdefault("decode_workers", 2)
+        return ai_art_similarity.ImageSimilaritySearch(**params)
+
+    return create
+
+
+@pytest.fixture
+def art_dataset(tmp_path):
+    """Directory of 12 pattern images, img_0.png .. img_11.png, with a metadata file."""
+    database_dir = tmp_path / "art"
+    database_dir.mkdir()
+    for i in range(12):
+        pattern_image(i).save(database_dir / f"img_{i}.png")
+    with open(database_dir / "metadata.jsonl", "w") as f:
+        for i in range(12):
+            f.write(json.dumps({"path": f"img_{i}.png", "artist": "even" if i % 2 == 0 else "odd"}) + "\n")
+    return str(database_dir)
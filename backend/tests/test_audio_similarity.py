@@ -0,0 +1,168 @@
+import json
+import os
+import wave
+
+import numpy as np
+import pytest
+
+from audio_fingerprint import decodable_extensions
+from audio_similarity import AudioSimilaritySearch
+from search_engine import AudioSearchEngine, EngineNotReady
+
+SAMPLE_RATE = 11025
+
+
+def synthetic_track(rng, seconds=10):
+    """Random notes of 0.1-0.5 s, each a few decaying sines."""
+    out = np.zeros(int(seconds * SAMPLE_RATE), dtype=np.float32)
+    position = 0
+    while position < len(out):
+        length = min(int(SAMPLE_RATE * rng.uniform(0.1, 0.5)), len(out) - position)
+        t = np.arange(length, dtype=np.float32) / SAMPLE_RATE
+        for _ in range(rng.integers(1, 4)):
+            frequency = 110 * 2 ** (rng.integers(0, 40) / 12)
+            out[position:position + length] += np.exp(-t * 4) * np.sin(2 * np.pi * frequency * t) * 0.3
+        position += length
+    return out / np.abs(out).max() * 0.8
+
+
+def write_wav(path, samples):
+    with wave.open(str(path), 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLE_RATE)
+        f.writeframes((samples * 32767).astype('<i2').tobytes())
+
+
+@pytest.fixture
+def tracks():
+    rng = np.random.default_rng(0)
+    return [synthetic_track(rng) for _ in range(4)]
+
+
+@pytest.fixture
+def database(tmp_path, tracks):
+    database_dir = tmp_path / "audio"
+    database_dir.mkdir()
+    for i, samples in enumerate(tracks):
+        write_wav(database_dir / f"t{i}.wav", samples)
+    with open(database_dir / "metadata.jsonl", "w") as f:
+        for i in range(len(tracks)):
+            f.write(json.dumps({"path": f"t{i}.wav", "artist": "a" if i < 2 else "b"}) + "\n")
+    return str(database_dir)
+
+
+@pytest.fixture
+def search(database):
+    search = AudioSimilaritySearch(decode_workers=2)
+    search.index_database(database)
+    return search
+
+
+def clip(samples, start_seconds, seconds=3):
+    start = int(start_seconds * SAMPLE_RATE)
+    return samples[start:start + int(seconds * SAMPLE_RATE)]
+
+
+def test_finds_the_track_and_offset_of_a_clip(search, database, tracks):
+    results = search.search(clip(tracks[2], 4.0), top_k=2)
+    score, path, offset = results[0]
+    assert path == os.path.join(database, "t2.wav")
+    assert abs(offset - 4.0) < 0.1
+    assert 0 < score <= 1
+
+
+def test_top_k_below_one_is_rejected(search, tracks):
+    with pytest.raises(ValueError):
+        search.search(clip(tracks[0], 1.0), top_k=0)
+
+
+def test_scan_lists_decodable_files_only(database):
+    open(os.path.join(database, "notes.txt"), "w").close()
+    paths = AudioSimilaritySearch._scan_database_dir(database)
+    assert [os.path.basename(path) for path in paths] == ["t0.wav", "t1.wav", "t2.wav", "t3.wav"]
+
+
+@pytest.mark.skipif(".mp3" in decodable_extensions(), reason="MP3 can be decoded here")
+def test_undecodable_audio_files_fail_loudly(database):
+    open(os.path.join(database, "song.mp3"), "wb").close()
+    with pytest.raises(ValueError, match="song.mp3"):
+        AudioSimilaritySearch().index_database(database)
+    # An explicit pattern is taken as is
+    assert len(AudioSimilaritySearch._scan_database_dir(database, "*.wav")) == 4
+
+
+def test_relabel_keeps_the_fingerprints(search, database, tracks):
+    before = {path: search.index.track_postings([entry['row']])[0] for path, entry in search.manifest.items()}
+    with open(os.path.join(database, "metadata.jsonl"), "w") as f:
+        for i in range(len(tracks)):
+            f.write(json.dumps({"path": f"t{i}.wav", "artist": "c" if i == 1 else "a"}) + "\n")
+    summary = search.sync_database(database)
+    assert summary['relabeled'] == 3 and summary['added'] == summary['updated'] == 0
+    for path, entry in search.manifest.items():
+        hashes, frames = search.index.track_postings([entry['row']])[0]
+        old_hashes, old_frames = before[path]
+        assert sorted(zip(hashes, frames)) == sorted(zip(old_hashes, old_frames))
+    results = search.search(clip(tracks[1], 2.0), filters={"artist": "c"})
+    assert [path for _, path, _ in results] == [os.path.join(database, "t1.wav")]
+    assert search.search(clip(tracks[1], 2.0), filters={"artist": "b"}) == []
+
+
+def test_track_postings_match_a_full_scan(search):
+    hashes, tracks, frames = search.index.postings()
+    rows = [entry['row'] for entry in search.manifest.values()][::-1]
+    for row, (row_hashes, row_frames) in zip(rows, search.index.track_postings(rows)):
+        mine = tracks == row
+        assert sorted(zip(row_hashes, row_frames)) == sorted(zip(hashes[mine], frames[mine]))
+
+
+def test_unreadable_update_keeps_the_indexed_track(search, database, tracks):
+    path = os.path.join(database, "t3.wav")
+    with open(path, "wb") as f:
+        f.write(b"RIFF truncated")
+    os.utime(path, (1, 1))
+    summary = search.sync_database(database)
+    assert summary['failed'] == 1 and summary['updated'] == 0
+    assert path in search.manifest
+    assert search.search(clip(tracks[3], 5.0), top_k=1)[0][1] == path
+
+
+def test_audio_engine_lifecycle(database, tracks, tmp_path):
+    engine = AudioSearchEngine(database_dir=database, cache_path=str(tmp_path / "store"))
+    with pytest.raises(EngineNotReady, match="Audio search engine is cold"):
+        engine.search(clip(tracks[0], 1.0))
+    assert engine.health()['status'] == "cold"
+
+    engine.start_warmup().join()
+    assert engine.ready and engine.warmup()
+    assert engine.health()['tracks'] == 4
+    assert dict((name, value) for name, _, _, value in engine.gauges())['similarity_audio_engine_ready'] == 1
+    assert engine.search(clip(tracks[1], 3.0), top_k=1)[0][1] == os.path.join(database, "t1.wav")
+
+    os.remove(os.path.join(database, "t0.wav"))
+    assert engine.refresh()['removed'] == 1
+
+
+def test_audio_engine_warmup_failure_is_reported(tmp_path):
+    engine = AudioSearchEngine(database_dir=str(tmp_path / "missing"), cache_path=str(tmp_path / "store"))
+    assert not engine.warmup()
+    health = engine.health()
+    assert health['status'] == "failed" and health['error']
+    with pytest.raises(EngineNotReady):
+        engine.refresh()
+
+
+def test_search_during_an_add_sees_complete_rows(search, database, tracks):
+    add = search.index.add
+    seen = []
+
+    def add_then_search(*args, **kwargs):
+        # A search that runs as soon as the index holds the new postings
+        add(*args, **kwargs)
+        seen.append(search.search(clip(new_track, 2.0), top_k=1))
+
+    new_track = synthetic_track(np.random.default_rng(9))
+    write_wav(os.path.join(database, "new.wav"), new_track)
+    search.index.add = add_then_search
+    search.sync_database(database)
+    assert seen[0][0][1] == os.path.join(database, "new.wav")
@@ -0,0 +1,109 @@
+import io
+import json
+import zipfile
+from types import SimpleNamespace
+
+from batch_inputs import iter_ndjson, iter_uploads
+
+PNG_URL = "data:image/png;base64,iVBORw0KGgo="
+
+
+class RecordingReader(io.BytesIO):
+    """BytesIO that remembers the largest single read."""
+
+    def __init__(self, data):
+        super().__init__(data)
+        self.largest_read = 0
+
+    def readline(self, size=-1):
+        line = super().readline(size)
+        self.largest_read = max(self.largest_read, len(line))
+        return line
+
+    def read(self, size=-1):
+        data = super().read(size)
+        self.largest_read = max(self.largest_read, len(data))
+        return data
+
+
+def ndjson(*lines):
+    return b"".join(line if isinstance(line, bytes) else json.dumps(line).encode() + b"\n" for line in lines)
+
+
+def test_yields_urls_and_objects_with_ids():
+    data = ndjson(PNG_URL, {"id": "b", "image": "https://example.com/b.png"})
+    assert list(iter_ndjson(io.BytesIO(data), "q.ndjson")) == [
+        ("q.ndjson:1", PNG_URL),
+        ("b", "https://example.com/b.png"),
+    ]
+
+
+def test_blank_lines_are_skipped_but_counted():
+    items = list(iter_ndjson(io.BytesIO(b"\n" + ndjson(PNG_URL)), "q"))
+    assert items == [("q:2", PNG_URL)]
+
+
+def test_bad_items_are_reported_in_place():
+    data = b"{not json\n" + ndjson("/etc/passwd", PNG_URL)
+    items = list(iter_ndjson(io.BytesIO(data), "q"))
+    assert [item_id for item_id, _ in items] == ["q:1", "q:2", "q:3"]
+    assert "Invalid JSON" in str(items[0][1])
+    assert isinstance(items[1][1], ValueError)
+    assert items[2][1] == PNG_URL
+
+
+def test_oversized_line_is_skipped_without_buffering_it():
+    huge = b'"' + b"A" * 100000 + b'"\n'
+    reader = RecordingReader(huge + ndjson(PNG_URL))
+    items = list(iter_ndjson(reader, "q", max_item_bytes=1000))
+    assert [item_id for item_id, _ in items] == ["q:1", "q:2"]
+    assert "larger than 1000 bytes" in str(items[0][1])
+    assert items[1][1] == PNG_URL
+    assert reader.largest_read <= 1001
+
+
+def test_oversized_last_line_without_newline():
+    reader = RecordingReader(ndjson(PNG_URL) + b"B" * 5000)
+    items = list(iter_ndjson(reader, "q", max_item_bytes=1000))
+    assert items[0] == ("q:1", PNG_URL)
+    assert isinstance(items[1][1], ValueError)
+    assert len(items) == 2
+
+
+def test_line_at_the_limit_is_accepted():
+    line = json.dumps(PNG_URL).encode() + b"\n"
+    items = list(iter_ndjson(io.BytesIO(line), "q", max_item_bytes=len(line)))
+    assert items == [("q:1", PNG_URL)]
+
+
+def upload(filename, data, content_type=None):
+    return SimpleNamespace(filename=filename, content_type=content_type, file=RecordingReader(data))
+
+
+def test_oversized_image_upload_is_reported_without_reading_it_whole():
+    big = upload("big.png", b"\x89PNG" + b"\0" * 100000)
+    small = upload("small.png", b"\x89PNG small")
+    items = list(iter_uploads([big, small], max_item_bytes=1000))
+    assert [item_id for item_id, _ in items] == ["big.png", "small.png"]
+    assert "larger than 1000 bytes" in str(items[0][1])
+    assert items[1][1] == b"\x89PNG small"
+    assert big.file.largest_read == 1001
+
+
+def test_zip_and_ndjson_uploads_are_expanded():
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as f:
+        f.writestr("a.png", b"a")
+        f.writestr("b.png", b"b" * 2000)
+        f.writestr("__MACOSX/._a.png", b"junk")
+    uploads = [
+        upload("images.zip", archive.getvalue()),
+        upload("queries", ndjson(PNG_URL), content_type="application/x-ndjson"),
+        upload("broken.zip", b"not a zip"),
+    ]
+    items = list(iter_uploads(uploads, max_item_bytes=1000))
+    assert [item_id for item_id, _ in items] == ["images.zip/a.png", "images.zip/b.png", "queries:1", "broken.zip"]
+    assert items[0][1] == b"a"
+    assert "larger than 1000 bytes" in str(items[1][1])
+    assert items[2][1] == PNG_URL
+    assert "Unreadable upload" in str(items[3][1])
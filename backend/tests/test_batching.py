@@ -0,0 +1,136 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from batching import BatchScheduler
+
+
+class RecordingPredict:
+    """predict_fn that returns each image's sum and records the batch sizes."""
+
+    def __init__(self, release=None):
+        self.sizes = []
+        self.release = release
+
+    def __call__(self, batch):
+        if self.release is not None:
+            self.release.wait(5)
+        self.sizes.append(len(batch))
+        return batch.reshape(len(batch), -1).sum(axis=1, keepdims=True)
+
+
+def image(value):
+    return np.full((2, 2), value, dtype=np.float32)
+
+
+@pytest.fixture
+def scheduler():
+    schedulers = []
+
+    def create(predict_fn, **params):
+        schedulers.append(BatchScheduler(predict_fn, **params))
+        return schedulers[-1]
+
+    yield create
+    for s in schedulers:
+        s.stop(timeout=5)
+
+
+def test_queued_images_run_as_one_batch_with_their_own_rows(scheduler):
+    predict = RecordingPredict()
+    batcher = scheduler(predict, max_batch_size=8, batch_window_ms=50)
+    futures = [batcher.submit(image(i)) for i in range(5)]
+    batcher.start()
+    assert [f.result(5).tolist() for f in futures] == [[4.0 * i] for i in range(5)]
+    assert predict.sizes == [5]
+    assert batcher.stats()['mean_batch_size'] == 5.0
+
+
+def test_batches_are_capped_at_max_batch_size(scheduler):
+    predict = RecordingPredict()
+    batcher = scheduler(predict, max_batch_size=4, batch_window_ms=50)
+    futures = [batcher.submit(image(i)[None]) for i in range(10)]
+    batcher.start()
+    for f in futures:
+        f.result(5)
+    assert predict.sizes == [4, 4, 2]
+    assert batcher.stats()['batches'] == 3
+
+
+def test_window_waits_for_concurrent_callers(scheduler):
+    predict = RecordingPredict()
+    batcher = scheduler(predict, max_batch_size=8, batch_window_ms=300).start()
+    first = batcher.submit(image(1))
+    time.sleep(0.05)
+    second = batcher.submit(image(2))
+    assert second.result(5).tolist() == [8.0]
+    assert first.result(5).tolist() == [4.0]
+    assert predict.sizes == [2]
+
+
+def test_lone_image_runs_when_the_window_closes(scheduler):
+    batcher = scheduler(RecordingPredict(), batch_window_ms=100).start()
+    t0 = time.perf_counter()
+    batcher.submit(image(1)).result(5)
+    elapsed = time.perf_counter() - t0
+    assert 0.09 <= elapsed < 2.0
+
+
+def test_zero_window_runs_without_waiting(scheduler):
+    batcher = scheduler(RecordingPredict(), batch_window_ms=0).start()
+    t0 = time.perf_counter()
+    batcher.submit(image(1)).result(5)
+    assert time.perf_counter() - t0 < 0.5
+
+
+def test_predict_errors_reach_every_caller_in_the_batch(scheduler):
+    def fail(batch):
+        raise RuntimeError("model exploded")
+
+    batcher = scheduler(fail, batch_window_ms=50)
+    futures = [batcher.submit(image(i)) for i in range(3)]
+    batcher.start()
+    for f in futures:
+        with pytest.raises(RuntimeError, match="model exploded"):
+            f.result(5)
+    # The worker survives a failed batch
+    batcher.predict_fn = RecordingPredict()
+    assert batcher.submit(image(1)).result(5).tolist() == [4.0]
+
+
+def test_cancelled_callers_are_skipped(scheduler):
+    predict = RecordingPredict()
+    batcher = scheduler(predict, batch_window_ms=50)
+    cancelled = batcher.submit(image(1))
+    kept = batcher.submit(image(2))
+    assert cancelled.cancel()
+    batcher.start()
+    assert kept.result(5).tolist() == [8.0]
+    assert predict.sizes == [1]
+
+
+def test_stop_fails_queued_images_and_refuses_new_ones(scheduler):
+    release = threading.Event()
+    batcher = scheduler(RecordingPredict(release), max_batch_size=1, batch_window_ms=0).start()
+    running = batcher.submit(image(1))
+    time.sleep(0.05)
+    waiting = batcher.submit(image(2))
+    stopper = threading.Thread(target=batcher.stop)
+    stopper.start()
+    deadline = time.monotonic() + 5
+    while not batcher._stopped.is_set() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    release.set()
+    stopper.join(5)
+    assert running.result(5).tolist() == [4.0]
+    with pytest.raises(RuntimeError, match="stopped"):
+        waiting.result(5)
+    with pytest.raises(RuntimeError, match="stopped"):
+        batcher.submit(image(3))
+
+
+def test_max_batch_size_must_be_positive():
+    with pytest.raises(ValueError):
+        BatchScheduler(RecordingPredict(), max_batch_size=0)
@@ -0,0 +1,124 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from feature_store import (CURRENT_FILE, FeatureStoreWriter, load_feature_store, save_feature_store,
+                           store_exists)
+
+
+def rows(n, dim=8, seed=0):
+    return np.random.default_rng(seed).standard_normal((n, dim)).astype(np.float32)
+
+
+def meta(n, prefix="img"):
+    return [{'path': f"{prefix}_{i}.png", 'size': i} for i in range(n)]
+
+
+def versions(store_dir):
+    return sorted(name for name in os.listdir(store_dir) if name.startswith('v'))
+
+
+def test_round_trip_memory_maps_rows_metadata_and_arrays(tmp_path):
+    store_dir = str(tmp_path / "store")
+    features = rows(10)
+    with FeatureStoreWriter(store_dir, dim=8, model_type="resnet50", pooling="avg",
+                            extra_header={'normalized': True}) as writer:
+        writer.append(features[:4], meta(10)[:4])
+        writer.append(features[4:], meta(10)[4:])
+        writer.write_array("postings", np.arange(6, dtype=np.int32))
+
+    store = load_feature_store(store_dir)
+    assert isinstance(store.features, np.memmap)
+    np.testing.assert_array_equal(store.features, features)
+    assert store.paths == [f"img_{i}.png" for i in range(10)]
+    assert store.meta[3] == {'path': "img_3.png", 'size': 3}
+    assert len(store) == 10
+    assert store.header['model_type'] == "resnet50"
+    assert store.header['normalized'] is True
+    np.testing.assert_array_equal(store.arrays["postings"], np.arange(6))
+
+
+def test_empty_store_round_trips(tmp_path):
+    store_dir = str(tmp_path / "store")
+    save_feature_store(store_dir, np.empty((0, 8), np.float32), [], "resnet50", "avg")
+    store = load_feature_store(store_dir)
+    assert store.features.shape == (0, 8)
+    assert store.paths == []
+
+
+def test_commit_swaps_current_and_keeps_old_readers_valid(tmp_path):
+    store_dir = str(tmp_path / "store")
+    save_feature_store(store_dir, rows(3), meta(3), "resnet50", "avg")
+    old = load_feature_store(store_dir)
+
+    version_dir = save_feature_store(store_dir, rows(5, seed=1), meta(5, "new"), "resnet50", "avg")
+
+    with open(os.path.join(store_dir, CURRENT_FILE)) as f:
+        assert f.read() == os.path.basename(version_dir) == "v000002"
+    assert load_feature_store(store_dir).paths == [f"new_{i}.png" for i in range(5)]
+    assert load_feature_store(store_dir).header['version'] == 2
+    # The earlier version is still on disk and its memmap still reads
+    np.testing.assert_array_equal(old.features, rows(3))
+    assert not os.path.exists(os.path.join(store_dir, CURRENT_FILE + ".tmp"))
+
+
+def test_nothing_is_visible_before_commit(tmp_path):
+    store_dir = str(tmp_path / "store")
+    save_feature_store(store_dir, rows(3), meta(3), "resnet50", "avg")
+    writer = FeatureStoreWriter(store_dir, dim=8, model_type="resnet50", pooling="avg")
+    writer.append(rows(2), meta(2, "pending"))
+    assert load_feature_store(store_dir).paths == [f"img_{i}.png" for i in range(3)]
+    writer.commit()
+    assert load_feature_store(store_dir).paths == ["pending_0.png", "pending_1.png"]
+
+
+def test_failed_write_leaves_the_current_version(tmp_path):
+    store_dir = str(tmp_path / "store")
+    save_feature_store(store_dir, rows(3), meta(3), "resnet50", "avg")
+    with pytest.raises(RuntimeError):
+        with FeatureStoreWriter(store_dir, dim=8, model_type="resnet50", pooling="avg") as writer:
+            writer.append(rows(2), meta(2, "lost"))
+            raise RuntimeError("crashed mid-write")
+    assert load_feature_store(store_dir).paths == [f"img_{i}.png" for i in range(3)]
+    # The temporary directory is gone
+    assert sorted(os.listdir(store_dir)) == [CURRENT_FILE, "v000001"]
+
+
+def test_old_versions_are_pruned(tmp_path):
+    store_dir = str(tmp_path / "store")
+    for seed in range(4):
+        save_feature_store(store_dir, rows(2, seed=seed), meta(2), "resnet50", "avg", keep_versions=2)
+    assert versions(store_dir) == ["v000003", "v000004"]
+    np.testing.assert_array_equal(load_feature_store(store_dir).features, rows(2, seed=3))
+
+
+def test_rejects_mismatched_rows(tmp_path):
+    writer = FeatureStoreWriter(str(tmp_path / "store"), dim=8, model_type="resnet50", pooling="avg")
+    with pytest.raises(ValueError, match="same length"):
+        writer.append(rows(2), meta(3))
+    with pytest.raises(ValueError, match="Expected 8-d"):
+        writer.append(rows(2, dim=4), meta(2))
+    writer.abort()
+
+
+def test_rejects_stores_it_cannot_read(tmp_path):
+    store_dir = str(tmp_path / "store")
+    assert not store_exists(store_dir)
+    version_dir = save_feature_store(store_dir, rows(2), meta(2), "resnet50", "avg")
+    assert store_exists(store_dir)
+    header_path = os.path.join(version_dir, "header.json")
+    with open(header_path) as f:
+        header = json.load(f)
+    with open(header_path, 'w') as f:
+        json.dump(dict(header, format_version=header['format_version'] + 1), f)
+    with pytest.raises(ValueError, match="newer than supported"):
+        load_feature_store(store_dir)
+
+    with open(header_path, 'w') as f:
+        json.dump(header, f)
+    with open(os.path.join(version_dir, "meta.jsonl"), 'w') as f:
+        f.write(json.dumps(meta(1)[0]) + "\n")
+    with pytest.raises(ValueError, match="corrupt"):
+        load_feature_store(store_dir)
@@ -0,0 +1,266 @@
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from urllib.parse import parse_qs, urlsplit
+
+import httpcore
+import pytest
+from PIL import Image
+
+from fetcher import FetchError, ImageFetcher
+
+# Global address of a stand-in public image host; connections to it are
+# routed to the local server (see public_dns)
+PUBLIC_ADDRESS = "93.184.216.34"
+
+
+def png_bytes(size=(32, 24)):
+    buffer = BytesIO()
+    Image.new("RGB", size, (200, 30, 30)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class ImageHost(ThreadingHTTPServer):
+    """Local HTTP server with a few image, error and redirect routes."""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), ImageHandler)
+        self.port = self.server_address[1]
+        self.paths = []
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+
+class ImageHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        url = urlsplit(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        with server.lock:
+            server.paths.append(self.path)
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+        try:
+            time.sleep(float(query.get("delay", 0)))
+            getattr(self, "route_" + url.path.strip("/"))(query)
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def send_body(self, body, content_type="image/png", length=True):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        if length:
+            self.send_header("Content-Length", str(len(body)))
+        else:
+            # Close-delimited body: the size is only known while streaming
+            self.send_header("Connection", "close")
+            self.close_connection = True
+        self.end_headers()
+        self.wfile.write(body)
+
+    def route_image(self, query):
+        self.send_body(png_bytes())
+
+    def route_big(self, query):
+        self.send_body(png_bytes() + b"\0" * 200000)
+
+    def route_big_streamed(self, query):
+        self.send_body(png_bytes() + b"\0" * 200000, length=False)
+
+    def route_page(self, query):
+        self.send_body(b"<html><body>not an image</body></html>", content_type="text/html")
+
+    def route_redirect(self, query):
+        self.send_response(302)
+        self.send_header("Location", query["to"])
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+
+@pytest.fixture
+def host():
+    server = ImageHost()
+    thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def fetcher():
+    fetcher = ImageFetcher(timeout=5.0, max_bytes=100000, per_host=2, allow_private=True)
+    yield fetcher
+    fetcher.close()
+
+
+@pytest.fixture
+def strict_fetcher():
+    fetcher = ImageFetcher(timeout=5.0, max_bytes=100000)
+    yield fetcher
+    fetcher.close()
+
+
+@pytest.fixture
+def public_dns(monkeypatch, host):
+    """
+    Fake DNS for *.test hosts, and a network backend that routes connections
+    to PUBLIC_ADDRESS to the local server. Returns the per-host answers (a
+    list is consumed one lookup at a time) and the addresses connected to.
+    """
+    answers = {}
+    connected = []
+    real_getaddrinfo = socket.getaddrinfo
+    real_connect = httpcore.AnyIOBackend.connect_tcp
+
+    def getaddrinfo(name, port, *args, **kwargs):
+        if name not in answers:
+            return real_getaddrinfo(name, port, *args, **kwargs)
+        answer = answers[name]
+        address = answer.pop(0) if isinstance(answer, list) else answer
+        return [(socket.AF_INET, socket.SOCK_STREAM, 6, "", (address, port))]
+
+    async def connect_tcp(self, host_name, port, *args, **kwargs):
+        connected.append(host_name)
+        if host_name == PUBLIC_ADDRESS:
+            host_name = "127.0.0.1"
+        return await real_connect(self, host_name, port, *args, **kwargs)
+
+    monkeypatch.setattr(socket, "getaddrinfo", getaddrinfo)
+    monkeypatch.setattr(httpcore.AnyIOBackend, "connect_tcp", connect_tcp)
+    return answers, connected
+
+
+def url(host, path, name="127.0.0.1"):
+    return f"http://{name}:{host.port}{path}"
+
+
+def test_fetches_and_decodes_an_image(host, fetcher):
+    image = fetcher.fetch(url(host, "/image"))
+    assert image.size == (32, 24)
+    assert fetcher.stats()["bytes_received"] > 0
+
+
+def test_body_over_the_size_cap_is_refused(host, fetcher):
+    with pytest.raises(FetchError, match="larger than 100000 bytes"):
+        fetcher.fetch(url(host, "/big"))
+
+
+def test_streamed_body_over_the_size_cap_is_refused(host, fetcher):
+    with pytest.raises(FetchError, match="larger than 100000 bytes"):
+        fetcher.fetch(url(host, "/big_streamed"))
+
+
+def test_non_image_body_is_refused(host, fetcher):
+    with pytest.raises(FetchError, match="not a readable image"):
+        fetcher.fetch(url(host, "/page"))
+
+
+def test_http_errors_are_fetch_errors(host, fetcher):
+    with pytest.raises(FetchError):
+        fetcher.fetch(url(host, "/missing"))
+
+
+def test_per_host_limit(host, fetcher):
+    futures = [fetcher.submit(url(host, "/image?delay=0.2")) for _ in range(6)]
+    assert all(future.result().size == (32, 24) for future in futures)
+    assert host.max_active == 2
+
+
+def test_batch_prefetch_fetches_urls_concurrently(host):
+    fetcher = ImageFetcher(timeout=5.0, per_host=8, allow_private=True)
+    try:
+        items = [url(host, f"/image?delay=0.3&i={i}") for i in range(6)] + [b"raw image bytes"]
+        t0 = time.perf_counter()
+        results = list(fetcher.prefetch(items, window=8))
+        images = [result.result() for result in results[:-1]]
+        elapsed = time.perf_counter() - t0
+    finally:
+        fetcher.close()
+    assert results[-1] == b"raw image bytes"
+    assert all(image.size == (32, 24) for image in images)
+    assert host.max_active == 6
+    # Six 0.3 s downloads, overlapped
+    assert elapsed < 1.2
+
+
+def test_loopback_urls_are_refused_by_default(host, strict_fetcher):
+    with pytest.raises(FetchError, match="Refusing"):
+        strict_fetcher.fetch(url(host, "/image"))
+    assert host.paths == []
+
+
+def test_public_host_is_fetched(host, strict_fetcher, public_dns):
+    answers, connected = public_dns
+    answers["images.test"] = PUBLIC_ADDRESS
+    assert strict_fetcher.fetch(url(host, "/image", "images.test")).size == (32, 24)
+    assert connected == [PUBLIC_ADDRESS]
+
+
+@pytest.mark.parametrize("target", ["http://internal.test:{port}/image", "http://127.0.0.1:{port}/image",
+                                    "http://169.254.169.254/latest/meta-data"])
+def test_redirect_to_a_private_address_is_refused(host, strict_fetcher, public_dns, target):
+    answers, _ = public_dns
+    answers["images.test"] = PUBLIC_ADDRESS
+    answers["internal.test"] = "10.0.0.5"
+    start = url(host, "/redirect?to=" + target.format(port=host.port), "images.test")
+    with pytest.raises(FetchError, match="Refusing"):
+        strict_fetcher.fetch(start)
+    # Only the first hop reached a server
+    assert [path.split("?")[0] for path in host.paths] == ["/redirect"]
+
+
+def test_dns_rebinding_connects_to_the_checked_address(host, strict_fetcher, public_dns):
+    answers, connected = public_dns
+    # Public for the first lookup, loopback for any later one
+    answers["rebind.test"] = [PUBLIC_ADDRESS, "127.0.0.1", "127.0.0.1"]
+    assert strict_fetcher.fetch(url(host, "/image", "rebind.test")).size == (32, 24)
+    assert connected == [PUBLIC_ADDRESS]
+    assert answers["rebind.test"] == ["127.0.0.1", "127.0.0.1"]
+
+
+def test_host_rebound_to_a_private_address_is_refused(host, strict_fetcher, public_dns):
+    answers, connected = public_dns
+    answers["rebind.test"] = "127.0.0.1"
+    with pytest.raises(FetchError, match="Refusing"):
+        strict_fetcher.fetch(url(host, "/image", "rebind.test"))
+    assert connected == []
+
+
+def test_idle_hosts_are_forgotten_beyond_max_hosts(host):
+    fetcher = ImageFetcher(timeout=5.0, allow_private=True, max_hosts=2)
+    try:
+        for name in ("127.0.0.1", "localhost", "127.0.0.2", "127.0.0.1"):
+            try:
+                fetcher.fetch(url(host, "/image", name))
+            except FetchError:
+                # Nothing listens on 127.0.0.2; the host is tracked all the same
+                pass
+            assert fetcher.stats()["hosts"] <= 2
+        assert list(fetcher._hosts) == [f"127.0.0.2:{host.port}", f"127.0.0.1:{host.port}"]
+    finally:
+        fetcher.close()
+
+
+def test_busy_hosts_are_kept(host):
+    fetcher = ImageFetcher(timeout=5.0, allow_private=True, max_hosts=1, per_host=1)
+    try:
+        slow = [fetcher.submit(url(host, "/image?delay=0.3")) for _ in range(2)]
+        time.sleep(0.1)
+        assert fetcher.fetch(url(host, "/image", "localhost")).size == (32, 24)
+        # The first host still had requests waiting on its limit
+        assert all(future.result().size == (32, 24) for future in slow)
+        assert host.max_active == 2
+    finally:
+        fetcher.close()
@@ -0,0 +1,104 @@
+import os
+import time
+
+from conftest import pattern_image
+from search_engine import SearchEngine
+
+
+def image_path(database_dir, i):
+    return os.path.join(database_dir, f"img_{i}.png")
+
+
+def top_path(search, query):
+    return search.search(query, top_k=1)[0][1]
+
+
+def test_sync_adds_updates_and_removes_in_place(image_search, art_dataset):
+    search = image_search()
+    search.index_database(art_dataset)
+    nn_model = search.nn_model
+    calls = search.feature_extractor.calls
+
+    pattern_image(100).save(os.path.join(art_dataset, "img_new.png"))
+    pattern_image(101).save(image_path(art_dataset, 3))
+    os.utime(image_path(art_dataset, 3), (1, 1))
+    os.remove(image_path(art_dataset, 5))
+    summary = search.sync_database(art_dataset)
+
+    assert summary == {'added': 1, 'updated': 1, 'removed': 1, 'relabeled': 0, 'unchanged': 10, 'failed': 0}
+    # Updated in place: no refit, and only the two new images were embedded
+    assert search.nn_model is nn_model
+    assert search.feature_extractor.calls == calls + 1
+    assert nn_model.n_alive == 12
+    assert top_path(search, pattern_image(100)) == os.path.join(art_dataset, "img_new.png")
+    assert top_path(search, pattern_image(101)) == image_path(art_dataset, 3)
+    assert image_path(art_dataset, 5) not in {path for _, path in search.search(pattern_image(5), top_k=12)}
+
+
+def test_touched_but_unchanged_files_are_not_embedded(image_search, art_dataset):
+    search = image_search()
+    search.index_database(art_dataset)
+    calls = search.feature_extractor.calls
+    os.utime(image_path(art_dataset, 0), (1, 1))
+    assert search.sync_database(art_dataset)['unchanged'] == 12
+    assert search.feature_extractor.calls == calls
+
+
+def test_unreadable_update_keeps_the_indexed_image(image_search, art_dataset):
+    search = image_search()
+    search.index_database(art_dataset)
+    with open(image_path(art_dataset, 1), "wb") as f:
+        f.write(b"\x89PNG truncated")
+    summary = search.sync_database(art_dataset)
+    assert summary['failed'] == 1 and summary['updated'] == 0
+    assert top_path(search, pattern_image(1)) == image_path(art_dataset, 1)
+
+
+def test_add_and_remove_survive_a_cache_round_trip(image_search, art_dataset, tmp_path):
+    cache_path = str(tmp_path / "store")
+    search = image_search()
+    search.index_database(art_dataset, cache_path=cache_path)
+    os.remove(image_path(art_dataset, 2))
+    pattern_image(200).save(os.path.join(art_dataset, "img_new.png"))
+    search.sync_database(art_dataset, cache_path=cache_path)
+
+    reopened = image_search()
+    reopened.index_database(art_dataset, cache_path=cache_path)
+    assert reopened.feature_extractor.calls == 0
+    assert sorted(reopened.manifest) == sorted(search.manifest)
+    assert top_path(reopened, pattern_image(200)) == os.path.join(art_dataset, "img_new.png")
+
+
+def test_search_during_an_add_sees_complete_rows(image_search, art_dataset):
+    search = image_search()
+    search.index_database(art_dataset)
+    extend = search.nn_model.extend
+    seen = []
+
+    def extend_then_search(vectors):
+        # A search that runs as soon as the index hands out the new rows
+        rows = extend(vectors)
+        seen.append(search.search(pattern_image(300), top_k=3))
+        return rows
+
+    search.nn_model.extend = extend_then_search
+    pattern_image(300).save(os.path.join(art_dataset, "img_new.png"))
+    search.sync_database(art_dataset)
+    assert seen[0][0][1] == os.path.join(art_dataset, "img_new.png")
+
+
+def test_engine_refreshes_periodically(image_search, art_dataset, tmp_path):
+    engine = SearchEngine(database_dir=art_dataset, cache_path=str(tmp_path / "store"))
+    engine.start_warmup().join()
+    assert engine.ready, engine.error
+    engine.start_refresh(0.05)
+    try:
+        pattern_image(400).save(os.path.join(art_dataset, "img_new.png"))
+        deadline = time.monotonic() + 10
+        while (engine.last_refresh or {}).get('added') != 1 and time.monotonic() < deadline:
+            time.sleep(0.05)
+    finally:
+        engine.stop_refresh()
+    assert engine.health()['last_refresh']['added'] == 1
+    results = engine.search(pattern_image(400), top_k=1)
+    assert results[0][1] == os.path.join(art_dataset, "img_new.png")
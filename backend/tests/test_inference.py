@@ -0,0 +1,97 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+import inference
+from inference import build_inference_backend, check_parity, embedding_parity, preprocess_input, sample_batch
+
+
+@pytest.fixture(scope="module")
+def tf():
+    return pytest.importorskip("tensorflow")
+
+
+@pytest.fixture(scope="module")
+def exported(tf, tmp_path_factory):
+    """
+    A small convolutional stand-in for ResNet50 (no ImageNet weights to
+    download), patched in as the model every backend builds or exports.
+    """
+    inputs = tf.keras.Input(inference.INPUT_SHAPE)
+    x = tf.keras.layers.Conv2D(8, 7, strides=8, activation="relu")(inputs)
+    model = tf.keras.Model(inputs, tf.keras.layers.GlobalAveragePooling2D()(x))
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(inference, "build_keras_model", lambda pooling="avg": model)
+        yield model, str(tmp_path_factory.mktemp("models"))
+
+
+def test_preprocess_input_matches_keras(tf):
+    from tensorflow.keras.applications.resnet50 import preprocess_input as keras_preprocess_input
+
+    pixels = np.random.default_rng(0).integers(0, 256, (2, 8, 8, 3)).astype(np.float32)
+    expected = keras_preprocess_input(pixels.copy())
+    np.testing.assert_allclose(preprocess_input(pixels), expected, atol=1e-4)
+    assert preprocess_input(pixels.astype(np.uint8)).dtype == np.float32
+
+
+def test_preprocessing_does_not_import_tensorflow():
+    code = ("import sys, inference; inference.sample_batch(1); "
+            "assert 'tensorflow' not in sys.modules, 'tensorflow was imported'")
+    subprocess.run([sys.executable, "-c", code], check=True, cwd=os.path.dirname(inference.__file__))
+
+
+def test_embedding_parity_flags_diverging_rows():
+    expected = np.eye(3, dtype=np.float32)
+    assert embedding_parity(expected, expected * 2)['ok']
+    drifted = expected.copy()
+    drifted[1, 2] = 0.5
+    report = embedding_parity(expected, drifted, tolerance=1e-3)
+    assert not report['ok']
+    assert report['max_cosine_distance'] == pytest.approx(1 - 1 / np.sqrt(1.25))
+
+
+def test_keras_direct_calls_match_model_predict(exported):
+    model, _ = exported
+    batch = sample_batch(3)
+    direct = build_inference_backend("keras", model=model)
+    through_predict = build_inference_backend("keras", model=model, direct_call_max_batch=0)
+    assert check_parity(direct, through_predict, batch, tolerance=1e-6)['ok']
+
+
+@pytest.mark.parametrize("backend, quantize, tolerance", [
+    ("tflite", None, 1e-5),
+    ("tflite", "int8", 1e-3),
+    ("onnx", None, 1e-5),
+    ("onnx", "int8", 1e-3),
+])
+def test_exported_backends_match_keras(exported, backend, quantize, tolerance):
+    if backend == "onnx":
+        pytest.importorskip("onnxruntime")
+    model, model_dir = exported
+    reference = build_inference_backend("keras", model=model)
+    candidate = build_inference_backend(backend, quantize=quantize, model_dir=model_dir)
+    # Batch sizes change between calls, which resizes the TFLite input
+    for size in (3, 1):
+        report = check_parity(reference, candidate, sample_batch(size, seed=size), tolerance)
+        assert report['ok'], report
+
+
+def test_exported_model_is_reused(exported, monkeypatch):
+    _, model_dir = exported
+    build_inference_backend("tflite", model_dir=model_dir)
+
+    def no_export(*args):
+        raise AssertionError("exported again")
+
+    monkeypatch.setattr(inference.TFLiteBackend, "_export", staticmethod(no_export))
+    build_inference_backend("tflite", model_dir=model_dir)
+
+
+def test_unknown_backends_and_quantizations_are_rejected(tmp_path):
+    with pytest.raises(ValueError, match="Unknown inference backend"):
+        build_inference_backend("tensorrt")
+    with pytest.raises(ValueError, match="Unsupported quantization"):
+        build_inference_backend("tflite", quantize="fp8", model_dir=str(tmp_path))
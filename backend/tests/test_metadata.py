@@ -0,0 +1,81 @@
+import os
+
+import pytest
+
+from conftest import pattern_image
+from metadata import MetadataTable, read_metadata_file, validate_filter
+from search_engine import SearchEngine
+
+
+def test_missing_values_match_only_negative_conditions():
+    table = MetadataTable({'year': 'number'})
+    table.append([{'uploader': 'alice', 'year': 2000}, {'uploader': 'bob'}, {}])
+    assert table.evaluate({'uploader': 'alice'}).tolist() == [True, False, False]
+    assert table.evaluate({'uploader': {'in': ['alice', 'bob']}}).tolist() == [True, True, False]
+    assert table.evaluate({'year': {'lt': 3000}}).tolist() == [True, False, False]
+    assert table.evaluate({'uploader': {'ne': 'alice'}}).tolist() == [False, True, True]
+    assert table.evaluate({'uploader': {'nin': ['alice']}}).tolist() == [False, True, True]
+    assert table.evaluate({'year': {'ne': 2000}}).tolist() == [False, True, True]
+    assert table.evaluate({'uploader': {'ne': 'alice', 'exists': True}}).tolist() == [False, True, False]
+
+
+def test_read_metadata_file(tmp_path):
+    (tmp_path / "metadata.jsonl").write_text(
+        '{"path": "a.png", "artist": "x"}\n'
+        '\n'
+        'not json\n'
+        '{"artist": "no path"}\n'
+        '{"path": "b.wav", "year": 1999}\n'
+    )
+    assert read_metadata_file(str(tmp_path)) == {
+        str(tmp_path / "a.png"): {"artist": "x"},
+        str(tmp_path / "b.wav"): {"year": 1999},
+    }
+
+
+def test_missing_metadata_file_is_empty(tmp_path):
+    assert read_metadata_file(str(tmp_path)) == {}
+
+
+@pytest.mark.parametrize("expression", [
+    {"artist": {"gt": 3}},
+    {"registered": "false"},
+    {"registered": {"in": [True, 1]}},
+    {"year": {"gte": "1999"}},
+    {"created": {"lt": "last year"}},
+    {"unknown": {"lte": 2}},
+    {"artist": {"exists": "yes"}},
+    {"artist": {"eq": {"nested": 1}}},
+    {"or": [{"artist": "a"}, {"not": {"registered": 0}}]},
+])
+def test_conditions_are_checked_against_the_field_types(expression):
+    table = MetadataTable({'year': 'number'})
+    with pytest.raises(ValueError):
+        validate_filter(expression, table.schema)
+    with pytest.raises(ValueError):
+        table.evaluate(expression)
+
+
+def test_bool_fields_only_match_bools():
+    table = MetadataTable()
+    table.append([{'registered': True}, {'registered': False}, {}])
+    assert table.evaluate({'registered': False}).tolist() == [False, True, False]
+    assert table.evaluate({'registered': {'in': [True, False]}}).tolist() == [True, True, False]
+    # Without the schema check, 1 would select the True rows
+    assert not table._compare('registered', 'eq', 1).any()
+
+
+def test_without_a_schema_only_the_structure_is_checked():
+    validate_filter({"artist": {"gt": 3}})
+    with pytest.raises(ValueError):
+        validate_filter({"artist": {"greater": 3}})
+
+
+def test_engine_rejects_filters_that_do_not_fit_the_field_types(image_search, art_dataset, tmp_path):
+    engine = SearchEngine(database_dir=art_dataset, cache_path=str(tmp_path / "store"))
+    # Only the structure can be checked before the metadata is loaded
+    engine.validate_filter({"artist": {"gt": 3}})
+    assert engine.warmup()
+    with pytest.raises(ValueError, match="needs a number or date field"):
+        engine.search(pattern_image(0), filters={"artist": {"gt": 3}})
+    assert engine.search(pattern_image(0), top_k=1, filters={"artist": "even"})[0][1] == os.path.join(art_dataset, "img_0.png")
@@ -0,0 +1,114 @@
+import glob
+import os
+
+import pytest
+
+import metrics
+from metrics import Registry
+
+
+@pytest.fixture
+def registry():
+    registry = Registry()
+    return registry, registry.histogram("t_seconds", "Test latency.", ("stage",), buckets=(0.1, 1.0)), \
+        registry.counter("t_total", "Test count.", ("stage", "status"))
+
+
+def test_render_uses_the_prometheus_text_format(registry):
+    registry, histogram, counter = registry
+    for value in (0.05, 0.5, 0.5, 3.0):
+        histogram.observe(value, stage="decode")
+    counter.inc(stage="fetch", status='say "hi"\n')
+    counter.inc(2.5, stage="fetch", status='say "hi"\n')
+    text = registry.render([("t_ready", "gauge", "Ready.", 1), ("t_missing", "gauge", "Skipped.", None)])
+    assert text.splitlines() == [
+        "# HELP t_seconds Test latency.",
+        "# TYPE t_seconds histogram",
+        't_seconds_bucket{stage="decode",le="0.1"} 1',
+        't_seconds_bucket{stage="decode",le="1"} 3',
+        't_seconds_bucket{stage="decode",le="+Inf"} 4',
+        't_seconds_sum{stage="decode"} 4.05',
+        't_seconds_count{stage="decode"} 4',
+        "# HELP t_total Test count.",
+        "# TYPE t_total counter",
+        't_total{stage="fetch",status="say \\"hi\\"\\n"} 3.5',
+        "# HELP t_ready Ready.",
+        "# TYPE t_ready gauge",
+        "t_ready 1",
+    ]
+    assert histogram.summary(stage="decode") == (4, pytest.approx(4.05))
+    registry.reset()
+    assert histogram.summary(stage="decode") == (0, 0.0)
+
+
+def test_metric_names_are_unique(registry):
+    registry, _, _ = registry
+    with pytest.raises(ValueError, match="already registered"):
+        registry.counter("t_total", "Again.")
+
+
+def test_stage_records_time_items_errors_and_hooks():
+    calls = []
+    metrics.add_hook(lambda *call: calls.append(call))
+    count, _ = metrics.STAGE_SECONDS.summary(stage="test_stage")
+    items = metrics.STAGE_ITEMS.value(stage="test_stage")
+    errors = metrics.STAGE_ERRORS.value(stage="test_stage")
+    try:
+        with metrics.stage("test_stage", items=4):
+            pass
+        with pytest.raises(KeyError):
+            with metrics.stage("test_stage"):
+                raise KeyError("boom")
+    finally:
+        metrics._hooks.clear()
+    assert metrics.STAGE_SECONDS.summary(stage="test_stage")[0] == count + 2
+    assert metrics.STAGE_ITEMS.value(stage="test_stage") == items + 5
+    assert metrics.STAGE_ERRORS.value(stage="test_stage") == errors + 1
+    assert [(name, n) for name, _, n in calls] == [("test_stage", 4), ("test_stage", 1)]
+
+
+def test_profiler_dumps_one_in_every_calls(tmp_path):
+    profiler = metrics.configure_profiling(str(tmp_path), every=3, stages=["test_profiled"])
+    try:
+        for _ in range(7):
+            with metrics.stage("test_profiled"):
+                sum(range(100))
+            with metrics.stage("test_unprofiled"):
+                pass
+    finally:
+        metrics.configure_profiling(None)
+    # Calls 1, 4 and 7
+    assert profiler.written == 3
+    assert len(glob.glob(os.path.join(tmp_path, "test_profiled-*.prof"))) == 3
+
+
+def test_searches_record_every_stage(image_search, art_dataset):
+    search = image_search()
+    search.index_database(art_dataset)
+    before = {name: metrics.STAGE_SECONDS.summary(stage=name)[0] for name in ("decode", "resize", "predict", "knn")}
+    search.search(os.path.join(art_dataset, "img_1.png"), top_k=3)
+    for name, count in before.items():
+        assert metrics.STAGE_SECONDS.summary(stage=name)[0] > count, name
+    assert 'similarity_stage_seconds_bucket{stage="knn",le="+Inf"}' in metrics.render()
+
+
+def test_metrics_endpoint_reports_requests_and_engine_gauges():
+    pytest.importorskip("dotenv")
+    from fastapi.testclient import TestClient
+
+    import main
+
+    # Without the lifespan context no engine warms up; both report as not ready
+    client = TestClient(main.app)
+    client.get("/health")
+    client.get("/no-such-page")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    text = response.text
+    assert 'similarity_http_requests_total{method="GET",route="/health",status="503"}' in text
+    assert 'similarity_http_requests_total{method="GET",route="unmatched",status="404"}' in text
+    assert "# TYPE similarity_http_request_seconds histogram" in text
+    assert "\nsimilarity_engine_ready 0\n" in text
+    assert "\nsimilarity_audio_engine_ready 0\n" in text
+    assert "process_resident_memory_bytes" in text
@@ -0,0 +1,120 @@
+import os
+
+import numpy as np
+import pytest
+
+from conftest import pattern_image
+from nn_index import INDEX_BACKENDS, append_rows, build_index, l2_normalize
+
+FAST_PARAMS = {
+    "ivf": {"nlist": 4, "nprobe": 4},
+    "quantized": {"storage": "int8"},
+}
+
+
+def make_index(backend, **params):
+    """An unfitted index; hnsw tests are skipped without the optional hnswlib."""
+    if backend == "hnsw":
+        pytest.importorskip("hnswlib")
+    return build_index(backend, **params)
+
+
+@pytest.fixture
+def vectors():
+    return l2_normalize(np.random.default_rng(0).standard_normal((200, 16)))
+
+
+@pytest.mark.parametrize("backend", sorted(INDEX_BACKENDS))
+def test_extend_indexes_rows_appended_to_a_shared_buffer(backend, vectors):
+    index = make_index(backend, **FAST_PARAMS.get(backend, {})).fit(vectors[:150], normalized=True)
+    buffer = vectors[:150]
+    for start in (150, 170):
+        buffer = append_rows(buffer, start, vectors[start:start + 20])
+        ids = index.extend(buffer[:start + 20])
+        assert ids.tolist() == list(range(start, start + 20))
+    assert len(index) == index.n_alive == 190
+    _, found = index.query(vectors[[3, 160, 185]], 1)
+    assert found[:, 0].tolist() == [3, 160, 185]
+
+
+@pytest.mark.parametrize("backend", ["exact", "ivf", "hnsw", "two_stage"])
+def test_extend_references_the_callers_rows(backend, vectors):
+    index = make_index(backend, **FAST_PARAMS.get(backend, {})).fit(vectors[:150], normalized=True)
+    buffer = append_rows(vectors[:150], 150, vectors[150:])
+    index.extend(buffer[:200])
+    assert np.shares_memory(index._vectors, buffer)
+    assert index._added is None
+
+
+def test_extend_after_add_keeps_every_row(vectors):
+    index = make_index("hnsw").fit(vectors[:150], normalized=True)
+    index.add(vectors[150:160])
+    index.extend(vectors[:170])
+    index.remove(range(0, 150))
+    # Filtered queries score the candidates from the referenced rows
+    _, found = index.query(vectors[[155, 165]], 1, allowed=np.ones(170, dtype=bool))
+    assert found[:, 0].tolist() == [155, 165]
+
+
+def test_image_search_keeps_one_copy_of_the_features(image_search, art_dataset):
+    search = image_search()
+    search.index_database(art_dataset)
+    pattern_image(100).save(os.path.join(art_dataset, "img_new.png"))
+    search.sync_database(art_dataset)
+
+    assert search.nn_model._vectors is search.database_features
+    assert np.shares_memory(search.database_features, search._features_buffer)
+    assert search.search(pattern_image(100), top_k=1)[0][1] == os.path.join(art_dataset, "img_new.png")
+
+
+def recall(found, truth):
+    return np.mean([len(set(f) & set(t)) / len(t) for f, t in zip(found, truth)])
+
+
+@pytest.fixture(scope="module")
+def catalog():
+    """Clustered vectors, like embeddings of related artworks, and held-out queries."""
+    rng = np.random.default_rng(1)
+    centers = rng.standard_normal((20, 32))
+    rows = centers[rng.integers(0, 20, 3000)] + 0.5 * rng.standard_normal((3000, 32))
+    queries = centers[rng.integers(0, 20, 50)] + 0.5 * rng.standard_normal((50, 32))
+    return l2_normalize(rows), l2_normalize(queries)
+
+
+@pytest.mark.parametrize("backend, params, minimum", [
+    ("ivf", {"nlist": 32, "nprobe": 8}, 0.9),
+    ("hnsw", {}, 0.95),
+])
+def test_approximate_backends_recall_the_exact_neighbours(catalog, backend, params, minimum):
+    rows, queries = catalog
+    _, truth = build_index("exact").fit(rows).query(queries, 10)
+    _, found = make_index(backend, **params).fit(rows).query(queries, 10)
+    assert recall(found, truth) >= minimum
+
+
+def test_more_ivf_probes_recall_more(catalog):
+    rows, queries = catalog
+    _, truth = build_index("exact").fit(rows).query(queries, 10)
+    index = make_index("ivf", nlist=32, nprobe=1).fit(rows)
+    few = recall(index.query(queries, 10)[1], truth)
+    index.nprobe = 32
+    assert recall(index.query(queries, 10)[1], truth) == 1.0
+    assert few < 1.0
+
+
+@pytest.mark.parametrize("backend", ["ivf", "hnsw"])
+def test_filtered_queries_get_k_allowed_rows(catalog, backend):
+    rows, queries = catalog
+    allowed = np.zeros(len(rows), dtype=bool)
+    allowed[::7] = True
+    _, truth = build_index("exact").fit(rows).query(queries, 5, allowed=allowed)
+    _, found = make_index(backend).fit(rows).query(queries, 5, allowed=allowed)
+    assert allowed[found].all()
+    assert recall(found, truth) >= 0.9
+
+
+@pytest.mark.parametrize("backend", sorted(INDEX_BACKENDS))
+def test_k_below_one_is_rejected(backend, vectors):
+    index = make_index(backend, **FAST_PARAMS.get(backend, {})).fit(vectors)
+    with pytest.raises(ValueError, match="k must be at least 1"):
+        index.query(vectors[:1], 0)
@@ -0,0 +1,84 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from pipeline import iter_decoded_batches
+
+
+def decode(item):
+    if item == "bad":
+        raise ValueError("not an image")
+    if item == "audio":
+        return None, "fingerprinted"
+    return np.full((2, 2), item, dtype=np.float32), item * 10
+
+
+def test_batches_keep_input_order_and_report_failures():
+    batches = list(iter_decoded_batches([0, 1, "bad", 3, "audio", 5, 6], decode, batch_size=3, workers=4))
+    assert [batch.paths for batch in batches] == [[0, 1], [3, 5], [6]]
+    assert [batch.extras for batch in batches] == [[0, 10], [30, 50], [60]]
+    np.testing.assert_array_equal(batches[0].images[:, 0, 0], [0, 1])
+    item, error = batches[0].errors[0]
+    assert item == "bad" and isinstance(error, ValueError)
+    assert batches[1].skipped == [("audio", "fingerprinted")]
+
+
+def test_batch_of_only_failures_has_no_images():
+    batches = list(iter_decoded_batches(["bad", "bad"], decode, batch_size=2))
+    assert batches[0].images is None
+    assert len(batches[0].errors) == 2
+
+
+def test_items_decode_in_parallel():
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    def slow_decode(item):
+        with lock:
+            running.append(item)
+            peak.append(len(running))
+        time.sleep(0.05)
+        with lock:
+            running.remove(item)
+        return np.zeros(1), None
+
+    list(iter_decoded_batches(range(8), slow_decode, batch_size=8, workers=4))
+    assert max(peak) > 1
+
+
+def test_decoding_runs_ahead_of_the_consumer_by_at_most_prefetch_batches():
+    consumed = []
+
+    def items():
+        for i in range(100):
+            consumed.append(i)
+            yield i
+
+    batches = iter_decoded_batches(items(), decode, batch_size=4, workers=2, prefetch=2)
+    next(batches)
+    time.sleep(0.2)
+    # The batch being consumed, two queued, one blocked on the full queue and
+    # the next chunk the producer has taken
+    assert len(consumed) <= 4 * 5
+    batches.close()
+
+
+def test_stopping_early_stops_the_producer():
+    batches = iter_decoded_batches(range(1000), decode, batch_size=2, prefetch=1)
+    next(batches)
+    batches.close()
+    names = {thread.name for thread in threading.enumerate()}
+    assert "decode-producer" not in names
+
+
+def test_errors_from_the_item_iterator_reach_the_consumer():
+    def items():
+        yield 0
+        yield 1
+        raise OSError("dataset went away")
+
+    with pytest.raises(OSError, match="dataset went away"):
+        list(iter_decoded_batches(items(), decode, batch_size=1))
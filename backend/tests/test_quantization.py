@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+
+import quantization
+from nn_index import build_index, l2_normalize
+from quantization import CODECS, PCATransform, build_codec
+
+
+@pytest.fixture(scope="module")
+def catalog():
+    """Clustered unit vectors, like embeddings of related artworks, and queries."""
+    rng = np.random.default_rng(1)
+    centers = rng.standard_normal((20, 64))
+    rows = centers[rng.integers(0, 20, 2000)] + 0.7 * rng.standard_normal((2000, 64))
+    queries = centers[rng.integers(0, 20, 20)] + 0.7 * rng.standard_normal((20, 64))
+    return l2_normalize(rows), l2_normalize(queries)
+
+
+def codec_scores(catalog, storage, **params):
+    rows, queries = catalog
+    codec = build_codec(storage, **params).fit(rows)
+    codes = codec.encode(rows)
+    return codec.scores(codes, queries), queries @ rows.T, codes
+
+
+@pytest.mark.parametrize("storage, params, max_mean_error, bytes_per_row", [
+    ("float32", {}, 1e-6, 256),
+    ("float16", {}, 1e-4, 128),
+    ("int8", {}, 5e-3, 64),
+    ("pq", {"m": 16}, 0.05, 16),
+])
+def test_scores_approximate_the_dot_product(catalog, storage, params, max_mean_error, bytes_per_row):
+    scores, exact, codes = codec_scores(catalog, storage, **params)
+    assert np.abs(scores - exact).mean() < max_mean_error
+    assert codes.nbytes == bytes_per_row * len(exact[0])
+
+
+def test_more_pq_sub_spaces_mean_less_error(catalog):
+    coarse, exact, _ = codec_scores(catalog, "pq", m=4)
+    fine, _, _ = codec_scores(catalog, "pq", m=16)
+    assert np.abs(fine - exact).mean() < np.abs(coarse - exact).mean()
+
+
+def test_binary_scores_rank_well_enough_to_pick_candidates(catalog):
+    scores, exact, codes = codec_scores(catalog, "binary")
+    # 64 dims pack into one 64-bit word
+    assert codes.shape == (2000, 8)
+    assert np.corrcoef(scores.ravel(), exact.ravel())[0, 1] > 0.6
+    truth = np.argsort(-exact, axis=1)[:, :10]
+    candidates = np.argsort(-scores, axis=1)[:, :100]
+    recall = np.mean([len(set(t) & set(c)) / 10 for t, c in zip(truth, candidates)])
+    assert recall >= 0.9
+
+
+def test_popcount_fallback_matches_numpy(monkeypatch):
+    words = np.random.default_rng(0).integers(0, 2 ** 63, (5, 4), dtype=np.uint64)
+    expected = np.array([[bin(int(w)).count('1') for w in row] for row in words])
+    np.testing.assert_array_equal(quantization._popcount(words), expected)
+    monkeypatch.delattr(np, 'bitwise_count', raising=False)
+    np.testing.assert_array_equal(quantization._popcount(words), expected)
+
+
+def test_pca_keeps_the_leading_similarity(catalog):
+    rows, queries = catalog
+    pca = PCATransform(16).fit(rows)
+    reduced = pca.transform(rows)
+    assert reduced.shape == (2000, 16)
+    np.testing.assert_allclose(np.linalg.norm(reduced, axis=1), 1.0, rtol=1e-5)
+    exact = queries @ rows.T
+    approx = pca.transform(queries) @ reduced.T
+    assert np.corrcoef(approx.ravel(), exact.ravel())[0, 1] > 0.9
+
+
+@pytest.mark.parametrize("storage, minimum", [("float16", 0.99), ("int8", 0.9), ("pq", 0.5)])
+def test_quantized_index_finds_the_exact_neighbours(catalog, storage, minimum):
+    rows, queries = catalog
+    _, truth = build_index("exact").fit(rows).query(queries, 10)
+    index = build_index("quantized", storage=storage).fit(rows)
+    _, found = index.query(queries, 10)
+    recall = np.mean([len(set(t) & set(f)) / 10 for t, f in zip(truth, found)])
+    assert recall >= minimum
+    # Rows added later are scored with the codec fitted on the first ones
+    index.add(queries[:2])
+    assert index.query(queries[:2], 1)[1][:, 0].tolist() == [2000, 2001]
+
+
+def test_unknown_storage_is_rejected():
+    with pytest.raises(ValueError, match="Unknown"):
+        build_codec("int4")
+    assert set(CODECS) == {"float32", "float16", "int8", "pq", "binary"}
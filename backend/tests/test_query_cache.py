@@ -0,0 +1,112 @@
+import os
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+from conftest import pattern_image
+from query_cache import CachedQuery, QueryCache, perceptual_hash
+
+
+def png_bytes(img, **params):
+    buffer = BytesIO()
+    img.save(buffer, format="PNG", **params)
+    return buffer.getvalue()
+
+
+def query(data, key="a"):
+    return CachedQuery(data, content_key=key)
+
+
+def decode(data):
+    return Image.open(BytesIO(data)).convert("RGB")
+
+
+def test_results_hit_until_the_index_changes():
+    cache = QueryCache()
+    first = query(b"x")
+    first.embedding = np.ones(4, np.float32)
+    cache.store(first, [(0.9, "a.png"), (0.8, "b.png")], top_k=2, index_version=1)
+
+    again = query(b"x")
+    assert cache.lookup(again, top_k=1, index_version=1)
+    assert again.results == [(0.9, "a.png")]
+
+    # A new index version keeps the embedding and drops the results
+    changed = query(b"x")
+    assert cache.lookup(changed, top_k=1, index_version=2)
+    assert changed.results is None and changed.embedding is first.embedding
+    stats = cache.stats()
+    assert (stats['hits'], stats['embedding_hits'], stats['invalidations']) == (1, 1, 1)
+
+
+def test_results_need_the_same_filter_and_enough_neighbours():
+    cache = QueryCache()
+    first = query(b"x")
+    first.embedding = np.ones(4, np.float32)
+    cache.store(first, [(0.9, "a.png")], top_k=1, index_version=1, filter_key="artist=a")
+    for top_k, key in ((1, None), (2, "artist=a")):
+        other = query(b"x")
+        assert cache.lookup(other, top_k=top_k, index_version=1, filter_key=key)
+        assert other.results is None and other.embedding is not None
+
+
+def test_entries_expire_and_are_evicted():
+    now = [0.0]
+    cache = QueryCache(max_entries=2, ttl_seconds=10, clock=lambda: now[0])
+    for key in "abc":
+        entry = query(key.encode(), key)
+        entry.embedding = np.zeros(4, np.float32)
+        cache.store(entry, [], top_k=1, index_version=1)
+    assert not cache.lookup(query(b"a", "a"), top_k=1, index_version=1)
+    assert cache.stats()['evictions'] == 1
+    now[0] = 11
+    assert not cache.lookup(query(b"b", "b"), top_k=1, index_version=1)
+    assert cache.stats()['expirations'] == 1
+
+
+def test_perceptual_hash_is_opt_in():
+    img = pattern_image(0)
+    reencoded = query(png_bytes(img, compress_level=0), "b")
+    cache = QueryCache()
+    stored = query(img)
+    stored.phash = perceptual_hash(img)
+    stored.embedding = np.ones(4, np.float32)
+    cache.store(stored, [(1.0, "a.png")], top_k=1, index_version=1)
+    assert not cache.lookup(reencoded, top_k=1, index_version=1, decode=decode)
+
+    cache = QueryCache(use_perceptual_hash=True)
+    cache.store(stored, [(1.0, "a.png")], top_k=1, index_version=1)
+    assert cache.lookup(reencoded, top_k=1, index_version=1, decode=decode)
+    assert reencoded.results == [(1.0, "a.png")] and cache.stats()['phash_hits'] == 1
+
+
+def test_flat_images_are_not_perceptually_hashed():
+    assert perceptual_hash(Image.new("RGB", (64, 64), (200, 20, 20))) is None
+    noise = np.random.default_rng(0).normal(128, 0.5, (64, 64)).clip(0, 255).astype(np.uint8)
+    assert perceptual_hash(Image.fromarray(noise)) is None
+    assert perceptual_hash(pattern_image(0)) is not None
+
+    cache = QueryCache(use_perceptual_hash=True)
+    red = query(png_bytes(Image.new("RGB", (64, 64), (200, 20, 20))), "red")
+    cache.lookup(red, top_k=1, index_version=1, decode=decode)
+    red.embedding = np.ones(4, np.float32)
+    cache.store(red, [(1.0, "red.png")], top_k=1, index_version=1)
+    blue = query(png_bytes(Image.new("RGB", (64, 64), (20, 20, 200))), "blue")
+    assert not cache.lookup(blue, top_k=1, index_version=1, decode=decode)
+
+
+def test_search_answers_repeats_from_the_cache(image_search, art_dataset):
+    search = image_search(query_cache=QueryCache())
+    search.index_database(art_dataset)
+    data = png_bytes(pattern_image(4))
+    first = search.search(data, top_k=3)
+    calls = search.feature_extractor.calls
+    assert search.search(data, top_k=3) == first
+    assert search.feature_extractor.calls == calls
+
+    # Changing the index invalidates the results but not the embedding
+    search.remove_images([os.path.join(art_dataset, "img_4.png")])
+    results = search.search(data, top_k=3)
+    assert search.feature_extractor.calls == calls
+    assert os.path.join(art_dataset, "img_4.png") not in [path for _, path in results]
@@ -0,0 +1,95 @@
+import os
+
+import numpy as np
+import pytest
+
+from conftest import pattern_image
+from nn_index import l2_normalize
+from regions import RegionIndex, tile_boxes
+
+REGION_PARAMS = {'scales': [1, 2]}
+
+
+def top_names(search, query, k=1):
+    return [os.path.basename(path) for _, path in search.search(query, top_k=k)]
+
+
+def collage_of(artwork):
+    """The artwork pasted over the first 2x2 query tile of a busy 192x192 photo."""
+    canvas = pattern_image(99, size=(192, 192))
+    canvas.paste(artwork.resize((120, 120)), (0, 0))
+    return canvas
+
+
+def test_tile_boxes_cover_the_image_at_every_scale():
+    boxes = tile_boxes(100, 60, scales=(1, 2, 3), overlap=0.25)
+    assert len(boxes) == 1 + 4 + 9
+    assert boxes[0] == (0, 0, 100, 60)
+    for left, upper, right, lower in boxes:
+        assert 0 <= left < right <= 100 and 0 <= upper < lower <= 60
+    # Scale 2 tiles are a quarter larger than half the image and reach both edges
+    assert boxes[1] == (0, 0, 62, 38)
+    assert boxes[4] == (38, 22, 100, 60)
+
+
+def test_scales_must_include_the_whole_image():
+    with pytest.raises(ValueError, match="must include 1"):
+        RegionIndex(scales=(2, 3))
+    assert RegionIndex(scales=(2, 1)).scales == (1, 2)
+
+
+def test_artworks_score_their_best_region_once():
+    rng = np.random.default_rng(0)
+    vectors = l2_normalize(rng.standard_normal((3 * 5, 16)))
+    owners = np.repeat([0, 1, 2], 5)
+    index = RegionIndex().fit(vectors, owners)
+    # Query tiles close to region 7 (artwork 1) and region 13 (artwork 2)
+    queries = np.stack([vectors[7], vectors[13] + 0.1 * vectors[2]])[None]
+    scores, rows = index.query(queries, 3)
+    assert rows[0, :2].tolist() == [1, 2]
+    assert scores[0, 0] == pytest.approx(1.0, abs=1e-3)
+    assert sorted(rows[0].tolist()) == [0, 1, 2]
+
+    allowed = np.array([True, False, True])
+    _, rows = index.query(queries, 3, allowed=allowed)
+    assert rows[0].tolist() == [2, 0, -1]
+
+    index.remove_owners([1])
+    assert index.n_alive == 10
+    assert 1 not in index.query(queries, 3)[1][0]
+    index.move_owners([1], [3])
+    assert index.query(queries, 1)[1][0, 0] == 3
+
+
+def test_crops_match_in_region_mode_only(image_search, art_dataset):
+    crop = pattern_image(3).crop(tile_boxes(96, 96)[4])
+    global_search = image_search()
+    global_search.index_database(art_dataset)
+    assert top_names(global_search, crop) != ["img_3.png"]
+
+    region_search = image_search(region_params=REGION_PARAMS)
+    region_search.index_database(art_dataset)
+    assert top_names(region_search, crop) == ["img_3.png"]
+    assert top_names(region_search, collage_of(pattern_image(5))) == ["img_5.png"]
+    # Whole images still match themselves
+    assert top_names(region_search, pattern_image(8)) == ["img_8.png"]
+    assert region_search.regions.n_alive == 12 * 5
+
+
+def test_region_mode_follows_syncs_and_the_feature_store(image_search, art_dataset, tmp_path):
+    cache_path = str(tmp_path / "store")
+    search = image_search(region_params=REGION_PARAMS)
+    search.index_database(art_dataset, cache_path=cache_path)
+
+    pattern_image(100).save(os.path.join(art_dataset, "img_new.png"))
+    os.remove(os.path.join(art_dataset, "img_5.png"))
+    search.sync_database(art_dataset, cache_path=cache_path)
+    assert top_names(search, collage_of(pattern_image(100))) == ["img_new.png"]
+    assert "img_5.png" not in top_names(search, collage_of(pattern_image(5)), k=12)
+
+    reopened = image_search(region_params=REGION_PARAMS)
+    reopened.index_database(art_dataset, cache_path=cache_path)
+    # Region vectors come from the store, nothing is embedded again
+    assert reopened.feature_extractor.calls == 0
+    assert reopened.regions.n_alive == 12 * 5
+    assert top_names(reopened, pattern_image(3).crop(tile_boxes(96, 96)[1])) == ["img_3.png"]
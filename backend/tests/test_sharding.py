@@ -0,0 +1,57 @@
+import logging
+import time
+
+import numpy as np
+import pytest
+
+from sharding import ShardedIndex, ShardUnavailable
+
+
+@pytest.fixture
+def features():
+    return np.random.default_rng(0).standard_normal((40, 8)).astype(np.float32)
+
+
+@pytest.fixture
+def index(features):
+    index = ShardedIndex(num_shards=2, timeout=10.0).fit(features)
+    yield index
+    index.close()
+
+
+def kill_shard(shard):
+    shard.process.kill()
+    shard.process.join()
+    deadline = time.monotonic() + 10
+    while shard.alive and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not shard.alive
+
+
+def test_query_merges_all_shards(index, features):
+    _, ids = index.query(features[[3, 30]], 1)
+    assert ids[:, 0].tolist() == [3, 30]
+    assert index.partial_queries == 0
+
+
+def test_missing_shard_fails_the_query_by_default(index, features):
+    kill_shard(index.shards[1])
+    with pytest.raises(ShardUnavailable, match=r"\['1'\]"):
+        index.query(features[:1], 5)
+    assert index.partial_queries == 1
+
+
+def test_allow_partial_answers_from_live_shards_and_warns(index, features, caplog):
+    kill_shard(index.shards[1])
+    index.allow_partial = True
+    with caplog.at_level(logging.WARNING, logger="sharding"):
+        _, ids = index.query(features[[3, 30]], 1)
+    assert ids[0, 0] == 3
+    # Row 30 lives on the dead shard
+    assert ids[1, 0] != 30
+    assert "partial results from 1 of 2 shards" in caplog.text
+
+
+def test_k_below_one_is_rejected(index, features):
+    with pytest.raises(ValueError):
+        index.query(features[:1], 0)
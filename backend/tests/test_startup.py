@@ -0,0 +1,59 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import startup
+from conftest import pattern_image
+from search_engine import EngineNotReady, SearchEngine
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ("tensorflow", "keras", "onnxruntime", "hnswlib")
+
+
+def imported_heavy_modules(statement):
+    """Heavy modules loaded by running `statement` in a fresh interpreter."""
+    code = f"import sys\n{statement}\nprint(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    result = subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, check=True,
+                            capture_output=True, text=True)
+    return result.stdout.strip().splitlines()[-1] if result.stdout.strip() else ""
+
+
+def test_backend_modules_import_without_the_model_runtimes():
+    modules = "search_engine, ai_art_similarity, audio_similarity, inference, nn_index, sharding, metrics"
+    assert imported_heavy_modules(f"import {modules}") == ""
+
+
+def test_api_imports_without_the_model_runtimes():
+    pytest.importorskip("dotenv")
+    statement = "import main, startup\nassert 'app_imported_seconds' in startup.report()"
+    assert imported_heavy_modules(statement) == ""
+
+
+def test_milestones_keep_their_first_time():
+    startup.mark("test_milestone_seconds")
+    first = startup.report()["test_milestone_seconds"]
+    startup.mark("test_milestone_seconds")
+    report = startup.report()
+    assert report["test_milestone_seconds"] == first
+    assert report["pid"] == os.getpid()
+    assert 0 < report["rss_bytes"] and 0 < report["peak_rss_bytes"]
+    assert report["uptime_seconds"] >= first
+
+
+def test_engine_refuses_searches_until_warm(image_search, art_dataset, tmp_path):
+    engine = SearchEngine(database_dir=art_dataset, cache_path=str(tmp_path / "store"))
+    health = engine.health()
+    assert health["status"] == "cold" and not health["ready"]
+    with pytest.raises(EngineNotReady):
+        engine.search(pattern_image(1))
+
+    engine.start_warmup().join()
+    health = engine.health()
+    assert health["ready"], engine.error
+    assert health["indexed_images"] == 12
+    for timing in ("model_load_seconds", "index_load_seconds", "warmup_inference_seconds"):
+        assert health[timing] >= 0
+    assert "engine_ready_seconds" in health["process"]
+    assert engine.search(pattern_image(1), top_k=1)[0][1].endswith("img_1.png")
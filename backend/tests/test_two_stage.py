@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+
+from nn_index import build_index, l2_normalize
+
+
+@pytest.fixture(scope="module")
+def catalog():
+    """Clustered unit vectors, like embeddings of related artworks, and queries."""
+    rng = np.random.default_rng(2)
+    centers = rng.standard_normal((20, 64))
+    rows = centers[rng.integers(0, 20, 3000)] + 0.7 * rng.standard_normal((3000, 64))
+    queries = centers[rng.integers(0, 20, 30)] + 0.7 * rng.standard_normal((30, 64))
+    return l2_normalize(rows), l2_normalize(queries)
+
+
+@pytest.fixture(scope="module")
+def truth(catalog):
+    rows, queries = catalog
+    return build_index("exact").fit(rows).query(queries, 10)
+
+
+def recall(found, truth):
+    return np.mean([len(set(f) & set(t)) / len(t) for f, t in zip(found, truth)])
+
+
+@pytest.mark.parametrize("params", [{}, {"storage": "float16", "pca_dim": 16}])
+def test_rerank_returns_exact_scores_of_the_best_candidates(catalog, truth, params):
+    rows, queries = catalog
+    scores, found = build_index("two_stage", candidates=200, **params).fit(rows).query(queries, 10)
+    # Scores are full-precision similarities, not first-stage estimates
+    np.testing.assert_allclose(scores, np.take_along_axis(queries @ rows.T, found, axis=1), atol=1e-5)
+    assert (np.diff(scores, axis=1) <= 1e-6).all()
+    assert recall(found, truth[1]) >= 0.9
+
+
+def test_more_candidates_recall_more(catalog, truth):
+    rows, queries = catalog
+    index = build_index("two_stage", candidates=10).fit(rows)
+    few = recall(index.query(queries, 10)[1], truth[1])
+    index.candidates = len(rows)
+    _, found = index.query(queries, 10)
+    # Re-ranking every row is an exact search
+    assert recall(found, truth[1]) == 1.0
+    assert few < 1.0
+
+
+def test_added_and_removed_rows(catalog):
+    rows, queries = catalog
+    index = build_index("two_stage").fit(rows[:2000])
+    ids = index.add(rows[2000:])
+    assert ids[0] == 2000 and len(index) == 3000
+    scores, found = index.query(rows[[10, 2500]], 1)
+    assert found[:, 0].tolist() == [10, 2500]
+    np.testing.assert_allclose(scores[:, 0], 1.0, atol=1e-5)
+
+    index.remove([10, 2500])
+    _, found = index.query(rows[[10, 2500]], 5)
+    assert not {10, 2500} & set(found.ravel().tolist())
+
+
+def test_filtered_queries_rerank_allowed_rows(catalog):
+    rows, queries = catalog
+    exact = build_index("exact").fit(rows)
+    index = build_index("two_stage", candidates=200).fit(rows)
+    for step in (50, 3):
+        # A selective filter (scored directly) and a broad one (masked in the first stage)
+        allowed = np.zeros(len(rows), dtype=bool)
+        allowed[::step] = True
+        _, expected = exact.query(queries, 5, allowed=allowed)
+        _, found = index.query(queries, 5, allowed=allowed)
+        assert allowed[found].all()
+        assert recall(found, expected) >= 0.9
+
+
+def test_fitted_matrix_is_referenced_not_copied(catalog):
+    rows, _ = catalog
+    index = build_index("two_stage").fit(rows, normalized=True)
+    assert index._vectors is rows
+    # First-stage sign bits: 64 dims in 8 bytes per row
+    assert index._codes.nbytes == 8 * len(rows)
@@ -0,0 +1,82 @@
+"""
+Offline helpers for experimenting with the similarity search.
+
+Kept out of the serving path so the API process never imports matplotlib or
+the TensorFlow dataset loaders.
+"""
+import os
+
+from PIL import Image
+
+from fetcher import get_fetcher, is_url
+
+
+def visualize_results(query_img_path, results, display_size=(224, 224)):
+    """
+    Visualize search results.
+
+    Args:
+        query_img_path (str or PIL.Image): Path or URL of the query image, or PIL Image object.
+        results (list): List of (similarity_score, image_path) tuples.
+        display_size (tuple): Display size for images.
+    """
+    import matplotlib.pyplot as plt
+
+    if isinstance(query_img_path, str):
+        if is_url(query_img_path):
+            query_img = get_fetcher().fetch(query_img_path)
+        else:
+            query_img = Image.open(query_img_path)
+    else:
+        query_img = query_img_path
+
+    # Create a figure with subplots
+    n_results = len(results)
+    fig, axes = plt.subplots(1, n_results + 1, figsize=(15, 4))
+
+    # Display query image
+    axes[0].imshow(query_img.resize(display_size))
+    axes[0].set_title("Query Image")
+    axes[0].axis('off')
+
+    # Display results
+    for i, (score, path) in enumerate(results):
+        img = Image.open(path)
+        axes[i + 1].imshow(img.resize(display_size))
+        axes[i + 1].set_title(f"Score: {score:.2f}")
+        axes[i + 1].axis('off')
+
+    plt.tight_layout()
+    plt.show()
+
+
+def download_sample_dataset(output_dir, num_images=100):
+    """
+    Download a sample dataset from the CIFAR-10 dataset.
+
+    Args:
+        output_dir (str): Directory to save the images.
+        num_images (int): Number of images to download.
+    """
+    import tensorflow as tf
+
+    # Create output directory if it doesn't exist
+    os.makedirs(output_dir, exist_ok=True)
+
+    # Load CIFAR-10 dataset
+    (x_train, y_train), _ = tf.keras.datasets.cifar10.load_data()
+
+    # Define class names
+    class_names = ['airplane', 'automobile', 'bird', 'cat', 'deer',
+                   'dog', 'frog', 'horse', 'ship', 'truck']
+
+    # Save images
+    count = 0
+    for i in range(min(num_images, len(x_train))):
+        img = Image.fromarray(x_train[i])
+        class_name = class_names[y_train[i][0]]
+        img_path = os.path.join(output_dir, f"{class_name}_{i}.png")
+        img.save(img_path)
+        count += 1
+
+    print(f"Downloaded {count} images to {output_dir}")